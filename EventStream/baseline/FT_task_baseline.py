@@ -6,6 +6,7 @@ import json
 import pickle
 import warnings
 from abc import ABC
+from collections.abc import Callable, Iterable, Iterator
 from datetime import datetime
 from pathlib import Path
 from typing import Any
@@ -14,21 +15,24 @@ import numpy as np
 import omegaconf
 import polars as pl
 import polars.selectors as cs
+import scipy.sparse
 import wandb
 from hydra.core.config_store import ConfigStore
 from omegaconf import OmegaConf
-from sklearn.decomposition import NMF, PCA
+from sklearn.decomposition import NMF, PCA, IncrementalPCA, TruncatedSVD
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.feature_selection import SelectKBest, mutual_info_classif
 from sklearn.impute import KNNImputer, SimpleImputer
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import (
     accuracy_score,
     average_precision_score,
     log_loss,
     roc_auc_score,
 )
+from sklearn.naive_bayes import GaussianNB
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, StandardScaler
 
 from ..data.dataset_polars import Dataset
 from ..data.pytorch_dataset import PytorchDataset
@@ -47,7 +51,8 @@ def load_flat_rep(
     task_df_name: str | None = None,
     do_cache_filtered_task: bool = True,
     subjects_included: dict[str, set[int]] | None = None,
-) -> dict[str, pl.LazyFrame]:
+    do_split_by_chunk: bool = False,
+) -> dict[str, pl.LazyFrame | list[pl.LazyFrame]]:
     """Loads a set of flat representations from a passed dataset that satisfy the given constraints.
 
     Args:
@@ -77,6 +82,9 @@ def load_flat_rep(
             relevant rows for the task, be cached to disk for faster re-use.
         subjects_included: A dictionary by split of the subjects to include in the task. Omitted splits are
             used wholesale.
+        do_split_by_chunk: If `True`, each split maps to a list of lazy frames, one per subject chunk of the
+            stored flat representation, rather than to a single lazy frame over all chunks. This allows
+            the representation to be processed one shard at a time without ever being fully in memory.
 
     Raises:
         FileNotFoundError: If `do_update_if_missing` is `False` and the requested historical representations
@@ -162,7 +170,7 @@ def load_flat_rep(
                 task_window_dir = flat_dir / "task_histories" / task_df_name / sp / window_size
 
             window_dir = flat_dir / "over_history" / sp / window_size
-            window_dfs = []
+            window_dfs = {}
             for fp in window_dir.glob("*.parquet"):
                 subjects_idx = int(fp.stem)
                 subjects = params["subject_chunks_by_split"][sp][subjects_idx]
@@ -175,7 +183,7 @@ def load_flat_rep(
                         if subjects_included.get(sp, None) is not None:
                             subjects = list(set(subjects).intersection(subjects_included[sp]))
                             df = df.filter(pl.col("subject_id").is_in(subjects))
-                        window_dfs.append(df)
+                        window_dfs[subjects_idx] = df
                         continue
 
                 df = pl.scan_parquet(fp)
@@ -193,27 +201,35 @@ def load_flat_rep(
                     subjects = list(set(subjects).intersection(subjects_included[sp]))
                     df = df.filter(pl.col("subject_id").is_in(subjects))
 
-                window_dfs.append(df)
+                window_dfs[subjects_idx] = df
 
-            dfs.append(pl.concat(window_dfs, how="vertical"))
+            dfs.append(window_dfs)
 
-        joined_df = dfs[0]
-        for jdf in dfs[1:]:
-            joined_df = joined_df.join(jdf, on=join_keys, how="inner")
-
-        # Add in the labels
         if task_df_name is not None:
-            joined_df = joined_df.join(sp_join_df, on=join_keys, how="inner")
             extra_cols = [c for c in sp_join_df.columns if c not in join_keys]
         else:
             extra_cols = []
 
-        # Add in the static data
-        by_split[sp] = (
-            joined_df.join(static_df, on="subject_id", how="left")
-            .with_columns(cs.ends_with("count").fill_null(0))
-            .select(*join_keys, *extra_cols, *allowed_features)
-        )
+        def join_windows(window_dfs: list[pl.LazyFrame]) -> pl.LazyFrame:
+            joined_df = window_dfs[0]
+            for jdf in window_dfs[1:]:
+                joined_df = joined_df.join(jdf, on=join_keys, how="inner")
+
+            # Add in the labels
+            if task_df_name is not None:
+                joined_df = joined_df.join(sp_join_df, on=join_keys, how="inner")
+
+            # Add in the static data
+            return (
+                joined_df.join(static_df, on="subject_id", how="left")
+                .with_columns(cs.ends_with("count").fill_null(0))
+                .select(*join_keys, *extra_cols, *allowed_features)
+            )
+
+        if do_split_by_chunk:
+            by_split[sp] = [join_windows([w_dfs[idx] for w_dfs in dfs]) for idx in sorted(dfs[0])]
+        else:
+            by_split[sp] = join_windows([pl.concat(list(w_dfs.values()), how="vertical") for w_dfs in dfs])
 
     return by_split
 
@@ -224,6 +240,26 @@ class ESDFlatFeatureLoader:
     This can dynamically apply window size, feature inclusion frequency, measurement restrictions, and mean
     variable conversions to flat feature sets. All window sizes indicated in this featurizer must be included
     in the passed dataframes.
+
+    If ``do_produce_sparse`` is set, `transform` returns a `scipy.sparse.csr_matrix` built directly from the
+    non-null, non-zero entries of each polars column rather than a dense array. In this mode, null features
+    are stored as implicit zeros (the same result as the default constant imputation with a fill value of
+    0); the absence of a measurement remains visible through its count columns. NaN values are stored
+    explicitly, so downstream imputers still see them as missing.
+
+    Examples:
+        >>> import polars as pl
+        >>> loader = ESDFlatFeatureLoader(
+        ...     None, window_sizes=["FULL"], convert_to_mean_var=False, do_produce_sparse=True
+        ... )
+        >>> loader.feature_columns = ["FULL/a/count", "FULL/a/sum"]
+        >>> X = loader.transform(pl.DataFrame({"FULL/a/count": [0, 2, 1], "FULL/a/sum": [None, 3.0, -1.0]}))
+        >>> type(X).__name__, X.nnz
+        ('csr_matrix', 4)
+        >>> X.toarray()
+        array([[ 0.,  0.],
+               [ 2.,  3.],
+               [ 1., -1.]])
     """
 
     def __init__(
@@ -233,6 +269,7 @@ class ESDFlatFeatureLoader:
         feature_inclusion_frequency: float | dict[str, float] | None = None,
         include_only_measurements: set[str] | None = None,
         convert_to_mean_var: bool = True,
+        do_produce_sparse: bool = False,
         **kwargs,
     ):
         self.ESD = ESD
@@ -242,6 +279,7 @@ class ESDFlatFeatureLoader:
         self.feature_inclusion_frequency = feature_inclusion_frequency
         self.include_only_measurements = include_only_measurements
         self.convert_to_mean_var = convert_to_mean_var
+        self.do_produce_sparse = do_produce_sparse
 
     def set_params(
         self,
@@ -250,6 +288,7 @@ class ESDFlatFeatureLoader:
         feature_inclusion_frequency: float | dict[str, float] | None = None,
         include_only_measurements: set[str] | None = None,
         convert_to_mean_var: bool | None = None,
+        do_produce_sparse: bool | None = None,
     ):
         if ESD is not None:
             self.ESD = ESD
@@ -261,15 +300,24 @@ class ESDFlatFeatureLoader:
             self.include_only_measurements = include_only_measurements
         if convert_to_mean_var is not None:
             self.convert_to_mean_var = convert_to_mean_var
+        if do_produce_sparse is not None:
+            self.do_produce_sparse = do_produce_sparse
 
     def fit(self, flat_rep_df: pl.DataFrame, _) -> "ESDFlatFeatureLoader":
-        self.feature_columns = self.ESD._get_flat_rep_feature_cols(
-            feature_inclusion_frequency=self.feature_inclusion_frequency,
-            window_sizes=self.window_sizes,
-            include_only_measurements=self.include_only_measurements,
-        )
+        self._all_feature_columns = None
+        return self.partial_fit(flat_rep_df, _)
+
+    def partial_fit(self, flat_rep_df: pl.DataFrame, _=None) -> "ESDFlatFeatureLoader":
+        """Fits the loader incrementally, retaining any allowed column that is non-null in some batch."""
+        if getattr(self, "_all_feature_columns", None) is None:
+            self._all_feature_columns = self.ESD._get_flat_rep_feature_cols(
+                feature_inclusion_frequency=self.feature_inclusion_frequency,
+                window_sizes=self.window_sizes,
+                include_only_measurements=self.include_only_measurements,
+            )
+            self._non_null_feature_columns = set()
 
-        want_cols = set(self.feature_columns)
+        want_cols = set(self._all_feature_columns)
         have_cols = set(flat_rep_df.columns)
         if not want_cols.issubset(have_cols):
             missing_cols = list(want_cols - have_cols)
@@ -279,14 +327,53 @@ class ESDFlatFeatureLoader:
                 f"Have columns:\n{', '.join(flat_rep_df.columns)}"
             )
 
-        flat_rep_df = flat_rep_df.select(self.feature_columns)
-        non_null_cols = [s.name for s in flat_rep_df if s.null_count() != flat_rep_df.height]
+        flat_rep_df = flat_rep_df.select(self._all_feature_columns)
+        self._non_null_feature_columns.update(
+            s.name for s in flat_rep_df if s.null_count() != flat_rep_df.height
+        )
 
-        self.feature_columns = non_null_cols
+        self.feature_columns = [c for c in self._all_feature_columns if c in self._non_null_feature_columns]
 
         return self
 
-    def transform(self, flat_rep_df: pl.DataFrame) -> np.ndarray:
+    @staticmethod
+    def _to_csr(df: pl.DataFrame) -> scipy.sparse.csr_matrix:
+        """Builds a CSR matrix from the non-null, non-zero entries of ``df`` without densifying it.
+
+        Each column contributes only its stored entries, so the columns form a CSC matrix directly (row
+        indices come out sorted); converting that to CSR is linear in the number of stored entries.
+
+        Examples:
+            >>> import polars as pl
+            >>> df = pl.DataFrame({"a": [None, 1, 0], "b": [2.5, None, float("nan")]})
+            >>> X = ESDFlatFeatureLoader._to_csr(df)
+            >>> X.shape, X.nnz
+            ((3, 2), 3)
+            >>> X.toarray()
+            array([[0. , 2.5],
+                   [1. , 0. ],
+                   [0. , nan]])
+        """
+        indptr = np.zeros(df.width + 1, dtype=np.int64)
+        indices = []
+        data = []
+        for i, col in enumerate(df):
+            col = col.cast(pl.Float64).fill_null(0)
+            is_stored = col != 0
+            indices.append(is_stored.arg_true().to_numpy().astype(np.int64))
+            data.append(col.filter(is_stored).to_numpy())
+            indptr[i + 1] = indptr[i] + len(indices[-1])
+
+        if df.width > 0:
+            indices = np.concatenate(indices)
+            data = np.concatenate(data)
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            data = np.zeros(0, dtype=np.float64)
+
+        return scipy.sparse.csc_matrix((data, indices, indptr), shape=df.shape).tocsr()
+
+    def transform(self, flat_rep_df: pl.DataFrame) -> np.ndarray | scipy.sparse.csr_matrix:
         out_df = flat_rep_df.lazy().select(self.feature_columns)
 
         if self.convert_to_mean_var:
@@ -307,7 +394,10 @@ class ESDFlatFeatureLoader:
             out_df = (
                 out_df.with_columns(
                     *[
-                        (pl.col(f"{c}/sum") / pl.col(f"{c}/has_values_count")).alias(f"{c}/mean")
+                        pl.when(pl.col(f"{c}/has_values_count") > 0)
+                        .then(pl.col(f"{c}/sum") / pl.col(f"{c}/has_values_count"))
+                        .otherwise(None)
+                        .alias(f"{c}/mean")
                         for c in to_conv_mean_cols
                     ],
                 )
@@ -327,8 +417,8 @@ class ESDFlatFeatureLoader:
                 )
             )
 
-        out_df = out_df
-
+        if self.do_produce_sparse:
+            return self._to_csr(out_df.collect())
         return out_df.collect().to_numpy()
 
 
@@ -364,15 +454,20 @@ class BaseSklearnModuleConfig(ABC):
         cls.__name__: cls
         for cls in [
             PCA,
+            IncrementalPCA,
+            TruncatedSVD,
             NMF,
             SelectKBest,
             mutual_info_classif,
             KNNImputer,
             SimpleImputer,
             MinMaxScaler,
+            MaxAbsScaler,
             StandardScaler,
             ESDFlatFeatureLoader,
             RandomForestClassifier,
+            SGDClassifier,
+            GaussianNB,
         ]
     }
     SKIP_PARAMS = ["CLS", "SKLEARN_COMPONENTS", "SKIP_PARAMS"]
@@ -396,6 +491,15 @@ class BaseSklearnModuleConfig(ABC):
 
         return self.SKLEARN_COMPONENTS[self.CLS](**kwargs)
 
+    def for_sparse_input(self) -> "BaseSklearnModuleConfig | None":
+        """Returns the config to use in place of this one when the pipeline input is a sparse matrix.
+
+        By default, components are assumed to accept sparse inputs and are returned unchanged. Components
+        that require dense inputs override this to return a sparse-capable substitute, or `None` if they
+        can be omitted from the pipeline entirely; those with neither are left to fail on sparse inputs.
+        """
+        return self
+
     @property
     def module_kwargs(self) -> dict[str, Any]:
         return {k: v for k, v in dataclasses.asdict(self).items() if k not in self.SKIP_PARAMS}
@@ -421,15 +525,52 @@ class RandomForestClassifierConfig(BaseSklearnModuleConfig):
     max_samples: int | float | None = None
 
 
+@registered_sklearn_config
+class SGDClassifierConfig(BaseSklearnModuleConfig):
+    CLS: str = "SGDClassifier"
+
+    loss: str = "log_loss"
+    penalty: str | None = "l2"
+    alpha: float = 0.0001
+    l1_ratio: float = 0.15
+    max_iter: int = 1000
+    tol: float | None = 0.001
+    learning_rate: str = "optimal"
+    eta0: float = 0.01
+
+
+@registered_sklearn_config
+class GaussianNBConfig(BaseSklearnModuleConfig):
+    CLS: str = "GaussianNB"
+
+    var_smoothing: float = 1e-9
+
+
 @registered_sklearn_config
 class MinMaxScalerConfig(BaseSklearnModuleConfig):
     CLS: str = "MinMaxScaler"
 
+    def for_sparse_input(self) -> BaseSklearnModuleConfig:
+        # Scaling by the maximum absolute value matches min-max scaling on non-negative features, but keeps
+        # zeros at zero and so does not densify the input.
+        return MaxAbsScalerConfig()
+
+
+@registered_sklearn_config
+class MaxAbsScalerConfig(BaseSklearnModuleConfig):
+    CLS: str = "MaxAbsScaler"
+
 
 @registered_sklearn_config
 class StandardScalerConfig(BaseSklearnModuleConfig):
     CLS: str = "StandardScaler"
 
+    with_mean: bool = True
+
+    def for_sparse_input(self) -> BaseSklearnModuleConfig:
+        # Centering would make every implicit zero non-zero, so sparse inputs are only scaled.
+        return dataclasses.replace(self, with_mean=False)
+
 
 @registered_sklearn_config
 class SimpleImputerConfig(BaseSklearnModuleConfig):
@@ -453,6 +594,29 @@ class PCAConfig(BaseSklearnModuleConfig):
 
     n_components: int = 2
 
+    def for_sparse_input(self) -> BaseSklearnModuleConfig:
+        # PCA only accepts sparse inputs in recent versions of scikit-learn, and centers them densely when it
+        # does; a truncated SVD is the uncentered, sparse-native equivalent.
+        return TruncatedSVDConfig(n_components=self.n_components)
+
+
+@registered_sklearn_config
+class IncrementalPCAConfig(BaseSklearnModuleConfig):
+    CLS: str = "IncrementalPCA"
+
+    n_components: int = 2
+
+    def for_sparse_input(self) -> BaseSklearnModuleConfig:
+        # `IncrementalPCA.partial_fit` rejects sparse inputs, so these are reduced via a truncated SVD too.
+        return TruncatedSVDConfig(n_components=self.n_components)
+
+
+@registered_sklearn_config
+class TruncatedSVDConfig(BaseSklearnModuleConfig):
+    CLS: str = "TruncatedSVD"
+
+    n_components: int = 2
+
 
 @registered_sklearn_config
 class SelectKBestConfig(BaseSklearnModuleConfig):
@@ -469,6 +633,11 @@ class KNNImputerConfig(BaseSklearnModuleConfig):
     weights: str = "uniform"
     add_indicator: bool = True
 
+    def for_sparse_input(self) -> BaseSklearnModuleConfig:
+        # KNN imputation requires dense inputs. Sparse flat representations already store null features as
+        # implicit zeros, so the remaining (explicit NaN) missing values are filled with zeros as well.
+        return SimpleImputerConfig(strategy="constant", fill_value=0, add_indicator=self.add_indicator)
+
 
 @registered_sklearn_config
 class ESDFlatFeatureLoaderConfig(BaseSklearnModuleConfig):
@@ -478,6 +647,7 @@ class ESDFlatFeatureLoaderConfig(BaseSklearnModuleConfig):
     feature_inclusion_frequency: float | None = None
     include_only_measurements: list[str] | None = None
     convert_to_mean_var: bool = True
+    do_produce_sparse: bool = False
 
 
 @dataclasses.dataclass
@@ -506,6 +676,10 @@ class SklearnConfig:
 
     train_subset_size: int | float | str | None = None
 
+    # If set, the pipeline is trained and evaluated over batches of this many rows, streamed one flat
+    # representation shard at a time, rather than over the full dataset in memory.
+    stream_batch_size: int | None = None
+
     do_overwrite: bool = False
 
     task_df_name: str | None = omegaconf.MISSING
@@ -545,7 +719,18 @@ class SklearnConfig:
                     f"between 0 and 1. Got {self.train_subset_size}."
                 )
 
-    def __get_component_model(self, component: str, **kwargs) -> Any:
+        match self.stream_batch_size:
+            case int() as batch_size if batch_size > 0:
+                pass
+            case None:
+                pass
+            case _:
+                raise ValueError(
+                    f"stream_batch_size invalid! Must be either None or a positive int. Got "
+                    f"{self.stream_batch_size}."
+                )
+
+    def __get_component_model(self, component: str, sparse_input: bool = False, **kwargs) -> Any:
         if component not in self.PIPELINE_COMPONENTS:
             raise ValueError(f"Unknown component {component}")
 
@@ -564,26 +749,47 @@ class SklearnConfig:
                     f"Got {type(component_val)}({component_val})."
                 )
 
+        if sparse_input:
+            sparse_val = component_val.for_sparse_input()
+            if sparse_val is not component_val:
+                warnings.warn(
+                    f"{component} {component_val.CLS} does not support sparse inputs as configured; using "
+                    f"{'passthrough' if sparse_val is None else sparse_val} instead."
+                )
+            if sparse_val is None:
+                return "passthrough"
+            component_val = sparse_val
+
         return component_val.get_model(seed=self.seed, **kwargs)
 
     def get_model(self, dataset: Dataset) -> Any:
+        feature_selector = self.__get_component_model("feature_selector", ESD=dataset)
+        sparse_input = getattr(feature_selector, "do_produce_sparse", False)
         return Pipeline(
-            [("feature_selector", self.__get_component_model("feature_selector", ESD=dataset))]
-            + [(n, self.__get_component_model(n)) for n in self.PIPELINE_COMPONENTS[1:]]
+            [("feature_selector", feature_selector)]
+            + [
+                (n, self.__get_component_model(n, sparse_input=sparse_input))
+                for n in self.PIPELINE_COMPONENTS[1:]
+            ]
         )
 
 
 config_store = ConfigStore.instance()
 config_store.store(name="sklearn_config", node=SklearnConfig)
 config_store.store(group="scaling", name="min_max_scaler", node=MinMaxScalerConfig)
+config_store.store(group="scaling", name="max_abs_scaler", node=MaxAbsScalerConfig)
 config_store.store(group="scaling", name="standard_scaler", node=StandardScalerConfig)
 config_store.store(group="imputation", name="simple_imputer", node=SimpleImputerConfig)
 config_store.store(group="imputation", name="knn_imputer", node=KNNImputerConfig)
 config_store.store(group="dim_reduce", name="nmf", node=NMFConfig)
 config_store.store(group="dim_reduce", name="pca", node=PCAConfig)
+config_store.store(group="dim_reduce", name="incremental_pca", node=IncrementalPCAConfig)
+config_store.store(group="dim_reduce", name="truncated_svd", node=TruncatedSVDConfig)
 config_store.store(group="dim_reduce", name="select_k_best", node=SelectKBestConfig)
 config_store.store(group="feature_selector", name="esd_flat_feature_loader", node=ESDFlatFeatureLoaderConfig)
 config_store.store(group="model", name="random_forest_classifier", node=RandomForestClassifierConfig)
+config_store.store(group="model", name="sgd_classifier", node=SGDClassifierConfig)
+config_store.store(group="model", name="gaussian_nb", node=GaussianNBConfig)
 
 METRIC_FNS = {
     "NLL": log_loss,
@@ -648,6 +854,105 @@ def eval_binary_classification(Y: np.ndarray, probs: np.ndarray) -> dict[str, fl
     return results
 
 
+def iter_flat_rep_batches(chunks: Iterable[pl.LazyFrame], batch_size: int) -> Iterator[pl.DataFrame]:
+    """Yields batches of ``batch_size`` rows over a sequence of lazy frames, collecting one at a time.
+
+    Rows left over at the end of one chunk are carried into the next, so only the final batch may be
+    smaller than ``batch_size``.
+
+    Examples:
+        >>> import polars as pl
+        >>> chunks = [pl.LazyFrame({"a": [1, 2, 3]}), pl.LazyFrame({"a": [4]}), pl.LazyFrame({"a": [5, 6]})]
+        >>> [df["a"].to_list() for df in iter_flat_rep_batches(chunks, 2)]
+        [[1, 2], [3, 4], [5, 6]]
+        >>> [df["a"].to_list() for df in iter_flat_rep_batches(chunks, 4)]
+        [[1, 2, 3, 4], [5, 6]]
+    """
+    remainder = None
+    for chunk in chunks:
+        df = chunk.collect()
+        if remainder is not None:
+            df = pl.concat([remainder, df], how="vertical")
+            remainder = None
+
+        for batch in df.iter_slices(batch_size):
+            if batch.height < batch_size:
+                remainder = batch
+            else:
+                yield batch
+
+    if remainder is not None and remainder.height > 0:
+        yield remainder
+
+
+def fit_pipeline_in_batches(
+    model: Pipeline,
+    get_batches: Callable[[], Iterable[tuple[Any, np.ndarray]]],
+    classes: np.ndarray,
+) -> Pipeline:
+    """Fits a scikit-learn pipeline over a stream of ``(X, Y)`` batches that need never be in memory at once.
+
+    Steps are fit in order. Each step makes its own pass over the batches (as returned by a fresh call to
+    ``get_batches``), which are transformed by the already fitted earlier steps and then passed to the
+    step's ``partial_fit`` method. Intermediate steps without ``partial_fit`` are fit on the first batch
+    only, with a warning; the final estimator must support ``partial_fit``. Note that scikit-learn's
+    incremental scalers never recover from a feature that is entirely missing in the first batch they see,
+    so batches should be large enough for every retained feature to be observed in them.
+
+    Args:
+        model: The (unfitted) pipeline to fit.
+        get_batches: A function returning a new iterable over the training batches each time it is called.
+        classes: The full set of labels, which the final estimator's ``partial_fit`` needs up front.
+
+    Returns:
+        The fitted pipeline.
+
+    Raises:
+        ValueError: If the final estimator does not support ``partial_fit``.
+    """
+    final_step = len(model.steps) - 1
+    for i, (name, step) in enumerate(model.steps):
+        if step is None or step == "passthrough":
+            continue
+
+        can_partial_fit = hasattr(step, "partial_fit")
+        if i == final_step and not can_partial_fit:
+            raise ValueError(
+                f"Training over batches requires a final estimator with `partial_fit`; "
+                f"{type(step).__name__} has none."
+            )
+        elif not can_partial_fit:
+            warnings.warn(
+                f"{name} {type(step).__name__} does not support `partial_fit`; fitting it on the first batch."
+            )
+
+        fit_kwargs = {"classes": classes} if i == final_step else {}
+        for X, Y in get_batches():
+            for _, fit_step in model.steps[:i]:
+                if fit_step is not None and fit_step != "passthrough":
+                    X = fit_step.transform(X)
+
+            if can_partial_fit:
+                step.partial_fit(X, Y, **fit_kwargs)
+            else:
+                step.fit(X, Y)
+                break
+
+    return model
+
+
+def predict_proba_in_batches(
+    model: Pipeline, batches: Iterable[tuple[Any, np.ndarray]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the concatenated labels and predicted probabilities of ``model`` over ``batches``."""
+    Ys = []
+    probs = []
+    for X, Y in batches:
+        Ys.append(Y)
+        probs.append(model.predict_proba(X))
+    return np.concatenate(Ys), np.concatenate(probs)
+
+
 def train_sklearn_pipeline(cfg: SklearnConfig):
     print(f"Saving config to {cfg.save_dir / 'config.yaml'}")
     cfg.save_dir.mkdir(exist_ok=True, parents=True)
@@ -697,28 +1002,47 @@ def train_sklearn_pipeline(cfg: SklearnConfig):
     with open(cfg.save_dir / "subjects.json", mode="w") as f:
         json.dump(subjects_included, f)
 
+    do_stream = cfg.stream_batch_size is not None
     flat_reps = load_flat_rep(
         ESD,
         window_sizes=cfg.feature_selector.window_sizes,
         task_df_name=cfg.task_df_name,
         subjects_included=subjects_included,
+        do_split_by_chunk=do_stream,
     )
-    Xs_and_Ys = {}
-    for split in ("train", "tuning", "held_out"):
-        st = datetime.now()
-        print(f"Loading dataset for {split}")
-        df = flat_reps[split].with_columns(normalized_label.alias(cfg.finetuning_task_label)).collect()
 
+    def split_X_and_Y(df: pl.DataFrame) -> tuple[pl.DataFrame, np.ndarray]:
         X = df.drop(["subject_id", "timestamp", cfg.finetuning_task_label])
         Y = df[cfg.finetuning_task_label].to_numpy()
-        print(f"Done with {split} dataset with X of shape {X.shape} " f"(elapsed: {datetime.now() - st})")
-        Xs_and_Ys[split] = (X, Y)
+        return X, Y
+
+    def iter_batches(split: str) -> Iterator[tuple[pl.DataFrame, np.ndarray]]:
+        chunks = [c.with_columns(normalized_label.alias(cfg.finetuning_task_label)) for c in flat_reps[split]]
+        for df in iter_flat_rep_batches(chunks, cfg.stream_batch_size):
+            yield split_X_and_Y(df)
+
+    if do_stream:
+        Xs_and_Ys = None
+    else:
+        Xs_and_Ys = {}
+        for split in ("train", "tuning", "held_out"):
+            st = datetime.now()
+            print(f"Loading dataset for {split}")
+            df = flat_reps[split].with_columns(normalized_label.alias(cfg.finetuning_task_label)).collect()
+
+            X, Y = split_X_and_Y(df)
+            print(f"Done with {split} dataset with X of shape {X.shape} (elapsed: {datetime.now() - st})")
+            Xs_and_Ys[split] = (X, Y)
 
     print("Initializing model!")
     model = cfg.get_model(dataset=ESD)
 
-    print("Fitting model!")
-    model.fit(*Xs_and_Ys["train"])
+    if do_stream:
+        print(f"Fitting model over batches of {cfg.stream_batch_size} rows!")
+        fit_pipeline_in_batches(model, lambda: iter_batches("train"), classes=np.array(task_vocab))
+    else:
+        print("Fitting model!")
+        model.fit(*Xs_and_Ys["train"])
     print(f"Saving model to {cfg.save_dir}")
     with open(cfg.save_dir / "model.pkl", mode="wb") as f:
         pickle.dump(model, f)
@@ -726,8 +1050,11 @@ def train_sklearn_pipeline(cfg: SklearnConfig):
     print("Evaluating model!")
     all_metrics = {}
     for split in ("tuning", "held_out"):
-        X, Y = Xs_and_Ys[split]
-        probs = model.predict_proba(X)
+        if do_stream:
+            Y, probs = predict_proba_in_batches(model, iter_batches(split))
+        else:
+            X, Y = Xs_and_Ys[split]
+            probs = model.predict_proba(X)
 
         match task_type:
             case "binary_classification":
@@ -0,0 +1,303 @@
+"""Persisted summary statistics of the deep-learning representation files of a dataset.
+
+On construction, `PytorchDataset` needs the minimum, mean log, and standard deviation of the log of the
+inter-event times of its split, as well as the subjects whose records contain malformed (non-positive)
+inter-event times, all restricted to the subjects with at least ``config.min_seq_len`` events. Computing these
+requires exploding every inter-event time in the split, which for large cohorts is a substantial cost paid
+again by every DDP rank and every run. Instead, per-sequence-length partial statistics of each cached data
+file are computed once, when the file is written, and stored in a small JSON file next to it (e.g.,
+``DL_reps/train_0.stats.json`` for ``DL_reps/train_0.parquet``). These are exactly combinable across files
+and for any minimum sequence length. Each stats file records its format version and a checksum of the data
+file it summarizes, so stats which are out of date are ignored and recomputed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import polars as pl
+
+STATS_FORMAT_VERSION = 1
+
+PARQUET_MAGIC = b"PAR1"
+
+
+def with_time_delta(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Converts the ``time`` column of a deep learning representation into a ``time_delta`` column.
+
+    The ``start_time`` is shifted to the time of the first event and ``time_delta`` holds the time between
+    each event and the next. The last event of each subject has a placeholder ``time_delta`` of 1, which is
+    ignored downstream as there is no next event. Dataframes which already have a ``time_delta`` column are
+    returned unchanged.
+
+    Examples:
+        >>> from datetime import datetime
+        >>> df = pl.DataFrame({"start_time": [datetime(2020, 1, 1)], "time": [[5.0, 7.0, 10.0]]})
+        >>> with_time_delta(df)
+        shape: (1, 2)
+        ┌─────────────────────┬─────────────────┐
+        │ start_time          ┆ time_delta      │
+        │ ---                 ┆ ---             │
+        │ datetime[μs]        ┆ list[f64]       │
+        ╞═════════════════════╪═════════════════╡
+        │ 2020-01-01 00:05:00 ┆ [2.0, 3.0, 1.0] │
+        └─────────────────────┴─────────────────┘
+    """
+    if "time_delta" in df.columns:
+        return df
+
+    return df.with_columns(
+        (pl.col("start_time") + pl.duration(minutes=pl.col("time").list.first())).alias("start_time"),
+        pl.col("time")
+        .list.eval(
+            # We fill with 1 here as it will be ignored in the code anyways as the next event's
+            # event mask will be null.
+            # TODO(mmd): validate this in a test.
+            (pl.col("").shift(-1) - pl.col("")).fill_null(1)
+        )
+        .alias("time_delta"),
+    ).drop("time")
+
+
+def file_checksum(fp: Path) -> str:
+    """Returns a checksum identifying the contents of the file at `fp`.
+
+    The file size is always hashed. For parquet files, only the footer (which holds the schema, row group
+    offsets and sizes, and column statistics of the file) is hashed in addition, so that this is cheap
+    regardless of the size of the file; other files are hashed in full. File timestamps are not used, so
+    copies of a file (e.g., when staging data onto scratch storage) have the same checksum.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     fp = Path(d) / "train_0.parquet"
+        ...     pl.DataFrame({"a": [1, 2]}).write_parquet(fp)
+        ...     checksum = file_checksum(fp)
+        ...     checksum == file_checksum(fp)
+        ...     os.utime(fp, ns=(0, 0))
+        ...     checksum == file_checksum(fp)
+        ...     pl.DataFrame({"a": [1, 2, 3]}).write_parquet(fp)
+        ...     checksum == file_checksum(fp)
+        True
+        True
+        False
+    """
+    size = fp.stat().st_size
+    hasher = hashlib.sha256(f"{size}".encode())
+    with open(fp, mode="rb") as f:
+        if size >= 12:
+            f.seek(size - 8)
+            tail = f.read(8)
+            if tail[4:] == PARQUET_MAGIC:
+                footer_size = int.from_bytes(tail[:4], "little") + 8
+                f.seek(max(size - footer_size, 0))
+                hasher.update(f.read())
+                return hasher.hexdigest()
+            f.seek(0)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class CachedDataStats:
+    """Inter-event time and malformed subject statistics of deep learning representation data.
+
+    Statistics are stored per sequence length (number of events), so that they can be restricted to subjects
+    with at least a given number of events after the fact. Statistics of several files can be combined with
+    `concat`.
+
+    Args:
+        seq_len_stats: A dataframe with one row per observed sequence length (``seq_len``) holding the number
+            of subjects with that many events (``n_subjects``), the number of their non-null inter-event
+            times (``n_inter_event_times``), and the minimum (``min``), mean log (``mean_log``), and sum of
+            squared deviations from the mean log (``m2_log``) of those inter-event times.
+        malformed_subjects: A dataframe of the ``subject_id`` and ``seq_len`` of all subjects with
+            non-positive inter-event times.
+
+    Examples:
+        >>> import tempfile
+        >>> df = pl.DataFrame({
+        ...     "subject_id": [1, 2, 3],
+        ...     "time_delta": [[1.0, 4.0], [2.0, 0.0, 8.0], [3.0]],
+        ...     "dynamic_indices": [[[1], [2]], [[1], [2], [3]], [[1]]],
+        ... })
+        >>> stats = CachedDataStats.from_df(df)
+        >>> stats.summarize(min_seq_len=2)
+        {'min': 0.0, 'mean_log': -inf, 'std_log': nan}
+        >>> stats.malformed_subject_ids(min_seq_len=2)
+        [2]
+        >>> stats.malformed_subject_ids(min_seq_len=4)
+        []
+
+        Statistics of disjoint sets of subjects can be combined, and match those of the combined data:
+
+        >>> df = df.with_columns(pl.col("time_delta").list.eval(pl.element() + 1))
+        >>> S = CachedDataStats.concat([
+        ...     CachedDataStats.from_df(df.filter(pl.col("subject_id") == 1)),
+        ...     CachedDataStats.from_df(df.filter(pl.col("subject_id") != 1)),
+        ... ])
+        >>> summary = S.summarize(min_seq_len=1)
+        >>> log_times = df["time_delta"].explode().log()
+        >>> summary["min"]
+        1.0
+        >>> abs(summary["mean_log"] - log_times.mean()) < 1e-12
+        True
+        >>> abs(summary["std_log"] - log_times.std()) < 1e-12
+        True
+        >>> S.malformed_subject_ids()
+        []
+
+        Statistics are saved next to the data file they summarize, and are only re-loaded if that file has not
+        changed:
+
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     fp = Path(d) / "train_0.parquet"
+        ...     df.write_parquet(fp)
+        ...     S.save(CachedDataStats.stats_fp_for(fp), fp)
+        ...     CachedDataStats.load(CachedDataStats.stats_fp_for(fp), fp).summarize(min_seq_len=1) == summary
+        ...     df.head(2).write_parquet(fp)
+        ...     CachedDataStats.load(CachedDataStats.stats_fp_for(fp), fp) is None
+        True
+        True
+    """
+
+    SEQ_LEN_STATS_SCHEMA = {
+        "seq_len": pl.UInt32,
+        "n_subjects": pl.UInt32,
+        "n_inter_event_times": pl.UInt32,
+        "min": pl.Float64,
+        "mean_log": pl.Float64,
+        "m2_log": pl.Float64,
+    }
+
+    MALFORMED_SUBJECTS_SCHEMA = {"subject_id": pl.Int64, "seq_len": pl.UInt32}
+
+    def __init__(self, seq_len_stats: pl.DataFrame, malformed_subjects: pl.DataFrame):
+        self.seq_len_stats = seq_len_stats
+        self.malformed_subjects = malformed_subjects
+
+    @staticmethod
+    def stats_fp_for(fp: Path) -> Path:
+        """Returns the file in which the statistics of the cached data file `fp` are stored.
+
+        Examples:
+            >>> CachedDataStats.stats_fp_for(Path("DL_reps/train_0.parquet"))
+            PosixPath('DL_reps/train_0.stats.json')
+        """
+        return fp.with_suffix(".stats.json")
+
+    @classmethod
+    def from_df(cls, df: pl.DataFrame | pl.LazyFrame) -> CachedDataStats:
+        """Computes the statistics of a deep learning representation dataframe, in ``time`` or
+        ``time_delta`` form."""
+        df = with_time_delta(df.lazy()).select(
+            "subject_id",
+            pl.col("dynamic_indices").list.lengths().cast(pl.UInt32).alias("seq_len"),
+            "time_delta",
+        )
+
+        log_time = pl.col("inter_event_time").log()
+        inter_event_time_stats = (
+            df.select("seq_len", pl.col("time_delta").alias("inter_event_time"))
+            .explode("inter_event_time")
+            .drop_nulls("inter_event_time")
+            .groupby("seq_len")
+            .agg(
+                pl.count().alias("n_inter_event_times"),
+                pl.col("inter_event_time").min().alias("min"),
+                log_time.mean().alias("mean_log"),
+                (log_time.var(ddof=0) * pl.count()).alias("m2_log"),
+            )
+        )
+        seq_len_stats = (
+            df.groupby("seq_len")
+            .agg(pl.count().alias("n_subjects"))
+            .join(inter_event_time_stats, on="seq_len", how="left")
+            .with_columns(pl.col("n_inter_event_times").fill_null(0))
+            .select(pl.col(c).cast(dt) for c, dt in cls.SEQ_LEN_STATS_SCHEMA.items())
+            .sort("seq_len")
+        )
+        malformed_subjects = df.filter(pl.col("time_delta").list.min() <= 0).select(
+            pl.col(c).cast(dt) for c, dt in cls.MALFORMED_SUBJECTS_SCHEMA.items()
+        )
+
+        return cls(*pl.collect_all([seq_len_stats, malformed_subjects]))
+
+    @classmethod
+    def concat(cls, stats: list[CachedDataStats]) -> CachedDataStats:
+        """Combines the statistics of several disjoint sets of subjects."""
+        return cls(
+            pl.concat([s.seq_len_stats for s in stats]),
+            pl.concat([s.malformed_subjects for s in stats]),
+        )
+
+    def summarize(self, min_seq_len: int = 0) -> dict[str, float | None]:
+        """Returns the ``min``, ``mean_log``, and ``std_log`` of the inter-event times of all subjects with at
+        least `min_seq_len` events.
+
+        The mean and standard deviation (with one delta degree of freedom) of the log inter-event times are
+        combined across sequence lengths via the pairwise update of Chan et al., so this matches computing
+        them directly over all inter-event times. Statistics which are undefined (e.g., as there are no
+        inter-event times) are `None`.
+        """
+        stats = self.seq_len_stats.filter(
+            (pl.col("seq_len") >= min_seq_len) & (pl.col("n_inter_event_times") > 0)
+        )
+
+        N = int(stats["n_inter_event_times"].sum() or 0)
+        if N == 0:
+            return {"min": None, "mean_log": None, "std_log": None}
+
+        n = pl.col("n_inter_event_times").cast(pl.Float64)
+        mean_log = (n * pl.col("mean_log")).sum() / N
+        m2_log = pl.col("m2_log").sum() + (n * (pl.col("mean_log") - mean_log) ** 2).sum()
+
+        summary = stats.select(
+            pl.col("min").min().alias("min"),
+            mean_log.alias("mean_log"),
+            (m2_log / (N - 1)).sqrt().alias("std_log") if N > 1 else pl.lit(None).alias("std_log"),
+        )
+        return {k: None if v is None else float(v) for k, v in summary.row(0, named=True).items()}
+
+    def malformed_subject_ids(self, min_seq_len: int = 0) -> list:
+        """Returns the IDs of subjects with at least `min_seq_len` events and non-positive inter-event
+        times."""
+        return self.malformed_subjects.filter(pl.col("seq_len") >= min_seq_len)["subject_id"].to_list()
+
+    def save(self, stats_fp: Path, data_fp: Path):
+        """Writes these statistics, as those of the data file `data_fp`, to `stats_fp`.
+
+        The file is written to a temporary path first and then moved into place, so concurrent readers never
+        observe a partially written file.
+        """
+        stats = {
+            "version": STATS_FORMAT_VERSION,
+            "checksum": file_checksum(data_fp),
+            "seq_len_stats": self.seq_len_stats.to_dict(as_series=False),
+            "malformed_subjects": self.malformed_subjects.to_dict(as_series=False),
+        }
+
+        tmp_fp = stats_fp.with_name(f"{stats_fp.name}.tmp.{os.getpid()}")
+        with open(tmp_fp, mode="w") as f:
+            json.dump(stats, f)
+        os.replace(tmp_fp, stats_fp)
+
+    @classmethod
+    def load(cls, stats_fp: Path, data_fp: Path) -> CachedDataStats | None:
+        """Loads the statistics in `stats_fp`, if they exist and are up to date with the data file
+        `data_fp`, returning `None` otherwise."""
+        if not stats_fp.is_file():
+            return None
+
+        with open(stats_fp) as f:
+            stats = json.load(f)
+
+        if stats.get("version") != STATS_FORMAT_VERSION or stats.get("checksum") != file_checksum(data_fp):
+            return None
+
+        seq_len_stats = pl.DataFrame(stats["seq_len_stats"], schema=cls.SEQ_LEN_STATS_SCHEMA)
+        malformed_subjects = pl.DataFrame(stats["malformed_subjects"], schema=cls.MALFORMED_SUBJECTS_SCHEMA)
+        return cls(seq_len_stats, malformed_subjects)
@@ -0,0 +1,522 @@
+"""Array-backed storage for the deep-learning representation of a dataset.
+
+The deep learning representation produced by `Dataset.build_DL_cached_representation` is doubly ragged: each
+subject has a variable number of events, and each event has a variable number of data elements. Converting
+this into nested python lists (via `polars.DataFrame.rows`) is extremely memory intensive for large cohorts.
+This module instead stores each column as a flat `numpy` value buffer plus one offset array per level of list
+nesting, so that a subject's data can be recovered with a handful of array slices.
+
+These buffers can also be written to disk as ``.npy`` files alongside a small JSON manifest, and re-opened as
+memory maps. Memory-mapped buffers are backed by the OS page cache, so all DataLoader workers and DDP ranks on
+a node that open the same files share a single copy of the data.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import shutil
+from collections.abc import Sequence
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from .cached_data_stats import file_checksum
+
+MEMMAP_MANIFEST_FN = "manifest.json"
+MEMMAP_FORMAT_VERSION = 1
+
+EVENT_COLUMNS = ("time", "time_delta", "dynamic_indices", "dynamic_values", "dynamic_measurement_indices")
+"""The deep learning representation columns which hold one element per event."""
+
+
+def flatten_list_series(s: pl.Series) -> tuple[pl.Series, np.ndarray]:
+    """Flattens one level of list nesting from `s`, returning the flattened values and the row offsets.
+
+    Null lists are treated as empty lists.
+
+    Args:
+        s: A polars series of list type.
+
+    Returns:
+        The exploded values of `s` (with no placeholders for empty or null lists) and an integer array of
+        length ``len(s) + 1`` such that the values of row ``i`` are at positions
+        ``offsets[i]:offsets[i+1]`` of the exploded values.
+
+    Examples:
+        >>> import polars as pl
+        >>> vals, offsets = flatten_list_series(pl.Series([[1, 2], [], None, [3, None]]))
+        >>> vals.to_list()
+        [1, 2, 3, None]
+        >>> offsets
+        array([0, 2, 2, 2, 4])
+    """
+    lengths = s.list.lengths().fill_null(0).to_numpy().astype(np.int64)
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # Polars emits a single null placeholder when exploding an empty or null list, so we drop those here.
+    keep = np.repeat(lengths > 0, np.maximum(lengths, 1))
+    return s.explode().filter(pl.Series(keep)), offsets
+
+
+@dataclasses.dataclass
+class RaggedColumn:
+    """A (possibly nested) ragged column stored as a flat value buffer plus per-level offset arrays.
+
+    Attributes:
+        values: The flat values of the column, across all rows and all levels of nesting.
+        offsets: A list of offset arrays, one per level of list nesting. ``offsets[0]`` maps rows to the
+            elements of the first nested level, ``offsets[1]`` maps those elements to the second level, etc.
+            Scalar columns have no offsets.
+
+    Examples:
+        >>> import polars as pl
+        >>> col = RaggedColumn.from_series(pl.Series([[[1, 2], [3]], [[4, 5, 6]]]), dtype=np.int64)
+        >>> col.values
+        array([1, 2, 3, 4, 5, 6])
+        >>> col.offsets
+        [array([0, 2, 3]), array([0, 2, 3, 6])]
+        >>> col[0]
+        [array([1, 2]), array([3])]
+        >>> col[1]
+        [array([4, 5, 6])]
+        >>> col = RaggedColumn.from_series(pl.Series([[1.0, None], None]), dtype=np.float32)
+        >>> col[0]
+        array([ 1., nan], dtype=float32)
+        >>> col[1]
+        array([], dtype=float32)
+        >>> RaggedColumn.from_series(pl.Series([3, 4]))[1]
+        4
+        >>> col = RaggedColumn.from_series(pl.Series([[[1, 2], [3], [4, 5]], [[6]]]), dtype=np.int64)
+        >>> col.get_slice(0, 1, 3)
+        [array([3]), array([4, 5])]
+        >>> col.get_slice(1, 1, 3)
+        []
+    """
+
+    values: np.ndarray
+    offsets: list[np.ndarray] = dataclasses.field(default_factory=list)
+
+    @classmethod
+    def from_series(cls, s: pl.Series, dtype: np.dtype | None = None) -> RaggedColumn:
+        """Builds a ragged column from a polars series of arbitrarily nested list type."""
+        offsets = []
+        while s.dtype == pl.List:
+            s, level_offsets = flatten_list_series(s)
+            offsets.append(level_offsets)
+
+        if s.dtype == pl.Datetime:
+            s = s.cast(pl.Datetime("us"))
+
+        # Polars may return a read-only, zero-copy view here, so we take an owned, writable copy.
+        values = np.array(s.to_numpy(), dtype=dtype)
+
+        return cls(values=values, offsets=offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets[0]) - 1 if self.offsets else len(self.values)
+
+    def __getitem__(self, idx: int) -> np.ndarray | list[np.ndarray] | object:
+        if not self.offsets:
+            val = self.values[idx]
+            return val.item() if isinstance(val, np.generic) else val
+
+        return self._get_elements(self.offsets[0][idx], self.offsets[0][idx + 1])
+
+    def get_slice(self, idx: int, start: int, end: int) -> np.ndarray | list[np.ndarray]:
+        """Returns elements ``start:end`` of the first nested level of row `idx`, as ``self[idx][start:end]``.
+
+        Only the requested elements are read, so this is much cheaper than slicing the full row when the row
+        is long (e.g., for a short task window over a subject with many events).
+        """
+        row_st, row_end = self.offsets[0][idx], self.offsets[0][idx + 1]
+        return self._get_elements(min(row_st + start, row_end), min(row_st + end, row_end))
+
+    def _get_elements(self, st: int, end: int) -> np.ndarray | list[np.ndarray]:
+        if len(self.offsets) == 1:
+            return self.values[st:end]
+        if len(self.offsets) > 2:
+            raise NotImplementedError("Only up to two levels of list nesting are supported.")
+
+        inner = self.offsets[1][st : end + 1]
+        if len(inner) == 1:
+            return []
+        return np.split(self.values[inner[0] : inner[-1]], inner[1:-1] - inner[0])
+
+    @property
+    def nbytes(self) -> int:
+        """The total number of bytes consumed by the value and offset buffers of this column."""
+        return self.values.nbytes + sum(o.nbytes for o in self.offsets)
+
+
+class ColumnarCachedData:
+    """A row-indexable, array-backed container for a deep learning representation dataframe.
+
+    Indexing this object returns a tuple of per-column values for the requested row, in the same column
+    order as `columns`, which mirrors the output of `polars.DataFrame.rows`. Unlike that output, however, list
+    columns are returned as `numpy` array slices (or lists of slices for doubly nested columns) of shared flat
+    buffers.
+
+    Args:
+        columns: A dictionary from column name to the `RaggedColumn` storing that column's data. All columns
+            must have the same number of rows.
+
+    Raises:
+        ValueError: If the passed columns differ in their number of rows.
+
+    Examples:
+        >>> import polars as pl
+        >>> from datetime import datetime
+        >>> df = pl.DataFrame({
+        ...     "start_time": [datetime(2020, 1, 1), datetime(2021, 1, 1)],
+        ...     "time_delta": [[1.0, 2.0], [3.0]],
+        ...     "dynamic_indices": [[[1, 2], [3]], [[4]]],
+        ...     "dynamic_values": [[[None, 0.5], None], [[1.5]]],
+        ...     "static_indices": [[1], None],
+        ... })
+        >>> data = ColumnarCachedData.from_df(df)
+        >>> len(data)
+        2
+        >>> data.columns
+        ['start_time', 'time_delta', 'dynamic_indices', 'dynamic_values', 'static_indices']
+        >>> start_time, time_delta, dynamic_indices, dynamic_values, static_indices = data[0]
+        >>> start_time
+        datetime.datetime(2020, 1, 1, 0, 0)
+        >>> time_delta
+        array([1., 2.])
+        >>> dynamic_indices
+        [array([1, 2]), array([3])]
+        >>> dynamic_values
+        [array([nan, 0.5], dtype=float32), array([], dtype=float32)]
+        >>> data[1][-1]
+        array([], dtype=int64)
+    """
+
+    COLUMN_DTYPES = {
+        "time_delta": np.float64,
+        "time": np.float64,
+        "dynamic_values": np.float32,
+        "dynamic_indices": np.int64,
+        "dynamic_measurement_indices": np.int64,
+        "static_indices": np.int64,
+        "static_measurement_indices": np.int64,
+    }
+    """The storage dtypes used for the known deep learning representation columns."""
+
+    def __init__(self, columns: dict[str, RaggedColumn], memmap_dir: Path | None = None):
+        lengths = {k: len(v) for k, v in columns.items()}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"All columns must have the same number of rows! Got {lengths}")
+
+        self.data = columns
+        self.columns = list(columns.keys())
+        self.memmap_dir = memmap_dir
+        self._n_rows = next(iter(lengths.values())) if lengths else 0
+
+    def __getstate__(self) -> dict:
+        # If we are backed by memory maps, we pickle only the directory, so that spawned workers re-open the
+        # shared files rather than receiving a private copy of the data.
+        if self.memmap_dir is not None:
+            return {"memmap_dir": self.memmap_dir}
+        return self.__dict__
+
+    def __setstate__(self, state: dict):
+        if "data" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(self.load(state["memmap_dir"]).__dict__)
+
+    @staticmethod
+    def memmap_dir_for(fp: Path) -> Path:
+        """Returns the directory in which the memory-mappable version of the parquet file `fp` is stored.
+
+        Examples:
+            >>> ColumnarCachedData.memmap_dir_for(Path("DL_reps/train_0.parquet"))
+            PosixPath('DL_reps/train_0.memmap')
+        """
+        return fp.with_suffix(".memmap")
+
+    def save(self, memmap_dir: Path, do_overwrite: bool = False, source_fp: Path | None = None):
+        """Writes the buffers of this object to `memmap_dir` as ``.npy`` files plus a JSON manifest.
+
+        The files are written to a temporary directory first and then moved into place, so concurrent readers
+        never observe a partially written directory. An existing `memmap_dir` is moved aside rather than
+        deleted in place and only removed once the new directory is in place; readers that have already opened
+        its buffers keep them, as the files persist while they are mapped. Concurrent writers of the same
+        directory must be serialized by the caller (see `PytorchDataset`).
+
+        Args:
+            memmap_dir: The directory in which the buffers should be written.
+            do_overwrite: Whether or not to overwrite `memmap_dir` if it already exists.
+            source_fp: The file from which this data was read, if any. Its checksum is recorded in the
+                manifest, so that `is_current` can detect when that file has since been rewritten.
+
+        Raises:
+            FileExistsError: If `memmap_dir` exists and `do_overwrite` is `False`.
+            TypeError: If any column has an object dtype, which can't be memory mapped.
+
+        Examples:
+            >>> import tempfile
+            >>> df = pl.DataFrame({"subject_id": [1, 2], "time": [[0.0, 2.0], [0.0]]})
+            >>> data = ColumnarCachedData.from_df(df)
+            >>> with tempfile.TemporaryDirectory() as d:
+            ...     data.save(Path(d) / "train_0.memmap")
+            ...     sorted(fp.name for fp in (Path(d) / "train_0.memmap").iterdir())
+            ...     reloaded = ColumnarCachedData.load(Path(d) / "train_0.memmap")
+            ...     type(reloaded.data["time"].values).__name__
+            ...     reloaded[0]
+            ['manifest.json', 'subject_id.npy', 'time.npy', 'time.offsets.0.npy']
+            'memmap'
+            (1, memmap([0., 2.]))
+            >>> with tempfile.TemporaryDirectory() as d:
+            ...     data.save(Path(d))
+            Traceback (most recent call last):
+                ...
+            FileExistsError: ... exists and do_overwrite is False!
+        """
+        if memmap_dir.exists():
+            if not do_overwrite:
+                raise FileExistsError(f"{memmap_dir} exists and do_overwrite is {do_overwrite}!")
+
+        manifest = {"version": MEMMAP_FORMAT_VERSION, "n_rows": len(self), "columns": {}}
+        if source_fp is not None:
+            manifest["checksum"] = file_checksum(source_fp)
+
+        tmp_dir = memmap_dir.with_name(f"{memmap_dir.name}.tmp.{os.getpid()}")
+        old_dir = memmap_dir.with_name(f"{memmap_dir.name}.old.{os.getpid()}")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for c in self.columns:
+                col = self.data[c]
+                if col.values.dtype == object:
+                    raise TypeError(f"Column {c} has an object dtype and can't be memory mapped!")
+
+                np.save(tmp_dir / f"{c}.npy", col.values, allow_pickle=False)
+                for lvl, offsets in enumerate(col.offsets):
+                    np.save(tmp_dir / f"{c}.offsets.{lvl}.npy", offsets, allow_pickle=False)
+
+                manifest["columns"][c] = {"dtype": str(col.values.dtype), "n_levels": len(col.offsets)}
+
+            with open(tmp_dir / MEMMAP_MANIFEST_FN, mode="w") as f:
+                json.dump(manifest, f)
+
+            if memmap_dir.exists():
+                os.replace(memmap_dir, old_dir)
+            os.replace(tmp_dir, memmap_dir)
+        finally:
+            for d in (tmp_dir, old_dir):
+                if d.exists():
+                    shutil.rmtree(d)
+
+    @staticmethod
+    def is_current(memmap_dir: Path, source_fp: Path) -> bool:
+        """Returns whether `memmap_dir` holds data saved from the current contents of `source_fp`.
+
+        Examples:
+            >>> import tempfile
+            >>> with tempfile.TemporaryDirectory() as d:
+            ...     fp, memmap_dir = Path(d) / "train_0.parquet", Path(d) / "train_0.memmap"
+            ...     ColumnarCachedData.is_current(memmap_dir, fp)
+            ...     pl.DataFrame({"subject_id": [1, 2]}).write_parquet(fp)
+            ...     ColumnarCachedData.from_df(pl.read_parquet(fp)).save(memmap_dir, source_fp=fp)
+            ...     ColumnarCachedData.is_current(memmap_dir, fp)
+            ...     pl.DataFrame({"subject_id": [3]}).write_parquet(fp)
+            ...     ColumnarCachedData.is_current(memmap_dir, fp)
+            False
+            True
+            False
+        """
+        manifest_fp = memmap_dir / MEMMAP_MANIFEST_FN
+        if not manifest_fp.is_file():
+            return False
+
+        with open(manifest_fp) as f:
+            manifest = json.load(f)
+
+        return manifest.get("version") == MEMMAP_FORMAT_VERSION and manifest.get("checksum") == file_checksum(
+            source_fp
+        )
+
+    @classmethod
+    def load(cls, memmap_dir: Path) -> ColumnarCachedData:
+        """Opens the buffers written by `save` in `memmap_dir` as read-only memory maps.
+
+        Raises:
+            FileNotFoundError: If there is no manifest in `memmap_dir`.
+            ValueError: If the manifest was written with an unsupported format version.
+        """
+        manifest_fp = memmap_dir / MEMMAP_MANIFEST_FN
+        if not manifest_fp.is_file():
+            raise FileNotFoundError(f"No memory-mapped data manifest found at {manifest_fp}!")
+
+        with open(manifest_fp) as f:
+            manifest = json.load(f)
+
+        if manifest["version"] != MEMMAP_FORMAT_VERSION:
+            raise ValueError(
+                f"Memory-mapped data at {memmap_dir} has version {manifest['version']}; "
+                f"expected {MEMMAP_FORMAT_VERSION}."
+            )
+
+        columns = {}
+        for c, col_info in manifest["columns"].items():
+            columns[c] = RaggedColumn(
+                values=np.load(memmap_dir / f"{c}.npy", mmap_mode="r"),
+                offsets=[
+                    np.load(memmap_dir / f"{c}.offsets.{lvl}.npy", mmap_mode="r")
+                    for lvl in range(col_info["n_levels"])
+                ],
+            )
+
+        return cls(columns, memmap_dir=memmap_dir)
+
+    @classmethod
+    def from_df(cls, df: pl.DataFrame) -> ColumnarCachedData:
+        """Converts a deep learning representation dataframe into columnar storage."""
+        return cls(
+            {c: RaggedColumn.from_series(df[c], dtype=cls.COLUMN_DTYPES.get(c, None)) for c in df.columns}
+        )
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def __getitem__(self, idx: int) -> tuple:
+        return tuple(self.data[c][idx] for c in self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        """The total number of bytes consumed by the buffers of all columns."""
+        return sum(c.nbytes for c in self.data.values())
+
+
+class ColumnarCachedDataView:
+    """A zero-copy view over a selection of rows drawn from one or more `ColumnarCachedData` shards.
+
+    If the underlying shards store absolute event times in a ``time`` column (as the raw deep learning
+    representation does) rather than ``time_delta``, the view converts them on access to match the format
+    `PytorchDataset` produces: ``start_time`` is shifted by the (integral) minute offset of the first event,
+    and ``time_delta`` holds the difference between each event's time and the next event's time, with the last
+    event's time delta set to 1.
+
+    A view can also restrict each of its rows to a window of that row's events (e.g., the events within the
+    time range of a task sample), in which case only those events are read from the per-event columns (see
+    `EVENT_COLUMNS`), and can carry additional per-row columns (e.g., task labels) which are not stored in the
+    shards. This allows many task samples to be drawn from the same subject without copying its data.
+
+    Args:
+        shards: The shards from which rows are drawn.
+        shard_idx: For each row of the view, the index into `shards` of the shard containing it.
+        shard_row_idx: For each row of the view, the index of that row within its shard.
+        drop_columns: Any columns of the shards that should be omitted from the view.
+        event_start_idx: If not `None`, for each row of the view, the index of the first event of that row to
+            include.
+        event_end_idx: If not `None`, for each row of the view, the index one past the last event of that row
+            to include. Must be specified if and only if `event_start_idx` is.
+        extra_columns: Additional columns of the view, as arrays with one value per row of the view.
+
+    Raises:
+        ValueError: If the shards have different columns, the row index arrays have different lengths, or
+            only one of `event_start_idx` and `event_end_idx` is specified.
+
+    Examples:
+        >>> from datetime import datetime
+        >>> shard_0 = ColumnarCachedData.from_df(pl.DataFrame({
+        ...     "start_time": [datetime(2020, 1, 1), datetime(2020, 1, 2)],
+        ...     "time": [[0.0, 2.0, 5.0], [10.5, 11.5]],
+        ... }))
+        >>> shard_1 = ColumnarCachedData.from_df(pl.DataFrame({
+        ...     "start_time": [datetime(2020, 1, 3)],
+        ...     "time": [[1.0]],
+        ... }))
+        >>> view = ColumnarCachedDataView([shard_0, shard_1], np.array([1, 0]), np.array([0, 1]))
+        >>> len(view)
+        2
+        >>> view.columns
+        ['start_time', 'time_delta']
+        >>> view[0]
+        (datetime.datetime(2020, 1, 3, 0, 1), array([1.]))
+        >>> view[1]
+        (datetime.datetime(2020, 1, 2, 0, 10), array([1., 1.]))
+        >>> view = ColumnarCachedDataView(
+        ...     [shard_0], np.array([0, 0]), np.array([0, 0]),
+        ...     event_start_idx=np.array([0, 1]), event_end_idx=np.array([2, 3]),
+        ...     extra_columns={"label": np.array([True, False])},
+        ... )
+        >>> view.columns
+        ['start_time', 'time_delta', 'label']
+        >>> view[0]
+        (datetime.datetime(2020, 1, 1, 0, 0), array([2., 1.]), True)
+        >>> view[1]
+        (datetime.datetime(2020, 1, 1, 0, 2), array([3., 1.]), False)
+    """
+
+    def __init__(
+        self,
+        shards: list[ColumnarCachedData],
+        shard_idx: np.ndarray,
+        shard_row_idx: np.ndarray,
+        drop_columns: Sequence[str] = (),
+        event_start_idx: np.ndarray | None = None,
+        event_end_idx: np.ndarray | None = None,
+        extra_columns: dict[str, np.ndarray] | None = None,
+    ):
+        if any(s.columns != shards[0].columns for s in shards[1:]):
+            raise ValueError("All shards must have the same columns!")
+        if len(shard_idx) != len(shard_row_idx):
+            raise ValueError(
+                f"shard_idx and shard_row_idx must have the same length! Got {len(shard_idx)} and "
+                f"{len(shard_row_idx)}"
+            )
+        if (event_start_idx is None) != (event_end_idx is None):
+            raise ValueError("event_start_idx and event_end_idx must be specified together!")
+
+        self.shards = shards
+        self.shard_idx = np.asarray(shard_idx)
+        self.shard_row_idx = np.asarray(shard_row_idx)
+
+        self.event_start_idx = None if event_start_idx is None else np.asarray(event_start_idx)
+        self.event_end_idx = None if event_end_idx is None else np.asarray(event_end_idx)
+        self.extra_columns = (
+            {} if extra_columns is None else {k: np.asarray(v) for k, v in extra_columns.items()}
+        )
+
+        self.derive_time_delta = "time" in shards[0].columns
+        self.columns = [
+            ("time_delta" if c == "time" else c) for c in shards[0].columns if c not in drop_columns
+        ] + list(self.extra_columns)
+
+    def __len__(self) -> int:
+        return len(self.shard_idx)
+
+    def __getitem__(self, idx: int) -> tuple:
+        shard = self.shards[self.shard_idx[idx]]
+        shard_row_idx = self.shard_row_idx[idx]
+
+        if self.event_start_idx is None:
+            row = dict(zip(shard.columns, shard[shard_row_idx]))
+        else:
+            st, end = self.event_start_idx[idx], self.event_end_idx[idx]
+            row = {
+                c: (col.get_slice(shard_row_idx, st, end) if c in EVENT_COLUMNS else col[shard_row_idx])
+                for c, col in shard.data.items()
+            }
+
+        for c, vals in self.extra_columns.items():
+            val = vals[idx]
+            row[c] = val.item() if isinstance(val, np.generic) else val
+
+        if self.derive_time_delta:
+            time = row.pop("time")
+            if len(time) > 0:
+                row["start_time"] = row["start_time"] + timedelta(minutes=int(time[0]))
+            time_delta = np.empty(len(time), dtype=np.float64)
+            time_delta[:-1] = np.diff(time)
+            time_delta[-1:] = 1
+            row["time_delta"] = time_delta
+
+        return tuple(row[c] for c in self.columns)
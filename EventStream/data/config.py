@@ -781,6 +781,30 @@ class SubsequenceSamplingStrategy(StrEnum):
     """
 
 
+class CachedDataStorageMode(StrEnum):
+    """Enumeration for how a `PytorchDataset` holds its deep learning representation in memory."""
+
+    ROWS = enum.auto()
+    """Store each subject's data as a tuple of (nested) python lists.
+
+    This is the default.
+    """
+
+    COLUMNAR = enum.auto()
+    """Store each column as a flat `numpy` array plus offset arrays for each level of list nesting.
+
+    This uses far less memory than `ROWS` for large datasets, and items are returned as `numpy` array slices.
+    """
+
+    MEMMAP = enum.auto()
+    """Like `COLUMNAR`, but the arrays are memory-mapped from ``.npy`` files next to the parquet files.
+
+    The memory maps are shared through the OS page cache by all processes on a node that open them, so
+    DataLoader workers and DDP ranks do not each hold a private copy of the data. Missing memory-mapped files
+    are built from the parquet files on first use.
+    """
+
+
 @hydra_dataclass
 class PytorchDatasetConfig(JSONableMixin):
     """Configuration options for building a PyTorch dataset from a `Dataset`.
@@ -813,12 +837,19 @@ class PytorchDatasetConfig(JSONableMixin):
         do_include_start_time_min: Whether or not to include the start time of the individual's sequence in
             minutes since the epoch (1/1/1970) in the output data. This is necessary during generation, and
             not used anywhere else currently.
+        cached_data_storage: How the deep learning representation should be stored in memory after loading.
+            See `CachedDataStorageMode` for options.
+        do_pad_to_shape_buckets: If True, collated batches are padded to the next power of two sequence
+            length (capped at `max_seq_len`), number of dynamic data elements, and number of static data
+            elements, rather than to the largest in the batch. This limits the number of distinct batch
+            shapes, so that models compiled for static input shapes need only be recompiled a few times.
 
     Raises:
-        ValueError: If 'seq_padding_side' is not a valid value; If 'min_seq_len' is not a non-negative
-            integer; If 'max_seq_len' is not an integer greater or equal to 'min_seq_len'; If
-            'train_subset_seed' is not None when 'train_subset_size' is None or 'FULL'; If 'train_subset_size'
-            is negative when it's an integer; If 'train_subset_size' is not within (0, 1) when it's a float.
+        ValueError: If 'seq_padding_side' or 'cached_data_storage' is not a valid value; If 'min_seq_len' is
+            not a non-negative integer; If 'max_seq_len' is not an integer greater or equal to 'min_seq_len';
+            If 'train_subset_seed' is not None when 'train_subset_size' is None or 'FULL'; If
+            'train_subset_size' is negative when it's an integer; If 'train_subset_size' is not within (0, 1)
+            when it's a float.
         TypeError: If 'train_subset_size' is of unrecognized type.
 
     Examples:
@@ -880,9 +911,17 @@ class PytorchDatasetConfig(JSONableMixin):
     do_include_subject_id: bool = False
     do_include_start_time_min: bool = False
 
+    cached_data_storage: CachedDataStorageMode = CachedDataStorageMode.ROWS
+
+    do_pad_to_shape_buckets: bool = False
+
     def __post_init__(self):
         if self.seq_padding_side not in SeqPaddingSide.values():
             raise ValueError(f"seq_padding_side invalid; must be in {', '.join(SeqPaddingSide.values())}")
+        if self.cached_data_storage not in CachedDataStorageMode.values():
+            raise ValueError(
+                f"cached_data_storage invalid; must be in {', '.join(CachedDataStorageMode.values())}"
+            )
         if type(self.min_seq_len) is not int or self.min_seq_len < 0:
             raise ValueError(f"min_seq_len must be a non-negative integer; got {self.min_seq_len}")
         if type(self.max_seq_len) is not int or self.max_seq_len < self.min_seq_len:
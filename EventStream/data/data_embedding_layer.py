@@ -346,11 +346,10 @@ class DataEmbeddingLayer(torch.nn.Module):
                     [0.3333, 0.1667, 0.3333, 0.1667, 0.0000]])
         """
 
-        one_hot = torch.nn.functional.one_hot(measurement_indices)
-
-        normalization_vals = 1.0 / one_hot.sum(dim=-2)
-
-        normalization_vals = torch.gather(normalization_vals, dim=-1, index=measurement_indices)
+        # Occurrences are counted by comparing each position with every other in its row, rather than with a
+        # one-hot encoding sized by the largest observed index, so shapes don't depend on the data values.
+        counts = (measurement_indices.unsqueeze(-1) == measurement_indices.unsqueeze(-2)).sum(dim=-1)
+        normalization_vals = 1.0 / counts
 
         # Make sure that the zero index is not counted in the normalization
         normalization_vals = torch.where(measurement_indices == 0, 0, normalization_vals)
@@ -493,10 +492,11 @@ class DataEmbeddingLayer(torch.nn.Module):
             AssertionError: If `indices.max()` is greater than or equal to `self.n_total_embeddings`.
             ValueError: If `self.embedding_mode` is not a valid `EmbeddingMode`.
         """
-        torch._assert(
-            indices.max() < self.n_total_embeddings,
-            f"Invalid embedding! {indices.max()} >= {self.n_total_embeddings}",
-        )
+        if not torch.compiler.is_compiling():
+            torch._assert(
+                indices.max() < self.n_total_embeddings,
+                f"Invalid embedding! {indices.max()} >= {self.n_total_embeddings}",
+            )
         match self.embedding_mode:
             case EmbeddingMode.JOINT:
                 return self._joint_embed(indices, measurement_indices, values, values_mask)
@@ -514,7 +514,7 @@ class DataEmbeddingLayer(torch.nn.Module):
         return self._embed(batch["static_indices"], batch["static_measurement_indices"])
 
     def _split_batch_into_measurement_index_buckets(
-        self, batch: PytorchBatch
+        self, batch: PytorchBatch, measurement_bucket: int | None = None
     ) -> tuple[torch.Tensor, torch.Tensor]:
         """Splits the batch into groups of measurement indices.
 
@@ -525,6 +525,8 @@ class DataEmbeddingLayer(torch.nn.Module):
 
         Args:
             batch: A batch of data.
+            measurement_bucket: If not `None`, only the masks for the measurement group at this index are
+                produced, and the returned tensors have a group dimension of size 1.
 
         Returns:
             A tuple of tensors that contain the categorical mask and values mask for each group.
@@ -538,6 +540,8 @@ class DataEmbeddingLayer(torch.nn.Module):
         categorical_masks = []
         numerical_masks = []
         for i, meas_index_group in enumerate(self.split_by_measurement_indices):
+            if measurement_bucket is not None and i != measurement_bucket:
+                continue
             if len(meas_index_group) == 0 and i > 0:
                 raise ValueError(
                     f"Empty measurement index group: {meas_index_group} at index {i}! "
@@ -571,17 +575,20 @@ class DataEmbeddingLayer(torch.nn.Module):
 
         return torch.stack(categorical_masks, dim=-2), torch.stack(numerical_masks, dim=-2)
 
-    def _dynamic_embedding(self, batch: PytorchBatch) -> torch.Tensor:
+    def _dynamic_embedding(self, batch: PytorchBatch, measurement_bucket: int | None = None) -> torch.Tensor:
         """Returns the embedding of the dynamic features of the input batch.
 
         Args:
             batch: The input batch to be embedded.
+            measurement_bucket: If not `None`, only the measurement group at this index is embedded.
         """
         batch_size, sequence_length, num_data_elements = batch["dynamic_values_mask"].shape
         out_shape = (batch_size, sequence_length, self.out_dim)
 
         if self.split_by_measurement_indices:
-            categorical_mask, numerical_mask = self._split_batch_into_measurement_index_buckets(batch)
+            categorical_mask, numerical_mask = self._split_batch_into_measurement_index_buckets(
+                batch, measurement_bucket=measurement_bucket
+            )
             _, _, num_measurement_buckets, _ = categorical_mask.shape
             out_shape = (batch_size, sequence_length, num_measurement_buckets, self.out_dim)
 
@@ -617,11 +624,15 @@ class DataEmbeddingLayer(torch.nn.Module):
         # Reshape back out into the original shape. Testing ensures these reshapes reflect original structure
         return embedded.view(*out_shape)
 
-    def forward(self, batch: PytorchBatch) -> torch.Tensor:
+    def forward(self, batch: PytorchBatch, measurement_bucket: int | None = None) -> torch.Tensor:
         """Returns the final embeddings of the values in the batch.
 
         Args:
             batch: The input batch to be embedded.
+            measurement_bucket: If not `None`, only the measurement group at this index of
+                `split_by_measurement_indices` is embedded, and the output has a measurement bucket dimension
+                of size 1. The result is identical to the corresponding slice of the full output. This is used
+                in generation, where dependency graph elements are filled in one at a time.
 
         Returns:
             The final embeddings. These will either be of shape (batch_size, sequence_length, out_dim) or
@@ -632,7 +643,9 @@ class DataEmbeddingLayer(torch.nn.Module):
             AssertionError: If `indices.max()` is greater than or equal to `self.n_total_embeddings`.
             ValueError: If `self.embedding_mode` is not a valid `EmbeddingMode`, or if
                 `split_by_measurement_indices` is not `None` and there either there is an empty measurement
-                group beyond the first or there is an invalid specified group mode.
+                group beyond the first or there is an invalid specified group mode, or if
+                `measurement_bucket` is specified but is not a valid index into
+                `split_by_measurement_indices`.
 
         Examples:
             >>> import torch
@@ -689,8 +702,24 @@ class DataEmbeddingLayer(torch.nn.Module):
             >>> out = L(batch)
             >>> out.shape # batch, seq_len, dependency graph length (split_by_measruement_indices), out_dim
             torch.Size([2, 3, 2, 10])
+            >>> out_bucket = L(batch, measurement_bucket=1)
+            >>> out_bucket.shape
+            torch.Size([2, 3, 1, 10])
+            >>> torch.allclose(out_bucket, out[:, :, 1:2])
+            True
+            >>> L(batch, measurement_bucket=2)
+            Traceback (most recent call last):
+                ...
+            ValueError: measurement_bucket must be in [0, 2) for this layer; got 2
         """
-        embedded = self._dynamic_embedding(batch)
+        if measurement_bucket is not None:
+            n_buckets = len(self.split_by_measurement_indices or [])
+            if not (0 <= measurement_bucket < n_buckets):
+                raise ValueError(
+                    f"measurement_bucket must be in [0, {n_buckets}) for this layer; got {measurement_bucket}"
+                )
+
+        embedded = self._dynamic_embedding(batch, measurement_bucket=measurement_bucket)
         # embedded is of shape (batch_size, sequence_length, out_dim) or of shape
         # (batch_size, sequence_length, num_measurement_buckets, out_dim)
 
@@ -10,8 +10,16 @@ import abc
 import copy
 import itertools
 import json
+import multiprocessing
 from collections import defaultdict
-from collections.abc import Hashable, Sequence
+from collections.abc import Hashable, Iterator, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from pathlib import Path
 from typing import Any, Generic, TypeVar
 
@@ -23,6 +31,7 @@ from plotly.graph_objs._figure import Figure
 from tqdm.auto import tqdm
 
 from ..utils import lt_count_or_proportion
+from .columnar_storage import ColumnarCachedData
 from .config import (
     DatasetConfig,
     DatasetSchema,
@@ -57,6 +66,8 @@ class DatasetBase(
             built from source via the extraction pipeline defined in `input_schema`.
         input_schema: The schema configuration object to define the extraction pipeline for pulling raw data
             from source and produce the `subjects_df`, `events_df`, `dynamic_measurements_df` input view.
+        lazy: Keyword only; if passed with a value evaluating to `True`, then `dynamic_measurements_df` is
+            processed out-of-core (see `lazy`).
     """
 
     _PICKLER: str = "dill"
@@ -72,6 +83,12 @@ class DatasetBase(
     ]
     """Attributes that are saved via separate files, and will be deleted before pickling."""
 
+    lazy: bool = False
+    """Whether `dynamic_measurements_df` is kept as a lazily evaluated query over files in `config.save_dir`
+    rather than in memory, so that cohorts whose measurements do not fit in memory can be pre-processed and
+    cached for deep learning. In this mode, the measurements are only ever materialized a chunk at a time,
+    save for describing, visualizing, or flattening the dataset, which are not supported."""
+
     DF_SAVE_FORMAT: str = "parquet"
     """The save format for internal dataframes in this dataset."""
 
@@ -345,13 +362,26 @@ class DatasetBase(
     @classmethod
     @abc.abstractmethod
     def _read_df(cls, fp: Path, **kwargs) -> DF_T:
-        """Reads a dataframe from `fp`."""
+        """Reads a dataframe from `fp`, lazily if `lazy` is passed as a keyword argument that is `True`."""
         raise NotImplementedError
 
     @classmethod
     @abc.abstractmethod
     def _write_df(cls, df: DF_T, fp: Path, **kwargs):
-        """Writes `df` to `fp`."""
+        """Writes `df` to `fp`, streaming it if `do_stream` is passed as a keyword argument that is `True`."""
+        raise NotImplementedError
+
+    @classmethod
+    @abc.abstractmethod
+    def _write_memmap_df(cls, df: DF_T, memmap_dir: Path, **kwargs):
+        """Writes `df` to `memmap_dir` in a memory-mappable, array-backed format."""
+        raise NotImplementedError
+
+    @classmethod
+    @abc.abstractmethod
+    def _write_DL_stats(cls, df: DF_T, fp: Path, **kwargs):
+        """Writes the summary statistics of the deep-learning representation `df`, stored in `fp`, next to
+        `fp`."""
         raise NotImplementedError
 
     @property
@@ -402,7 +432,7 @@ class DatasetBase(
         if (not hasattr(self, "_dynamic_measurements_df")) or self._dynamic_measurements_df is None:
             dynamic_measurements_fp = self.dynamic_measurements_fp(self.config.save_dir)
             print(f"Loading dynamic_measurements from {dynamic_measurements_fp}...")
-            self._dynamic_measurements_df = self._read_df(dynamic_measurements_fp)
+            self._dynamic_measurements_df = self._read_df(dynamic_measurements_fp, lazy=self.lazy)
 
         return self._dynamic_measurements_df
 
@@ -506,7 +536,12 @@ class DatasetBase(
 
         self._write_df(self.subjects_df, subjects_fp, do_overwrite=do_overwrite)
         self._write_df(self.events_df, events_fp, do_overwrite=do_overwrite)
-        self._write_df(self.dynamic_measurements_df, dynamic_measurements_fp, do_overwrite=do_overwrite)
+        self._write_df(
+            self.dynamic_measurements_df,
+            dynamic_measurements_fp,
+            do_overwrite=do_overwrite,
+            do_stream=self.lazy,
+        )
 
     def __init__(
         self,
@@ -521,6 +556,8 @@ class DatasetBase(
 
         if "do_overwrite" in kwargs:
             self.do_overwrite = kwargs["do_overwrite"]
+        if "lazy" in kwargs:
+            self.lazy = kwargs["lazy"]
 
         if (
             subjects_df is None or events_df is None or dynamic_measurements_df is None
@@ -703,6 +740,133 @@ class DatasetBase(
 
         self.split_subjects = {k: set(v) for k, v in zip(split_names, subjects_per_split)}
 
+    @TimeableMixin.TimeAs
+    def append(
+        self,
+        subjects_df: DF_T | None = None,
+        events_df: DF_T | None = None,
+        dynamic_measurements_df: DF_T | None = None,
+        input_schema: DatasetSchema | None = None,
+        seed: int = 1,
+    ) -> dict[str, set[int]]:
+        """Appends new subjects to this fit dataset, pre-processing them with the already fit parameters.
+
+        The new data, specified either directly by dataframes or via an extraction pipeline as in the
+        constructor, is validated, aggregated, and filtered as it would be in a full build, then transformed
+        with the fit measurement configs (vocabularies, outlier detectors, and normalizers are not re-fit).
+        Subject, event, and measurement IDs are local to the new data; they are shifted past those already
+        in use before the new data is appended to the internal dataframes. Each new subject is assigned to a
+        split at random with probability proportional to that split's current size, but deterministically
+        given its (shifted) subject ID and `seed`, so the assignment does not depend on which other subjects
+        are appended alongside it. Event types not yet seen are retained in `events_df` but are not added to
+        the (fit) event type vocabulary.
+
+        Only the new subjects then need to be cached; to do so, pass the returned subject IDs to the
+        ``subject_ids`` argument of `cache_deep_learning_representation` and `cache_flat_representation`.
+
+        Args:
+            subjects_df: The subjects dataframe of the new data.
+            events_df: The events dataframe of the new data.
+            dynamic_measurements_df: The dynamic measurements dataframe of the new data.
+            input_schema: The schema to extract the new data from source, if the dataframes are not specified.
+            seed: The seed governing the assignment of new subjects to splits.
+
+        Returns:
+            The IDs of the appended subjects (those which remain after filtering), by split.
+
+        Raises:
+            ValueError: If this dataset has not been fit or split, or if (given `input_schema`) any new
+                subject already exists in this dataset, as appending events to existing subjects is not
+                supported.
+        """
+        if not self._is_fit:
+            raise ValueError("Can't append to a dataset that has not been fit!")
+        if not self.split_subjects:
+            raise ValueError("Can't append to a dataset that has not been split!")
+
+        new = type(self)(
+            config=self.config,
+            subjects_df=subjects_df,
+            events_df=events_df,
+            dynamic_measurements_df=dynamic_measurements_df,
+            input_schema=input_schema,
+        )
+
+        if input_schema is not None:
+            subject_id_col = input_schema.static.subject_id_col
+            existing_subjects = set(new.subjects_df[subject_id_col]) & set(self.subjects_df[subject_id_col])
+            if existing_subjects:
+                raise ValueError(
+                    f"{len(existing_subjects)} subjects to append already exist (e.g., "
+                    f"{sorted(existing_subjects)[:5]}); appending events to existing subjects is not "
+                    "supported!"
+                )
+
+        new._filter_subjects()
+        new._add_time_dependent_measurements()
+        new.inferred_measurement_configs = self.inferred_measurement_configs
+        new._is_fit = True
+        new.transform_measurements()
+
+        self._shift_appended_ids(new)
+        new._update_subject_event_properties()
+
+        unseen_event_types = set(new.event_types) - set(self.event_types)
+        if unseen_event_types:
+            print(f"WARNING: Appended event types {sorted(unseen_event_types)} are not in the vocabulary!")
+
+        split_names = sorted(self.split_subjects)
+        split_sizes = np.array([len(self.split_subjects[sp]) for sp in split_names])
+        split_bounds = split_sizes.cumsum() / split_sizes.sum()
+
+        new_split_subjects = {sp: set() for sp in split_names}
+        for subject_id in sorted(new.subject_ids):
+            draw = np.random.default_rng([seed, int(subject_id)]).random()
+            split_idx = min(int(np.searchsorted(split_bounds, draw, side="right")), len(split_names) - 1)
+            new_split_subjects[split_names[split_idx]].add(subject_id)
+
+        self.subjects_df = self._concat_dfs([self.subjects_df, new.subjects_df])
+        self.events_df = self._concat_dfs([self.events_df, new.events_df])
+        self.dynamic_measurements_df = self._concat_dfs(
+            [self.dynamic_measurements_df, new.dynamic_measurements_df]
+        )
+
+        self.subject_ids.update(new.subject_ids)
+        self.n_events_per_subject.update(new.n_events_per_subject)
+        for sp, subjects in new_split_subjects.items():
+            self.split_subjects[sp].update(subjects)
+
+        return new_split_subjects
+
+    @abc.abstractmethod
+    def _shift_appended_ids(self, new: "DatasetBase"):
+        """Shifts the IDs in the dataframes of `new` past those in use in this dataset, in place.
+
+        The ID columns of both datasets' dataframes are also cast to a shared type, so they can be
+        concatenated.
+        """
+        raise NotImplementedError("This method must be implemented by a subclass.")
+
+    @abc.abstractmethod
+    def _partition_by_subjects(
+        self, subject_partitions: dict[str, Sequence[int]]
+    ) -> Iterator[tuple[str, tuple[DF_T, DF_T, DF_T]]]:
+        """Partitions the internal dataframes by subject, in a single pass over each.
+
+        Partitions are materialized lazily, as they are iterated over, so that only those in use are held in
+        memory at once.
+
+        Args:
+            subject_partitions: A mapping from partition name to the IDs of the subjects in that partition.
+                Subjects must be in at most one partition; those in none are omitted from the output.
+
+        Yields:
+            Tuples of each partition name, in the order of `subject_partitions`, and that partition's
+            subjects, events, and dynamic measurements dataframes, in that order. Partitions with no data are
+            included, with empty dataframes.
+        """
+        raise NotImplementedError("This method must be implemented by a subclass.")
+
     @classmethod
     @abc.abstractmethod
     def _filter_col_inclusion(cls, df: DF_T, col_inclusion_targets: dict[str, bool | Sequence[Any]]) -> DF_T:
@@ -758,7 +922,7 @@ class DatasetBase(
         return self._filter_col_inclusion(self.dynamic_measurements_df, {"event_id": list(event_ids)})
 
     @TimeableMixin.TimeAs
-    def preprocess(self):
+    def preprocess(self, num_workers: int = 1):
         """Fits all pre-processing parameters over the train set, then transforms all observations.
 
         This entails the following steps:
@@ -768,10 +932,13 @@ class DatasetBase(
            in the events dataframe.
         3. Next, fit all pre-processing parameters over the observed measurements.
         4. Finally, transform all data via the fit pre-processing parameters.
+
+        Args:
+            num_workers: How many threads to use to fit measurements concurrently (see `fit_measurements`).
         """
         self._filter_subjects()
         self._add_time_dependent_measurements()
-        self.fit_measurements()
+        self.fit_measurements(num_workers=num_workers)
         self.transform_measurements()
 
     @TimeableMixin.TimeAs
@@ -820,14 +987,27 @@ class DatasetBase(
         return source_attr, source_id, source_df
 
     @TimeableMixin.TimeAs
-    def fit_measurements(self):
+    def fit_measurements(self, num_workers: int = 1):
         """Fits all preprocessing parameters over the training dataset, according to `self.config`.
 
+        The training split of each source dataframe is retrieved once, and the observation counts of all
+        measurements in that source are computed together. The remaining (per-measurement) fits are
+        independent of one another, so they can be run concurrently in a pool of `num_workers` threads;
+        regardless, the fit configs are stored in `inferred_measurement_configs` in the order of
+        `self.config.measurement_configs`.
+
+        Args:
+            num_workers: How many threads to use to fit measurements concurrently. If this is one or less,
+                measurements are fit serially.
+
         Raises:
             ValueError: if fitting preprocessing parameters fails for a given measurement.
         """
         self._is_fit = False
 
+        # Measurements of the same temporality share a source dataframe.
+        source_dfs = {}
+        configs_by_source = defaultdict(dict)
         for measure, config in self.config.measurement_configs.items():
             if config.is_dropped:
                 continue
@@ -835,55 +1015,117 @@ class DatasetBase(
             self.inferred_measurement_configs[measure] = copy.deepcopy(config)
             config = self.inferred_measurement_configs[measure]
 
-            _, _, source_df = self._get_source_df(config, do_only_train=True)
+            if config.temporality not in source_dfs:
+                _, _, source_dfs[config.temporality] = self._get_source_df(config, do_only_train=True)
 
-            if measure not in source_df:
+            if measure not in source_dfs[config.temporality]:
                 print(f"WARNING: Measure {measure} not found! Dropping...")
                 config.drop()
                 continue
 
-            total_possible, total_observed, raw_total_observed = self._total_possible_and_observed(
-                measure, config, source_df
+            configs_by_source[config.temporality][measure] = config
+
+        fit_args = []
+        for temporality, configs in configs_by_source.items():
+            source_df = source_dfs[temporality]
+            counts = self._total_possible_and_observed_by_measure(configs, source_df)
+            fit_args.extend(
+                (measure, config, source_df, *counts[measure]) for measure, config in configs.items()
             )
-            source_df = self._filter_col_inclusion(source_df, {measure: True})
 
-            if total_possible == 0:
-                print(f"Found no possible events for {measure}!")
-                config.drop()
-                continue
+        if num_workers <= 1:
+            for args in fit_args:
+                self._fit_measurement(*args)
+        else:
+            # Each fit runs on its own shallow copy, so that the (non thread-safe) timings of concurrent fits
+            # are tracked separately; these are merged back in order afterwards.
+            fitters = [copy.copy(self) for _ in fit_args]
+            for fitter in fitters:
+                fitter._timings = defaultdict(list)
+
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [
+                    executor.submit(fitter._fit_measurement, *args) for fitter, args in zip(fitters, fit_args)
+                ]
+                for future in futures:
+                    future.result()
 
-            config.observation_rate_over_cases = total_observed / total_possible
-            config.observation_rate_per_case = raw_total_observed / total_observed
+            for fitter in fitters:
+                for key, timings in fitter._timings.items():
+                    self._timings[key].extend(timings)
 
-            # 2. Drop the column if observations occur too rarely.
-            if lt_count_or_proportion(
-                total_observed, self.config.min_valid_column_observations, total_possible
-            ):
-                config.drop()
-                continue
+        self._is_fit = True
 
-            if config.is_numeric:
-                config.add_missing_mandatory_metadata_cols()
-                try:
-                    config.measurement_metadata = self._fit_measurement_metadata(measure, config, source_df)
-                except BaseException as e:
-                    raise ValueError(f"Fitting measurement metadata failed for measure {measure}!") from e
-
-            if config.vocabulary is None:
-                config.vocabulary = self._fit_vocabulary(measure, config, source_df)
-
-                # 4. Eliminate observations that occur too rarely.
-                if config.vocabulary is not None:
-                    if self.config.min_valid_vocab_element_observations is not None:
-                        config.vocabulary.filter(
-                            len(source_df), self.config.min_valid_vocab_element_observations
-                        )
+    def _fit_measurement(
+        self,
+        measure: str,
+        config: MeasurementConfig,
+        source_df: DF_T,
+        total_possible: int,
+        total_observed: int,
+        raw_total_observed: int,
+    ):
+        """Fits the preprocessing parameters of `measure` over the training split of its source, in place.
 
-                    # 5. If all observations were eliminated, drop the column.
-                    if config.vocabulary.vocabulary == ["UNK"]:
-                        config.drop()
+        Args:
+            measure: The name of the measurement.
+            config: The (inferred) measurement config to fit.
+            source_df: The training split of the measurement's source dataframe.
+            total_possible: The number of instances where `measure` could have been observed.
+            total_observed: The number of instances where `measure` was observed.
+            raw_total_observed: The total number of observations of `measure`.
 
-        self._is_fit = True
+        Raises:
+            ValueError: if fitting the measurement metadata fails.
+        """
+        source_df = self._filter_col_inclusion(source_df, {measure: True})
+
+        if total_possible == 0:
+            print(f"Found no possible events for {measure}!")
+            config.drop()
+            return
+
+        config.observation_rate_over_cases = total_observed / total_possible
+        config.observation_rate_per_case = raw_total_observed / total_observed
+
+        # 2. Drop the column if observations occur too rarely.
+        if lt_count_or_proportion(total_observed, self.config.min_valid_column_observations, total_possible):
+            config.drop()
+            return
+
+        if config.is_numeric:
+            config.add_missing_mandatory_metadata_cols()
+            try:
+                config.measurement_metadata = self._fit_measurement_metadata(measure, config, source_df)
+            except BaseException as e:
+                raise ValueError(f"Fitting measurement metadata failed for measure {measure}!") from e
+
+        if config.vocabulary is None:
+            config.vocabulary = self._fit_vocabulary(measure, config, source_df)
+
+            # 4. Eliminate observations that occur too rarely.
+            if config.vocabulary is not None:
+                if self.config.min_valid_vocab_element_observations is not None:
+                    config.vocabulary.filter(
+                        raw_total_observed, self.config.min_valid_vocab_element_observations
+                    )
+
+                # 5. If all observations were eliminated, drop the column.
+                if config.vocabulary.vocabulary == ["UNK"]:
+                    config.drop()
+
+    def _total_possible_and_observed_by_measure(
+        self, configs: dict[str, MeasurementConfig], source_df: DF_T
+    ) -> dict[str, tuple[int, int, int]]:
+        """Returns `_total_possible_and_observed` for each of the measurements in `configs`.
+
+        All measurements in `configs` must share `source_df`. Subclasses can override this to compute the
+        counts of all measurements in a single pass over `source_df`.
+        """
+        return {
+            measure: self._total_possible_and_observed(measure, config, source_df)
+            for measure, config in configs.items()
+        }
 
     @abc.abstractmethod
     def _total_possible_and_observed(
@@ -940,28 +1182,36 @@ class DatasetBase(
             ValueError: If transforming fails for a given measurement.
         """
         for measure, config in self.measurement_configs.items():
-            source_attr, id_col, source_df = self._get_source_df(config, do_only_train=False)
+            self._transform_measurement(measure, config)
 
-            source_df = self._filter_col_inclusion(source_df, {measure: True})
-            updated_cols = [measure]
+    def _transform_measurement(self, measure: str, config: MeasurementConfig):
+        """Transforms the observations of `measure` in its source dataframe given its fit parameters.
 
-            try:
-                if config.is_numeric:
-                    source_df = self._transform_numerical_measurement(measure, config, source_df)
+        Raises:
+            ValueError: If transforming fails.
+        """
+        source_attr, id_col, source_df = self._get_source_df(config, do_only_train=False)
 
-                    if config.modality == DataModality.MULTIVARIATE_REGRESSION:
-                        updated_cols.append(config.values_column)
+        source_df = self._filter_col_inclusion(source_df, {measure: True})
+        updated_cols = [measure]
 
-                    if self.config.outlier_detector_config is not None:
-                        updated_cols.append(f"{measure}_is_inlier")
+        try:
+            if config.is_numeric:
+                source_df = self._transform_numerical_measurement(measure, config, source_df)
 
-                if config.vocabulary is not None:
-                    source_df = self._transform_categorical_measurement(measure, config, source_df)
+                if config.modality == DataModality.MULTIVARIATE_REGRESSION:
+                    updated_cols.append(config.values_column)
 
-            except BaseException as e:
-                raise ValueError(f"Transforming measurement failed for measure {measure}!") from e
+                if self.config.outlier_detector_config is not None:
+                    updated_cols.append(f"{measure}_is_inlier")
 
-            self._update_attr_df(source_attr, id_col, source_df, updated_cols)
+            if config.vocabulary is not None:
+                source_df = self._transform_categorical_measurement(measure, config, source_df)
+
+        except BaseException as e:
+            raise ValueError(f"Transforming measurement failed for measure {measure}!") from e
+
+        self._update_attr_df(source_attr, id_col, source_df, updated_cols)
 
     @TimeableMixin.TimeAs
     @abc.abstractmethod
@@ -1074,11 +1324,13 @@ class DatasetBase(
     def _get_flat_static_rep(self, **kwargs) -> DF_T:
         raise NotImplementedError("Must be overwritten in base class.")
 
-    @classmethod
     @abc.abstractmethod
-    def _summarize_over_window(self, df: DF_T, window_size: str):
+    def _summarize_over_windows(self, df: DF_T, window_sizes: list[str]) -> dict[str, DF_T]:
         raise NotImplementedError("Must be overwritten in base class.")
 
+    def _summarize_over_window(self, df: DF_T, window_size: str) -> DF_T:
+        return self._summarize_over_windows(df, [window_size])[window_size]
+
     def _resolve_flat_rep_cache_params(
         self,
         feature_inclusion_frequency: float | dict[str, float] | None = None,
@@ -1176,6 +1428,8 @@ class DatasetBase(
         include_only_measurements: set[str] | None = None,
         do_overwrite: bool = False,
         do_update: bool = True,
+        subject_ids: set[int] | None = None,
+        num_workers: int = 1,
     ):
         """Writes a flat (historically summarized) representation of the dataset to disk.
 
@@ -1212,6 +1466,12 @@ class DatasetBase(
                 been used historically, overwriting the specified `subjects_per_output_file` parameter!), then
                 (b) attempt to write only those files that are not yet written to disk across the historical
                 summarization targets.
+            subject_ids: If specified, only these subjects (e.g., those added by `append`) are assigned to new
+                subject chunks, which are added to those already recorded on disk for each split. With
+                `do_update`, only the files of these new chunks are then written.
+            num_workers: How many worker processes to use to summarize subject chunks over the historical
+                windows in parallel. If this is one or less, chunks are summarized serially in this process.
+                Either way, all window sizes of a chunk are summarized together.
 
         .. _link: https://pola-rs.github.io/polars/py-polars/html/reference/dataframe/api/polars.DataFrame.groupby_rolling.html # noqa: E501
         """
@@ -1224,19 +1484,32 @@ class DatasetBase(
 
         flat_dir = self.config.save_dir / "flat_reps"
         flat_dir.mkdir(exist_ok=True, parents=True)
+        params_fp = flat_dir / "params.json"
 
         sp_subjects = {}
+        if subject_ids is not None and params_fp.exists():
+            with open(params_fp) as f:
+                sp_subjects = json.load(f)["subject_chunks_by_split"]
+
         for split, split_subjects in self.split_subjects.items():
+            if subject_ids is not None:
+                chunked_subjects = {s for chunk in sp_subjects.get(split, []) for s in chunk}
+                split_subjects = (split_subjects & set(subject_ids)) - chunked_subjects
+                sp_subjects.setdefault(split, [])
+                if not split_subjects:
+                    continue
+
             if subjects_per_output_file is None:
-                sp_subjects[split] = [[int(x) for x in split_subjects]]
+                chunks = [[int(x) for x in split_subjects]]
             else:
-                sp_subjects[split] = [
+                chunks = [
                     [int(e) for e in x]
                     for x in np.array_split(
                         np.random.permutation(list(split_subjects)),
-                        len(split_subjects) // subjects_per_output_file,
+                        max(len(split_subjects) // subjects_per_output_file, 1),
                     )
                 ]
+            sp_subjects[split] = sp_subjects.get(split, []) + chunks
 
         params = {
             "subjects_per_output_file": subjects_per_output_file,
@@ -1244,7 +1517,6 @@ class DatasetBase(
             "include_only_measurements": include_only_measurements,
             "subject_chunks_by_split": sp_subjects,
         }
-        params_fp = flat_dir / "params.json"
         if params_fp.exists():
             if do_update:
                 with open(params_fp) as f:
@@ -1256,9 +1528,13 @@ class DatasetBase(
                         f"({old_params['subjects_per_output_file']})."
                     )
                     params["subjects_per_output_file"] = old_params["subjects_per_output_file"]
-                    params["subject_chunks_by_split"] = old_params["subject_chunks_by_split"]
+                    if subject_ids is None:
+                        params["subject_chunks_by_split"] = old_params["subject_chunks_by_split"]
 
                 old_params["include_only_measurements"] = sorted(old_params["include_only_measurements"])
+                if subject_ids is not None:
+                    # The new subjects' chunks extend, rather than reproduce, the recorded chunks.
+                    old_params["subject_chunks_by_split"] = params["subject_chunks_by_split"]
 
                 if old_params != params:
                     err_strings = ["Asked to update but parameters differ:"]
@@ -1350,22 +1626,58 @@ class DatasetBase(
         # 3. Produce summarized history representations
         history_subdir = flat_dir / "over_history"
 
-        for window_size in tqdm(window_sizes, desc="History window sizes"):
-            for sp, df_fps in tqdm(list(ts_dfs.items()), desc="Windowing Splits", leave=False):
-                for i, df_fp in enumerate(tqdm(df_fps, desc="Subject chunks", leave=False)):
+        # All window sizes of a subject chunk are summarized together, from a single read of its raw
+        # representation.
+        history_fps_by_chunk = []
+        for sp, df_fps in ts_dfs.items():
+            for i, df_fp in enumerate(df_fps):
+                fps = {}
+                for window_size in window_sizes:
                     fp = history_subdir / sp / window_size / f"{i}.parquet"
                     if fp.exists():
                         if do_update:
                             continue
                         elif not do_overwrite:
                             raise FileExistsError(f"do_overwrite is {do_overwrite} and {fp} exists!")
+                    fps[window_size] = fp
+                if fps:
+                    history_fps_by_chunk.append((df_fp, fps))
+
+        write_kwargs = {"do_overwrite": do_overwrite}
+        if num_workers <= 1:
+            for df_fp, fps in tqdm(history_fps_by_chunk, desc="Summarizing history windows"):
+                self._write_flat_history_reps(df_fp, fps, **write_kwargs)
+            return
 
-                    df = self._summarize_over_window(df_fp, window_size)
-                    self._write_df(df, fp)
+        # Summarizing only needs the fit measurement metadata, so the (possibly large) dataframes of this
+        # dataset are not sent to the workers.
+        summarizer = copy.copy(self)
+        summarizer.subjects_df = summarizer.events_df = summarizer.dynamic_measurements_df = None
+
+        # Polars' internal thread pool does not survive forking, so workers are spawned instead.
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+            futures = [
+                executor.submit(summarizer._write_flat_history_reps, df_fp, fps, **write_kwargs)
+                for df_fp, fps in history_fps_by_chunk
+            ]
+            for future in tqdm(futures, desc="Summarizing history windows"):
+                future.result()
+
+    def _write_flat_history_reps(self, df_fp: Path, fps: dict[str, Path], do_overwrite: bool):
+        """Summarizes the raw flat representation in `df_fp` over each window size in `fps`, writing the
+        summary over each window size to its filepath in `fps`."""
+        for window_size, df in self._summarize_over_windows(df_fp, list(fps.keys())).items():
+            self._write_df(df, fps[window_size], do_overwrite=do_overwrite)
 
     @TimeableMixin.TimeAs
     def cache_deep_learning_representation(
-        self, subjects_per_output_file: int | None = None, do_overwrite: bool = False
+        self,
+        subjects_per_output_file: int | None = None,
+        do_overwrite: bool = False,
+        do_write_memmap: bool = False,
+        num_workers: int = 1,
+        subject_ids: set[int] | None = None,
     ):
         """Writes a deep-learning friendly representation of the dataset to disk.
 
@@ -1397,33 +1709,116 @@ class DatasetBase(
           array of arrays, each containing only the indices of measurements observed at each event. It is of
           the same shape and of a consistent order as ``dynamic_indices``.
 
+        The subjects of each split are randomly assigned to chunks of (at most) `subjects_per_output_file`
+        subjects, and the internal dataframes are partitioned into these chunks in a single pass. Each chunk
+        is then converted and written to its own file, named ``{split}_{chunk_idx}``, either serially or, if
+        `num_workers` is greater than one, in a pool of worker processes. Chunks are partitioned from the
+        input dataframes only as they are written, so at most `num_workers` chunks are held in memory at once.
+        If `subject_ids` is specified, only those
+        subjects are written, in new chunks numbered after those already on disk for each split (e.g., to
+        cache only the subjects added by `append`). Summary statistics of each file, which `PytorchDataset`
+        would otherwise compute on every load, are written next to it (e.g., ``DL_reps/train_0.stats.json``
+        for ``DL_reps/train_0.parquet``; see `EventStream.data.cached_data_stats.CachedDataStats`).
+
         Args:
             subjects_per_output_file: How big to chunk the dataset down for writing to disk; larger values
                 will make fewer chunks but increase the memory cost.
             do_overwrite: Whether or not to overwrite any existing file on disk.
+            do_write_memmap: Whether or not to also write a memory-mappable copy of each output file to a
+                directory next to it (e.g., ``DL_reps/train_0.memmap`` for ``DL_reps/train_0.parquet``), for
+                use with the ``"memmap"`` `PytorchDataset` storage mode.
+            num_workers: How many worker processes to use to build and write chunks in parallel. If this is
+                one or less, chunks are built serially in this process.
+            subject_ids: If specified, only these subjects are written, to new chunks.
         """
 
         DL_dir = self.config.save_dir / "DL_reps"
         DL_dir.mkdir(exist_ok=True, parents=True)
 
-        if subjects_per_output_file is None:
-            subject_chunks = [None]
-        else:
-            subjects = np.random.permutation(list(self.subject_ids))
-            subject_chunks = np.array_split(
-                subjects,
-                np.arange(subjects_per_output_file, len(subjects), subjects_per_output_file),
-            )
-            subject_chunks = [list(c) for c in subject_chunks]
+        subject_chunks = {}
+        for split, subjects in self.split_subjects.items():
+            first_chunk_idx = 0
+            if subject_ids is not None:
+                subjects = subjects & set(subject_ids)
+                if not subjects:
+                    continue
+                first_chunk_idx = self._n_chunks_on_disk(DL_dir, split)
+
+            subjects = np.random.permutation(sorted(subjects))
+            if subjects_per_output_file is None:
+                chunks = [subjects]
+            else:
+                chunks = np.array_split(
+                    subjects, np.arange(subjects_per_output_file, len(subjects), subjects_per_output_file)
+                )
+            for chunk_idx, chunk in enumerate(chunks, start=first_chunk_idx):
+                subject_chunks[f"{split}_{chunk_idx}"] = list(chunk)
+
+        def chunks() -> Iterator[tuple["DatasetBase", Path]]:
+            for chunk_name, chunk_dfs in self._partition_by_subjects(subject_chunks):
+                # Vocabularies (e.g., of event types) must remain those of the full dataset, so only the
+                # subject-level attributes are restricted to the chunk.
+                chunk = copy.copy(self)
+                chunk.subjects_df, chunk.events_df, chunk.dynamic_measurements_df = chunk_dfs
+                chunk.subject_ids = set(subject_chunks[chunk_name])
+                chunk.n_events_per_subject = {s: self.n_events_per_subject[s] for s in chunk.subject_ids}
+                chunk.split_subjects = {}
+                yield chunk, DL_dir / f"{chunk_name}.{self.DF_SAVE_FORMAT}"
+
+        write_kwargs = {"do_overwrite": do_overwrite, "do_write_memmap": do_write_memmap}
+        pbar = tqdm(total=len(subject_chunks), desc="Caching DL representation chunks")
+        if num_workers <= 1:
+            for chunk, fp in chunks():
+                chunk._write_DL_cached_representation(fp, **write_kwargs)
+                pbar.update()
+            pbar.close()
+            return
 
-        for chunk_idx, subjects_list in self._tqdm(list(enumerate(subject_chunks))):
-            cached_df = self.build_DL_cached_representation(subject_ids=subjects_list)
+        # Polars' internal thread pool does not survive forking, so workers are spawned instead.
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+            # Chunks are only built as workers free up, so that they aren't all held in memory at once.
+            in_flight = set()
+            for chunk, fp in chunks():
+                if len(in_flight) >= num_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                        pbar.update()
+                in_flight.add(executor.submit(chunk._write_DL_cached_representation, fp, **write_kwargs))
+            for future in as_completed(in_flight):
+                future.result()
+                pbar.update()
+        pbar.close()
 
-            for split, subjects in self.split_subjects.items():
-                fp = DL_dir / f"{split}_{chunk_idx}.{self.DF_SAVE_FORMAT}"
+    @classmethod
+    def _n_chunks_on_disk(cls, DL_dir: Path, split: str) -> int:
+        """Returns one more than the largest index of the ``{split}_{chunk_idx}`` files in `DL_dir`, if any.
 
-                split_cached_df = self._filter_col_inclusion(cached_df, {"subject_id": subjects})
-                self._write_df(split_cached_df, fp, do_overwrite=do_overwrite)
+        Examples:
+            >>> import tempfile
+            >>> with tempfile.TemporaryDirectory() as d:
+            ...     for fn in ("train_0.parquet", "train_2.parquet", "train_subset_5.parquet"):
+            ...         _ = (Path(d) / fn).write_text("")
+            ...     DatasetBase._n_chunks_on_disk(Path(d), "train")
+            3
+        """
+        chunk_idxs = [-1]
+        for fp in DL_dir.glob(f"{split}_*.{cls.DF_SAVE_FORMAT}"):
+            chunk_idx = fp.stem[len(split) + 1 :]
+            if chunk_idx.isdigit():
+                chunk_idxs.append(int(chunk_idx))
+        return max(chunk_idxs) + 1
+
+    def _write_DL_cached_representation(self, fp: Path, do_overwrite: bool, do_write_memmap: bool):
+        """Builds the deep-learning representation of this dataset's subjects and writes it to `fp`."""
+        cached_df = self.build_DL_cached_representation()
+        self._write_df(cached_df, fp, do_overwrite=do_overwrite)
+        self._write_DL_stats(cached_df, fp)
+        if do_write_memmap:
+            self._write_memmap_df(
+                cached_df, ColumnarCachedData.memmap_dir_for(fp), do_overwrite=do_overwrite, source_fp=fp
+            )
 
     @property
     def vocabulary_config(self) -> VocabularyConfig:
@@ -8,9 +8,13 @@ Attributes:
 """
 
 import dataclasses
+import io
 import math
 import multiprocessing
-from collections.abc import Callable, Sequence
+import shutil
+import tempfile
+from collections import defaultdict
+from collections.abc import Callable, Iterator, Sequence
 from pathlib import Path
 from typing import Any, Union
 
@@ -21,6 +25,8 @@ import polars.selectors as cs
 from mixins import TimeableMixin
 
 from ..utils import lt_count_or_proportion
+from .cached_data_stats import CachedDataStats
+from .columnar_storage import ColumnarCachedData
 from .config import MeasurementConfig
 from .dataset_base import DatasetBase
 from .preprocessing import Preprocessor, StandardScaler, StddevCutoffOutlierDetector
@@ -113,6 +119,12 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
     """Use C++ parquet implementation vs Rust parquet implementation for writing parquets."""
     STREAMING = True
     """Execute any lazy query in streaming mode."""
+    LAZY_EVENTS_PER_CHUNK = 1000000
+    """In lazy mode, the number of events whose measurements are materialized together at a time."""
+
+    _DEL_BEFORE_SAVING_ATTRS: list[str] = DatasetBase._DEL_BEFORE_SAVING_ATTRS + [
+        "_dynamic_measurements_checkpoint_dir"
+    ]
 
     @staticmethod
     def get_smallest_valid_uint_type(num: int | float | pl.Expr) -> pl.DataType:
@@ -395,11 +407,15 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
 
     @classmethod
     def _concat_dfs(cls, dfs: list[DF_T]) -> DF_T:
-        """Concatenates a list of dataframes into a single dataframe."""
+        """Concatenates a list of dataframes into a single dataframe, which is lazy if any input is."""
+        if any(isinstance(df, pl.LazyFrame) for df in dfs):
+            dfs = [df.lazy() for df in dfs]
         return pl.concat(dfs, how="diagonal")
 
     @classmethod
     def _read_df(cls, fp: Path, **kwargs) -> DF_T:
+        if kwargs.get("lazy", False):
+            return pl.scan_parquet(fp)
         return pl.read_parquet(fp)
 
     @classmethod
@@ -411,11 +427,30 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
 
         fp.parent.mkdir(exist_ok=True, parents=True)
 
-        if isinstance(df, pl.LazyFrame):
+        if isinstance(df, pl.LazyFrame) and kwargs.get("do_stream", False):
+            # `df` may be reading from `fp` itself, so it is only replaced once fully written.
+            tmp_fp = fp.with_name(f".{fp.name}.tmp")
+            df.sink_parquet(tmp_fp)
+            tmp_fp.replace(fp)
+        elif isinstance(df, pl.LazyFrame):
             df.collect().write_parquet(fp, use_pyarrow=cls.WRITE_USE_PYARROW)
         else:
             df.write_parquet(fp, use_pyarrow=cls.WRITE_USE_PYARROW)
 
+    @classmethod
+    def _write_memmap_df(cls, df: DF_T, memmap_dir: Path, **kwargs):
+        if isinstance(df, pl.LazyFrame):
+            df = df.collect()
+        ColumnarCachedData.from_df(df).save(
+            memmap_dir,
+            do_overwrite=kwargs.get("do_overwrite", False),
+            source_fp=kwargs.get("source_fp", None),
+        )
+
+    @classmethod
+    def _write_DL_stats(cls, df: DF_T, fp: Path, **kwargs):
+        CachedDataStats.from_df(df).save(CachedDataStats.stats_fp_for(fp), fp)
+
     def get_metadata_schema(self, config: MeasurementConfig) -> dict[str, pl.DataType]:
         schema = {
             "value_type": self.METADATA_SCHEMA["value_type"],
@@ -716,6 +751,158 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
                 self.n_events_per_subject[sid] = 0
             self.subject_ids.update(subjects_with_no_events)
 
+    def _validate_and_set_initial_properties(self, subjects_df, events_df, dynamic_measurements_df):
+        super()._validate_and_set_initial_properties(subjects_df, events_df, dynamic_measurements_df)
+        if self.lazy:
+            self._checkpoint_dynamic_measurements_df()
+
+    @TimeableMixin.TimeAs
+    def _checkpoint_dynamic_measurements_df(
+        self, chunk_fn: Callable[[pl.DataFrame], pl.DataFrame] | None = None
+    ):
+        """Writes `dynamic_measurements_df` to parquet shards in `config.save_dir` and lazily re-reads them.
+
+        This is used in lazy mode to bound the cost of queries over the measurements: each chunk of
+        `LAZY_EVENTS_PER_CHUNK` events' measurements (by event ID range, so each shard covers a disjoint range
+        of event IDs) is materialized, optionally transformed, and written in turn, so only one chunk is ever
+        held in memory. The previous checkpoint, if any, is deleted once replaced.
+
+        Args:
+            chunk_fn: If specified, a function applied to each materialized chunk before it is written.
+
+        Raises:
+            ValueError: If `config.save_dir` is not set.
+        """
+        if self.config.save_dir is None:
+            raise ValueError("Lazy mode requires config.save_dir to be set, to store intermediate results!")
+
+        checkpoints_dir = self.config.save_dir / "lazy_checkpoints"
+        checkpoints_dir.mkdir(parents=True, exist_ok=True)
+        checkpoint_dir = Path(tempfile.mkdtemp(prefix="dynamic_measurements_df_", dir=checkpoints_dir))
+
+        event_id = pl.col("event_id")
+        chunk_bounds = self.events_df.get_column("event_id").sort().take_every(self.LAZY_EVENTS_PER_CHUNK)
+        chunk_bounds = chunk_bounds.to_list()[1:]
+
+        # Measurements without a (valid) event ID are kept in the first chunk.
+        chunk_filters = []
+        for lower, upper in zip([None] + chunk_bounds, chunk_bounds + [None]):
+            match lower, upper:
+                case None, None:
+                    chunk_filters.append(pl.lit(True))
+                case None, _:
+                    chunk_filters.append(event_id.is_null() | (event_id < upper))
+                case _, None:
+                    chunk_filters.append(event_id >= lower)
+                case _:
+                    chunk_filters.append((event_id >= lower) & (event_id < upper))
+
+        for i, chunk_filter in enumerate(self._tqdm(chunk_filters, desc="Checkpointing measurements")):
+            chunk_df = (
+                self.dynamic_measurements_df.lazy().filter(chunk_filter).collect(streaming=self.STREAMING)
+            )
+            if chunk_fn is not None:
+                chunk_df = chunk_fn(chunk_df)
+            chunk_df.write_parquet(checkpoint_dir / f"{i:06d}.parquet", use_pyarrow=self.WRITE_USE_PYARROW)
+
+        old_checkpoint_dir = getattr(self, "_dynamic_measurements_checkpoint_dir", None)
+        self._dynamic_measurements_checkpoint_dir = checkpoint_dir
+        self.dynamic_measurements_df = pl.scan_parquet(checkpoint_dir / "*.parquet")
+        if old_checkpoint_dir is not None:
+            shutil.rmtree(old_checkpoint_dir, ignore_errors=True)
+
+    def _shift_appended_ids(self, new: "Dataset"):
+        id_attrs = {
+            "subject_id": ["subjects_df", "events_df"],
+            "event_id": ["events_df", "dynamic_measurements_df"],
+            "measurement_id": ["dynamic_measurements_df"],
+        }
+        for id_col, (source_attr, *linked_attrs) in id_attrs.items():
+            max_id = self._collect(getattr(self, source_attr).select(pl.col(id_col).max())).item()
+            new_max_id = new._collect(getattr(new, source_attr).select(pl.col(id_col).max())).item()
+
+            offset = 0 if max_id is None else max_id + 1
+            id_dts = [self.get_smallest_valid_uint_type(offset + (new_max_id or 0) + 1)]
+            id_dts.extend(getattr(self, attr).schema[id_col] for attr in [source_attr, *linked_attrs])
+            id_dt = max(id_dts, key=[pl.UInt8, pl.UInt16, pl.UInt32, pl.UInt64].index)
+
+            for attr in [source_attr, *linked_attrs]:
+                df, new_df = getattr(self, attr), getattr(new, attr)
+                if df.schema[id_col] != id_dt:
+                    setattr(self, attr, df.with_columns(pl.col(id_col).cast(id_dt)))
+                setattr(new, attr, new_df.with_columns((pl.col(id_col).cast(id_dt) + offset).cast(id_dt)))
+
+    def _partition_by_subjects(
+        self, subject_partitions: dict[str, Sequence[int]]
+    ) -> Iterator[tuple[str, tuple[DF_T, DF_T, DF_T]]]:
+        partitions_df = pl.DataFrame(
+            {
+                "subject_id": [s for subjects in subject_partitions.values() for s in subjects],
+                "__partition": [p for p, subjects in subject_partitions.items() for _ in subjects],
+            },
+            schema={"subject_id": self.subjects_df["subject_id"].dtype, "__partition": pl.Utf8},
+        )
+
+        def rows_per_partition(df: pl.DataFrame, partition_by_df: pl.DataFrame) -> dict[str, pl.Series]:
+            # Only the (sorted, so order-preserving) row indices of each partition are held up front; the
+            # rows themselves are gathered as each partition is used.
+            on = partition_by_df.columns[0]
+            rows_df = (
+                df.select(on)
+                .with_row_count("__row")
+                .join(partition_by_df, on=on, how="inner")
+                .groupby("__partition")
+                .agg(pl.col("__row").sort())
+            )
+            return dict(zip(rows_df["__partition"], rows_df["__row"]))
+
+        event_partitions_df = self.events_df.select("event_id", "subject_id").join(
+            partitions_df, on="subject_id", how="inner"
+        )
+
+        dfs_to_partition = [
+            (self.subjects_df, rows_per_partition(self.subjects_df, partitions_df)),
+            (self.events_df, rows_per_partition(self.events_df, partitions_df)),
+        ]
+        lazy_measurements = isinstance(self.dynamic_measurements_df, pl.LazyFrame)
+        if not lazy_measurements:
+            dfs_to_partition.append(
+                (
+                    self.dynamic_measurements_df,
+                    rows_per_partition(
+                        self.dynamic_measurements_df, event_partitions_df.select("event_id", "__partition")
+                    ),
+                )
+            )
+
+        for p in subject_partitions:
+            partition_dfs = [df[rows[p]] if p in rows else df.clear() for df, rows in dfs_to_partition]
+            if lazy_measurements:
+                # In lazy mode, measurements are only materialized when that partition is used.
+                partition_dfs.append(
+                    self._filter_col_inclusion(
+                        self.dynamic_measurements_df, {"event_id": partition_dfs[1].get_column("event_id")}
+                    )
+                )
+            yield p, tuple(partition_dfs)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Polars can't round-trip categorical columns through pickle, which is needed to send datasets to
+        # worker processes, so dataframes are serialized in the Arrow IPC format instead.
+        state = self.__dict__.copy()
+        for attr in ("_subjects_df", "_events_df", "_dynamic_measurements_df"):
+            if isinstance(state.get(attr, None), pl.DataFrame):
+                buffer = io.BytesIO()
+                state.pop(attr).write_ipc(buffer)
+                state[f"{attr}_ipc"] = buffer.getvalue()
+        return state
+
+    def __setstate__(self, state: dict[str, Any]):
+        for attr in ("_subjects_df", "_events_df", "_dynamic_measurements_df"):
+            if f"{attr}_ipc" in state:
+                state[attr] = pl.read_ipc(io.BytesIO(state.pop(f"{attr}_ipc")))
+        self.__dict__.update(state)
+
     @classmethod
     def _filter_col_inclusion(cls, df: DF_T, col_inclusion_targets: dict[str, bool | Sequence[Any]]) -> DF_T:
         filter_exprs = []
@@ -752,10 +939,14 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
         else:
             self.events_df = self.events_df.with_columns(exprs)
 
-    @TimeableMixin.TimeAs
-    def _prep_numerical_source(
-        self, measure: str, config: MeasurementConfig, source_df: DF_T
-    ) -> tuple[DF_T, str, str, str, pl.DataFrame]:
+    def _numerical_metadata_as_polars(
+        self, measure: str, config: MeasurementConfig
+    ) -> tuple[str, str, pl.DataFrame]:
+        """Returns the key and value column names of numerical `measure` and its metadata as a dataframe.
+
+        For univariate regression measurements, the key column is a constant key column ``"const_key"``,
+        which does not exist in the source dataframe, and the metadata dataframe has a single row.
+        """
         metadata = config.measurement_metadata
 
         metadata_schema = self.get_metadata_schema(config)
@@ -767,7 +958,6 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
                 metadata_as_polars = pl.DataFrame(
                     {key_col: [measure], **{c: [v] for c, v in metadata.items()}}
                 )
-                source_df = source_df.with_columns(pl.lit(measure).cast(pl.Categorical).alias(key_col))
             case DataModality.MULTIVARIATE_REGRESSION:
                 key_col = measure
                 val_col = config.values_column
@@ -785,6 +975,17 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
             **{k: pl.col(k).cast(v) for k, v in metadata_schema.items()},
         )
 
+        return key_col, val_col, metadata_as_polars
+
+    @TimeableMixin.TimeAs
+    def _prep_numerical_source(
+        self, measure: str, config: MeasurementConfig, source_df: DF_T
+    ) -> tuple[DF_T, str, str, str, pl.DataFrame]:
+        key_col, val_col, metadata_as_polars = self._numerical_metadata_as_polars(measure, config)
+
+        if config.modality == DataModality.UNIVARIATE_REGRESSION:
+            source_df = source_df.with_columns(pl.lit(measure).cast(pl.Categorical).alias(key_col))
+
         source_df = source_df.join(metadata_as_polars, on=key_col, how="left")
         return source_df, key_col, val_col, f"{measure}_is_inlier", metadata_as_polars
 
@@ -798,13 +999,54 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
             num_non_null = len(source_df.drop_nulls(measure))
             num_total = num_non_null
         else:
-            num_possible = source_df.select(pl.col("event_id").n_unique()).item()
-            num_non_null = source_df.select(
-                pl.col("event_id").filter(pl.col(measure).is_not_null()).n_unique()
+            num_possible = self._collect(source_df.select(pl.col("event_id").n_unique())).item()
+            num_non_null = self._collect(
+                source_df.select(pl.col("event_id").filter(pl.col(measure).is_not_null()).n_unique())
             ).item()
-            num_total = source_df.select(pl.col(measure).is_not_null().sum()).item()
+            num_total = self._collect(source_df.select(pl.col(measure).is_not_null().sum())).item()
         return num_possible, num_non_null, num_total
 
+    def _total_possible_and_observed_by_measure(
+        self, configs: dict[str, MeasurementConfig], source_df: DF_T
+    ) -> dict[str, tuple[int, int, int]]:
+        is_dynamic = {config.temporality == TemporalityType.DYNAMIC for config in configs.values()}
+        if len(is_dynamic) != 1:
+            return super()._total_possible_and_observed_by_measure(configs, source_df)
+
+        if is_dynamic.pop():
+            num_possible = pl.col("event_id").n_unique()
+            num_non_null = {m: pl.col("event_id").filter(pl.col(m).is_not_null()).n_unique() for m in configs}
+        else:
+            num_possible = pl.count()
+            num_non_null = {m: pl.col(m).is_not_null().sum() for m in configs}
+        num_total = {m: pl.col(m).is_not_null().sum() for m in configs}
+
+        counts = self._collect(
+            source_df.select(
+                num_possible.alias("__num_possible"),
+                *(expr.alias(f"{m}/non_null") for m, expr in num_non_null.items()),
+                *(expr.alias(f"{m}/total") for m, expr in num_total.items()),
+            )
+        ).row(0, named=True)
+
+        return {m: (counts["__num_possible"], counts[f"{m}/non_null"], counts[f"{m}/total"]) for m in configs}
+
+    def _collect(self, df: DF_T) -> pl.DataFrame:
+        """Materializes `df` if it is lazy, as happens for `dynamic_measurements_df` in lazy mode."""
+        if isinstance(df, pl.LazyFrame):
+            return df.collect(streaming=self.STREAMING)
+        return df
+
+    def _collect_measure_source(self, measure: str, config: MeasurementConfig, source_df: DF_T) -> DF_T:
+        """Materializes only the columns of `source_df` needed to fit `measure`, if it is lazy."""
+        if not isinstance(source_df, pl.LazyFrame):
+            return source_df
+
+        cols = ["event_id", measure]
+        if config.modality == DataModality.MULTIVARIATE_REGRESSION:
+            cols.append(config.values_column)
+        return self._collect(source_df.select(cols))
+
     @TimeableMixin.TimeAs
     def _add_inferred_val_types(
         self,
@@ -914,6 +1156,7 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
     def _fit_measurement_metadata(
         self, measure: str, config: MeasurementConfig, source_df: DF_T
     ) -> pd.DataFrame:
+        source_df = self._collect_measure_source(measure, config, source_df)
         source_df, vocab_keys_col, vals_col, _, measurement_metadata = self._prep_numerical_source(
             measure, config, source_df
         )
@@ -1050,6 +1293,7 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
 
     @TimeableMixin.TimeAs
     def _fit_vocabulary(self, measure: str, config: MeasurementConfig, source_df: DF_T) -> Vocabulary:
+        source_df = self._collect_measure_source(measure, config, source_df)
         match config.modality:
             case DataModality.MULTIVARIATE_REGRESSION:
                 val_types = pl.from_pandas(
@@ -1110,20 +1354,45 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
             except AssertionError as e:
                 raise AssertionError(f"Failed to build vocabulary for {measure}") from e
 
-    @TimeableMixin.TimeAs
-    def _transform_numerical_measurement(
-        self, measure: str, config: MeasurementConfig, source_df: DF_T
-    ) -> DF_T:
-        source_df, keys_col_name, vals_col_name, inliers_col_name, _ = self._prep_numerical_source(
-            measure, config, source_df
-        )
-        keys_col = pl.col(keys_col_name)
-        vals_col = pl.col(vals_col_name)
+    def _numerical_transform_exprs(
+        self, measure: str, config: MeasurementConfig
+    ) -> tuple[list[dict[str, pl.Expr]], pl.Expr, pl.Expr, pl.Expr | None, pl.Expr]:
+        """Returns expressions for the transformed keys and values of numerical measurement `measure`.
 
-        cols_to_drop_at_end = []
-        for col in config.measurement_metadata:
-            if col != measure and col in source_df:
-                cols_to_drop_at_end.append(col)
+        Rather than joining the measurement metadata onto the source dataframe, the fit parameters for each
+        observation are looked up by the position of its key in the (small) metadata dataframe, so that the
+        returned expressions can be evaluated directly over the source dataframe. Intermediate results that
+        are used repeatedly are computed once, into temporary columns prefixed by ``"__{measure}/"``.
+
+        Args:
+            measure: The column name of the governing measurement to transform.
+            config: The configuration object governing this measure.
+
+        Returns:
+            The successive steps of expressions (by column name) which compute the temporary columns, then
+            the expressions over the source dataframe and those columns for the transformed keys, the
+            transformed values, the inlier indicators (or `None` if no outlier detector is configured), and
+            an indicator of those observations which are removed entirely, as they are present but no fit
+            outlier model applies to them.
+        """
+        keys_col_name, vals_col_name, metadata = self._numerical_metadata_as_polars(measure, config)
+
+        temp_steps = []
+        if config.modality == DataModality.UNIVARIATE_REGRESSION:
+            keys_col = pl.lit(measure).cast(pl.Categorical)
+            metadata_idx = pl.lit(0, dtype=pl.UInt32)
+        else:
+            keys_col = pl.col(keys_col_name)
+            keys = metadata[keys_col_name].cast(pl.Utf8).to_list()
+            metadata_idx_col_name = f"__{measure}/metadata_idx"
+            metadata_idx = keys_col.map_dict(dict(zip(keys, range(len(keys)))), return_dtype=pl.UInt32)
+            temp_steps.append({metadata_idx_col_name: metadata_idx.alias(metadata_idx_col_name)})
+            metadata_idx = pl.col(metadata_idx_col_name)
+
+        def metadata_col(col: str) -> pl.Expr:
+            return pl.lit(metadata[col]).take(metadata_idx)
+
+        vals_col = pl.col(vals_col_name)
 
         bound_cols = {}
         for col in (
@@ -1134,85 +1403,101 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
             "censor_lower_bound",
             "censor_upper_bound",
         ):
-            if col in source_df:
-                bound_cols[col] = pl.col(col)
+            if col in metadata:
+                bound_cols[col] = metadata_col(col)
 
         if bound_cols:
             vals_col = self.drop_or_censor(vals_col, **bound_cols)
 
-        value_type = pl.col("value_type")
-        keys_col = (
-            pl.when(value_type == NumericDataModalitySubtype.DROPPED)
-            .then(keys_col)
-            .when(value_type == NumericDataModalitySubtype.CATEGORICAL_INTEGER)
-            .then(keys_col + "__EQ_" + vals_col.round(0).fill_nan(-1).cast(pl.Int64).cast(pl.Utf8))
-            .when(value_type == NumericDataModalitySubtype.CATEGORICAL_FLOAT)
-            .then(keys_col + "__EQ_" + vals_col.cast(pl.Utf8))
-            .otherwise(keys_col)
-            .alias(keys_col_name)
-        )
+        # Only the branches for the value types of some key of this measurement need to be evaluated.
+        value_type = metadata_col("value_type")
+        value_types = set(metadata["value_type"].drop_nulls().cast(pl.Utf8))
 
-        vals_col = (
-            pl.when(
-                value_type.is_in(
-                    [
-                        NumericDataModalitySubtype.DROPPED,
-                        NumericDataModalitySubtype.CATEGORICAL_INTEGER,
-                        NumericDataModalitySubtype.CATEGORICAL_FLOAT,
-                    ]
+        key_branches = []
+        if NumericDataModalitySubtype.CATEGORICAL_INTEGER in value_types:
+            key_branches.append(
+                (
+                    value_type == NumericDataModalitySubtype.CATEGORICAL_INTEGER,
+                    keys_col + "__EQ_" + vals_col.round(0).fill_nan(-1).cast(pl.Int64).cast(pl.Utf8),
+                )
+            )
+        if NumericDataModalitySubtype.CATEGORICAL_FLOAT in value_types:
+            key_branches.append(
+                (
+                    value_type == NumericDataModalitySubtype.CATEGORICAL_FLOAT,
+                    keys_col + "__EQ_" + vals_col.cast(pl.Utf8),
                 )
             )
-            .then(np.NaN)
-            .when(value_type == NumericDataModalitySubtype.INTEGER)
-            .then(vals_col.round(0))
-            .otherwise(vals_col)
-            .alias(vals_col_name)
-        )
 
-        source_df = source_df.with_columns(keys_col, vals_col)
+        dropped_value_types = value_types.intersection(
+            (
+                NumericDataModalitySubtype.DROPPED,
+                NumericDataModalitySubtype.CATEGORICAL_INTEGER,
+                NumericDataModalitySubtype.CATEGORICAL_FLOAT,
+            )
+        )
+        val_branches = []
+        if dropped_value_types:
+            val_branches.append((value_type.is_in(sorted(dropped_value_types)), np.NaN))
+        if NumericDataModalitySubtype.INTEGER in value_types:
+            val_branches.append((value_type == NumericDataModalitySubtype.INTEGER, vals_col.round(0)))
+
+        def when_then_otherwise(branches: list[tuple[pl.Expr, Any]], otherwise: pl.Expr) -> pl.Expr:
+            if not branches:
+                return otherwise
+            expr = pl.when(branches[0][0]).then(branches[0][1])
+            for cond, val in branches[1:]:
+                expr = expr.when(cond).then(val)
+            return expr.otherwise(otherwise)
+
+        keys_col = when_then_otherwise(key_branches, keys_col)
+        vals_col = when_then_otherwise(val_branches, vals_col)
+
+        vals_col_name = f"__{measure}/vals"
+        temp_exprs = {vals_col_name: vals_col.alias(vals_col_name)}
+        vals_col = pl.col(vals_col_name)
+        if key_branches:
+            keys_col_name = f"__{measure}/keys"
+            temp_exprs[keys_col_name] = keys_col.alias(keys_col_name)
+            keys_col = pl.col(keys_col_name)
+        temp_steps.append(temp_exprs)
 
         null_idx = keys_col.is_null() | vals_col.is_null() | vals_col.is_nan()
 
-        null_source = source_df.filter(null_idx)
-        present_source = source_df.filter(~null_idx)
-
-        if len(present_source) == 0:
-            if self.config.outlier_detector_config is not None:
-                null_source = null_source.with_columns(pl.lit(None).cast(pl.Boolean).alias(inliers_col_name))
-            return null_source.drop(cols_to_drop_at_end)
-
-        # 5. Add inlier/outlier indices and remove learned outliers.
-        if self.config.outlier_detector_config is not None:
-            M = self._get_preprocessing_model(self.config.outlier_detector_config, for_fit=False)
-
-            inliers_col = ~M.predict_from_polars(vals_col, pl.col("outlier_model")).alias(inliers_col_name)
-            vals_col = pl.when(inliers_col).then(vals_col).otherwise(np.NaN)
-
-            present_source = present_source.with_columns(inliers_col, vals_col)
-            null_source = null_source.with_columns(pl.lit(None).cast(pl.Boolean).alias(inliers_col_name))
-
-            new_nulls = present_source.filter(~pl.col(inliers_col_name))
-            null_source = null_source.vstack(new_nulls)
-            present_source = present_source.filter(inliers_col_name)
-
-        if len(present_source) == 0:
-            return null_source.drop(cols_to_drop_at_end)
-
         # 6. Normalize values.
+        normalized_vals_col = vals_col
         if self.config.normalizer_config is not None:
             M = self._get_preprocessing_model(self.config.normalizer_config, for_fit=False)
+            normalized_vals_col = M.predict_from_polars(vals_col, metadata_col("normalizer"))
 
-            vals_col = M.predict_from_polars(vals_col, pl.col("normalizer"))
-            present_source = present_source.with_columns(vals_col)
+        # 5. Add inlier/outlier indices and remove learned outliers.
+        if self.config.outlier_detector_config is None:
+            vals_col = pl.when(null_idx).then(vals_col).otherwise(normalized_vals_col)
+            return temp_steps, keys_col, vals_col, None, pl.lit(False)
 
-        source_df = present_source.vstack(null_source)
+        M = self._get_preprocessing_model(self.config.outlier_detector_config, for_fit=False)
+        is_outlier = M.predict_from_polars(vals_col, metadata_col("outlier_model"))
 
-        return source_df.drop(cols_to_drop_at_end)
+        inliers_col = pl.when(null_idx).then(pl.lit(None).cast(pl.Boolean)).otherwise(~is_outlier)
+        vals_col = (
+            pl.when(null_idx).then(vals_col).when(~is_outlier).then(normalized_vals_col).otherwise(np.NaN)
+        )
+        is_dropped = ~null_idx & is_outlier.is_null()
 
-    @TimeableMixin.TimeAs
-    def _transform_categorical_measurement(
-        self, measure: str, config: MeasurementConfig, source_df: DF_T
-    ) -> DF_T:
+        return temp_steps, keys_col, vals_col, inliers_col, is_dropped
+
+    def _categorical_transform_exprs(
+        self, measure: str, config: MeasurementConfig, keys_col: pl.Expr, vals_col: pl.Expr | None
+    ) -> dict[str, pl.Expr]:
+        """Returns expressions mapping the observations of `measure` onto its vocabulary, by output column.
+
+        Args:
+            measure: The column name of the governing measurement to transform.
+            config: The configuration object governing this measure.
+            keys_col: The expression for the vocabulary elements of `measure`.
+            vals_col: The expression for the associated values of `measure`, if it is a regression
+                measurement.
+        """
         if (config.modality == DataModality.UNIVARIATE_REGRESSION) and (
             config.measurement_metadata.value_type
             not in (
@@ -1220,33 +1505,183 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
                 NumericDataModalitySubtype.CATEGORICAL_FLOAT,
             )
         ):
-            return source_df
+            return {}
 
-        transform_expr = []
+        transform_exprs = {}
         if config.modality == DataModality.MULTIVARIATE_REGRESSION:
-            transform_expr.append(
-                pl.when(~pl.col(measure).is_in(config.vocabulary.vocabulary))
-                .then(np.NaN)
-                .otherwise(pl.col(config.values_column))
-                .alias(config.values_column)
+            transform_exprs[config.values_column] = (
+                pl.when(~keys_col.is_in(config.vocabulary.vocabulary)).then(np.NaN).otherwise(vals_col)
             )
-            vocab_el_col = pl.col(measure)
-        elif config.modality == DataModality.UNIVARIATE_REGRESSION:
-            vocab_el_col = pl.col("const_key")
-        else:
-            vocab_el_col = pl.col(measure)
 
-        transform_expr.append(
-            pl.when(vocab_el_col.is_null())
+        transform_exprs[measure] = (
+            pl.when(keys_col.is_null())
             .then(None)
-            .when(~vocab_el_col.is_in(config.vocabulary.vocabulary))
+            .when(~keys_col.is_in(config.vocabulary.vocabulary))
             .then(pl.lit("UNK"))
-            .otherwise(vocab_el_col)
+            .otherwise(keys_col)
             .cast(pl.Categorical)
-            .alias(measure)
         )
 
-        return source_df.with_columns(transform_expr)
+        return transform_exprs
+
+    @TimeableMixin.TimeAs
+    def _transform_numerical_measurement(
+        self, measure: str, config: MeasurementConfig, source_df: DF_T
+    ) -> DF_T:
+        temp_steps, keys_col, vals_col, inliers_col, is_dropped = self._numerical_transform_exprs(
+            measure, config
+        )
+
+        temp_cols = []
+        for temp_exprs in temp_steps:
+            source_df = source_df.with_columns(list(temp_exprs.values()))
+            temp_cols.extend(temp_exprs)
+
+        if config.modality == DataModality.UNIVARIATE_REGRESSION:
+            transform_exprs = [keys_col.alias("const_key"), vals_col.alias(measure)]
+        else:
+            transform_exprs = [keys_col.alias(measure), vals_col.alias(config.values_column)]
+
+        if inliers_col is not None:
+            transform_exprs.append(inliers_col.alias(f"{measure}_is_inlier"))
+
+        return source_df.filter(~is_dropped).with_columns(transform_exprs).drop(temp_cols)
+
+    @TimeableMixin.TimeAs
+    def _transform_categorical_measurement(
+        self, measure: str, config: MeasurementConfig, source_df: DF_T
+    ) -> DF_T:
+        match config.modality:
+            case DataModality.MULTIVARIATE_REGRESSION:
+                keys_col, vals_col = pl.col(measure), pl.col(config.values_column)
+            case DataModality.UNIVARIATE_REGRESSION:
+                keys_col, vals_col = pl.col("const_key"), pl.col(measure)
+            case _:
+                keys_col, vals_col = pl.col(measure), None
+
+        transform_exprs = self._categorical_transform_exprs(measure, config, keys_col, vals_col)
+        return source_df.with_columns(**transform_exprs)
+
+    def _transform_measurement_exprs(
+        self, measure: str, config: MeasurementConfig
+    ) -> list[dict[str, pl.Expr]]:
+        """Returns the successive steps of expressions that transform `measure` over its source dataframe.
+
+        These produce the same outputs as `_transform_measurement`, but without filtering the source dataframe
+        to the observations of `measure` and joining the transformed columns back afterwards; instead, the
+        output columns are set to null wherever `measure` is not observed.
+
+        Returns:
+            A list of steps, each of which maps column names to the expressions (over the source dataframe and
+            the columns added in prior steps) that produce them. All but the last step add only temporary
+            columns, prefixed by ``"__{measure}/"``; the last step produces the transformed output columns.
+        """
+        is_kept = pl.col(measure).is_not_null()
+        keys_col, vals_col = pl.col(measure), None
+
+        steps = []
+        transform_exprs = {}
+        if config.is_numeric:
+            steps, keys_col, vals_col, inliers_col, is_dropped = self._numerical_transform_exprs(
+                measure, config
+            )
+            is_kept = is_kept & ~is_dropped
+
+            if config.modality == DataModality.MULTIVARIATE_REGRESSION:
+                transform_exprs[measure] = keys_col
+                transform_exprs[config.values_column] = vals_col
+            else:
+                transform_exprs[measure] = vals_col
+
+            if inliers_col is not None:
+                transform_exprs[f"{measure}_is_inlier"] = inliers_col
+
+        if config.vocabulary is not None:
+            transform_exprs.update(self._categorical_transform_exprs(measure, config, keys_col, vals_col))
+
+        steps.append({col: pl.when(is_kept).then(expr).alias(col) for col, expr in transform_exprs.items()})
+        return steps
+
+    @staticmethod
+    def _apply_transform_steps(df: DF_T, steps_by_measure: list[list[dict[str, pl.Expr]]]) -> DF_T:
+        """Applies the transformation steps of each measure to `df`, in as few ``with_columns`` as possible.
+
+        The temporary columns of all measures are computed together, in one ``with_columns`` per step, and
+        are dropped at the end. The output expressions are likewise batched into a single ``with_columns``
+        until a measure writes a column that an earlier measure in the batch also writes, in which case that
+        measure starts a new batch, so that (as when measures are transformed one at a time) its outputs
+        overwrite the earlier ones.
+
+        Examples:
+            >>> df = pl.DataFrame({"a": [1, 2], "b": [3, 4]})
+            >>> Dataset._apply_transform_steps(df, [
+            ...     [{"__a/x": (pl.col("a") * 2).alias("__a/x")}, {"a": (pl.col("__a/x") + 1).alias("a")}],
+            ...     [{"c": pl.col("b").alias("c")}],
+            ...     [{"b": (pl.col("a") * 10).alias("b")}],
+            ...     [{"c": (pl.col("a") * 100).alias("c")}],
+            ... ])
+            shape: (2, 3)
+            ┌─────┬─────┬─────┐
+            │ a   ┆ b   ┆ c   │
+            │ --- ┆ --- ┆ --- │
+            │ i64 ┆ i64 ┆ i64 │
+            ╞═════╪═════╪═════╡
+            │ 3   ┆ 10  ┆ 300 │
+            │ 5   ┆ 20  ┆ 500 │
+            └─────┴─────┴─────┘
+        """
+        temp_steps = defaultdict(list)
+        temp_cols = []
+        output_stages = [[]]
+        output_cols = set()
+        for steps in steps_by_measure:
+            *measure_temp_steps, transform_exprs = steps
+            for i, temp_exprs in enumerate(measure_temp_steps):
+                temp_steps[i].extend(temp_exprs.values())
+                temp_cols.extend(temp_exprs)
+
+            if output_cols.intersection(transform_exprs):
+                output_stages.append([])
+                output_cols = set()
+            output_stages[-1].extend(transform_exprs.values())
+            output_cols.update(transform_exprs)
+
+        for i in sorted(temp_steps):
+            df = df.with_columns(temp_steps[i])
+        for stage in output_stages:
+            if stage:
+                df = df.with_columns(stage)
+        return df.drop(temp_cols)
+
+    def transform_measurements(self):
+        """Transforms the entire dataset given the fit preprocessing parameters.
+
+        The transformations of all measurements that share a source dataframe are applied together, with a
+        single ``with_columns`` over that dataframe (or over each of its chunks, in lazy mode) rather than
+        with a filter and a join back per measurement.
+
+        Raises:
+            ValueError: If building the transformation of a given measurement fails.
+        """
+        steps_by_attr = defaultdict(list)
+        for measure, config in self.measurement_configs.items():
+            source_attr, _, _ = self._get_source_df(config, do_only_train=False)
+            try:
+                steps_by_attr[source_attr].append(self._transform_measurement_exprs(measure, config))
+            except BaseException as e:
+                raise ValueError(f"Transforming measurement failed for measure {measure}!") from e
+
+        for source_attr, steps_by_measure in steps_by_attr.items():
+            if self.lazy and source_attr == "dynamic_measurements_df":
+                self._checkpoint_dynamic_measurements_df(
+                    chunk_fn=lambda chunk_df: self._apply_transform_steps(chunk_df, steps_by_measure)
+                )
+            else:
+                setattr(
+                    self,
+                    source_attr,
+                    self._apply_transform_steps(getattr(self, source_attr), steps_by_measure),
+                )
 
     @TimeableMixin.TimeAs
     def _update_attr_df(self, attr: str, id_col: str, df: DF_T, cols_to_update: list[str]):
@@ -1365,6 +1800,8 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
         else:
             dynamic_measurements_df = self.dynamic_measurements_df
 
+        dynamic_measurements_df = self._collect(dynamic_measurements_df)
+
         dynamic_ids = ["event_id", "measurement_id"] if do_sort_outputs else ["event_id"]
         dynamic_data = self._melt_df(dynamic_measurements_df, dynamic_ids, dynamic_measures)
 
@@ -1384,12 +1821,18 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
                 pl.col("value").alias("dynamic_values"),
             )
             .sort("subject_id", "timestamp")
+            .with_columns(
+                # This is computed outside of the aggregation below as, in that context, polars fails to
+                # resolve the type of the time delta for subject chunks without any events.
+                (
+                    (pl.col("timestamp") - pl.col("timestamp").min().over("subject_id")).dt.nanoseconds()
+                    / (1e9 * 60)
+                ).alias("time")
+            )
             .groupby("subject_id")
             .agg(
                 pl.col("timestamp").first().alias("start_time"),
-                ((pl.col("timestamp") - pl.col("timestamp").min()).dt.nanoseconds() / (1e9 * 60)).alias(
-                    "time"
-                ),
+                pl.col("time"),
                 pl.col("dynamic_measurement_indices"),
                 pl.col("dynamic_indices"),
                 pl.col("dynamic_values"),
@@ -1767,86 +2210,233 @@ class Dataset(DatasetBase[DF_T, INPUT_DF_T]):
         ).lazy()
         return flat_df
 
-    def _summarize_over_window(self, df: DF_T, window_size: str) -> pl.LazyFrame:
-        if isinstance(df, Path):
-            df = pl.scan_parquet(df)
+    @staticmethod
+    def _window_sums(values: np.ndarray, window_start: np.ndarray) -> np.ndarray:
+        """Sums ``values[window_start[..., i] : i + 1]`` for each ``i`` via differences of one cumulative sum.
 
-        def time_aggd_col_alias_fntr(new_agg: str | None = None) -> Callable[[str], str]:
-            if new_agg is None:
+        This is only exact for integer values. Differences of a floating point cumulative sum lose all
+        precision in windows that follow a value of much greater magnitude, so it must not be used for them.
 
-                def f(c: str) -> str:
-                    return "/".join([window_size] + c.split("/")[1:])
+        Args:
+            values: The integer values to sum.
+            window_start: The (inclusive) start index of the window ending at each index, either for a single
+                set of windows (of the same shape as `values`) or for several (stacked along the first axis).
+                These must satisfy ``0 <= window_start[..., i] <= i``.
 
-            else:
+        Examples:
+            >>> Dataset._window_sums(np.array([1, 2, 3, 4]), np.array([[0, 0, 1, 3], [0, 1, 2, 3]]))
+            array([[1, 3, 5, 4],
+                   [1, 2, 3, 4]])
+        """
+        cumsum = np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+        return cumsum[1:] - cumsum[window_start]
 
-                def f(c: str) -> str:
-                    return "/".join([window_size] + c.split("/")[1:-1] + [new_agg])
+    @staticmethod
+    def _window_extrema(values: np.ndarray, window_start: np.ndarray, fn: np.ufunc) -> np.ndarray:
+        """Reduces ``values[window_start[..., i] : i + 1]`` via `fn` for each ``i``, using a sparse table.
 
-            return f
+        Level ``k`` of the table holds the reduction of each run of ``2**k`` values, so each window is covered
+        by the (overlapping) two runs of the largest length that fits within it. Levels are built one at a
+        time and windows answered as soon as their level is available, so only one level is held at once.
 
-        # Columns to convert to counts:
-        present_indicator_cols = cs.ends_with("/present")
+        Args:
+            values: The values to reduce.
+            window_start: The (inclusive) start index of the window ending at each index, either for a single
+                set of windows (of the same shape as `values`) or for several (stacked along the first axis).
+                These must satisfy ``0 <= window_start[..., i] <= i``.
+            fn: An idempotent binary reduction, e.g., `np.fmin` or `np.fmax` (which ignore ``NaN`` values).
 
-        # Columns to convert to value aggregations:
-        value_cols = cs.ends_with("/value")
+        Examples:
+            >>> vals = np.array([3.0, 1.0, np.nan, 5.0, 2.0, 4.0])
+            >>> Dataset._window_extrema(vals, np.array([0, 0, 0, 1, 2, 2]), np.fmin)
+            array([3., 1., 1., 1., 2., 2.])
+            >>> Dataset._window_extrema(vals, np.array([[0, 0, 2, 1, 2, 2], [0, 1, 2, 3, 4, 5]]), np.fmax)
+            array([[ 3.,  3., nan,  5.,  5.,  5.],
+                   [ 3.,  1., nan,  5.,  2.,  4.]])
+        """
+        shape = window_start.shape
+        out = np.empty(window_start.size, dtype=values.dtype)
+        if len(values) == 0:
+            return out.reshape(shape)
+
+        window_start = window_start.ravel()
+        window_end = np.tile(np.arange(len(values)), window_start.size // len(values))
+
+        # Windows are answered in order of their level, which is the floor of the log2 of their length.
+        # Levels are small integers, for which a stable sort is a (linear time) radix sort.
+        window_level = (np.frexp(window_end - window_start + 1)[1] - 1).astype(np.int8)
+        order = np.argsort(window_level, kind="stable")
+        level_bounds = np.searchsorted(window_level[order], np.arange(window_level.max() + 2))
+
+        level_vals = values
+        for level in range(window_level.max() + 1):
+            run_len = 1 << level
+            if level > 0:
+                level_vals = fn(level_vals[: -run_len // 2], level_vals[run_len // 2 :])
+
+            idx = order[level_bounds[level] : level_bounds[level + 1]]
+            out[idx] = fn(level_vals[window_start[idx]], level_vals[window_end[idx] - run_len + 1])
+
+        return out.reshape(shape)
+
+    def _summarize_over_windows(self, df: DF_T, window_sizes: list[str]) -> dict[str, pl.LazyFrame]:
+        """Summarizes the flat representation `df` over each of the historical windows in `window_sizes`.
+
+        The summary over a window size (e.g., ``"7d"``) at each event of a subject aggregates that event and
+        all of the subject's prior events within that window of time, and the summary over ``"FULL"``
+        aggregates that event and all of the subject's prior events. Rather than aggregating over each window
+        separately, counts over every window are taken as differences of a single cumulative sum (see
+        `_window_sums`), and minima and maxima are looked up in a single sparse table (see `_window_extrema`),
+        so each additional window only costs locating its bounds. Floating point sums can't be differenced
+        without losing precision, so those are aggregated over each window by `polars`.
 
-        # Columns to aggregate via other operations
-        cnt_cols = (cs.ends_with("/count") | cs.ends_with("/has_values_count")).fill_null(0)
+        Args:
+            df: The flat representation to summarize, or the path to it, with rows sorted by ``subject_id``
+                and ``timestamp``.
+            window_sizes: The window sizes to summarize over, as ``"FULL"`` or `polars` duration strings.
 
-        cols_to_sum = cs.ends_with("/sum") | cs.ends_with("/sum_sqd")
-        cols_to_min = cs.ends_with("/min")
-        cols_to_max = cs.ends_with("/max")
+        Returns:
+            A dictionary from each window size to the summarized representation over that window.
+        """
+        if isinstance(df, Path):
+            df = pl.read_parquet(df)
+        elif isinstance(df, pl.LazyFrame):
+            df = df.collect()
+
+        feature_cols = [c for c in df.columns if c not in ("subject_id", "timestamp")]
+
+        def cols_with_suffix(*suffixes: str) -> list[str]:
+            return [c for suffix in suffixes for c in feature_cols if c.endswith(suffix)]
+
+        def renamed(c: str, new_agg: str | None = None) -> list[str]:
+            parts = c.split("/")[1:]
+            return parts if new_agg is None else parts[:-1] + [new_agg]
+
+        # Columns to convert to counts, to convert to value aggregations, and to aggregate via other ops.
+        present_indicator_cols = cols_with_suffix("/present")
+        value_cols = cols_with_suffix("/value")
+        cnt_cols = cols_with_suffix("/count", "/has_values_count")
+        cols_to_sum = cols_with_suffix("/sum", "/sum_sqd")
+        cols_to_min = cols_with_suffix("/min")
+        cols_to_max = cols_with_suffix("/max")
+
+        # Each output column is a sum, min, or max over the window of a per-event source expression.
+        aggs = [
+            *((renamed(c, "count"), "sum", pl.col(c)) for c in present_indicator_cols),
+            *((renamed(c, "count"), "sum", pl.col(c).is_not_null()) for c in value_cols),
+            *(
+                (renamed(c, "has_values_count"), "sum", pl.col(c).is_not_null() & pl.col(c).is_not_nan())
+                for c in value_cols
+            ),
+            *((renamed(c, "sum"), "sum", pl.col(c)) for c in value_cols),
+            *((renamed(c, "sum_sqd"), "sum", pl.col(c) ** 2) for c in value_cols),
+            *((renamed(c, "min"), "min", pl.col(c)) for c in value_cols),
+            *((renamed(c, "max"), "max", pl.col(c)) for c in value_cols),
+            *((renamed(c), "sum", pl.col(c).fill_null(0)) for c in cnt_cols),
+            *((renamed(c), "sum", pl.col(c)) for c in cols_to_sum),
+            *((renamed(c), "min", pl.col(c)) for c in cols_to_min),
+            *((renamed(c), "max", pl.col(c)) for c in cols_to_max),
+        ]
 
-        if window_size == "FULL":
-            df = df.groupby("subject_id").agg(
-                "timestamp",
-                # present to counts
-                present_indicator_cols.cumsum().map_alias(time_aggd_col_alias_fntr("count")),
-                # values to stats
-                value_cols.is_not_null().cumsum().map_alias(time_aggd_col_alias_fntr("count")),
-                (
-                    (value_cols.is_not_null() & value_cols.is_not_nan())
-                    .cumsum()
-                    .map_alias(time_aggd_col_alias_fntr("has_values_count"))
-                ),
-                value_cols.cumsum().map_alias(time_aggd_col_alias_fntr("sum")),
-                (value_cols**2).cumsum().map_alias(time_aggd_col_alias_fntr("sum_sqd")),
-                value_cols.cummin().map_alias(time_aggd_col_alias_fntr("min")),
-                value_cols.cummax().map_alias(time_aggd_col_alias_fntr("max")),
-                # Raw aggregations
-                cnt_cols.cumsum().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_sum.cumsum().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_min.cummin().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_max.cummax().map_alias(time_aggd_col_alias_fntr()),
+        if "FULL" in window_sizes:
+            # Over the full history, all aggregations are plain cumulative ones.
+            cum_fns = {"sum": lambda e: e.cumsum(), "min": lambda e: e.cummin(), "max": lambda e: e.cummax()}
+            full_df = (
+                df.lazy()
+                .groupby("subject_id", maintain_order=True)
+                .agg(
+                    "timestamp",
+                    *(
+                        cum_fns[agg](expr).alias("/".join(["FULL", *name_parts]))
+                        for name_parts, agg, expr in aggs
+                    ),
+                )
             )
-            df = df.explode(*[c for c in df.columns if c != "subject_id"])
-        else:
-            df = df.groupby_rolling(
-                index_column="timestamp",
-                by="subject_id",
-                period=window_size,
-            ).agg(
-                # present to counts
-                present_indicator_cols.sum().map_alias(time_aggd_col_alias_fntr("count")),
-                # values to stats
-                value_cols.is_not_null().sum().map_alias(time_aggd_col_alias_fntr("count")),
-                (
-                    (value_cols.is_not_null() & value_cols.is_not_nan())
-                    .sum()
-                    .map_alias(time_aggd_col_alias_fntr("has_values_count"))
+            full_df = full_df.explode(*[c for c in full_df.columns if c != "subject_id"])
+
+        rolling_window_sizes = [w for w in window_sizes if w != "FULL"]
+        if rolling_window_sizes:
+            window_starts = (
+                df.with_row_count("__row_idx")
+                .select(
+                    (
+                        pl.col("__row_idx").min().over("subject_id")
+                        + pl.col("timestamp")
+                        .search_sorted(pl.col("timestamp").dt.offset_by(f"-{w}"), side="right")
+                        .over("subject_id")
+                    ).alias(w)
+                    for w in rolling_window_sizes
+                )
+                .to_numpy()
+                .T.astype(np.int64)
+            )
+
+            sources = df.select(
+                *(
+                    (expr if agg == "sum" else expr.is_not_null()).fill_null(0).alias(f"{i}/sum_source")
+                    for i, (_, agg, expr) in enumerate(aggs)
+                ),
+                *(
+                    expr.cast(pl.Float64).fill_null(float("nan")).alias(f"{i}/extrema_source")
+                    for i, (_, agg, expr) in enumerate(aggs)
+                    if agg != "sum"
                 ),
-                value_cols.sum().map_alias(time_aggd_col_alias_fntr("sum")),
-                (value_cols**2).sum().map_alias(time_aggd_col_alias_fntr("sum_sqd")),
-                value_cols.min().map_alias(time_aggd_col_alias_fntr("min")),
-                value_cols.max().map_alias(time_aggd_col_alias_fntr("max")),
-                # Raw aggregations
-                cnt_cols.sum().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_sum.sum().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_min.min().map_alias(time_aggd_col_alias_fntr()),
-                cols_to_max.max().map_alias(time_aggd_col_alias_fntr()),
             )
 
-        return self._normalize_flat_rep_df_cols(df, set_count_0_to_null=True)
+            float_sum_cols = [
+                f"{i}/sum_source"
+                for i, (_, agg, _) in enumerate(aggs)
+                if agg == "sum" and sources[f"{i}/sum_source"].dtype in (pl.Float32, pl.Float64)
+            ]
+            float_window_sum_cols = set(float_sum_cols)
+            # `groupby_rolling` returns one row per input row, in input order, as `df` is sorted by subject.
+            float_window_sums = {
+                w: sources.select(float_sum_cols)
+                .with_columns(df["subject_id"], df["timestamp"])
+                .groupby_rolling(index_column="timestamp", by="subject_id", period=w)
+                .agg(pl.col(float_sum_cols).sum().cast(pl.Float64))
+                for w in (rolling_window_sizes if float_sum_cols else [])
+            }
+
+            rolling_dfs = {
+                w: {"subject_id": df["subject_id"], "timestamp": df["timestamp"]}
+                for w in rolling_window_sizes
+            }
+            for i, (name_parts, agg, _) in enumerate(aggs):
+                if f"{i}/sum_source" in float_window_sum_cols:
+                    for w in rolling_window_sizes:
+                        col = "/".join([w, *name_parts])
+                        rolling_dfs[w][col] = float_window_sums[w][f"{i}/sum_source"].alias(col)
+                    continue
+
+                sum_source = sources[f"{i}/sum_source"].to_numpy().astype(np.int64)
+                window_sums = self._window_sums(sum_source, window_starts)
+
+                if agg != "sum":
+                    window_extrema = self._window_extrema(
+                        sources[f"{i}/extrema_source"].to_numpy(),
+                        window_starts,
+                        np.fmin if agg == "min" else np.fmax,
+                    )
+
+                for j, w in enumerate(rolling_window_sizes):
+                    col = "/".join([w, *name_parts])
+                    if agg == "sum":
+                        rolling_dfs[w][col] = pl.Series(col, window_sums[j])
+                        continue
+
+                    # Windows without any observed values have a null extremum, as in `polars`. Extrema are
+                    # only otherwise `NaN` if all observed values are, which is rare.
+                    rolling_dfs[w][col] = pl.Series(col, window_extrema[j], nan_to_null=True)
+                    is_nan = (window_sums[j] > 0) & np.isnan(window_extrema[j])
+                    if is_nan.any():
+                        rolling_dfs[w][col] = rolling_dfs[w][col].set(pl.Series(is_nan), float("nan"))
+
+        out = {}
+        for w in window_sizes:
+            summary_df = full_df if w == "FULL" else pl.DataFrame(rolling_dfs[w]).lazy()
+            out[w] = self._normalize_flat_rep_df_cols(summary_df, set_count_0_to_null=True)
+        return out
 
     def _denormalize(self, events_df: DF_T, col: str) -> DF_T:
         if self.config.normalizer_config is None:
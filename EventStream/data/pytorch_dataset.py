@@ -1,13 +1,23 @@
+import itertools
 import json
-from collections import defaultdict
+import logging
 from pathlib import Path
 
 import numpy as np
 import polars as pl
 import torch
+from filelock import FileLock
 from mixins import SaveableMixin, SeedableMixin, TimeableMixin
 
+from .cached_data_stats import CachedDataStats, with_time_delta
+from .columnar_storage import (
+    EVENT_COLUMNS,
+    ColumnarCachedData,
+    ColumnarCachedDataView,
+    flatten_list_series,
+)
 from .config import (
+    CachedDataStorageMode,
     MeasurementConfig,
     PytorchDatasetConfig,
     SeqPaddingSide,
@@ -16,6 +26,8 @@ from .config import (
 )
 from .types import PytorchBatch
 
+logger = logging.getLogger(__name__)
+
 DATA_ITEM_T = dict[str, list[float]]
 
 
@@ -55,6 +67,61 @@ def to_int_index(col: pl.Expr) -> pl.Expr:
     return pl.when(col.is_null()).then(pl.lit(None)).otherwise(indices).alias(col.meta.output_name())
 
 
+def _flatten_ragged(seqs: list) -> tuple[np.ndarray, np.ndarray]:
+    """Flattens a list of (possibly `None`) sequences into a single float array plus per-sequence lengths.
+
+    `None` sequences are treated as empty and `None` elements are converted to ``NaN``.
+
+    Examples:
+        >>> import numpy as np
+        >>> _flatten_ragged([[1, None], None, [3.5]])
+        (array([1. , nan, 3.5]), array([2, 0, 1]))
+        >>> _flatten_ragged([np.array([1, 2]), np.array([], dtype=int), np.array([3])])
+        (array([1., 2., 3.]), array([2, 0, 1]))
+    """
+    lengths = np.fromiter((0 if v is None else len(v) for v in seqs), dtype=np.int64, count=len(seqs))
+    non_empty = [v for v, n in zip(seqs, lengths) if n > 0]
+
+    if not non_empty:
+        return np.zeros(0, dtype=np.float64), lengths
+    if all(isinstance(v, np.ndarray) for v in non_empty):
+        return np.concatenate(non_empty).astype(np.float64, copy=False), lengths
+    return np.array(list(itertools.chain.from_iterable(non_empty)), dtype=np.float64), lengths
+
+
+def _within_group_positions(lengths: np.ndarray) -> np.ndarray:
+    """Returns the position of each element of a flattened ragged array within its original sequence.
+
+    Examples:
+        >>> import numpy as np
+        >>> _within_group_positions(np.array([2, 0, 3]))
+        array([0, 1, 0, 1, 2])
+    """
+    starts = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum(), dtype=np.int64) - np.repeat(starts, lengths)
+
+
+def _shape_bucket(n: int, max_n: int | None = None) -> int:
+    """Returns the smallest power of two that is at least ``n``, capped at ``max_n`` (if given).
+
+    Examples:
+        >>> _shape_bucket(5), _shape_bucket(8), _shape_bucket(1)
+        (8, 8, 1)
+        >>> _shape_bucket(100, max_n=100), _shape_bucket(65, max_n=100), _shape_bucket(64, max_n=100)
+        (100, 100, 64)
+    """
+    bucket = 1 << max(n - 1, 0).bit_length()
+    return bucket if max_n is None else min(bucket, max_n)
+
+
+def _to_index_tensor(vals: np.ndarray) -> torch.LongTensor:
+    """Converts flattened float index values to a long tensor, mapping ``NaN`` (missing) indices to 0.
+
+    Values are routed through float32, to match the historical per-event collation behavior.
+    """
+    return torch.from_numpy(np.nan_to_num(vals.astype(np.float32), nan=0).astype(np.int64))
+
+
 class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.data.Dataset):
     """A PyTorch Dataset class built on a pre-processed `DatasetBase` instance.
 
@@ -75,13 +142,32 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
     * There should be a set of inferred measurement configs stored in ``config.save_dir /
       'inferred_measurement_configs.json'``
     * If a task dataframe name is specified in the configuration object, then there should be either a
-      pre-cached task-specifid DL representation dataframe in ``config.save_dir / 'DL_reps' / 'for_task' /
-      config.task_df_name / f"{split}.parquet"``, or a "raw" task dataframe, containing subject IDs, start and
-      end times, and labels, stored in ``config.save_dir / task_dfs / f"{config.task_df_name}.parquet"``. In
-      the case that the latter is all that exists, then the former will be constructed by limiting the input
-      cached dataframe down to the appropriate sequences and adding label columns. This newly constructed
-      datafrmae will then be saved in the former filepath for future use. This construction process should
-      happen first on the train split, so that inferred task vocabularies are shared across splits.
+      task index in ``config.save_dir / 'DL_reps' / 'for_task' / config.task_df_name / 'index' /
+      f"{split}*.parquet"``, or a "raw" task dataframe, containing subject IDs, start and end times, and
+      labels, stored in ``config.save_dir / task_dfs / f"{config.task_df_name}.parquet"``. In the case that
+      the latter is all that exists, then the former will be constructed, with one file per cached data file
+      holding, for each task sample, the row of its subject in that file, the range of that subject's events
+      which fall in the task's time range, and its labels (see `_build_task_index`). The task samples are then
+      sliced out of the shared cached data upon loading, so no copy of the data is made per task. This
+      construction process should happen first on the train split, so that inferred task vocabularies are
+      shared across splits. Task-specific copies of the cached data written by earlier versions, in
+      ``config.save_dir / 'DL_reps' / 'for_task' / config.task_df_name / f"{split}*.parquet"``, are still
+      used if present.
+
+    The inter-event time statistics of the split (and the subjects with malformed, non-positive inter-event
+    times) are read from the summary statistics files written next to each cached data file (see
+    `EventStream.data.cached_data_stats.CachedDataStats`), which are computed and written here if missing or
+    out of date. For task datasets, they are computed directly from the task samples.
+
+    After loading, the data is held in memory either as python row tuples or, if
+    ``config.cached_data_storage`` is ``"columnar"``, as flat `numpy` arrays with offset indices (see
+    `EventStream.data.columnar_storage.ColumnarCachedData`). If it is ``"memmap"``, those arrays are instead
+    memory-mapped from a ``.memmap`` directory next to each parquet file (e.g., ``DL_reps/train_0.memmap``),
+    which is written on first use if it does not already exist.
+
+    The (truncated) sequence length and maximum number of data elements per event of each subject are
+    stored in the ``seq_lens`` and ``n_data_per_event`` attributes, so that batches of similarly sized
+    subjects can be formed via `EventStream.data.sampler.LengthBucketedBatchSampler`.
 
     Args:
         config: Configuration options for the dataset.
@@ -148,6 +234,7 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
 
         if self.config.task_df_name is not None:
             task_dir = self.config.save_dir / "DL_reps" / "for_task" / config.task_df_name
+            task_index_dir = task_dir / "index"
             raw_task_df_fp = self.config.save_dir / "task_dfs" / f"{self.config.task_df_name}.parquet"
             task_info_fp = task_dir / "task_info.json"
 
@@ -158,12 +245,13 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
                     f"Re-loading task data for {self.config.task_df_name} from {task_dir}:\n"
                     f"{', '.join([str(fp) for fp in task_dir.glob(f'{split}*.parquet')])}"
                 )
-                self.cached_data = pl.scan_parquet(task_dir / f"{split}*.parquet")
-                with open(task_info_fp) as f:
-                    task_info = json.load(f)
-                    self.tasks = sorted(task_info["tasks"])
-                    self.task_vocabs = task_info["vocabs"]
-                    self.task_types = task_info["types"]
+                self.cached_data = self._scan_cached_data(task_dir)
+                self._load_task_info(task_info_fp)
+
+            elif len(list(task_index_dir.glob(f"{split}*.parquet"))) > 0:
+                print(f"Re-loading task index for {self.config.task_df_name} from {task_index_dir}")
+                self._load_task_info(task_info_fp)
+                self.cached_data = self._scan_task_cached_data(task_index_dir, raw_task_df_fp)
 
             elif raw_task_df_fp.is_file():
                 task_df = pl.scan_parquet(raw_task_df_fp)
@@ -172,13 +260,7 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
                     [c for c in task_df.columns if c not in ["subject_id", "start_time", "end_time"]]
                 )
 
-                normalized_cols = []
-                for t in self.tasks:
-                    task_type, normalized_vals = self.normalize_task(col=pl.col(t), dtype=task_df.schema[t])
-                    self.task_types[t] = task_type
-                    normalized_cols.append(normalized_vals.alias(t))
-
-                task_df = task_df.with_columns(normalized_cols)
+                task_df = self._normalize_task_df(task_df)
 
                 for t in self.tasks:
                     match self.task_types[t]:
@@ -211,26 +293,15 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
 
                 if self.split != "train":
                     print(f"WARNING: Constructing task-specific dataset on non-train split {self.split}!")
-                for cached_data_fp in Path(self.config.save_dir / "DL_reps").glob(f"{split}*.parquet"):
-                    task_df_fp = task_dir / cached_data_fp.name
-                    if task_df_fp.is_file():
-                        continue
-
-                    print(f"Caching DL task dataframe for data file {cached_data_fp} at {task_df_fp}...")
-
-                    task_cached_data = self._build_task_cached_df(task_df, pl.scan_parquet(cached_data_fp))
 
-                    task_df_fp.parent.mkdir(exist_ok=True, parents=True)
-                    task_cached_data.collect().write_parquet(task_df_fp)
-
-                self.cached_data = pl.scan_parquet(task_dir / f"{split}*.parquet")
+                self.cached_data = self._scan_task_cached_data(task_index_dir, raw_task_df_fp, task_df)
             else:
                 raise FileNotFoundError(
-                    f"Neither {task_dir}/*.parquet nor {raw_task_df_fp} exist, but config.task_df_name = "
-                    f"{config.task_df_name}!"
+                    f"Neither {task_index_dir}/*.parquet, {task_dir}/*.parquet, nor {raw_task_df_fp} exist, "
+                    f"but config.task_df_name = {config.task_df_name}!"
                 )
         else:
-            self.cached_data = pl.scan_parquet(self.config.save_dir / "DL_reps" / f"{split}*.parquet")
+            self.cached_data = self._scan_cached_data(self.config.save_dir / "DL_reps")
             self.has_task = False
             self.tasks = None
             self.task_vocabs = None
@@ -242,36 +313,22 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
         length_constraint = pl.col("dynamic_indices").list.lengths() >= config.min_seq_len
         self.cached_data = self.cached_data.filter(length_constraint)
 
-        if "time_delta" not in self.cached_data.columns:
-            self.cached_data = self.cached_data.with_columns(
-                (pl.col("start_time") + pl.duration(minutes=pl.col("time").list.first())).alias("start_time"),
-                pl.col("time")
-                .list.eval(
-                    # We fill with 1 here as it will be ignored in the code anyways as the next event's
-                    # event mask will be null.
-                    # TODO(mmd): validate this in a test.
-                    (pl.col("").shift(-1) - pl.col("")).fill_null(1)
-                )
-                .alias("time_delta"),
-            ).drop("time")
-
-        stats = (
-            self.cached_data.select(pl.col("time_delta").explode().drop_nulls().alias("inter_event_time"))
-            .select(
-                pl.col("inter_event_time").min().alias("min"),
-                pl.col("inter_event_time").log().mean().alias("mean_log"),
-                pl.col("inter_event_time").log().std().alias("std_log"),
-            )
-            .collect()
-        )
+        self.cached_data = with_time_delta(self.cached_data)
+
+        if self.has_task:
+            # Task samples span only part of their subjects' records, so their statistics are computed here.
+            cached_data_stats = CachedDataStats.from_df(self.cached_data)
+        else:
+            cached_data_stats = self._load_cached_data_stats()
+        stats = cached_data_stats.summarize(config.min_seq_len)
 
-        if stats["min"].item() <= 0:
+        if cached_data_stats.malformed_subject_ids(config.min_seq_len):
             bad_inter_event_times = self.cached_data.filter(pl.col("time_delta").list.min() <= 0).collect()
             bad_subject_ids = [str(x) for x in list(bad_inter_event_times["subject_id"])]
             warning_strs = [
                 f"WARNING: Observed inter-event times <= 0 for {len(bad_inter_event_times)} subjects!",
                 f"ESD Subject IDs: {', '.join(bad_subject_ids)}",
-                f"Global min: {stats['min'].item()}",
+                f"Global min: {stats['min']}",
             ]
             if self.config.save_dir is not None:
                 fp = self.config.save_dir / f"malformed_data_{self.split}.parquet"
@@ -283,8 +340,29 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
 
             self.cached_data = self.cached_data.filter(pl.col("time_delta").list.min() > 0)
 
-        self.mean_log_inter_event_time_min = stats["mean_log"].item()
-        self.std_log_inter_event_time_min = stats["std_log"].item()
+        self.mean_log_inter_event_time_min = stats["mean_log"]
+        self.std_log_inter_event_time_min = stats["std_log"]
+
+        # These per-subject sizes are used to group subjects of similar sizes into batches (see
+        # `EventStream.data.sampler.LengthBucketedBatchSampler`).
+        self.cached_data = self.cached_data.with_columns(
+            pl.col("time_delta").list.lengths().alias("_seq_len"),
+            pl.col("dynamic_indices")
+            .list.eval(pl.element().list.lengths())
+            .list.max()
+            .fill_null(0)
+            .alias("_n_data_per_event"),
+        )
+
+        is_task_index = "start_event_idx" in self.cached_data.columns
+
+        if self.config.cached_data_storage == CachedDataStorageMode.MEMMAP:
+            # The data itself will be read from the memory-mapped files, so we only need the row locations
+            # (plus, for samples drawn from a task index, their event ranges and labels).
+            location_cols = ["subject_id", "shard_idx", "shard_row_idx"]
+            if is_task_index:
+                location_cols.extend(["start_event_idx", "end_event_idx", *self.tasks])
+            self.cached_data = self.cached_data.select(*location_cols, "_seq_len", "_n_data_per_event")
 
         self.cached_data = self.cached_data.collect()
 
@@ -302,139 +380,315 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
 
             self.cached_data = self.cached_data.sample(seed=self.config.train_subset_seed, **kwargs)
 
-        with self._time_as("convert_to_rows"):
-            self.subject_ids = self.cached_data["subject_id"].to_list()
-            self.cached_data = self.cached_data.drop("subject_id")
-            self.columns = self.cached_data.columns
-            self.cached_data = self.cached_data.rows()
+        self.seq_lens = np.minimum(self.cached_data["_seq_len"].to_numpy(), self.max_seq_len)
+        self.n_data_per_event = self.cached_data["_n_data_per_event"].to_numpy()
+        self.cached_data = self.cached_data.drop("_seq_len", "_n_data_per_event")
+
+        match self.config.cached_data_storage:
+            case CachedDataStorageMode.ROWS:
+                with self._time_as("convert_to_rows"):
+                    self.subject_ids = self.cached_data["subject_id"].to_list()
+                    self.cached_data = self.cached_data.drop("subject_id")
+                    self.columns = self.cached_data.columns
+                    self.cached_data = self.cached_data.rows()
+            case CachedDataStorageMode.COLUMNAR:
+                with self._time_as("convert_to_columnar"):
+                    self.subject_ids = self.cached_data["subject_id"].to_numpy()
+                    self.cached_data = ColumnarCachedData.from_df(self.cached_data.drop("subject_id"))
+                    self.columns = self.cached_data.columns
+            case CachedDataStorageMode.MEMMAP:
+                with self._time_as("open_memmap"):
+                    shards = []
+                    for fp in self.cached_data_fps:
+                        memmap_dir = ColumnarCachedData.memmap_dir_for(fp)
+                        # Each DDP rank builds its own dataset, so only one may write a missing or stale
+                        # shard; the others wait for it and then open what it wrote.
+                        with FileLock(memmap_dir.with_name(f"{memmap_dir.name}.lock")):
+                            if not ColumnarCachedData.is_current(memmap_dir, fp):
+                                logger.info(f"Writing memory-mapped data for {fp} to {memmap_dir}...")
+                                with self._time_as("write_memmap"):
+                                    ColumnarCachedData.from_df(pl.read_parquet(fp)).save(
+                                        memmap_dir, do_overwrite=True, source_fp=fp
+                                    )
+                            shards.append(ColumnarCachedData.load(memmap_dir))
+
+                    view_kwargs = {}
+                    if is_task_index:
+                        view_kwargs = {
+                            "event_start_idx": self.cached_data["start_event_idx"].to_numpy(),
+                            "event_end_idx": self.cached_data["end_event_idx"].to_numpy(),
+                            "extra_columns": {t: self.cached_data[t].to_numpy() for t in self.tasks},
+                        }
+
+                    self.subject_ids = self.cached_data["subject_id"].to_numpy()
+                    self.cached_data = ColumnarCachedDataView(
+                        shards,
+                        shard_idx=self.cached_data["shard_idx"].to_numpy(),
+                        shard_row_idx=self.cached_data["shard_row_idx"].to_numpy(),
+                        drop_columns=["subject_id"],
+                        **view_kwargs,
+                    )
+                    self.columns = self.cached_data.columns
+            case _:
+                raise ValueError(f"Invalid cached data storage mode: {self.config.cached_data_storage}!")
+
+    def _scan_cached_data(self, data_dir: Path) -> pl.LazyFrame:
+        """Lazily scans the cached data parquet files for this split in `data_dir`.
+
+        In memory-mapped storage mode, the files are scanned individually and each row is annotated with the
+        index of its file (``shard_idx``) and its row number within that file (``shard_row_idx``), so that it
+        can be located in the memory-mapped copy of that file.
+        """
+        self.cached_data_fps = sorted(data_dir.glob(f"{self.split}*.parquet"))
+        if not self.cached_data_fps:
+            raise FileNotFoundError(f"No cached data found in {data_dir} for split {self.split}!")
+
+        if self.config.cached_data_storage != CachedDataStorageMode.MEMMAP:
+            return pl.scan_parquet(data_dir / f"{self.split}*.parquet")
+
+        return pl.concat(
+            [
+                pl.scan_parquet(fp)
+                .with_row_count("shard_row_idx")
+                .with_columns(pl.lit(i, dtype=pl.UInt32).alias("shard_idx"))
+                for i, fp in enumerate(self.cached_data_fps)
+            ]
+        )
+
+    def _load_cached_data_stats(self) -> CachedDataStats:
+        """Loads the summary statistics of the cached data files of this split.
+
+        These are written alongside the cached data files by `Dataset.cache_deep_learning_representation`. The
+        statistics of any file for which they are missing or out of date are computed and written here.
+        """
+        stats = []
+        for fp in self.cached_data_fps:
+            stats_fp = CachedDataStats.stats_fp_for(fp)
+            fp_stats = CachedDataStats.load(stats_fp, fp)
+            if fp_stats is None:
+                logger.info(f"Writing summary statistics for {fp} to {stats_fp}...")
+                fp_stats = CachedDataStats.from_df(pl.scan_parquet(fp))
+                fp_stats.save(stats_fp, fp)
+            stats.append(fp_stats)
+        return CachedDataStats.concat(stats)
+
+    def _load_task_info(self, task_info_fp: Path):
+        with open(task_info_fp) as f:
+            task_info = json.load(f)
+            self.tasks = sorted(task_info["tasks"])
+            self.task_vocabs = task_info["vocabs"]
+            self.task_types = task_info["types"]
+
+    def _normalize_task_df(self, task_df: pl.LazyFrame) -> pl.LazyFrame:
+        """Normalizes the label columns `self.tasks` of `task_df`, recording their types in `task_types`."""
+        normalized_cols = []
+        for t in self.tasks:
+            task_type, normalized_vals = self.normalize_task(col=pl.col(t), dtype=task_df.schema[t])
+            self.task_types[t] = task_type
+            normalized_cols.append(normalized_vals.alias(t))
+
+        return task_df.with_columns(normalized_cols)
 
     @staticmethod
-    def _build_task_cached_df(task_df: pl.LazyFrame, cached_data: pl.LazyFrame) -> pl.LazyFrame:
-        """Restricts the data in a cached dataframe to only contain data for the passed task dataframe.
+    def _task_index_matches(task_index_fp: Path, cached_data_fp: Path) -> bool:
+        """Returns whether every task sample in `task_index_fp` points to a row of its own subject in
+        `cached_data_fp`, which will not be the case if the latter has been re-cached since the index was
+        built."""
+        task_index = pl.scan_parquet(task_index_fp).select("subject_id", "shard_row_idx")
+        cached_data = pl.scan_parquet(cached_data_fp).select("subject_id").with_row_count("shard_row_idx")
+        n_mismatched = (
+            task_index.join(cached_data, on="shard_row_idx", how="left", suffix="_cached")
+            .filter(
+                pl.col("subject_id_cached").is_null() | (pl.col("subject_id") != pl.col("subject_id_cached"))
+            )
+            .select(pl.count())
+            .collect()
+            .item()
+        )
+        return n_mismatched == 0
+
+    def _scan_task_cached_data(
+        self, task_index_dir: Path, raw_task_df_fp: Path, task_df: pl.LazyFrame | None = None
+    ) -> pl.LazyFrame:
+        """Lazily scans the cached data for this split, restricted to the task samples in `task_index_dir`.
+
+        Each cached data file for this split is joined to the task index file of the same name in
+        `task_index_dir` by row and subject, and the per-event columns are sliced to each task sample's range
+        of events. Task index files that are missing (e.g., for files added by `Dataset.append`) or out of
+        date with their cached data file (e.g., if it has been re-cached) are (re-)built from the task
+        dataframe. In memory-mapped storage mode, the row locations (``shard_idx`` and ``shard_row_idx``) and
+        event ranges (``start_event_idx`` and ``end_event_idx``) are retained, so that the samples can be read
+        directly from the memory-mapped copies of the (shared) cached data files.
+
+        Args:
+            task_index_dir: The directory holding the task index files.
+            raw_task_df_fp: The file holding the raw task dataframe, from which task index files are built.
+            task_df: The normalized task dataframe, if it has already been read. Otherwise, it is read from
+                `raw_task_df_fp` only if some task index file needs to be built.
+
+        Raises:
+            FileNotFoundError: If there are no cached data files for this split, or if a task index file needs
+                to be built but `raw_task_df_fp` does not exist.
+        """
+        self.cached_data_fps = sorted((self.config.save_dir / "DL_reps").glob(f"{self.split}*.parquet"))
+        if not self.cached_data_fps:
+            raise FileNotFoundError(f"No cached data found for split {self.split}!")
+
+        for cached_data_fp in self.cached_data_fps:
+            task_index_fp = task_index_dir / cached_data_fp.name
+            if task_index_fp.is_file():
+                if self._task_index_matches(task_index_fp, cached_data_fp):
+                    continue
+                print(f"WARNING: Task index {task_index_fp} is out of date with {cached_data_fp}!")
+
+            if task_df is None:
+                if not raw_task_df_fp.is_file():
+                    raise FileNotFoundError(
+                        f"Task index {task_index_fp} is missing or out of date, and {raw_task_df_fp} does "
+                        "not exist to rebuild it from!"
+                    )
+                task_df = self._normalize_task_df(pl.scan_parquet(raw_task_df_fp))
+
+            print(f"Building task index for data file {cached_data_fp} at {task_index_fp}...")
+
+            task_index = self._build_task_index(task_df, pl.scan_parquet(cached_data_fp))
+
+            task_index_fp.parent.mkdir(exist_ok=True, parents=True)
+            task_index.write_parquet(task_index_fp)
+
+        cached_data = pl.concat(
+            [
+                pl.scan_parquet(task_index_dir / fp.name)
+                .join(
+                    pl.scan_parquet(fp).with_row_count("shard_row_idx"),
+                    on=["shard_row_idx", "subject_id"],
+                    how="inner",
+                )
+                .with_columns(pl.lit(i, dtype=pl.UInt32).alias("shard_idx"))
+                for i, fp in enumerate(self.cached_data_fps)
+            ]
+        )
+
+        n_events = pl.col("end_event_idx") - pl.col("start_event_idx")
+        cached_data = cached_data.with_columns(
+            pl.col(c).list.slice(pl.col("start_event_idx"), n_events)
+            for c in EVENT_COLUMNS
+            if c in cached_data.columns
+        )
+
+        if self.config.cached_data_storage != CachedDataStorageMode.MEMMAP:
+            cached_data = cached_data.drop("shard_idx", "shard_row_idx", "start_event_idx", "end_event_idx")
+        return cached_data
+
+    @staticmethod
+    def _build_task_index(task_df: pl.LazyFrame, cached_data: pl.LazyFrame) -> pl.DataFrame:
+        """Locates the samples of a task dataframe within a cached data file.
+
+        For each task sample, this finds the row of its subject in `cached_data` and, via a binary search over
+        that subject's event times, the range of that subject's events which fall in the sample's time range
+        (including events at the start time, but not those at the end time). All the samples of a subject are
+        searched together.
 
         Args:
             task_df: A polars LazyFrame, which must have columns ``subject_id``, ``start_time`` and
                 ``end_time``. These three columns define the schema of the task (the inputs). The remaining
                 columns in the task dataframe will be interpreted as labels.
-            cached_data: A polars LazyFrame containing the data to be restricted to the task dataframe. Must
-                have the columns ``subject_id``, ``start_time``, ``time`` or ``time_delta``,
-                ``dynamic_indices``, ``dynamic_values``, and ``dynamic_measurement_indices``. These columns
-                will all be restricted to just contain those events whose time values are in the specified
-                task specific time range.
+            cached_data: A polars LazyFrame containing the cached data file. Must have the columns
+                ``subject_id``, ``start_time``, and ``time`` or ``time_delta``.
 
         Returns:
-            The restricted cached dataframe, which will have the same columns as the input cached dataframe
-            plus the task label columns, and will be limited to just those subjects and time-periods specified
-            in the task dataframe.
+            A dataframe with one row per task sample whose subject is in `cached_data`, ordered by the rows
+            of those subjects in `cached_data`, with the columns ``subject_id``, ``shard_row_idx`` (the row of
+            the subject in `cached_data`), ``start_event_idx`` and ``end_event_idx`` (such that the sample's
+            events are the subject's events ``start_event_idx:end_event_idx``), and the task label columns.
 
         Examples:
             >>> import polars as pl
             >>> from datetime import datetime
             >>> cached_data = pl.DataFrame({
-            ...     "subject_id": [0, 1, 2, 3],
-            ...     "start_time": [
-            ...         datetime(2020, 1, 1),
-            ...         datetime(2020, 2, 1),
-            ...         datetime(2020, 3, 1),
-            ...         datetime(2020, 1, 2)
-            ...     ],
+            ...     "subject_id": [0, 1, 2],
+            ...     "start_time": [datetime(2020, 1, 1), datetime(2020, 2, 1), datetime(2020, 3, 1)],
             ...     "time": [
             ...         [0.0, 60*24.0, 2*60*24., 3*60*24., 4*60*24.],
-            ...         [0.0, 7*60*24.0, 2*7*60*24., 3*7*60*24., 4*7*60*24.],
+            ...         [0.0, 7*60*24.0, 2*7*60*24.],
             ...         [0.0, 60*12.0, 2*60*12.],
-            ...         [0.0, 60*24.0, 2*60*24., 3*60*24., 4*60*24.],
-            ...     ],
-            ...     "dynamic_measurement_indices": [
-            ...         [[0, 1, 1], [0, 2], [0], [0, 3], [0]],
-            ...         [[0, 1, 1], [0, 4], [0], [0, 1], [0]],
-            ...         [[0, 1, 1], [0], [0, 4]],
-            ...         [[0, 1, 1], [0, 4], [0], [0, 2], [0]],
-            ...     ],
-            ...     "dynamic_indices": [
-            ...         [[6, 11, 12], [1, 40], [5], [1, 55], [5]],
-            ...         [[2, 11, 13], [1, 84], [8], [1, 19], [5]],
-            ...         [[1, 18, 21], [1], [5, 87]],
-            ...         [[3, 20, 21], [1, 94], [8], [1, 33], [9]],
-            ...     ],
-            ...     "dynamic_values": [
-            ...         [[None, 0.2, 1.0], [None, 0.0], [None], [None, None], [None]],
-            ...         [[None, -0.1, 0.0], [None, None], [None], [None, -4.2], [None]],
-            ...         [[None, 0.9, 1.2], [None], [None, None]],
-            ...         [[None, 3.2, -1.0], [None, None], [None], [None, 0.5], [None]],
             ...     ],
             ... })
             >>> task_df = pl.DataFrame({
-            ...     "subject_id": [0, 1, 2, 5],
+            ...     "subject_id": [2, 0, 5, 0],
             ...     "start_time": [
-            ...         datetime(2020, 1, 1),
-            ...         datetime(2020, 1, 11),
             ...         datetime(2020, 3, 1, 13),
-            ...         datetime(2020, 1, 2)
+            ...         datetime(2020, 1, 1),
+            ...         datetime(2020, 1, 2),
+            ...         datetime(2020, 1, 2, 12),
             ...     ],
             ...     "end_time": [
-            ...         datetime(2020, 1, 3),
-            ...         datetime(2020, 1, 21),
             ...         datetime(2020, 3, 4),
-            ...         datetime(2020, 1, 3)
+            ...         datetime(2020, 1, 3),
+            ...         datetime(2020, 1, 3),
+            ...         datetime(2020, 1, 30),
             ...     ],
-            ...     "label1": [0, 1, 0, 1],
-            ...     "label2": [0, 1, 5, 1]
+            ...     "label": [0, 1, 0, 1],
             ... })
-            >>> pl.Config.set_tbl_width_chars(88)
-            <class 'polars.config.Config'>
-            >>> PytorchDataset._build_task_cached_df(task_df, cached_data)
-            shape: (3, 8)
-            ┌───────────┬───────────┬───────────┬──────────┬──────────┬──────────┬────────┬────────┐
-            │ subject_i ┆ start_tim ┆ time      ┆ dynamic_ ┆ dynamic_ ┆ dynamic_ ┆ label1 ┆ label2 │
-            │ d         ┆ e         ┆ ---       ┆ measurem ┆ indices  ┆ values   ┆ ---    ┆ ---    │
-            │ ---       ┆ ---       ┆ list[f64] ┆ ent_indi ┆ ---      ┆ ---      ┆ i64    ┆ i64    │
-            │ i64       ┆ datetime[ ┆           ┆ ces      ┆ list[lis ┆ list[lis ┆        ┆        │
-            │           ┆ μs]       ┆           ┆ ---      ┆ t[i64]]  ┆ t[f64]]  ┆        ┆        │
-            │           ┆           ┆           ┆ list[lis ┆          ┆          ┆        ┆        │
-            │           ┆           ┆           ┆ t[i64]]  ┆          ┆          ┆        ┆        │
-            ╞═══════════╪═══════════╪═══════════╪══════════╪══════════╪══════════╪════════╪════════╡
-            │ 0         ┆ 2020-01-0 ┆ [0.0,     ┆ [[0, 1,  ┆ [[6, 11, ┆ [[null,  ┆ 0      ┆ 0      │
-            │           ┆ 1         ┆ 1440.0]   ┆ 1], [0,  ┆ 12], [1, ┆ 0.2,     ┆        ┆        │
-            │           ┆ 00:00:00  ┆           ┆ 2]]      ┆ 40]]     ┆ 1.0],    ┆        ┆        │
-            │           ┆           ┆           ┆          ┆          ┆ [null,   ┆        ┆        │
-            │           ┆           ┆           ┆          ┆          ┆ 0.0]]    ┆        ┆        │
-            │ 1         ┆ 2020-02-0 ┆ []        ┆ []       ┆ []       ┆ []       ┆ 1      ┆ 1      │
-            │           ┆ 1         ┆           ┆          ┆          ┆          ┆        ┆        │
-            │           ┆ 00:00:00  ┆           ┆          ┆          ┆          ┆        ┆        │
-            │ 2         ┆ 2020-03-0 ┆ [1440.0]  ┆ [[0, 4]] ┆ [[5,     ┆ [[null,  ┆ 0      ┆ 5      │
-            │           ┆ 1         ┆           ┆          ┆ 87]]     ┆ null]]   ┆        ┆        │
-            │           ┆ 00:00:00  ┆           ┆          ┆          ┆          ┆        ┆        │
-            └───────────┴───────────┴───────────┴──────────┴──────────┴──────────┴────────┴────────┘
+            >>> PytorchDataset._build_task_index(task_df.lazy(), cached_data.lazy())
+            shape: (3, 5)
+            ┌────────────┬───────────────┬─────────────────┬───────────────┬───────┐
+            │ subject_id ┆ shard_row_idx ┆ start_event_idx ┆ end_event_idx ┆ label │
+            │ ---        ┆ ---           ┆ ---             ┆ ---           ┆ ---   │
+            │ i64        ┆ u32           ┆ u32             ┆ u32           ┆ i64   │
+            ╞════════════╪═══════════════╪═════════════════╪═══════════════╪═══════╡
+            │ 0          ┆ 0             ┆ 0               ┆ 2             ┆ 1     │
+            │ 0          ┆ 0             ┆ 2               ┆ 5             ┆ 1     │
+            │ 2          ┆ 2             ┆ 2               ┆ 3             ┆ 0     │
+            └────────────┴───────────────┴─────────────────┴───────────────┴───────┘
         """
-        time_dep_cols = [c for c in ("time", "time_delta") if c in cached_data.columns]
-        time_dep_cols.extend(["dynamic_indices", "dynamic_values", "dynamic_measurement_indices"])
+        time_col = "time" if "time" in cached_data.columns else "time_delta"
+        label_cols = [c for c in task_df.columns if c not in ("subject_id", "start_time", "end_time")]
 
-        if "time" in cached_data.columns:
-            time_col_expr = pl.col("time")
-        elif "time_delta" in cached_data.columns:
-            time_col_expr = pl.col("time_delta").cumsum().over("subject_id")
-
-        start_idx_expr = (
-            time_col_expr.list.explode().search_sorted(pl.col("start_time_min")).over("subject_id")
+        subjects = (
+            cached_data.select("subject_id", "start_time", time_col).with_row_count("shard_row_idx").collect()
         )
-        end_idx_expr = time_col_expr.list.explode().search_sorted(pl.col("end_time_min")).over("subject_id")
-
-        return (
-            cached_data.join(task_df, on="subject_id", how="inner", suffix="_task")
-            .with_columns(
-                start_time_min=(pl.col("start_time_task") - pl.col("start_time")) / np.timedelta64(1, "m"),
-                end_time_min=(pl.col("end_time") - pl.col("start_time")) / np.timedelta64(1, "m"),
+        samples = (
+            task_df.join(
+                subjects.lazy().select("subject_id", "shard_row_idx", "start_time"),
+                on="subject_id",
+                how="inner",
+                suffix="_subject",
             )
             .with_columns(
-                **{
-                    t: pl.col(t).list.slice(start_idx_expr, end_idx_expr - start_idx_expr)
-                    for t in time_dep_cols
-                },
+                start_time_min=(pl.col("start_time") - pl.col("start_time_subject")) / np.timedelta64(1, "m"),
+                end_time_min=(pl.col("end_time") - pl.col("start_time_subject")) / np.timedelta64(1, "m"),
             )
-            .drop("start_time_task", "end_time_min", "start_time_min", "end_time")
+            .sort("shard_row_idx", maintain_order=True)
+            .collect()
         )
 
-        return cached_data
+        times, offsets = flatten_list_series(subjects[time_col])
+        times = times.to_numpy()
+
+        row_idx = samples["shard_row_idx"].to_numpy()
+        start_time_min = samples["start_time_min"].to_numpy()
+        end_time_min = samples["end_time_min"].to_numpy()
+
+        start_event_idx = np.zeros(len(samples), dtype=np.uint32)
+        end_event_idx = np.zeros(len(samples), dtype=np.uint32)
+        if len(samples) > 0:
+            for subj_samples in np.split(np.arange(len(samples)), np.flatnonzero(np.diff(row_idx)) + 1):
+                row = row_idx[subj_samples[0]]
+                event_times = times[offsets[row] : offsets[row + 1]]
+                if time_col == "time_delta":
+                    event_times = np.cumsum(event_times)
+
+                start_event_idx[subj_samples] = np.searchsorted(event_times, start_time_min[subj_samples])
+                end_event_idx[subj_samples] = np.searchsorted(event_times, end_time_min[subj_samples])
+
+        return samples.select(
+            "subject_id",
+            "shard_row_idx",
+            pl.Series("start_event_idx", start_event_idx),
+            pl.Series("end_event_idx", end_event_idx),
+            *label_cols,
+        )
 
     def __len__(self):
         return len(self.cached_data)
@@ -484,7 +738,7 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
             if full_subj_data[k] is None:
                 full_subj_data[k] = []
         if self.config.do_include_subject_id:
-            full_subj_data["subject_id"] = self.subject_ids[idx]
+            full_subj_data["subject_id"] = int(self.subject_ids[idx])
         if self.config.do_include_start_time_min:
             # Note that this is using the python datetime module's `timestamp` function which differs from
             # some dataframe libraries' timestamp functions (e.g., polars).
@@ -533,121 +787,90 @@ class PytorchDataset(SaveableMixin, SeedableMixin, TimeableMixin, torch.utils.da
         """An internal collate function for both static and dynamic data."""
         out_batch = self.__dynamic_only_collate(batch)
 
-        # Get the maximum number of static elements in the batch.
-        max_n_static = max(len(e["static_indices"]) for e in batch)
-
-        # Walk through the batch and pad the associated tensors in all requisite dimensions.
         self._register_start("collate_static_padding")
-        out = defaultdict(list)
-        for e in batch:
-            if self.do_produce_static_data:
-                n_static = len(e["static_indices"])
-                static_delta = max_n_static - n_static
-                out["static_indices"].append(
-                    torch.nn.functional.pad(
-                        torch.Tensor(e["static_indices"]), (0, static_delta), value=np.NaN
-                    )
-                )
-                out["static_measurement_indices"].append(
-                    torch.nn.functional.pad(
-                        torch.Tensor(e["static_measurement_indices"]),
-                        (0, static_delta),
-                        value=np.NaN,
-                    )
-                )
+        static_lengths = np.array([len(e["static_indices"]) for e in batch], dtype=np.int64)
+        max_n_static = int(static_lengths.max(initial=0))
+        if self.config.do_pad_to_shape_buckets:
+            max_n_static = _shape_bucket(max_n_static)
+        out_shape = (len(batch), max_n_static)
+
+        batch_idx = np.repeat(np.arange(len(batch)), static_lengths)
+        pos_idx = _within_group_positions(static_lengths)
+
+        for k in ("static_indices", "static_measurement_indices"):
+            vals, _ = _flatten_ragged([e[k] for e in batch])
+            out = torch.zeros(out_shape, dtype=torch.long)
+            out[batch_idx, pos_idx] = _to_index_tensor(vals)
+            out_batch[k] = out
         self._register_end("collate_static_padding")
 
-        self._register_start("collate_static_post_padding")
-        # Unsqueeze the padded tensors into the batch dimension and combine them.
-        out = {k: torch.cat([T.unsqueeze(0) for T in Ts], dim=0) for k, Ts in out.items()}
-
-        # Convert to the right types and add to the batch.
-        out_batch["static_indices"] = torch.nan_to_num(out["static_indices"], nan=0).long()
-        out_batch["static_measurement_indices"] = torch.nan_to_num(
-            out["static_measurement_indices"], nan=0
-        ).long()
-        self._register_end("collate_static_post_padding")
-
         return out_batch
 
     def __dynamic_only_collate(self, batch: list[DATA_ITEM_T]) -> PytorchBatch:
-        """An internal collate function for dynamic data alone."""
-        # Get the local max sequence length and n_data elements for padding.
-        max_seq_len = max(len(e["time_delta"]) for e in batch)
+        """An internal collate function for dynamic data alone.
 
-        max_n_data = 0
-        for e in batch:
-            for v in e["dynamic_indices"]:
-                max_n_data = max(max_n_data, len(v))
-        if max_n_data == 0:
-            raise ValueError(f"Batch has no dynamic measurements! Got:\n{batch[0]}\n{batch[1]}\n...")
+        Rather than building and padding a tensor per event, this computes all sequence and data element
+        lengths up front, flattens each ragged key across the whole batch into a single array, and then writes
+        those arrays into preallocated ``[batch_size, max_seq_len, max_n_data]`` output tensors with a single
+        vectorized scatter per key.
+        """
+        # Get the local max sequence length and n_data elements for padding.
+        seq_lens = np.array([len(e["time_delta"]) for e in batch], dtype=np.int64)
+        max_seq_len = int(seq_lens.max())
+        if self.config.do_pad_to_shape_buckets:
+            max_seq_len = _shape_bucket(max_seq_len, max_n=max(self.max_seq_len, max_seq_len))
 
-        # Walk through the batch and pad the associated tensors in all requisite dimensions.
         self._register_start("collate_dynamic_padding")
-        out = defaultdict(list)
-        for e in batch:
-            seq_len = len(e["time_delta"])
-            seq_delta = max_seq_len - seq_len
-
-            if self.seq_padding_side == SeqPaddingSide.RIGHT:
-                out["time_delta"].append(
-                    torch.nn.functional.pad(torch.Tensor(e["time_delta"]), (0, seq_delta), value=np.NaN)
-                )
-            else:
-                out["time_delta"].append(
-                    torch.nn.functional.pad(torch.Tensor(e["time_delta"]), (seq_delta, 0), value=np.NaN)
-                )
-
-            data_elements = defaultdict(list)
-            for k in ("dynamic_indices", "dynamic_values", "dynamic_measurement_indices"):
-                for vs in e[k]:
-                    if vs is None:
-                        vs = [np.NaN] * max_n_data
-
-                    data_delta = max_n_data - len(vs)
-                    vs = [v if v is not None else np.NaN for v in vs]
+        flat_data = {}
+        for k in ("dynamic_indices", "dynamic_values", "dynamic_measurement_indices"):
+            events = []
+            for e in batch:
+                if len(e[k]) == 0:
+                    raise ValueError(f"Batch element has no {k}! Got:\n{e}.")
+                events.extend(e[k])
+            flat_data[k] = _flatten_ragged(events)
 
-                    # We don't worry about seq_padding_side here as this is not the sequence dimension.
-                    data_elements[k].append(
-                        torch.nn.functional.pad(torch.Tensor(vs), (0, data_delta), value=np.NaN)
-                    )
+        max_n_data = int(flat_data["dynamic_indices"][1].max(initial=0))
+        if max_n_data == 0:
+            raise ValueError(f"Batch has no dynamic measurements! Got:\n{batch[0]}\n{batch[1]}\n...")
+        if self.config.do_pad_to_shape_buckets:
+            max_n_data = _shape_bucket(max_n_data)
+
+        # The (batch, sequence) position of each event in the output, accounting for the padding side.
+        event_batch_idx = np.repeat(np.arange(len(batch)), seq_lens)
+        event_seq_idx = _within_group_positions(seq_lens)
+        if self.seq_padding_side == SeqPaddingSide.LEFT:
+            event_seq_idx += np.repeat(max_seq_len - seq_lens, seq_lens)
+
+        time_delta = torch.full((len(batch), max_seq_len), float("nan"), dtype=torch.float32)
+        time_delta[event_batch_idx, event_seq_idx] = torch.from_numpy(
+            np.concatenate([np.asarray(e["time_delta"], dtype=np.float32) for e in batch])
+        )
 
-                if len(data_elements[k]) == 0:
-                    raise ValueError(f"Batch element has no {k}! Got:\n{e}.")
+        out_batch = {"event_mask": ~time_delta.isnan(), "time_delta": torch.nan_to_num(time_delta, nan=0)}
 
-                if self.seq_padding_side == SeqPaddingSide.RIGHT:
-                    data_elements[k] = torch.nn.functional.pad(
-                        torch.cat([T.unsqueeze(0) for T in data_elements[k]]),
-                        (0, 0, 0, seq_delta),
-                        value=np.NaN,
-                    )
-                else:
-                    data_elements[k] = torch.nn.functional.pad(
-                        torch.cat([T.unsqueeze(0) for T in data_elements[k]]),
-                        (0, 0, seq_delta, 0),
-                        value=np.NaN,
-                    )
+        out_shape = (len(batch), max_seq_len, max_n_data)
+        for k, (vals, lengths) in flat_data.items():
+            # Data elements are always right-padded, as this is not the sequence dimension.
+            el_event_idx = np.repeat(np.arange(len(lengths)), lengths)
+            el_idx = (
+                event_batch_idx[el_event_idx],
+                event_seq_idx[el_event_idx],
+                _within_group_positions(lengths),
+            )
 
-                out[k].append(data_elements[k])
+            if k == "dynamic_values":
+                out = torch.full(out_shape, float("nan"), dtype=torch.float32)
+                out[el_idx] = torch.from_numpy(vals.astype(np.float32))
+                out_batch["dynamic_values_mask"] = ~out.isnan()
+                out_batch[k] = torch.nan_to_num(out, nan=0)
+            else:
+                out = torch.zeros(out_shape, dtype=torch.long)
+                out[el_idx] = _to_index_tensor(vals)
+                out_batch[k] = out
         self._register_end("collate_dynamic_padding")
 
         self._register_start("collate_post_padding_processing")
-        # Unsqueeze the padded tensors into the batch dimension and combine them.
-        out_batch = {k: torch.cat([T.unsqueeze(0) for T in Ts], dim=0) for k, Ts in out.items()}
-
-        # Add event and data masks on the basis of which elements are present, then convert the tensor
-        # elements to the appropriate types.
-        out_batch["event_mask"] = ~out_batch["time_delta"].isnan()
-        out_batch["dynamic_values_mask"] = ~out_batch["dynamic_values"].isnan()
-
-        out_batch["time_delta"] = torch.nan_to_num(out_batch["time_delta"], nan=0)
-
-        out_batch["dynamic_indices"] = torch.nan_to_num(out_batch["dynamic_indices"], nan=0).long()
-        out_batch["dynamic_measurement_indices"] = torch.nan_to_num(
-            out_batch["dynamic_measurement_indices"], nan=0
-        ).long()
-        out_batch["dynamic_values"] = torch.nan_to_num(out_batch["dynamic_values"], nan=0)
-
         if self.config.do_include_start_time_min:
             out_batch["start_time"] = torch.FloatTensor([e["start_time"] for e in batch])
         if self.config.do_include_subsequence_indices:
@@ -0,0 +1,224 @@
+"""Batch samplers that group subjects of similar size to limit padding in collated batches."""
+from collections.abc import Iterator, Sized
+
+import numpy as np
+import torch
+
+
+class LengthBucketedBatchSampler(torch.utils.data.BatchSampler):
+    """Groups dataset indices into batches of subjects with similar sequence lengths and event widths.
+
+    `PytorchDataset.collate` pads every batch to its longest sequence and to its widest event (the maximum
+    number of data elements observed in any one event), so batches that mix short and long subjects are
+    mostly padding. This sampler draws indices from ``sampler`` in pools of ``batch_size *
+    pool_size_multiplier`` indices, sorts each pool by sequence length and then by event width, and splits
+    the sorted pool into batches. The order in which the resulting batches are yielded is then shuffled (if
+    ``shuffle_batches`` is set), so batches remain randomized across training even though their contents are
+    size-homogeneous.
+
+    If ``max_tokens_per_batch`` is set, batches are instead formed greedily such that the padded batch size
+    of ``batch_size x max_seq_len x max_n_data_per_event`` never exceeds that budget (save for single
+    subjects which exceed it on their own, which are placed in a batch alone). In this mode, ``batch_size``
+    is still respected as an upper bound on the number of subjects in any batch.
+
+    For distributed training, lightning re-instantiates batch samplers with a distributed sampler in place of
+    ``sampler``. It can only do so from the batch sampler's original constructor arguments, which it records
+    itself only for batch samplers built within its dataloader hooks, so this class records them on
+    construction, in the same form. Each rank then groups only its own shard of the dataset into batches.
+    Note that in token-budget mode the number of batches can differ across distributed ranks, which is not
+    supported by distributed training; it should be used in single-process training only.
+
+    Args:
+        sampler: The sampler over dataset indices that this batch sampler groups into batches.
+        batch_size: The (maximum) number of subjects per batch.
+        drop_last: Whether to drop the final batch if it has fewer than ``batch_size`` subjects. Ignored in
+            token-budget mode.
+        seq_lens: The (truncated) sequence length of each subject in the dataset, indexed by dataset index.
+        n_data_per_event: The maximum number of data elements in any event for each subject in the
+            dataset, indexed by dataset index.
+        max_tokens_per_batch: If not `None`, the maximum number of padded elements (``batch size x sequence
+            length x data elements per event``) allowed in a batch.
+        pool_size_multiplier: How many batches worth of indices are pooled and sorted together. Larger
+            pools yield more homogeneous batches, at the cost of less random batch composition.
+        shuffle_batches: Whether to shuffle the order in which batches are yielded.
+        generator: The generator used to shuffle batch order, as in `torch.utils.data.RandomSampler`.
+
+    Raises:
+        ValueError: If ``seq_lens`` and ``n_data_per_event`` have different shapes, or if
+            ``max_tokens_per_batch`` or ``pool_size_multiplier`` are not positive.
+
+    Examples:
+        >>> seq_lens = np.array([10, 2, 9, 3, 1, 8])
+        >>> n_data_per_event = np.array([1, 1, 1, 1, 1, 1])
+        >>> sampler = LengthBucketedBatchSampler(
+        ...     range(6), batch_size=2, drop_last=False, seq_lens=seq_lens, n_data_per_event=n_data_per_event,
+        ...     shuffle_batches=False,
+        ... )
+        >>> list(sampler)
+        [[4, 1], [3, 5], [2, 0]]
+        >>> len(sampler)
+        3
+        >>> sampler = LengthBucketedBatchSampler(
+        ...     range(6), batch_size=6, drop_last=False, seq_lens=seq_lens, n_data_per_event=n_data_per_event,
+        ...     max_tokens_per_batch=9, shuffle_batches=False,
+        ... )
+        >>> list(sampler)
+        [[4, 1, 3], [5], [2], [0]]
+        >>> len(sampler)
+        4
+    """
+
+    def __init__(
+        self,
+        sampler: torch.utils.data.Sampler[int] | Iterator[int],
+        batch_size: int,
+        drop_last: bool,
+        seq_lens: np.ndarray,
+        n_data_per_event: np.ndarray,
+        max_tokens_per_batch: int | None = None,
+        pool_size_multiplier: int = 100,
+        shuffle_batches: bool = True,
+        generator: torch.Generator | None = None,
+    ):
+        # Lightning re-instantiates the batch sampler from these (see the class docstring). If it has already
+        # recorded them, as it does within its dataloader hooks, they are left as is.
+        if not hasattr(self, "__pl_saved_args"):
+            saved_kwargs = {
+                "sampler": sampler,
+                "batch_size": batch_size,
+                "drop_last": drop_last,
+                "seq_lens": seq_lens,
+                "n_data_per_event": n_data_per_event,
+                "max_tokens_per_batch": max_tokens_per_batch,
+                "pool_size_multiplier": pool_size_multiplier,
+                "shuffle_batches": shuffle_batches,
+                "generator": generator,
+            }
+            object.__setattr__(self, "__pl_saved_args", ())
+            object.__setattr__(self, "__pl_saved_kwargs", saved_kwargs)
+            object.__setattr__(self, "__pl_saved_arg_names", ())
+            object.__setattr__(self, "__pl_saved_default_kwargs", {})
+
+        super().__init__(sampler, batch_size, drop_last)
+
+        self.seq_lens = np.asarray(seq_lens, dtype=np.int64)
+        self.n_data_per_event = np.maximum(np.asarray(n_data_per_event, dtype=np.int64), 1)
+        if self.seq_lens.shape != self.n_data_per_event.shape:
+            raise ValueError(
+                f"seq_lens and n_data_per_event must have the same shape! Got {self.seq_lens.shape} and "
+                f"{self.n_data_per_event.shape}"
+            )
+        if max_tokens_per_batch is not None and max_tokens_per_batch <= 0:
+            raise ValueError(f"max_tokens_per_batch must be positive! Got {max_tokens_per_batch}")
+        if pool_size_multiplier <= 0:
+            raise ValueError(f"pool_size_multiplier must be positive! Got {pool_size_multiplier}")
+
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.pool_size_multiplier = pool_size_multiplier
+        self.shuffle_batches = shuffle_batches
+        self.generator = generator
+        self._last_n_batches = None
+
+    @classmethod
+    def from_dataset(
+        cls,
+        dataset: torch.utils.data.Dataset,
+        batch_size: int,
+        shuffle: bool,
+        drop_last: bool = False,
+        **kwargs,
+    ) -> "LengthBucketedBatchSampler":
+        """Builds a batch sampler over a `PytorchDataset` from its precomputed subject sizes.
+
+        Args:
+            dataset: The dataset to sample from. Must expose ``seq_lens`` and ``n_data_per_event`` arrays, as
+                `PytorchDataset` does.
+            batch_size: The (maximum) number of subjects per batch.
+            shuffle: Whether to sample subjects in a random order (and shuffle the order of batches), as
+                should be done for training, or to sample them in order, as is done for evaluation.
+            drop_last: Whether to drop the final incomplete batch.
+            **kwargs: Passed to the constructor.
+
+        Returns:
+            The batch sampler.
+        """
+        if shuffle:
+            sampler = torch.utils.data.RandomSampler(dataset)
+        else:
+            sampler = torch.utils.data.SequentialSampler(dataset)
+
+        kwargs.setdefault("shuffle_batches", shuffle)
+        return cls(
+            sampler,
+            batch_size=batch_size,
+            drop_last=drop_last,
+            seq_lens=dataset.seq_lens,
+            n_data_per_event=dataset.n_data_per_event,
+            **kwargs,
+        )
+
+    def _split_by_count(self, pool: np.ndarray) -> list[np.ndarray]:
+        return [pool[st : st + self.batch_size] for st in range(0, len(pool), self.batch_size)]
+
+    def _split_by_token_budget(self, pool: np.ndarray) -> list[np.ndarray]:
+        batches = []
+        st, max_L, max_M = 0, 0, 0
+        for i, (L, M) in enumerate(zip(self.seq_lens[pool], self.n_data_per_event[pool])):
+            L, M = max(max_L, L), max(max_M, M)
+            n = i - st + 1
+            if n > 1 and (n > self.batch_size or n * L * M > self.max_tokens_per_batch):
+                batches.append(pool[st:i])
+                st, L, M = i, self.seq_lens[pool[i]], self.n_data_per_event[pool[i]]
+            max_L, max_M = L, M
+        if st < len(pool):
+            batches.append(pool[st:])
+        return batches
+
+    def _batches(self, indices: np.ndarray) -> list[np.ndarray]:
+        pool_size = self.batch_size * self.pool_size_multiplier
+
+        batches = []
+        for st in range(0, len(indices), pool_size):
+            pool = indices[st : st + pool_size]
+            pool = pool[np.lexsort((self.n_data_per_event[pool], self.seq_lens[pool]))]
+
+            if self.max_tokens_per_batch is None:
+                batches.extend(self._split_by_count(pool))
+            else:
+                batches.extend(self._split_by_token_budget(pool))
+
+        if self.drop_last and self.max_tokens_per_batch is None and batches:
+            if len(batches[-1]) < self.batch_size:
+                batches = batches[:-1]
+
+        return batches
+
+    def __iter__(self) -> Iterator[list[int]]:
+        batches = self._batches(np.fromiter(self.sampler, dtype=np.int64))
+        self._last_n_batches = len(batches)
+
+        if self.shuffle_batches:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=self.generator).tolist()]
+
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self) -> int:
+        """The number of batches per epoch.
+
+        This is exact unless in token-budget mode, where it is computed from the last full pass over the
+        sampler or, before the first such pass, estimated by packing all subjects in the dataset.
+        """
+        n_samples = len(self.sampler) if isinstance(self.sampler, Sized) else len(self.seq_lens)
+
+        if self.max_tokens_per_batch is None:
+            if self.drop_last:
+                return n_samples // self.batch_size
+            return (n_samples + self.batch_size - 1) // self.batch_size
+
+        if self._last_n_batches is None:
+            if not len(self.seq_lens):
+                return 0
+            n_batches = len(self._batches(np.arange(len(self.seq_lens))))
+            self._last_n_batches = max(int(round(n_batches * n_samples / max(len(self.seq_lens), 1))), 1)
+        return self._last_n_batches
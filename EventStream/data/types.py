@@ -210,12 +210,19 @@ class PytorchBatch:
         """A dictionary like get method for this batch, by attribute name."""
         return getattr(self, item) if item in self.keys() else default
 
-    def _slice(self, index: tuple[int | slice] | int | slice) -> "PytorchBatch":
+    def _slice(self, index: tuple[int | slice | torch.LongTensor] | int | slice) -> "PytorchBatch":
         if not isinstance(index, tuple):
             index = (index,)
         if len(index) == 0 or len(index) > 3:
             raise ValueError(f"Invalid index {index} for PytorchBatch! Must be of length 1, 2, or 3.")
-        if any(not isinstance(i, (int, slice)) for i in index):
+        if isinstance(index[0], torch.Tensor):
+            if index[0].dtype != torch.long or index[0].dim() != 1:
+                raise ValueError(
+                    f"Invalid index {index} for PytorchBatch! Batch index tensors must be 1D longs."
+                )
+        elif not isinstance(index[0], (int, slice)):
+            raise ValueError(f"Invalid index {index} for PytorchBatch! Can only consist of ints and slices.")
+        if any(not isinstance(i, (int, slice)) for i in index[1:]):
             raise ValueError(f"Invalid index {index} for PytorchBatch! Can only consist of ints and slices.")
 
         batch_index = index[0]
@@ -252,11 +259,15 @@ class PytorchBatch:
             time=None if self.time is None else self.time[batch_index, seq_index],
         )
 
-    def __getitem__(self, item: str | tuple[int | slice]) -> Union[torch.Tensor, "PytorchBatch"]:
+    def __getitem__(
+        self, item: str | tuple[int | slice | torch.LongTensor] | torch.LongTensor
+    ) -> Union[torch.Tensor, "PytorchBatch"]:
         match item:
             case str():
-                return dataclasses.asdict(self)[item]
-            case tuple() | int() | slice():
+                if item not in self.keys():
+                    raise KeyError(item)
+                return getattr(self, item)
+            case tuple() | int() | slice() | torch.Tensor():
                 return self._slice(item)
             case _:
                 raise TypeError(f"Invalid type {type(item)} for {item} for indexing!")
@@ -303,17 +314,21 @@ class PytorchBatch:
                     raise ValueError(f"{k}: {type(self_v)} not supported in batch!")
         return True
 
+    def _as_dict(self) -> dict[str, Any]:
+        # Unlike `dataclasses.asdict`, this does not deep-copy the (potentially large) tensors in the batch.
+        return {f.name: getattr(self, f.name) for f in dataclasses.fields(self)}
+
     def items(self):
         """A dictionary like items` method for the elements of this batch, by attribute."""
-        return dataclasses.asdict(self).items()
+        return self._as_dict().items()
 
     def keys(self):
         """A dictionary like keys method for the elements of this batch, by attribute."""
-        return dataclasses.asdict(self).keys()
+        return self._as_dict().keys()
 
     def values(self):
         """A dictionary like values method for the elements of this batch, by attribute."""
-        return dataclasses.asdict(self).values()
+        return self._as_dict().values()
 
     def last_sequence_element_unsqueezed(self) -> "PytorchBatch":
         """Filters the batch down to just the last event, while retaining the same # of dims."""
@@ -805,6 +820,256 @@ class PytorchBatch:
         return pl.DataFrame(df)
 
 
+class PreallocatedPytorchBatch(PytorchBatch):
+    """A `PytorchBatch` whose sequence-dimension tensors are views into preallocated buffers.
+
+    During generation, a batch grows by one event per generation step and the data elements of its last event
+    are filled in (possibly over several dependency graph levels) after that event is appended. Doing this by
+    concatenating new tensors onto a `PytorchBatch` copies the entire batch on every such update. This class
+    instead reserves capacity for a fixed number of events and data elements per event up front, exposes the
+    filled portion of those buffers as its usual `PytorchBatch` attributes, and implements appending an event
+    and overwriting the last event's data as indexed writes into the buffers with a length counter. Should an
+    event have more data elements than there is capacity for, the data element capacity is grown
+    geometrically (which does require a copy), so only the sequence capacity is a hard limit.
+
+    As the exposed attributes are views, tensors or slices taken from this batch (e.g., via
+    `PytorchBatch.last_sequence_element_unsqueezed`) share memory with it. They will not include events
+    appended later but may reflect later writes to the last event, so they should not be held across updates.
+
+    Examples:
+        >>> import torch
+        >>> batch = PytorchBatch(
+        ...     event_mask=torch.tensor([[True, True], [False, True]]),
+        ...     time_delta=torch.tensor([[1.0, 1.0], [0.0, 1.0]]),
+        ...     static_indices=torch.tensor([[1], [2]]),
+        ...     static_measurement_indices=torch.tensor([[1], [1]]),
+        ...     dynamic_indices=torch.tensor([[[3], [4]], [[0], [5]]]),
+        ...     dynamic_measurement_indices=torch.tensor([[[2], [2]], [[0], [2]]]),
+        ...     dynamic_values=torch.tensor([[[0.0], [0.0]], [[0.0], [0.0]]]),
+        ...     dynamic_values_mask=torch.tensor([[[False], [False]], [[False], [False]]]),
+        ...     start_time=torch.tensor([0.0, 0.0]),
+        ... )
+        >>> buffered = PreallocatedPytorchBatch.from_batch(batch, max_sequence_length=4)
+        >>> buffered == batch
+        True
+        >>> buffered.sequence_capacity
+        4
+        >>> buffered.append_event(
+        ...     last_event_time_delta=torch.tensor([2.0, 3.0]),
+        ...     event_mask=torch.tensor([True, True]),
+        ...     dynamic_indices=torch.tensor([[6, 7], [8, 0]]),
+        ...     dynamic_measurement_indices=torch.tensor([[3, 3], [3, 0]]),
+        ...     dynamic_values=torch.tensor([[0.0, 0.0], [0.0, 0.0]]),
+        ...     dynamic_values_mask=torch.tensor([[False, False], [False, False]]),
+        ... )
+        >>> buffered.time_delta
+        tensor([[1., 2., 1.],
+                [0., 3., 1.]])
+        >>> buffered.dynamic_indices
+        tensor([[[3, 0],
+                 [4, 0],
+                 [6, 7]],
+        <BLANKLINE>
+                [[0, 0],
+                 [5, 0],
+                 [8, 0]]])
+        >>> buffered.set_last_event_data(
+        ...     dynamic_indices=torch.tensor([[9], [10]]),
+        ...     dynamic_measurement_indices=torch.tensor([[4], [4]]),
+        ...     dynamic_values=torch.tensor([[1.5], [2.5]]),
+        ...     dynamic_values_mask=torch.tensor([[True], [True]]),
+        ... )
+        >>> buffered.dynamic_indices[:, -1]
+        tensor([[ 9,  0],
+                [10,  0]])
+        >>> buffered.dynamic_values[:, -1]
+        tensor([[1.5000, 0.0000],
+                [2.5000, 0.0000]])
+        >>> batch.sequence_length # The source batch is not modified.
+        2
+        >>> type(buffered.to_pytorch_batch()).__name__
+        'PytorchBatch'
+        >>> buffered.append_event(
+        ...     last_event_time_delta=torch.tensor([1.0, 1.0]),
+        ...     event_mask=torch.tensor([True, True]),
+        ...     dynamic_indices=torch.tensor([[6], [8]]),
+        ...     dynamic_measurement_indices=torch.tensor([[3], [3]]),
+        ...     dynamic_values=torch.tensor([[0.0], [0.0]]),
+        ...     dynamic_values_mask=torch.tensor([[False], [False]]),
+        ... )
+        >>> buffered.append_event(
+        ...     last_event_time_delta=torch.tensor([1.0, 1.0]),
+        ...     event_mask=torch.tensor([True, True]),
+        ...     dynamic_indices=torch.tensor([[6], [8]]),
+        ...     dynamic_measurement_indices=torch.tensor([[3], [3]]),
+        ...     dynamic_values=torch.tensor([[0.0], [0.0]]),
+        ...     dynamic_values_mask=torch.tensor([[False], [False]]),
+        ... )
+        Traceback (most recent call last):
+            ...
+        ValueError: Can't append an event to a batch of length 4 with capacity 4.
+    """
+
+    _dynamic_keys = (
+        "dynamic_indices",
+        "dynamic_measurement_indices",
+        "dynamic_values",
+        "dynamic_values_mask",
+    )
+
+    @classmethod
+    def from_batch(
+        cls,
+        batch: PytorchBatch,
+        max_sequence_length: int,
+        n_data_elements: int | None = None,
+    ) -> "PreallocatedPytorchBatch":
+        """Copies `batch` into buffers with room for `max_sequence_length` events.
+
+        Args:
+            batch: The batch to copy. It is not modified.
+            max_sequence_length: The maximum number of events the batch will hold. If less than the sequence
+                length of `batch`, the sequence length of `batch` is used instead.
+            n_data_elements: The initial capacity for data elements per event. Defaults to (and can't be less
+                than) the number of data elements of `batch`.
+
+        Returns:
+            A `PreallocatedPytorchBatch` equal to `batch`.
+        """
+        L = max(max_sequence_length, batch.sequence_length)
+        M = max(n_data_elements or 0, batch.n_data_elements)
+
+        out = cls(**batch._as_dict())
+        out._length = batch.sequence_length
+        out._n_data_elements = batch.n_data_elements
+        out._buffers = {}
+
+        for k in ("event_mask", "time_delta"):
+            src = batch[k]
+            out._buffers[k] = src.new_zeros((batch.batch_size, L))
+            out._buffers[k][:, : out._length] = src
+        for k in cls._dynamic_keys:
+            src = batch[k]
+            out._buffers[k] = src.new_zeros((batch.batch_size, L, M))
+            out._buffers[k][:, : out._length, : out._n_data_elements] = src
+
+        out._refresh_views()
+        return out
+
+    def to_pytorch_batch(self) -> PytorchBatch:
+        """Returns a plain `PytorchBatch` with this batch's data, which no longer references its buffers.
+
+        Tensors which are not contiguous (e.g., as they don't span the full capacity of their buffers) are
+        copied; the rest are returned as-is.
+        """
+        return PytorchBatch(
+            **{k: v.contiguous() if isinstance(v, torch.Tensor) else v for k, v in self.items()}
+        )
+
+    @property
+    def sequence_capacity(self) -> int:
+        """The maximum number of events this batch can hold."""
+        return self._buffers["event_mask"].shape[1]
+
+    def _refresh_views(self):
+        L, M = self._length, self._n_data_elements
+        for k in ("event_mask", "time_delta"):
+            setattr(self, k, self._buffers[k][:, :L])
+        for k in self._dynamic_keys:
+            setattr(self, k, self._buffers[k][:, :L, :M])
+
+    def _reserve_data_elements(self, n_data_elements: int):
+        capacity = self._buffers["dynamic_indices"].shape[2]
+        if n_data_elements > capacity:
+            new_capacity = max(n_data_elements, 2 * capacity)
+            for k in self._dynamic_keys:
+                old = self._buffers[k]
+                new = old.new_zeros((*old.shape[:2], new_capacity))
+                new[:, :, :capacity] = old
+                self._buffers[k] = new
+        self._n_data_elements = max(self._n_data_elements, n_data_elements)
+
+    def _write_event_data(self, event_idx: int, **data: torch.Tensor):
+        n_new = data["dynamic_indices"].shape[-1]
+        self._reserve_data_elements(n_new)
+        for k in self._dynamic_keys:
+            self._buffers[k][:, event_idx, :n_new] = data[k]
+            self._buffers[k][:, event_idx, n_new:] = 0
+
+        # As with the new batches built by `GenerativeSequenceModelSamples`, any cached absolute times are
+        # dropped once the batch is modified; they are recomputed from `time_delta` when needed.
+        self.time = None
+
+    def append_event(
+        self,
+        last_event_time_delta: torch.FloatTensor,
+        event_mask: torch.BoolTensor,
+        dynamic_indices: torch.LongTensor,
+        dynamic_measurement_indices: torch.LongTensor,
+        dynamic_values: torch.FloatTensor,
+        dynamic_values_mask: torch.BoolTensor,
+    ):
+        """Appends a new event to the batch in place.
+
+        Args:
+            last_event_time_delta: The time between the current last event and the new event, of shape
+                ``(batch_size,)``. The new event is given a time delta of 1, as its successor is not known.
+            event_mask: Whether the new event exists, of shape ``(batch_size,)``.
+            dynamic_indices: The new event's data element indices, of shape ``(batch_size, n_data_elements)``.
+            dynamic_measurement_indices: The new event's measurement indices, of the same shape.
+            dynamic_values: The new event's values, of the same shape.
+            dynamic_values_mask: The new event's values mask, of the same shape.
+
+        Raises:
+            ValueError: If the batch is already at its sequence capacity.
+        """
+        if self._length >= self.sequence_capacity:
+            raise ValueError(
+                f"Can't append an event to a batch of length {self._length} with capacity "
+                f"{self.sequence_capacity}."
+            )
+
+        idx = self._length
+        self._buffers["time_delta"][:, idx - 1] = last_event_time_delta
+        self._buffers["time_delta"][:, idx] = 1
+        self._buffers["event_mask"][:, idx] = event_mask
+        self._write_event_data(
+            idx,
+            dynamic_indices=dynamic_indices,
+            dynamic_measurement_indices=dynamic_measurement_indices,
+            dynamic_values=dynamic_values,
+            dynamic_values_mask=dynamic_values_mask,
+        )
+
+        self._length += 1
+        self._refresh_views()
+
+    def set_last_event_data(
+        self,
+        dynamic_indices: torch.LongTensor,
+        dynamic_measurement_indices: torch.LongTensor,
+        dynamic_values: torch.FloatTensor,
+        dynamic_values_mask: torch.BoolTensor,
+    ):
+        """Overwrites the data elements of the last event in the batch in place.
+
+        Args:
+            dynamic_indices: The last event's new data element indices, of shape
+                ``(batch_size, n_data_elements)``.
+            dynamic_measurement_indices: The last event's new measurement indices, of the same shape.
+            dynamic_values: The last event's new values, of the same shape.
+            dynamic_values_mask: The last event's new values mask, of the same shape.
+        """
+        self._write_event_data(
+            self._length - 1,
+            dynamic_indices=dynamic_indices,
+            dynamic_measurement_indices=dynamic_measurement_indices,
+            dynamic_values=dynamic_values,
+            dynamic_values_mask=dynamic_values_mask,
+        )
+        self._refresh_views()
+
+
 class TemporalityType(StrEnum):
     """The ways a measurement can vary in time."""
 
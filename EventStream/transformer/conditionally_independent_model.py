@@ -196,7 +196,7 @@ class CIPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
         self.post_init()
 
     def prepare_inputs_for_generation(
-        self, batch: PytorchBatch, past: tuple | None = None, **kwargs
+        self, batch: PytorchBatch, past: tuple | None = None, max_length: int | None = None, **kwargs
     ) -> dict[str, Any]:
         """Returns model keyword arguments that have been modified for generation purposes.
 
@@ -204,7 +204,9 @@ class CIPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
             batch: The batch of data to be transformed.
             past: The past state of the model, if any. If specified, it must be a tuple containing the past
                 values over prior layers and heads.
-
+            max_length: The maximum sequence length that will be generated, if known. If caching is used and
+                there is no past yet, the past key/value cache is preallocated to this length and filled in
+                place on subsequent generation steps.
             **kwargs: Additional keyword arguments. If "use_cache" is set in the kwargs to False, then the
                 past state is ignored. If not, then the past state is passed through the model to accelerate
                 generation, if past is not None then the batch is trimmed to the last element in the sequence,
@@ -232,7 +234,10 @@ class CIPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
 
         match past:
             case None:
-                pass
+                if max_length is not None:
+                    past = self.encoder.preallocate_kv_cache(
+                        batch.batch_size, max(max_length, batch.sequence_length)
+                    )
 
             case tuple():
                 batch = batch.last_sequence_element_unsqueezed()
@@ -16,6 +16,7 @@ from transformers import PretrainedConfig
 from ..data.config import MeasurementConfig
 from ..data.data_embedding_layer import MeasIndexGroupOptions, StaticEmbeddingMode
 from ..data.pytorch_dataset import PytorchDataset
+from ..data.sampler import LengthBucketedBatchSampler
 from ..data.types import DataModality
 from ..utils import JSONableMixin, StrEnum, hydra_dataclass
 
@@ -232,10 +233,20 @@ class OptimizationConfig(JSONableMixin):
             If None, early stopping is not used.
         gradient_accumulation: The number of gradient accumulation steps to use. If None, gradient
             accumulation is not used.
+        num_dataloader_workers: The number of worker processes used by the dataloaders.
+        do_length_bucketed_batching: Whether to batch subjects of similar sequence lengths and event widths
+            together (via `EventStream.data.sampler.LengthBucketedBatchSampler`) to reduce padding, rather
+            than batching subjects uniformly at random.
+        max_tokens_per_batch: If set (which requires `do_length_bucketed_batching`), batches are capped to at
+            most this many padded elements (``batch size x sequence length x data elements per event``), in
+            addition to being capped at `batch_size` or `validation_batch_size` subjects.
+        length_bucketing_pool_size_multiplier: How many batches worth of subjects are sorted together when
+            forming length-bucketed batches.
 
     Raises:
-        ValueError: If `end_lr`, `init_lr`, and `end_lr_frac_of_init_lr` are not consistent, or if `end_lr`
-            and `end_lr_frac_of_init_lr` are both unset.
+        ValueError: If `end_lr`, `init_lr`, and `end_lr_frac_of_init_lr` are not consistent, if `end_lr`
+            and `end_lr_frac_of_init_lr` are both unset, or if `max_tokens_per_batch` is set without
+            `do_length_bucketed_batching`.
     """
 
     init_lr: float = 1e-2
@@ -254,7 +265,13 @@ class OptimizationConfig(JSONableMixin):
 
     num_dataloader_workers: int = 0
 
+    do_length_bucketed_batching: bool = False
+    max_tokens_per_batch: int | None = None
+    length_bucketing_pool_size_multiplier: int = 100
+
     def __post_init__(self):
+        if self.max_tokens_per_batch is not None and not self.do_length_bucketed_batching:
+            raise ValueError("`max_tokens_per_batch` requires `do_length_bucketed_batching` to be set!")
         if self.end_lr_frac_of_init_lr is not None:
             if self.end_lr_frac_of_init_lr <= 0.0 or self.end_lr_frac_of_init_lr >= 1.0:
                 raise ValueError("`end_lr_frac_of_init_lr` must be between 0.0 and 1.0!")
@@ -285,7 +302,10 @@ class OptimizationConfig(JSONableMixin):
             ValueError: If the setting process does not yield consistent results.
         """
 
-        steps_per_epoch = int(math.ceil(len(dataset) / self.batch_size))
+        if self.max_tokens_per_batch is not None:
+            steps_per_epoch = len(self.dataloader_batching_kwargs(dataset, is_train=True)["batch_sampler"])
+        else:
+            steps_per_epoch = int(math.ceil(len(dataset) / self.batch_size))
 
         if self.max_training_steps is None:
             self.max_training_steps = steps_per_epoch * self.max_epochs
@@ -307,6 +327,38 @@ class OptimizationConfig(JSONableMixin):
                 f"\tself.lr_num_warmup_steps = {self.lr_num_warmup_steps}"
             )
 
+    def dataloader_batching_kwargs(self, dataset: PytorchDataset, is_train: bool) -> dict[str, Any]:
+        """Returns the batching keyword arguments for a `torch.utils.data.DataLoader` over `dataset`.
+
+        Args:
+            dataset: The dataset the dataloader will load.
+            is_train: Whether the dataloader is used for training, in which case subjects are shuffled and
+                `batch_size` is used, or for evaluation, in which case subjects are loaded in order and
+                `validation_batch_size` is used.
+
+        Returns:
+            Either ``batch_size`` and ``shuffle`` keyword arguments or, if `do_length_bucketed_batching` is
+            set, a ``batch_sampler`` keyword argument.
+
+        Examples:
+            >>> OptimizationConfig(batch_size=4).dataloader_batching_kwargs(None, is_train=True)
+            {'batch_size': 4, 'shuffle': True}
+            >>> OptimizationConfig(validation_batch_size=8).dataloader_batching_kwargs(None, is_train=False)
+            {'batch_size': 8, 'shuffle': False}
+        """
+        batch_size = self.batch_size if is_train else self.validation_batch_size
+        if not self.do_length_bucketed_batching:
+            return {"batch_size": batch_size, "shuffle": is_train}
+
+        batch_sampler = LengthBucketedBatchSampler.from_dataset(
+            dataset,
+            batch_size=batch_size,
+            shuffle=is_train,
+            max_tokens_per_batch=self.max_tokens_per_batch,
+            pool_size_multiplier=self.length_bucketing_pool_size_multiplier,
+        )
+        return {"batch_sampler": batch_sampler}
+
 
 class StructuredEventProcessingMode(StrEnum):
     """Structured event sequence processing modes."""
@@ -318,6 +370,23 @@ class StructuredEventProcessingMode(StrEnum):
     """Intra-event covariates are predicted according to a user-specified intra-event dependency chain."""
 
 
+class GenerationValidationMode(StrEnum):
+    """How often the batch is checked for NaN or infinite values during generation.
+
+    Each check requires a host-device synchronization, so checks are disabled by default and are intended for
+    debugging.
+    """
+
+    OFF = enum.auto()
+    """The batch is never checked."""
+
+    SAMPLED = enum.auto()
+    """The batch is checked before every ``validation_interval``-th generated event."""
+
+    FULL = enum.auto()
+    """The batch is checked before every generated event and every dependency graph level."""
+
+
 class TimeToEventGenerationHeadType(StrEnum):
     """Options for model TTE generation heads."""
 
@@ -338,6 +407,24 @@ class AttentionLayerType(StrEnum):
     """Attention is limited to a local window of a config-determined size."""
 
 
+class AttentionImplementation(StrEnum):
+    """Options for how the attention operation is computed."""
+
+    EAGER = enum.auto()
+    """Attention scores, masks, softmax, and dropout are computed as separate PyTorch operations.
+
+    This is the reference implementation, and it is always used when attention weights are requested or a head
+    mask is passed.
+    """
+
+    SDPA = enum.auto()
+    """Attention is computed by the fused `torch.nn.functional.scaled_dot_product_attention` kernel.
+
+    This never materializes the per-head attention score matrix, and dispatches to memory-efficient or flash
+    attention kernels where the device and inputs allow.
+    """
+
+
 ATTENTION_TYPES_LIST_T = Union[
     # "global" -- all layers are global.
     AttentionLayerType,
@@ -460,6 +547,12 @@ class StructuredTransformerConfig(PretrainedConfig):
             string, ``"gelu"`` and ``"relu"`` are supported.
         input_dropout: The dropout probability for the input layer.
         attention_dropout: The dropout probability for the attention probabilities.
+        attention_implementation: How the attention operation is computed. See `AttentionImplementation`.
+        do_pack_sequences: If True, conditionally independent models compute event embeddings, projections,
+            and MLPs over only the real events of each batch, rather than over the batch padded to its longest
+            sequence; see `EventStream.transformer.transformer.PackedEvents`. This does not change the outputs
+            of the model at real events. It is only used when the full sequence is processed at once (i.e.,
+            not during cached generation steps), and only for conditionally independent models.
         resid_dropout: The dropout probability used on the residual connections.
         layer_norm_epsilon: The epsilon used by the layer normalization layers.
         init_std: The standard deviation of the truncated normal weight initialization distribution.
@@ -516,6 +609,8 @@ class StructuredTransformerConfig(PretrainedConfig):
         intermediate_size: int = 32,
         activation_function: str = "gelu",
         attention_dropout: float = 0.1,
+        attention_implementation: AttentionImplementation = AttentionImplementation.EAGER,
+        do_pack_sequences: bool | None = False,
         input_dropout: float = 0.1,
         resid_dropout: float = 0.1,
         init_std: float = 0.02,
@@ -624,6 +719,10 @@ class StructuredTransformerConfig(PretrainedConfig):
                     proc_measurements_per_dep_graph_level.append(proc_group)
                 measurements_per_dep_graph_level = proc_measurements_per_dep_graph_level
 
+                if do_pack_sequences:
+                    print(extra_param_err_tmpl.format("do_pack_sequences", do_pack_sequences))
+                    do_pack_sequences = None
+
             case StructuredEventProcessingMode.CONDITIONALLY_INDEPENDENT:
                 if measurements_per_dep_graph_level is not None:
                     print(
@@ -726,6 +825,14 @@ class StructuredTransformerConfig(PretrainedConfig):
         self.seq_window_size = seq_window_size
         self.dep_graph_window_size = dep_graph_window_size
 
+        if attention_implementation not in AttentionImplementation.values():
+            raise ValueError(
+                f"Invalid option for `attention_implementation`. Must be in "
+                f"({AttentionImplementation.values()}). Got {attention_implementation}."
+            )
+        self.attention_implementation = attention_implementation
+        self.do_pack_sequences = do_pack_sequences
+
         missing_param_err_tmpl = f"For a {TTE_generation_layer_type} model, {{}} should not be None"
         extra_param_err_tmpl = (
             f"WARNING: For a {TTE_generation_layer_type} model, {{}} is not used; got {{}}. "
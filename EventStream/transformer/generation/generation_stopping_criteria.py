@@ -4,6 +4,7 @@
 
 from abc import ABC
 
+import torch
 from transformers.utils import add_start_docstrings
 
 from ...data.types import PytorchBatch
@@ -19,6 +20,16 @@ STOPPING_CRITERIA_INPUTS_DOCSTRING = r"""
         `bool`. `False` indicates we should continue, `True` indicates we should stop.
 """
 
+PER_SEQUENCE_STOPPING_CRITERIA_INPUTS_DOCSTRING = r"""
+    Args:
+        `batch` (`PytorchBatch`): The input batch.
+        `outputs` (`GenerativeSequenceModelPredictions`): The predicted outputs.
+        kwargs:
+            Additional stopping criteria specific kwargs.
+    Return:
+        `torch.BoolTensor` of shape `(batch_size,)`. `True` indicates that sequence is finished.
+"""
+
 
 class StoppingCriteria(ABC):
     """Abstract base class for all stopping criteria that can be applied during generation."""
@@ -28,6 +39,20 @@ class StoppingCriteria(ABC):
         raise NotImplementedError("StoppingCriteria needs to be subclassed")
 
 
+class PerSequenceStoppingCriteria(StoppingCriteria):
+    """Abstract base class for stopping criteria that decide, for each sequence, whether it is finished.
+
+    Sequences which are finished are removed from the batch being generated, so subsequent generation steps
+    are only run over the sequences still in progress.
+    """
+
+    @add_start_docstrings(PER_SEQUENCE_STOPPING_CRITERIA_INPUTS_DOCSTRING)
+    def __call__(
+        self, batch: PytorchBatch, outputs: GenerativeSequenceModelPredictions, **kwargs
+    ) -> torch.BoolTensor:
+        raise NotImplementedError("PerSequenceStoppingCriteria needs to be subclassed")
+
+
 class MaxLengthCriteria(StoppingCriteria):
     """This class can be used to stop generation whenever the full generated number of events exceeds
     `max_length`.
@@ -47,7 +72,74 @@ class MaxLengthCriteria(StoppingCriteria):
         return batch.sequence_length >= self.max_length
 
 
+class MaxTimeCriteria(PerSequenceStoppingCriteria):
+    """Finishes each sequence once its last event is more than `max_time` after a reference event.
+
+    Args:
+        max_time (`float`):
+            The maximum time (in the units of `time_delta`) the last event of a sequence can be after the
+            reference event before that sequence is finished.
+        reference_event_index (`int`):
+            The sequence index of the reference event. Defaults to the start of the sequence; to measure time
+            from the end of a left-padded input to generation, pass the input sequence length minus one.
+    """
+
+    def __init__(self, max_time: float, reference_event_index: int = 0):
+        self.max_time = max_time
+        self.reference_event_index = reference_event_index
+
+    @add_start_docstrings(PER_SEQUENCE_STOPPING_CRITERIA_INPUTS_DOCSTRING)
+    def __call__(
+        self, batch: PytorchBatch, outputs: GenerativeSequenceModelPredictions, **kwargs
+    ) -> torch.BoolTensor:
+        # The time delta of event i is the time from event i to event i + 1, so the time from the reference
+        # event to the last event is the sum of the (observed) time deltas from the reference up to the last.
+        time_delta = batch.time_delta[:, self.reference_event_index : -1]
+        event_mask = batch.event_mask[:, self.reference_event_index : -1]
+        elapsed = torch.where(event_mask, time_delta, 0).sum(-1)
+        return elapsed > self.max_time
+
+
+class ObservedIndicesCriteria(PerSequenceStoppingCriteria):
+    """Finishes each sequence once its last event contains any of the given vocabulary indices.
+
+    This can be used to stop generating a sequence once some predicate event (e.g., a given diagnosis or event
+    type) has been generated.
+
+    Args:
+        indices (`list[int]`):
+            The (offset, unified vocabulary) indices of the data elements that finish a sequence.
+    """
+
+    def __init__(self, indices: list[int]):
+        self.indices = torch.LongTensor(indices)
+
+    @add_start_docstrings(PER_SEQUENCE_STOPPING_CRITERIA_INPUTS_DOCSTRING)
+    def __call__(
+        self, batch: PytorchBatch, outputs: GenerativeSequenceModelPredictions, **kwargs
+    ) -> torch.BoolTensor:
+        last_event_indices = batch.dynamic_indices[:, -1]
+        observed = torch.isin(last_event_indices, self.indices.to(last_event_indices.device)).any(-1)
+        return observed & batch.event_mask[:, -1]
+
+
 class StoppingCriteriaList(list):
-    @add_start_docstrings(STOPPING_CRITERIA_INPUTS_DOCSTRING)
-    def __call__(self, batch: PytorchBatch, outputs: GenerativeSequenceModelPredictions, **kwargs) -> bool:
-        return any(criteria(batch, outputs) for criteria in self)
+    """A list of stopping criteria, which is finished when any of its members is.
+
+    If all members are batch-wide `StoppingCriteria`, calling this list returns a single `bool`. If any member
+    is a `PerSequenceStoppingCriteria`, it instead returns a `torch.BoolTensor` of shape `(batch_size,)`
+    indicating which sequences are finished under any criterion.
+    """
+
+    def __call__(
+        self, batch: PytorchBatch, outputs: GenerativeSequenceModelPredictions, **kwargs
+    ) -> bool | torch.BoolTensor:
+        finished = False
+        for criteria in self:
+            is_finished = criteria(batch, outputs, **kwargs)
+            if isinstance(is_finished, torch.Tensor):
+                finished = is_finished | finished
+            elif is_finished:
+                # A batch-wide criterion is met, so all sequences are finished.
+                return True
+        return finished
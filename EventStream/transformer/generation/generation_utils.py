@@ -22,15 +22,17 @@
 import logging
 import warnings
 from dataclasses import dataclass
+from functools import partial
 from typing import Any
 
 import torch
 import torch.distributed as dist
 from transformers.utils import ModelOutput
 
-from ...data.types import PytorchBatch
-from ..config import StructuredEventProcessingMode
+from ...data.types import PreallocatedPytorchBatch, PytorchBatch
+from ..config import GenerationValidationMode, StructuredEventProcessingMode
 from ..model_output import GenerativeSequenceModelPredictions
+from ..transformer import PreallocatedKVCache
 from .generation_stopping_criteria import MaxLengthCriteria, StoppingCriteriaList
 
 logger = logging.getLogger(__name__)
@@ -82,6 +84,170 @@ class StructuredGenerationMixin:
     def _expand_inputs_for_generation(batch: PytorchBatch, expand_size: int = 1) -> PytorchBatch:
         return batch.repeat_batch_elements(expand_size)
 
+    @staticmethod
+    def _validate_batch(batch: PytorchBatch, context: str):
+        """Raises an error if the batch contains any NaN or infinite values.
+
+        Only floating point tensors can hold such values, and they are checked in a single pass each, with a
+        single host-device synchronization overall; the (more expensive) per-key breakdown of what was found
+        is only computed for the error message.
+
+        Args:
+            batch: The batch to check.
+            context: A description of the generation step, for the error message.
+
+        Raises:
+            ValueError: If any NaN or infinite values are found.
+
+        Examples:
+            >>> import torch
+            >>> batch = PytorchBatch(
+            ...     time_delta=torch.tensor([[1.0, 2.0]]),
+            ...     dynamic_indices=torch.tensor([[[1], [2]]]),
+            ...     dynamic_values=torch.tensor([[[0.1], [0.5]]]),
+            ... )
+            >>> StructuredGenerationMixin._validate_batch(batch, "on index 0")
+            >>> batch.dynamic_values[0, 0, 0] = float("nan")
+            >>> StructuredGenerationMixin._validate_batch(batch, "on index 0")
+            Traceback (most recent call last):
+                ...
+            ValueError: Non-finite values detected on index 0: dynamic_values has 1 NaN(s) and 0 inf(s)
+        """
+        vals = {}
+        for key in ("dynamic_values", "time_delta", "time"):
+            val = batch[key]
+            if isinstance(val, torch.Tensor) and val.is_floating_point():
+                vals[key] = val
+
+        if not vals:
+            return
+
+        is_finite = torch.stack([torch.isfinite(v).all() for v in vals.values()])
+        if is_finite.all():
+            return
+
+        errors = []
+        for key, val in vals.items():
+            n_nan = torch.isnan(val).sum()
+            n_inf = torch.isinf(val).sum()
+            if n_nan or n_inf:
+                errors.append(f"{key} has {n_nan} NaN(s) and {n_inf} inf(s)")
+        raise ValueError(f"Non-finite values detected {context}: {'; '.join(errors)}")
+
+    @classmethod
+    def _select_batch_elements(
+        cls, batch: PytorchBatch, model_kwargs: dict[str, Any], index: torch.LongTensor
+    ) -> tuple[PytorchBatch, dict[str, Any]]:
+        """Restricts the batch being generated and its cached state to the batch elements at `index`."""
+        new_batch = batch[index]
+        if isinstance(batch, PreallocatedPytorchBatch):
+            new_batch = PreallocatedPytorchBatch.from_batch(
+                new_batch, max_sequence_length=batch.sequence_capacity
+            )
+
+        model_kwargs = {
+            **model_kwargs,
+            "past": cls._select_past_batch_elements(model_kwargs.get("past"), index),
+        }
+        return new_batch, model_kwargs
+
+    @classmethod
+    def _select_past_batch_elements(cls, past: Any, index: torch.LongTensor) -> Any:
+        """Restricts a (possibly nested) past key/value cache to the batch elements at `index`.
+
+        All tensors in the cache are assumed to have the batch dimension first, as is the case for both the
+        conditionally independent and nested attention models.
+        """
+        match past:
+            case torch.Tensor():
+                return past.index_select(0, index)
+            case PreallocatedKVCache():
+                return past.index_select(index)
+            case dict():
+                return {k: cls._select_past_batch_elements(v, index) for k, v in past.items()}
+            case tuple() | list():
+                return type(past)(cls._select_past_batch_elements(v, index) for v in past)
+            case _:
+                return past
+
+    @staticmethod
+    def _merge_finished_sequences(
+        sequences: list[tuple[torch.LongTensor, PytorchBatch]],
+    ) -> PytorchBatch:
+        """Reassembles the full generated batch from sequences that finished at different generation steps.
+
+        Shorter sequences are right-padded (with unobserved events) to the length of the longest, and all are
+        padded to the same number of data elements per event.
+
+        Args:
+            sequences: Tuples of the positions in the full batch of some batch elements and the generated
+                batch for those elements. The positions must, together, cover the full batch exactly once.
+
+        Returns:
+            The full generated batch.
+
+        Examples:
+            >>> import torch
+            >>> first = PytorchBatch(
+            ...     event_mask=torch.tensor([[True, True]]),
+            ...     time_delta=torch.tensor([[2.0, 1.0]]),
+            ...     dynamic_indices=torch.tensor([[[1], [2]]]),
+            ...     dynamic_measurement_indices=torch.tensor([[[1], [1]]]),
+            ...     dynamic_values=torch.tensor([[[0.0], [0.0]]]),
+            ...     dynamic_values_mask=torch.tensor([[[False], [False]]]),
+            ...     start_time=torch.tensor([0.0]),
+            ... )
+            >>> rest = PytorchBatch(
+            ...     event_mask=torch.tensor([[True, True, True], [False, True, True]]),
+            ...     time_delta=torch.tensor([[1.0, 1.0, 1.0], [0.0, 3.0, 1.0]]),
+            ...     dynamic_indices=torch.tensor([[[1, 2], [2, 0], [3, 0]], [[0, 0], [4, 0], [5, 0]]]),
+            ...     dynamic_measurement_indices=torch.ones(2, 3, 2, dtype=torch.long),
+            ...     dynamic_values=torch.zeros(2, 3, 2),
+            ...     dynamic_values_mask=torch.zeros(2, 3, 2, dtype=torch.bool),
+            ...     start_time=torch.tensor([1.0, 2.0]),
+            ... )
+            >>> batch = StructuredGenerationMixin._merge_finished_sequences(
+            ...     [(torch.tensor([1]), first), (torch.tensor([2, 0]), rest)]
+            ... )
+            >>> batch.event_mask
+            tensor([[False,  True,  True],
+                    [ True,  True, False],
+                    [ True,  True,  True]])
+            >>> batch.dynamic_indices[1]
+            tensor([[1, 0],
+                    [2, 0],
+                    [0, 0]])
+            >>> batch.start_time
+            tensor([2., 0., 1.])
+        """
+        L = max(B.sequence_length for _, B in sequences)
+        M = max(B.n_data_elements for _, B in sequences)
+        order = torch.cat([idx for idx, _ in sequences]).argsort()
+
+        out = {}
+        for k in sequences[0][1].keys():
+            vals = [B[k] for _, B in sequences]
+            if any(v is None for v in vals):
+                out[k] = None
+                continue
+
+            match k:
+                case "stream_labels":
+                    out[k] = {kk: torch.cat([v[kk] for v in vals])[order] for kk in vals[0]}
+                    continue
+                case "event_mask" | "time_delta" | "time":
+                    vals = [torch.nn.functional.pad(v, (0, L - v.shape[1])) for v in vals]
+                case (
+                    "dynamic_indices"
+                    | "dynamic_measurement_indices"
+                    | "dynamic_values"
+                    | "dynamic_values_mask"
+                ):
+                    vals = [torch.nn.functional.pad(v, (0, M - v.shape[2], 0, L - v.shape[1])) for v in vals]
+            out[k] = torch.cat(vals)[order]
+
+        return PytorchBatch(**out)
+
     @staticmethod
     def _update_model_kwargs_for_generation(
         outputs: ModelOutput, model_kwargs: dict[str, Any]
@@ -136,6 +302,8 @@ class StructuredGenerationMixin:
         output_scores: bool | None = None,
         return_dict_in_generate: bool | None = None,
         synced_gpus: bool | None = False,
+        validation_mode: GenerationValidationMode = GenerationValidationMode.OFF,
+        validation_interval: int = 1,
         **model_kwargs,
     ) -> SampleDecoderOnlyOutput | PytorchBatch:
         # 1. Set generation parameters if not already defined
@@ -160,6 +328,10 @@ class StructuredGenerationMixin:
             else self.config.return_dict_in_generate
         )
 
+        validation_mode = GenerationValidationMode(validation_mode)
+        if validation_interval < 1:
+            raise ValueError(f"validation_interval must be a positive integer; got {validation_interval}")
+
         # 3. Define other model kwargs
         model_kwargs["use_cache"] = use_cache
         model_kwargs["output_attentions"] = output_attentions
@@ -206,6 +378,9 @@ class StructuredGenerationMixin:
                     "Can't run for a maximum length longer than the current maximum sequence length!"
                 )
 
+        # This lets models preallocate their past key/value caches to the full generation length.
+        model_kwargs["max_length"] = max_length
+
         # 7. prepare stopping criteria
         stopping_criteria = self._get_stopping_criteria(
             max_length=max_length, stopping_criteria=stopping_criteria
@@ -215,11 +390,21 @@ class StructuredGenerationMixin:
         # 11. expand batch with `num_return_sequences` additional sequences per batch
         batch = self._expand_inputs_for_generation(batch, expand_size=num_return_sequences)
 
+        # Reserve room for all generated events up front, so that each generation step writes into the batch
+        # in place rather than re-allocating and copying it.
+        if isinstance(batch, PytorchBatch) and max_length is not None:
+            batch = PreallocatedPytorchBatch.from_batch(
+                batch, max_sequence_length=max(max_length, batch.sequence_length + 1)
+            )
+
         match self.config.structured_event_processing_mode:
             case StructuredEventProcessingMode.CONDITIONALLY_INDEPENDENT:
                 sample_fn = self._conditionally_independent_sample_event
             case StructuredEventProcessingMode.NESTED_ATTENTION:
-                sample_fn = self._nested_attention_sample_event
+                sample_fn = partial(
+                    self._nested_attention_sample_event,
+                    validate_dep_graph_levels=(validation_mode == GenerationValidationMode.FULL),
+                )
             case _:
                 raise ValueError(
                     "Unsupported structured event processing mode: "
@@ -231,8 +416,11 @@ class StructuredGenerationMixin:
         decoder_attentions = () if (return_dict_in_generate and output_attentions) else None
         decoder_hidden_states = () if (return_dict_in_generate and output_hidden_states) else None
 
-        # keep track of which sequences are already finished
-        unfinished_sequences = batch["event_mask"].new_ones(batch.batch_size)
+        # Sequences finished by per-sequence stopping criteria are removed from the batch, so that subsequent
+        # steps only generate the sequences still in progress. `active_idx` holds the positions of the latter
+        # in the full batch (and is `None` while all are active); `finished_sequences` collects the former.
+        active_idx = None
+        finished_sequences = []
 
         this_peer_finished = False  # used by synced_gpus only
         generated_event_index = 0
@@ -250,23 +438,16 @@ class StructuredGenerationMixin:
             if synced_gpus and this_peer_finished:
                 continue  # don't waste resources running the code we don't need
 
-            for key in (
-                "dynamic_indices",
-                "dynamic_values",
-                "dynamic_measurement_indices",
-                "time_delta",
-                "time",
-            ):
-                vals = batch[key]
-                if isinstance(vals, torch.Tensor) and torch.isnan(vals).any():
-                    raise ValueError(
-                        f"{torch.isnan(vals).sum()} NaNs detected in {key} on index {generated_event_index}!"
-                    )
-                if isinstance(vals, torch.Tensor) and (~torch.isfinite(vals)).any():
-                    raise ValueError(
-                        f"{(~torch.isfinite(vals)).sum()} Non-finites detected in {key} on index "
-                        f"{generated_event_index}."
-                    )
+            match validation_mode:
+                case GenerationValidationMode.FULL:
+                    do_validate = True
+                case GenerationValidationMode.SAMPLED:
+                    do_validate = generated_event_index % validation_interval == 0
+                case _:
+                    do_validate = False
+
+            if do_validate:
+                self._validate_batch(batch, f"on index {generated_event_index}")
 
             # forward pass to get next token
             batch, scores, attentions, hidden_states, model_kwargs = sample_fn(
@@ -284,12 +465,23 @@ class StructuredGenerationMixin:
                 if output_hidden_states:
                     decoder_hidden_states += (hidden_states,)
 
-            # if eos_token was found in one sentence, set sentence to finished
-            # if eos_token_id is not None:
-            #     unfinished_sequences = unfinished_sequences.mul((next_tokens != eos_token_id).long())
-
             # stop when each sentence is finished, or if we exceed the maximum length
-            if unfinished_sequences.max() == 0 or stopping_criteria(batch, scores):
+            should_stop = stopping_criteria(batch, scores)
+            if isinstance(should_stop, torch.Tensor):
+                is_finished = should_stop
+                should_stop = bool(is_finished.all())
+                if not should_stop and is_finished.any():
+                    if active_idx is None:
+                        active_idx = torch.arange(batch.batch_size, device=batch.device)
+
+                    finished_idx = is_finished.nonzero(as_tuple=True)[0]
+                    keep_idx = (~is_finished).nonzero(as_tuple=True)[0]
+
+                    finished_sequences.append((active_idx[finished_idx], batch[finished_idx]))
+                    active_idx = active_idx[keep_idx]
+                    batch, model_kwargs = self._select_batch_elements(batch, model_kwargs, keep_idx)
+
+            if should_stop:
                 if not synced_gpus:
                     break
                 else:
@@ -297,6 +489,11 @@ class StructuredGenerationMixin:
 
             generated_event_index += 1
 
+        if isinstance(batch, PreallocatedPytorchBatch):
+            batch = batch.to_pytorch_batch()
+        if finished_sequences:
+            batch = self._merge_finished_sequences([*finished_sequences, (active_idx, batch)])
+
         if return_dict_in_generate:
             return SampleDecoderOnlyOutput(
                 scores=scores,
@@ -341,6 +538,7 @@ class StructuredGenerationMixin:
         self,
         batch: PytorchBatch,
         generated_event_index: int,
+        validate_dep_graph_levels: bool = False,
         **model_kwargs,
     ) -> tuple[
         PytorchBatch,
@@ -364,25 +562,13 @@ class StructuredGenerationMixin:
             if is_first and dep_graph_el_target == 0:
                 dep_graph_el_target = None
 
-            for key in (
-                "dynamic_indices",
-                "dynamic_values",
-                "dynamic_measurement_indices",
-                "time_delta",
-                "time",
-            ):
-                vals = batch[key]
-                if isinstance(vals, torch.Tensor) and torch.isnan(vals).any():
-                    raise ValueError(
-                        f"{torch.isnan(vals).sum()} NaNs detected in {key} on index {generated_event_index} "
-                        f"for dep_graph_el_target {dep_graph_el_target} (is_first={is_first})!"
-                    )
-                if isinstance(vals, torch.Tensor) and (~torch.isfinite(vals)).any():
-                    raise ValueError(
-                        f"{(~torch.isfinite(vals)).sum()} Non-finites detected in {key} on index "
-                        f"{generated_event_index} for dep_graph_el_target {dep_graph_el_target} "
-                        f"(is_first={is_first})!"
-                    )
+            # The batch as of the first level is validated (if requested) by `generate`.
+            if validate_dep_graph_levels and dep_graph_el_target:
+                self._validate_batch(
+                    batch,
+                    f"on index {generated_event_index} for dep_graph_el_target {dep_graph_el_target} "
+                    f"(is_first={is_first})",
+                )
 
             model_inputs = self.prepare_inputs_for_generation(
                 batch, dep_graph_el_generation_target=dep_graph_el_target, **model_kwargs
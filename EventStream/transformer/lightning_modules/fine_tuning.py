@@ -334,6 +334,9 @@ class FinetuneConfig:
     )
     do_use_filesystem_sharing: bool = True
 
+    # If True, the model is compiled with `torch.compile` and batches are padded to a small set of shapes.
+    compile: bool = False
+
     def __post_init__(self):
         match self.save_dir:
             case str():
@@ -452,6 +455,10 @@ def train(cfg: FinetuneConfig):
     if cfg.do_use_filesystem_sharing:
         torch.multiprocessing.set_sharing_strategy("file_system")
 
+    if cfg.compile:
+        # The compiled model is specialized to the shapes of its inputs, so we limit how many there are.
+        cfg.data_config.do_pad_to_shape_buckets = True
+
     train_pyd = PytorchDataset(cfg.data_config, split="train")
     tuning_pyd = PytorchDataset(cfg.data_config, split="tuning")
 
@@ -484,25 +491,24 @@ def train(cfg: FinetuneConfig):
 
     LM = ESTForStreamClassificationLM(**model_params)
 
-    # TODO(mmd): Get this working!
-    # if cfg.compile:
-    #     print("Compiling model!")
-    #     LM = torch.compile(LM)
+    if cfg.compile:
+        print("Compiling model!")
+        # Distribution argument validation can't be traced and would break the compiled graph.
+        torch.distributions.Distribution.set_default_validate_args(False)
+        LM.model.compile(dynamic=False)
 
     # Setting up torch dataloader
     train_dataloader = torch.utils.data.DataLoader(
         train_pyd,
-        batch_size=optimization_config.batch_size,
         num_workers=optimization_config.num_dataloader_workers,
         collate_fn=train_pyd.collate,
-        shuffle=True,
+        **optimization_config.dataloader_batching_kwargs(train_pyd, is_train=True),
     )
     tuning_dataloader = torch.utils.data.DataLoader(
         tuning_pyd,
-        batch_size=optimization_config.validation_batch_size,
         num_workers=optimization_config.num_dataloader_workers,
         collate_fn=tuning_pyd.collate,
-        shuffle=False,
+        **optimization_config.dataloader_batching_kwargs(tuning_pyd, is_train=False),
     )
 
     # Setting up model configurations
@@ -564,10 +570,9 @@ def train(cfg: FinetuneConfig):
     held_out_pyd = PytorchDataset(cfg.data_config, split="held_out")
     held_out_dataloader = torch.utils.data.DataLoader(
         held_out_pyd,
-        batch_size=optimization_config.validation_batch_size,
         num_workers=optimization_config.num_dataloader_workers,
         collate_fn=held_out_pyd.collate,
-        shuffle=False,
+        **optimization_config.dataloader_batching_kwargs(held_out_pyd, is_train=False),
     )
     tuning_metrics = trainer.validate(model=LM, dataloaders=tuning_dataloader, ckpt_path="best")
     held_out_metrics = trainer.test(model=LM, dataloaders=held_out_dataloader, ckpt_path="best")
@@ -554,7 +554,8 @@ class PretrainConfig:
     do_final_validation_on_metrics: bool = True
     do_use_filesystem_sharing: bool = True
 
-    # compile: bool = True
+    # If True, the model is compiled with `torch.compile` and batches are padded to a small set of shapes.
+    compile: bool = False
 
     def __post_init__(self):
         if type(self.save_dir) is str and self.save_dir != omegaconf.MISSING:
@@ -577,6 +578,10 @@ def train(cfg: PretrainConfig):
     if cfg.do_use_filesystem_sharing:
         torch.multiprocessing.set_sharing_strategy("file_system")
 
+    if cfg.compile:
+        # The compiled model is specialized to the shapes of its inputs, so we limit how many there are.
+        cfg.data_config.do_pad_to_shape_buckets = True
+
     train_pyd = PytorchDataset(cfg.data_config, split="train")
     tuning_pyd = PytorchDataset(cfg.data_config, split="tuning")
 
@@ -616,25 +621,24 @@ def train(cfg: PretrainConfig):
         metrics_config=cfg.pretraining_metrics_config,
     )
 
-    # TODO(mmd): Get this working!
-    # if cfg.compile:
-    #     print("Compiling model!")
-    #     LM = torch.compile(LM)
+    if cfg.compile:
+        print("Compiling model!")
+        # Distribution argument validation can't be traced and would break the compiled graph.
+        torch.distributions.Distribution.set_default_validate_args(False)
+        LM.model.compile(dynamic=False)
 
     # Setting up torch dataloader
     train_dataloader = torch.utils.data.DataLoader(
         train_pyd,
-        batch_size=optimization_config.batch_size,
         num_workers=optimization_config.num_dataloader_workers,
         collate_fn=train_pyd.collate,
-        shuffle=True,
+        **optimization_config.dataloader_batching_kwargs(train_pyd, is_train=True),
     )
     tuning_dataloader = torch.utils.data.DataLoader(
         tuning_pyd,
-        batch_size=optimization_config.validation_batch_size,
         num_workers=optimization_config.num_dataloader_workers,
         collate_fn=tuning_pyd.collate,
-        shuffle=False,
+        **optimization_config.dataloader_batching_kwargs(tuning_pyd, is_train=False),
     )
 
     # Setting up model configurations
@@ -687,10 +691,9 @@ def train(cfg: PretrainConfig):
         held_out_pyd = PytorchDataset(cfg.data_config, split="held_out")
         held_out_dataloader = torch.utils.data.DataLoader(
             held_out_pyd,
-            batch_size=optimization_config.validation_batch_size,
             num_workers=optimization_config.num_dataloader_workers,
             collate_fn=held_out_pyd.collate,
-            shuffle=False,
+            **optimization_config.dataloader_batching_kwargs(held_out_pyd, is_train=False),
         )
 
         LM.metrics_config = cfg.final_validation_metrics_config
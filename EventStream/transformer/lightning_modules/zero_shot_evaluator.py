@@ -27,6 +27,7 @@ from ...data.types import PytorchBatch
 from ...utils import task_wrapper
 from ..conditionally_independent_model import CIPPTForGenerativeSequenceModeling
 from ..config import StructuredEventProcessingMode, StructuredTransformerConfig
+from ..generation.generation_stopping_criteria import StoppingCriteriaList
 from ..model_output import StreamClassificationModelOutput
 from ..nested_attention_model import NAPPTForGenerativeSequenceModeling
 from ..utils import safe_weighted_avg, str_summary
@@ -224,6 +225,9 @@ class ESTForZeroShotClassificationLM(L.LightningModule):
                 output_attentions=False,
                 output_hidden_states=False,
                 use_cache=True,
+                stopping_criteria=StoppingCriteriaList(
+                    self.labeling_function.stopping_criteria(batch.sequence_length)
+                ),
             ),
             input_seq_len=batch.sequence_length,
         )
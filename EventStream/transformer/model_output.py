@@ -12,7 +12,12 @@ import torch
 from transformers.utils import ModelOutput
 
 from ..data.data_embedding_layer import MeasIndexGroupOptions
-from ..data.types import DataModality, PytorchBatch, TemporalityType
+from ..data.types import (
+    DataModality,
+    PreallocatedPytorchBatch,
+    PytorchBatch,
+    TemporalityType,
+)
 from .config import (
     MEAS_INDEX_GROUP_T,
     StructuredTransformerConfig,
@@ -869,14 +874,16 @@ class GenerativeSequenceModelSamples(ModelOutput):
         This function first constructs a new batch element from the current object, and then appends it to the
         given batch. It adjusts the time delta and event mask of the batch accordingly, and ensures that the
         dynamic data elements of the batch and the new element are of the same dimensions by applying padding
-        as needed.
+        as needed. If `batch` is a `PreallocatedPytorchBatch`, the new element is instead written into its
+        buffers in place.
 
         Args:
             batch: The PytorchBatch object to which the new element will be added.
             config: A StructuredTransformerConfig object containing configuration data.
 
         Returns:
-            A new PytorchBatch object, which includes the original data plus the appended new batch element.
+            A new PytorchBatch object, which includes the original data plus the appended new batch element,
+            or `batch` itself, updated in place, if it is a `PreallocatedPytorchBatch`.
         """
 
         (
@@ -888,6 +895,17 @@ class GenerativeSequenceModelSamples(ModelOutput):
             new_dynamic_values_mask,
         ) = self._build_new_batch_element(batch, config)
 
+        if isinstance(batch, PreallocatedPytorchBatch):
+            batch.append_event(
+                last_event_time_delta=new_event_time_delta,
+                event_mask=new_event_mask,
+                dynamic_indices=new_dynamic_indices,
+                dynamic_measurement_indices=new_dynamic_measurement_indices,
+                dynamic_values=new_dynamic_values,
+                dynamic_values_mask=new_dynamic_values_mask,
+            )
+            return batch
+
         # Combine everything
         seq_dim = 1
 
@@ -951,7 +969,8 @@ class GenerativeSequenceModelSamples(ModelOutput):
 
         This method modifies the last batch element in the given PytorchBatch object, based on the data
         available in the current object. The measurements that will be filled in the batch element are
-        determined by the configuration and the 'measurements_to_fill' argument.
+        determined by the configuration and the 'measurements_to_fill' argument. If `batch` is a
+        `PreallocatedPytorchBatch`, its last event is overwritten in place.
 
         Args:
             batch: The PytorchBatch object containing the batch element to be updated.
@@ -963,7 +982,8 @@ class GenerativeSequenceModelSamples(ModelOutput):
             ValueError: If 'time' is included in the 'measurements_to_fill' set.
 
         Returns:
-            A new PytorchBatch object that includes the updated batch element.
+            A new PytorchBatch object that includes the updated batch element, or `batch` itself, updated in
+            place, if it is a `PreallocatedPytorchBatch`.
         """
 
         if measurements_to_fill is None:
@@ -1031,6 +1051,15 @@ class GenerativeSequenceModelSamples(ModelOutput):
         new_dynamic_values = torch.cat((prev_dynamic_values, new_dynamic_values), 1)
         new_dynamic_values_mask = torch.cat((prev_dynamic_values_mask, new_dynamic_values_mask), 1)
 
+        if isinstance(batch, PreallocatedPytorchBatch):
+            batch.set_last_event_data(
+                dynamic_indices=new_dynamic_indices,
+                dynamic_measurement_indices=new_dynamic_measurement_indices,
+                dynamic_values=new_dynamic_values,
+                dynamic_values_mask=new_dynamic_values_mask,
+            )
+            return batch
+
         # Re-pad data elements.
         (
             (dynamic_indices, dynamic_measurement_indices, dynamic_values, dynamic_values_mask),
@@ -1280,12 +1309,6 @@ class GenerativeOutputLayerBase(torch.nn.Module):
 
         self.is_observed_criteria = torch.nn.BCEWithLogitsLoss(reduction="none")
 
-        self.classification_criteria = {}
-        for measurement in config.measurements_for(DataModality.SINGLE_LABEL_CLASSIFICATION):
-            self.classification_criteria[measurement] = torch.nn.CrossEntropyLoss(reduction="none")
-        for measurement in config.measurements_for(DataModality.MULTI_LABEL_CLASSIFICATION):
-            self.classification_criteria[measurement] = torch.nn.BCEWithLogitsLoss(reduction="none")
-
         self.regression_layers = torch.nn.ModuleDict({})
         for measurement in config.measurements_for(DataModality.MULTIVARIATE_REGRESSION):
             self.regression_layers[measurement] = GaussianIndexedRegressionLayer(
@@ -1308,6 +1331,61 @@ class GenerativeOutputLayerBase(torch.nn.Module):
                 assert measurement not in self.classification_mode_per_measurement
                 self.classification_mode_per_measurement[measurement] = generative_mode
 
+        self._build_classification_segments()
+
+    def _build_classification_segments(self):
+        """Precomputes the tensors used to compute all classification losses at once.
+
+        Each classification measurement owns a contiguous "segment" of the classification vocabulary, and is
+        assigned a segment index by its position in `classification_mode_per_measurement`. One extra segment
+        (with index equal to the number of classification measurements) collects all vocabulary elements and
+        measurements that are not used for classification, so that they can be dropped after reductions.
+        These are registered as non-persistent buffers, so they follow the module across devices but do not
+        change its state dict.
+        """
+        measurements = list(self.classification_mode_per_measurement.keys())
+        n_segments = len(measurements)
+
+        vocab_offsets = sorted(self.config.vocab_offsets_by_measurement.values())
+        n_measurement_indices = max(self.config.measurements_idxmap.values(), default=0) + 1
+
+        segment_by_vocab = torch.full((self.config.vocab_size,), n_segments, dtype=torch.long)
+        segment_by_measurement = torch.full((n_measurement_indices,), n_segments, dtype=torch.long)
+        vocab_start = torch.zeros(n_segments, dtype=torch.long)
+        vocab_len = torch.ones(n_segments)
+        is_observed_idx = torch.zeros(n_segments, dtype=torch.long)
+        # The last entry corresponds to the unused segment.
+        is_single_label = torch.zeros(n_segments + 1, dtype=torch.bool)
+        is_multi_label = torch.zeros(n_segments + 1, dtype=torch.bool)
+
+        self.classification_vocab_range_per_measurement = {}
+        for segment, measurement in enumerate(measurements):
+            start = self.config.vocab_offsets_by_measurement[measurement]
+            end = min([o for o in vocab_offsets if o > start] + [self.config.vocab_size])
+            self.classification_vocab_range_per_measurement[measurement] = (start, end)
+
+            segment_by_vocab[start:end] = segment
+            measurement_idx = self.config.measurements_idxmap[measurement]
+            segment_by_measurement[measurement_idx] = segment
+            vocab_start[segment] = start
+            vocab_len[segment] = end - start
+            # We subtract 1 here as the measurement_idx of 0 is withheld for missing data.
+            is_observed_idx[segment] = measurement_idx - 1
+
+            match self.classification_mode_per_measurement[measurement]:
+                case DataModality.SINGLE_LABEL_CLASSIFICATION:
+                    is_single_label[segment] = True
+                case DataModality.MULTI_LABEL_CLASSIFICATION:
+                    is_multi_label[segment] = True
+
+        self.register_buffer("_clf_segment_by_vocab", segment_by_vocab, persistent=False)
+        self.register_buffer("_clf_segment_by_measurement", segment_by_measurement, persistent=False)
+        self.register_buffer("_clf_vocab_start", vocab_start, persistent=False)
+        self.register_buffer("_clf_vocab_len", vocab_len, persistent=False)
+        self.register_buffer("_clf_is_observed_idx", is_observed_idx, persistent=False)
+        self.register_buffer("_clf_is_single_label", is_single_label, persistent=False)
+        self.register_buffer("_clf_is_multi_label", is_multi_label, persistent=False)
+
     def get_TTE_outputs(
         self, batch: PytorchBatch, encoded: torch.FloatTensor, is_generation: bool = False
     ) -> tuple[torch.FloatTensor, torch.distributions.Distribution, torch.FloatTensor,]:
@@ -1357,7 +1435,10 @@ class GenerativeOutputLayerBase(torch.nn.Module):
             print(f"Failed to compute TTE log prob on input {str_summary(TTE_true_exp)}: {e}")
             raise
 
-        if TTE_obs_mask_exp.isnan().any():
+        if torch.compiler.is_compiling():
+            # These checks depend on the values of the inputs, so can't be traced.
+            pass
+        elif TTE_obs_mask_exp.isnan().any():
             raise ValueError(f"NaNs in TTE_obs_mask_exp: {batch}")
         elif TTE_true_exp.isnan().any():
             raise ValueError(f"NaNs in TTE_true_exp: {batch}")
@@ -1435,111 +1516,113 @@ class GenerativeOutputLayerBase(torch.nn.Module):
         if not valid_measurements:
             return {}, {}, {}
 
-        torch._assert(~torch.isnan(encoded).any(), f"{torch.isnan(encoded).sum()} NaNs in encoded")
+        if not torch.compiler.is_compiling():
+            torch._assert(~torch.isnan(encoded).any(), f"{torch.isnan(encoded).sum()} NaNs in encoded")
 
         # Classification of what elements are going to occur:
         is_observed_score = self.IsObservedLayer(encoded)
-        torch._assert(
-            ~torch.isnan(is_observed_score).any(),
-            f"{torch.isnan(is_observed_score).sum()} NaNs in is_observed_score",
-        )
+        if not torch.compiler.is_compiling():
+            torch._assert(
+                ~torch.isnan(is_observed_score).any(),
+                f"{torch.isnan(is_observed_score).sum()} NaNs in is_observed_score",
+            )
 
         classification_scores = self.ClassificationLayer(encoded)
+        # classification_scores is of shape [batch X seq X vocab]
+
+        # All classification measurements are processed at once, as segments of the vocabulary. Tensors of
+        # shape [batch X seq X n_segments + 1] are indexed by segment; the last segment collects everything
+        # that is not a classification target and is dropped after each reduction.
+        batch_size, seq_len, vocab_size = classification_scores.shape
+        n_segments = len(self.classification_mode_per_measurement)
+        seg_shape = (batch_size, seq_len, n_segments + 1)
+        device = classification_scores.device
+
+        event_mask = batch["event_mask"]
+        dynamic_indices = batch["dynamic_indices"].long()
+
+        # We don't need to shift here, as given this is a structured model, we'll always rely on elements
+        # of the dependency graph that don't include these inputs to predict them (e.g., predict the
+        # contents of the event given the time at which the event occurred).
+        segment_by_element = self._clf_segment_by_measurement[batch["dynamic_measurement_indices"].long()]
+        segment_by_vocab = self._clf_segment_by_vocab.expand(batch_size, seq_len, vocab_size)
+
+        is_single_label = self._clf_is_single_label[:-1]
+        vocab_start = self._clf_vocab_start
+
+        # Single-label measurements. As there is only one index of this type per event, we can directly
+        # sum the indices observed in each segment.
+        n_observed = torch.zeros(seg_shape, dtype=torch.long, device=device).scatter_add_(
+            2, segment_by_element, torch.ones_like(segment_by_element)
+        )
+        events_with_label = n_observed[..., :-1] > 0
+        index_sum = torch.zeros(seg_shape, dtype=torch.long, device=device).scatter_add_(
+            2, segment_by_element, dynamic_indices
+        )
+        single_labels = torch.where(events_with_label & is_single_label, index_sum[..., :-1] - vocab_start, 0)
+        # single_labels is of shape [batch X seq X n_segments]
+
+        # A per-segment log-sum-exp. The max is only used for numerical stability, so needn't carry gradients.
+        seg_max = torch.zeros(seg_shape, dtype=classification_scores.dtype, device=device).scatter_reduce(
+            2, segment_by_vocab, classification_scores.detach(), "amax", include_self=False
+        )
+        seg_sum_exp = torch.zeros_like(seg_max).scatter_add_(
+            2, segment_by_vocab, (classification_scores - seg_max.gather(2, segment_by_vocab)).exp()
+        )
+        seg_lse = (seg_max + seg_sum_exp.log())[..., :-1]
+        label_scores = classification_scores.gather(2, single_labels + vocab_start)
+        single_label_loss = seg_lse - label_scores
+
+        is_obs_score = is_observed_score.index_select(2, self._clf_is_observed_idx)
+        is_obs_loss = self.is_observed_criteria(is_obs_score, events_with_label.float())
+
+        # Multi-label measurements. Labels are built over the whole vocabulary, with all elements that aren't
+        # multi-label targets scattered to an extra, dropped, column.
+        is_multi_label_element = self._clf_is_multi_label[segment_by_element]
+        multi_labels = torch.zeros(batch_size, seq_len, vocab_size + 1, device=device).scatter(
+            dim=2,
+            index=torch.where(is_multi_label_element, dynamic_indices, vocab_size),
+            value=1,
+        )[..., :-1]
+        loss_per_label = torch.nn.functional.binary_cross_entropy_with_logits(
+            classification_scores, multi_labels, reduction="none"
+        )
+        multi_label_loss = (
+            torch.zeros(seg_shape, dtype=loss_per_label.dtype, device=device)
+            .scatter_add_(2, segment_by_vocab, loss_per_label)[..., :-1]
+            .div(self._clf_vocab_len)
+        )
+
+        # Multi-label doesn't use a separate is-observed path, as it handles that natively.
+        loss_per_event = torch.where(is_single_label, single_label_loss + is_obs_loss, multi_label_loss)
+        loss_mask = event_mask.unsqueeze(-1) & (events_with_label | ~is_single_label)
+        losses = weighted_loss(loss_per_event.permute(2, 0, 1), loss_mask.permute(2, 0, 1)).unbind(0)
 
         classification_losses_by_measurement = {}
         classification_dists_by_measurement = {}
         classification_labels_by_measurement = {}
 
-        for measurement, classification_mode in self.classification_mode_per_measurement.items():
+        for segment, (measurement, classification_mode) in enumerate(
+            self.classification_mode_per_measurement.items()
+        ):
             if measurement not in valid_measurements:
                 continue
 
-            event_mask = batch["event_mask"]
-
-            measurement_idx = self.config.measurements_idxmap[measurement]
-            vocab_start = self.config.vocab_offsets_by_measurement[measurement]
-            vocab_end = min(
-                o
-                for o in list(self.config.vocab_offsets_by_measurement.values()) + [self.config.vocab_size]
-                if o > vocab_start
-            )
-
+            vocab_start, vocab_end = self.classification_vocab_range_per_measurement[measurement]
             scores = classification_scores[:, :, vocab_start:vocab_end]
-            # scores is of shape [batch X seq X vocab_end-vocab_start]
-            # We subtract 1 here as the measurement_idx of 0 is withheld for missing data.
-            is_obs_score = is_observed_score[:, :, measurement_idx - 1]
-            # is_obs_score is of shape [batch X seq]
-
-            # We don't need to shift here, as given this is a structured model, we'll always rely on elements
-            # of the dependency graph that don't include these inputs to predict them (e.g., predict the
-            # contents of the event given the time at which the event occurred).
-            dynamic_indices = batch["dynamic_indices"]
-            tensor_idx = batch["dynamic_measurement_indices"] == measurement_idx
 
             if classification_mode == DataModality.SINGLE_LABEL_CLASSIFICATION:
-                # As there is only one index of this type for this setting,
-                # we can directly multiply by the mask and sum
-                events_with_label = tensor_idx.any(dim=-1)
-                is_obs_loss = self.is_observed_criteria(is_obs_score, events_with_label.float())
-
-                labels = (
-                    (dynamic_indices.long() * tensor_idx.long()).sum(dim=-1) - vocab_start
-                ) * events_with_label.long()
-                # labels is of shape [batch X seq]
-
-                try:
-                    loss_per_event = self.classification_criteria[measurement](scores.transpose(1, 2), labels)
-                except IndexError as e:
-                    print(f"Failed to get loss for {measurement}: {e}!")
-                    print(f"vocab_start: {vocab_start}, vocab_end: {vocab_end}")
-                    print(f"max(labels): {labels.max()}, min(labels): {labels.min()}")
-                    print(
-                        f"max(dynamic_indices*tensor_idx): {((dynamic_indices*tensor_idx).max())}, "
-                        f"min(dynamic_indices*tensor_idx): {((dynamic_indices*tensor_idx).min())}"
-                    )
-                    print(f"max(tensor_idx.sum(-1)): {tensor_idx.sum(-1).max()}")
-                    print(f"scores.shape: {scores.shape}")
-                    raise
-
-                event_mask = event_mask & events_with_label
-
-                is_obs_dist = torch.distributions.Bernoulli(logits=is_obs_score)
+                is_obs_dist = torch.distributions.Bernoulli(logits=is_obs_score[:, :, segment])
                 dists = torch.distributions.Categorical(logits=scores)
-
+                labels = single_labels[:, :, segment]
             elif classification_mode == DataModality.MULTI_LABEL_CLASSIFICATION:
-                data_labels_or_zero = torch.where(
-                    tensor_idx,
-                    dynamic_indices - vocab_start + 1,
-                    torch.zeros_like(dynamic_indices),
-                ).long()
-
-                labels = torch.zeros(
-                    scores.shape[0], scores.shape[1], 1 + scores.shape[2], device=scores.device
-                ).scatter(
-                    dim=2,
-                    index=data_labels_or_zero,
-                    value=1,
-                )
-
-                labels = labels[:, :, 1:]  # Drop the omitted labels...
-
-                loss_per_label = self.classification_criteria[measurement](scores, labels)
-                loss_per_event = loss_per_label.mean(dim=-1)
-
-                # Multi-label doesn't use a separate is-observed path, as it handles that natively.
-                is_obs_loss = None
                 is_obs_dist = None
-
                 dists = torch.distributions.Bernoulli(logits=scores)
-
+                labels = multi_labels[:, :, vocab_start:vocab_end]
             else:
                 raise ValueError(f"Classification mode {classification_mode} Invalid!")
 
-            if is_obs_loss is not None:
-                loss_per_event = loss_per_event + is_obs_loss
-            loss_overall = weighted_loss(loss_per_event, event_mask)
-
-            classification_losses_by_measurement[measurement] = loss_overall
+            classification_losses_by_measurement[measurement] = losses[segment]
             classification_dists_by_measurement[measurement] = (is_obs_dist, dists)
             classification_labels_by_measurement[measurement] = labels
         return (
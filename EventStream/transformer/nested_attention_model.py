@@ -78,10 +78,11 @@ class NestedAttentionGenerativeOutputLayer(GenerativeOutputLayerBase):
                 f"If dep_graph_el_generation_target ({dep_graph_el_generation_target}) is not None, "
                 f"is_generation ({is_generation}) must be True!"
             )
-        torch._assert(
-            ~torch.isnan(encoded).any(),
-            f"{torch.isnan(encoded).sum()} NaNs in encoded (target={dep_graph_el_generation_target})",
-        )
+        if not torch.compiler.is_compiling():
+            torch._assert(
+                ~torch.isnan(encoded).any(),
+                f"{torch.isnan(encoded).sum()} NaNs in encoded (target={dep_graph_el_generation_target})",
+            )
 
         # These are the containers we'll use to process the outputs
         classification_dists_by_measurement = {}
@@ -155,13 +156,14 @@ class NestedAttentionGenerativeOutputLayer(GenerativeOutputLayerBase):
                     regression_measurements
                 )
 
-                torch._assert(
-                    ~torch.isnan(dep_graph_level_encoded).any(),
-                    (
-                        f"{torch.isnan(dep_graph_level_encoded).sum()} NaNs in dep_graph_level_encoded "
-                        f"({target_idx}, {i})"
-                    ),
-                )
+                if not torch.compiler.is_compiling():
+                    torch._assert(
+                        ~torch.isnan(dep_graph_level_encoded).any(),
+                        (
+                            f"{torch.isnan(dep_graph_level_encoded).sum()} NaNs in dep_graph_level_encoded "
+                            f"({target_idx}, {i})"
+                        ),
+                    )
                 classification_out = self.get_classification_outputs(
                     batch,
                     dep_graph_level_encoded,
@@ -263,7 +265,11 @@ class NAPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
         self.post_init()
 
     def prepare_inputs_for_generation(
-        self, batch: PytorchBatch, past: dict[str, tuple] | None = None, **kwargs
+        self,
+        batch: PytorchBatch,
+        past: dict[str, tuple] | None = None,
+        max_length: int | None = None,
+        **kwargs,
     ) -> dict[str, Any]:
         """Returns model keyword arguments that have been modified for generation purposes.
 
@@ -272,11 +278,16 @@ class NAPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
             past: The past state of the model, if any. If specified, it must be a dictionary containing both
                 the seq_past key (the past of the sequential attention module) and a dep_graph_past key (the
                 past of the dependency graph attention module). These inner past encodings are tuples
-                containing the past values over prior layers and heads.
+                containing the past values over prior layers and heads. It may also contain a
+                dep_graph_embed_past key, holding the cumulative input embedding of the dependency graph
+                levels of the last event seen so far; if so, and a dependency graph element beyond the first
+                is targeted, only the newest dependency graph level is embedded by the model.
+            max_length: The maximum sequence length that will be generated. Currently unused by this model.
             **kwargs: Additional keyword arguments. If "use_cache" is set in the kwargs to False, then the
                 past state is ignored. If not, then the past state is passed through the model to accelerate
                 generation, if past is not None then the batch is trimmed to the last element in the sequence,
-                and the sequential attention mask is pre-computed.
+                and the sequential attention mask is pre-computed (unless the dependency graph input embedding
+                is also cached, in which case the sequential attention module is not used).
 
         Raises:
             ValueError: If the past state is malformed or if there is a dep_graph_el_generation_target in the
@@ -288,7 +299,7 @@ class NAPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
             return {**kwargs, "batch": batch}
 
         dep_graph_el_generation_target = kwargs.get("dep_graph_el_generation_target", None)
-        seq_attention_mask = expand_mask(batch.event_mask, batch.time_delta.dtype)
+        dep_graph_embed_past = None
 
         match past:
             case None:
@@ -300,10 +311,6 @@ class NAPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
             case dict() as pasts_dict if "seq_past" in pasts_dict and "dep_graph_past" in pasts_dict:
                 past = pasts_dict["seq_past"]
 
-                # only last sequence element in the batch if past is defined in kwargs
-                batch.time = time_from_deltas(batch)
-                batch = batch.last_sequence_element_unsqueezed()
-
                 dep_graph_past = pasts_dict["dep_graph_past"]
                 if dep_graph_past is not None and dep_graph_el_generation_target is None:
                     raise ValueError(
@@ -312,14 +319,31 @@ class NAPPTForGenerativeSequenceModeling(StructuredGenerationMixin, StructuredTr
                 elif dep_graph_past is None and dep_graph_el_generation_target is not None:
                     raise ValueError("Trying to target only one dep graph element without past!")
 
+                if dep_graph_el_generation_target is not None and dep_graph_el_generation_target > 1:
+                    dep_graph_embed_past = pasts_dict.get("dep_graph_embed_past", None)
+
             case _:
                 raise ValueError(f"{past} malformed!")
 
+        if dep_graph_embed_past is None:
+            seq_attention_mask = expand_mask(batch.event_mask, batch.time_delta.dtype)
+            if past is not None:
+                # only last sequence element in the batch if past is defined in kwargs
+                batch.time = time_from_deltas(batch)
+                batch = batch.last_sequence_element_unsqueezed()
+        else:
+            # Only the newest dependency graph level of the last event is embedded and attended to here, so
+            # neither the sequence attention mask nor the time of the event (which is only embedded in the
+            # first dependency graph level) need to be computed over the full history.
+            seq_attention_mask = None
+            batch = batch.last_sequence_element_unsqueezed()
+
         return {
             **kwargs,
             "batch": batch,
             "past": past,
             "dep_graph_past": dep_graph_past,
+            "dep_graph_embed_past": dep_graph_embed_past,
             "seq_attention_mask": seq_attention_mask,
         }
 
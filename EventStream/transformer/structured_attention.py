@@ -78,20 +78,15 @@ class StructuredAttention(torch.nn.Module):
             # dimension is the dependency graph length.
             for_per_event_pooling = torch.reshape(hidden_states, (bsz * seq_len, dep_graph_len, hidden_size))
 
-            # However, we don't want to process any padding elements, so we need to filter those out.
+            # However, we don't want to use any padding elements, so we need to zero those out.
             # To do this, we'll use the event_mask. It has shape (bsz, seq_len). We'll expand it then re-shape
             # it in a similar manner as the for_per_event_pooling tensor.
-            if event_mask is None:
-                per_event_all = for_per_event_pooling[:, -1, :]
-            else:
+            per_event_all = for_per_event_pooling[:, -1, :]
+            if event_mask is not None:
                 flat_event_mask = torch.reshape(event_mask, (bsz * seq_len,)).bool()
-                for_per_event_pooling_present = for_per_event_pooling[flat_event_mask, :, :]
-                per_event = for_per_event_pooling_present[:, -1, :]
-
-                per_event_all = torch.zeros(
-                    bsz * seq_len, hidden_size, dtype=per_event.dtype, device=per_event.device
+                per_event_all = torch.where(
+                    flat_event_mask.unsqueeze(-1), per_event_all, torch.zeros_like(per_event_all)
                 )
-                per_event_all[flat_event_mask, :] = per_event
 
             per_event_all = torch.reshape(per_event_all, (bsz, seq_len, hidden_size))
 
@@ -161,7 +156,10 @@ class StructuredAttention(torch.nn.Module):
         # we also need to drop the padding elements of the sequence once more.
         dep_graph_seq = torch.reshape(dep_graph_seq, (bsz * seq_len, -1, hidden_size))
 
-        if event_mask is not None:
+        # Dropping the padding elements gives a tensor whose shape depends on the values of the event mask,
+        # which can't be compiled, so under `torch.compile` they are instead processed and zeroed out after.
+        do_drop_padding = event_mask is not None and not torch.compiler.is_compiling()
+        if do_drop_padding:
             dep_graph_seq = dep_graph_seq[flat_event_mask, :, :]
 
         dep_graph_out = self.dep_graph_module(
@@ -182,6 +180,10 @@ class StructuredAttention(torch.nn.Module):
         # Now we need to re-shape it back to the original, respecting the dropped sequence elements.
         if event_mask is None:
             dep_graph_all = dep_graph_out
+        elif not do_drop_padding:
+            dep_graph_all = torch.where(
+                flat_event_mask[:, None, None], dep_graph_out, torch.zeros_like(dep_graph_out)
+            )
         else:
             dep_graph_all = torch.zeros(
                 bsz * seq_len,
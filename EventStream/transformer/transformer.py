@@ -16,9 +16,17 @@ from transformers.activations import ACT2FN
 from transformers.modeling_utils import PreTrainedModel
 from transformers.utils import logging
 
-from ..data.data_embedding_layer import DataEmbeddingLayer, MeasIndexGroupOptions
+from ..data.data_embedding_layer import (
+    DataEmbeddingLayer,
+    EmbeddingMode,
+    MeasIndexGroupOptions,
+)
 from ..data.types import PytorchBatch
-from .config import StructuredEventProcessingMode, StructuredTransformerConfig
+from .config import (
+    AttentionImplementation,
+    StructuredEventProcessingMode,
+    StructuredTransformerConfig,
+)
 from .model_output import TransformerOutputWithPast
 from .structured_attention import StructuredAttention
 
@@ -76,6 +84,298 @@ def expand_mask(mask: torch.BoolTensor, dtype: torch.dtype) -> torch.Tensor:
     return attention_mask
 
 
+class PackedEvents:
+    """Indexes the real (non-padding) events of a batch, so that they can be processed without padding.
+
+    Batches are padded to the length of their longest sequence, so per-event computations (embeddings, layer
+    norms, projections, and MLPs) over the padded batch spend much of their time on padding. This records the
+    positions of the real events so that these computations can instead be run over a packed tensor of shape
+    ``(n_events, ...)`` holding only the real events, concatenated across the batch in order, with the padded
+    layout only restored (via `unpack`) where the sequence structure is needed.
+
+    Args:
+        event_mask: The boolean event mask of the padded batch, of shape ``(batch_size, sequence_length)``.
+
+    Examples:
+        >>> packed = PackedEvents(torch.BoolTensor([[True, True, False], [False, True, True]]))
+        >>> packed.n_events
+        4
+        >>> T = torch.arange(6).view(2, 3)
+        >>> packed.pack(T)
+        tensor([0, 1, 4, 5])
+        >>> packed.unpack(10 * packed.pack(T))
+        tensor([[ 0, 10,  0],
+                [ 0, 40, 50]])
+        >>> packed.subject_indices
+        tensor([0, 0, 1, 1])
+    """
+
+    def __init__(self, event_mask: torch.BoolTensor):
+        self.event_mask = event_mask
+        self.batch_size, self.sequence_length = event_mask.shape
+        self.indices = event_mask.flatten().nonzero().squeeze(-1)
+
+    @property
+    def n_events(self) -> int:
+        return self.indices.shape[0]
+
+    @property
+    def subject_indices(self) -> torch.LongTensor:
+        """The index in the batch of the subject of each packed event."""
+        return torch.div(self.indices, self.sequence_length, rounding_mode="floor")
+
+    def pack(self, T: torch.Tensor) -> torch.Tensor:
+        """Packs ``T``, of shape ``(batch_size, sequence_length, ...)``, into shape ``(n_events, ...)``."""
+        return T.flatten(0, 1).index_select(0, self.indices)
+
+    def unpack(self, T: torch.Tensor) -> torch.Tensor:
+        """Unpacks ``T``, of shape ``(n_events, ...)``, into shape ``(batch_size, sequence_length, ...)``.
+
+        Padding events are filled with zeros.
+        """
+        out = T.new_zeros((self.batch_size * self.sequence_length, *T.shape[1:]))
+        out = out.index_copy(0, self.indices, T)
+        return out.view(self.batch_size, self.sequence_length, *T.shape[1:])
+
+    def pack_batch(self, batch: PytorchBatch) -> PytorchBatch:
+        """Returns a batch holding each real event of ``batch`` as a separate sequence of length 1.
+
+        Static data is repeated for each of a subject's events, and event times are computed from the full
+        sequences before packing, so this batch can be passed to per-event layers (such as the input embedding
+        layers) in place of ``batch``.
+
+        Args:
+            batch: The padded batch.
+
+        Returns:
+            A batch of size ``n_events`` with sequences of length 1.
+        """
+        time = time_from_deltas(batch) if batch.get("time", None) is None else batch["time"]
+
+        static_kwargs = {}
+        if batch.static_indices is not None:
+            subject_indices = self.subject_indices
+            static_kwargs = dict(
+                static_indices=batch.static_indices.index_select(0, subject_indices),
+                static_measurement_indices=batch.static_measurement_indices.index_select(0, subject_indices),
+            )
+
+        return PytorchBatch(
+            event_mask=torch.ones_like(self.pack(batch.event_mask)).unsqueeze(1),
+            time_delta=self.pack(batch.time_delta).unsqueeze(1),
+            time=self.pack(time).unsqueeze(1),
+            **static_kwargs,
+            dynamic_indices=self.pack(batch.dynamic_indices).unsqueeze(1),
+            dynamic_measurement_indices=self.pack(batch.dynamic_measurement_indices).unsqueeze(1),
+            dynamic_values=self.pack(batch.dynamic_values).unsqueeze(1),
+            dynamic_values_mask=self.pack(batch.dynamic_values_mask).unsqueeze(1),
+        )
+
+
+class PreallocatedKVCache:
+    """A key/value cache for a single attention layer that is preallocated and filled in place.
+
+    Concatenating the keys and values of each newly decoded element onto the cache copies the entire cache at
+    every generation step, which makes generation quadratic in the generated length. This cache instead
+    reserves space for ``capacity`` sequence elements up front and writes new keys and values into it,
+    returning views over the filled portion.
+
+    Args:
+        key: The key buffer, of shape ``(batch_size, num_heads, capacity, head_dim)``.
+        value: The value buffer, of the same shape as ``key``.
+        length: How many sequence elements of the buffers are already filled.
+
+    Examples:
+        >>> cache = PreallocatedKVCache.empty(2, 1, 4, 3, dtype=torch.float32, device="cpu")
+        >>> cache.capacity, cache.length
+        (4, 0)
+        >>> key, value = cache.append(torch.ones(2, 1, 2, 3), torch.ones(2, 1, 2, 3))
+        >>> key.shape
+        torch.Size([2, 1, 2, 3])
+        >>> key, value = cache.append(2 * torch.ones(2, 1, 1, 3), 3 * torch.ones(2, 1, 1, 3))
+        >>> key[0, 0, :, 0]
+        tensor([1., 1., 2.])
+        >>> past_key, past_value = cache
+        >>> past_value[0, 0, :, 0]
+        tensor([1., 1., 3.])
+        >>> cache.append(torch.ones(2, 1, 2, 3), torch.ones(2, 1, 2, 3))
+        Traceback (most recent call last):
+            ...
+        ValueError: Can't append 2 elements to a cache holding 3 of at most 4 elements!
+    """
+
+    def __init__(self, key: torch.Tensor, value: torch.Tensor, length: int = 0):
+        self.key = key
+        self.value = value
+        self.length = length
+
+    @classmethod
+    def empty(
+        cls,
+        batch_size: int,
+        num_heads: int,
+        capacity: int,
+        head_dim: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> "PreallocatedKVCache":
+        """Allocates an empty cache with room for ``capacity`` sequence elements."""
+        shape = (batch_size, num_heads, capacity, head_dim)
+        return cls(
+            key=torch.empty(shape, dtype=dtype, device=device),
+            value=torch.empty(shape, dtype=dtype, device=device),
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.key.shape[-2]
+
+    def append(self, key: torch.Tensor, value: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Writes ``key`` and ``value`` after the filled elements and returns the filled keys and values.
+
+        Args:
+            key: The new keys, of shape ``(batch_size, num_heads, n_new_elements, head_dim)``.
+            value: The new values, of the same shape as ``key``.
+
+        Returns:
+            Views of all filled keys and values, including the newly appended ones.
+
+        Raises:
+            ValueError: If the new elements would exceed the capacity of the cache.
+        """
+        st, end = self.length, self.length + key.shape[-2]
+        if end > self.capacity:
+            raise ValueError(
+                f"Can't append {key.shape[-2]} elements to a cache holding {self.length} of at most "
+                f"{self.capacity} elements!"
+            )
+
+        self.key[:, :, st:end] = key
+        self.value[:, :, st:end] = value
+        self.length = end
+        return tuple(self)
+
+    def index_select(self, index: torch.LongTensor) -> "PreallocatedKVCache":
+        """Returns a new cache holding only the batch elements at ``index``, with the same capacity."""
+        return PreallocatedKVCache(
+            key=self.key.index_select(0, index),
+            value=self.value.index_select(0, index),
+            length=self.length,
+        )
+
+    def __iter__(self):
+        yield self.key[:, :, : self.length]
+        yield self.value[:, :, : self.length]
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        return tuple(self)[idx]
+
+
+class SlidingWindowKVCache(PreallocatedKVCache):
+    """A key/value cache for a local attention layer that retains only the most recent keys and values.
+
+    A local attention layer with window size ``window_size`` never attends to keys more than ``window_size``
+    elements before the query, so older keys and values need not be kept during generation. Each call to
+    `append` returns the retained keys and values (at most the last ``window_size``) followed by the new ones;
+    the local causal mask, aligned to the end of the keys, selects each query's window from these. Retained
+    elements are shifted to the front of the buffer only when it is full, so each element is copied an
+    amortized constant number of times if the buffer holds at least ``2 * window_size`` elements.
+
+    Args:
+        key: The key buffer, of shape ``(batch_size, num_heads, capacity, head_dim)``.
+        value: The value buffer, of the same shape as ``key``.
+        window_size: How many of the most recent elements must be retained between calls to `append`.
+        length: How many sequence elements of the buffers are already filled.
+        start: The index of the first retained element in the buffers.
+
+    Examples:
+        >>> cache = SlidingWindowKVCache.empty(1, 1, 4, 1, dtype=torch.float32, device="cpu", window_size=2)
+        >>> key, value = cache.append(torch.arange(3.).view(1, 1, 3, 1), torch.zeros(1, 1, 3, 1))
+        >>> key[0, 0, :, 0]
+        tensor([0., 1., 2.])
+        >>> key, value = cache.append(torch.full((1, 1, 1, 1), 3.), torch.zeros(1, 1, 1, 1))
+        >>> key[0, 0, :, 0]
+        tensor([1., 2., 3.])
+        >>> key, value = cache.append(torch.full((1, 1, 1, 1), 4.), torch.zeros(1, 1, 1, 1))
+        >>> key[0, 0, :, 0]
+        tensor([2., 3., 4.])
+        >>> past_key, past_value = cache
+        >>> past_key[0, 0, :, 0]
+        tensor([2., 3., 4.])
+        >>> cache.capacity
+        4
+    """
+
+    def __init__(
+        self, key: torch.Tensor, value: torch.Tensor, window_size: int, length: int = 0, start: int = 0
+    ):
+        super().__init__(key=key, value=value, length=length)
+        self.window_size = window_size
+        self.start = start
+
+    @classmethod
+    def empty(
+        cls,
+        batch_size: int,
+        num_heads: int,
+        capacity: int,
+        head_dim: int,
+        dtype: torch.dtype,
+        device: torch.device,
+        window_size: int = 1,
+    ) -> "SlidingWindowKVCache":
+        """Allocates an empty cache with an initial buffer of ``capacity`` sequence elements."""
+        shape = (batch_size, num_heads, capacity, head_dim)
+        return cls(
+            key=torch.empty(shape, dtype=dtype, device=device),
+            value=torch.empty(shape, dtype=dtype, device=device),
+            window_size=window_size,
+        )
+
+    def append(self, key: torch.Tensor, value: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Writes ``key`` and ``value`` after the retained elements and returns both.
+
+        Args:
+            key: The new keys, of shape ``(batch_size, num_heads, n_new_elements, head_dim)``.
+            value: The new values, of the same shape as ``key``.
+
+        Returns:
+            Views of the retained keys and values (at most the last ``window_size`` before this call),
+            followed by the newly appended ones.
+        """
+        n_new = key.shape[-2]
+        n_keep = min(self.length - self.start, self.window_size)
+        self.start = self.length - n_keep
+
+        if self.length + n_new > self.capacity:
+            capacity = max(self.capacity, n_keep + n_new)
+            new_key = self.key.new_empty((*self.key.shape[:2], capacity, self.key.shape[-1]))
+            new_value = self.value.new_empty((*self.value.shape[:2], capacity, self.value.shape[-1]))
+            new_key[:, :, :n_keep] = self.key[:, :, self.start : self.length]
+            new_value[:, :, :n_keep] = self.value[:, :, self.start : self.length]
+            self.key, self.value = new_key, new_value
+            self.start, self.length = 0, n_keep
+
+        self.key[:, :, self.length : self.length + n_new] = key
+        self.value[:, :, self.length : self.length + n_new] = value
+        self.length += n_new
+        return tuple(self)
+
+    def index_select(self, index: torch.LongTensor) -> "SlidingWindowKVCache":
+        """Returns a new cache holding only the batch elements at ``index``, with the same capacity."""
+        return SlidingWindowKVCache(
+            key=self.key.index_select(0, index),
+            value=self.value.index_select(0, index),
+            window_size=self.window_size,
+            length=self.length,
+            start=self.start,
+        )
+
+    def __iter__(self):
+        yield self.key[:, :, self.start : self.length]
+        yield self.value[:, :, self.start : self.length]
+
+
 class InnerSelfAttention(nn.Module):
     """This class implements the inner self-attention mechanism.
 
@@ -96,6 +396,13 @@ class InnerSelfAttention(nn.Module):
             does not match `embed_dim`.
     """
 
+    # The fused attention kernel has a fixed overhead that outweighs its benefits over very short sequences,
+    # such as those in dependency graph attention, so these use the eager implementation regardless.
+    SDPA_MIN_KEY_LENGTH = 8
+    # Local attention over a full sequence is computed in blocks (see `_banded_local_attn`) once the sequence
+    # spans this many windows; below that, the dense computation does comparably little wasted work.
+    BANDED_MIN_WINDOWS = 4
+
     def __init__(
         self,
         config: StructuredTransformerConfig,
@@ -105,7 +412,9 @@ class InnerSelfAttention(nn.Module):
         super().__init__()
 
         max_seq_len = config.max_seq_len
+        self.attention_type = attention_type
         self.window_size = window_size
+        self.attention_implementation = config.attention_implementation
         bias = torch.tril(torch.ones((max_seq_len, max_seq_len), dtype=torch.uint8)).view(
             1, 1, max_seq_len, max_seq_len
         )
@@ -216,6 +525,117 @@ class InnerSelfAttention(nn.Module):
 
         return attn_output, attn_weights
 
+    def _sdpa_attn(self, query, key, value, attention_mask=None):
+        """Performs the attention operation via `torch.nn.functional.scaled_dot_product_attention`.
+
+        This computes the same function as `_attn` (including its lack of scaling of the attention scores),
+        but never materializes the per-head attention weights. When no padding mask is needed, global
+        attention uses the kernel's built-in causal masking; otherwise, the causal and padding masks are
+        combined into a single additive mask, which is broadcast over heads rather than built per head.
+
+        Args:
+            query: The query tensor.
+            key: The key tensor.
+            value: The value tensor.
+            attention_mask: A mask to be applied on the attention weights.
+
+        Returns:
+            The output of the attention operation.
+        """
+
+        query_length, key_length = query.size(-2), key.size(-2)
+
+        is_causal = False
+        attn_mask = None
+        if attention_mask is None and self.attention_type == "global" and query_length == key_length:
+            is_causal = True
+        elif attention_mask is not None or self.attention_type != "global" or query_length > 1:
+            causal_mask = self.bias[:, :, key_length - query_length : key_length, :key_length].to(torch.bool)
+            attn_mask = torch.zeros(causal_mask.shape, dtype=query.dtype, device=query.device)
+            attn_mask = attn_mask.masked_fill(~causal_mask, torch.finfo(query.dtype).min)
+            if attention_mask is not None:
+                # This is added, exactly as in `_attn`, so that rows whose causal window is entirely padding
+                # are handled identically.
+                attn_mask = attn_mask + attention_mask.to(query.dtype)
+
+        return nn.functional.scaled_dot_product_attention(
+            query,
+            key,
+            value,
+            attn_mask=attn_mask,
+            dropout_p=self.attn_dropout.p if self.training else 0.0,
+            is_causal=is_causal,
+            scale=1.0,
+        )
+
+    def _banded_local_attn(self, query, key, value, attention_mask=None):
+        """Performs local attention over a full sequence in blocks, without forming the full attention matrix.
+
+        The sequence is split into blocks of ``window_size`` elements, and the queries in each block attend
+        only to the keys in that block and the block before it, which contain every key in their windows.
+        This takes time and memory proportional to ``seq_len * window_size``, rather than ``seq_len ** 2`` as
+        in `_attn`. At every non-padding query, this computes exactly what `_attn` would; outputs at padding
+        queries, which are masked out of all subsequent attention and so carry no information, may differ. The
+        per-block attention matrices are small enough that this is faster than the fused kernel as well, so it
+        is used regardless of the attention implementation.
+
+        Args:
+            query: The query tensor, of shape ``(batch, head, seq_len, head_dim)``.
+            key: The key tensor, of the same shape as ``query``.
+            value: The value tensor, of the same shape as ``query``.
+            attention_mask: An additive padding mask of shape ``(batch, 1, 1, seq_len)``, if any.
+
+        Returns:
+            The output of the attention operation.
+        """
+
+        batch_size, num_heads, seq_len, head_dim = query.shape
+        block_size = self.window_size
+        n_blocks = -(-seq_len // block_size)
+        pad_len = n_blocks * block_size - seq_len
+
+        def to_blocks(T: torch.Tensor) -> torch.Tensor:
+            T = nn.functional.pad(T, (0, 0, 0, pad_len))
+            return T.view(T.shape[0], T.shape[1], n_blocks, block_size, T.shape[-1])
+
+        def with_prior_block(T: torch.Tensor, fill_value: float = 0.0) -> torch.Tensor:
+            prior = nn.functional.pad(T[:, :, :-1], (0, 0, 0, 0, 1, 0), value=fill_value)
+            return torch.cat((prior, T), dim=-2)
+
+        query = to_blocks(query)
+        key = with_prior_block(to_blocks(key))
+        value = with_prior_block(to_blocks(value))
+        # query is now of shape (batch, head, n_blocks, block_size, head_dim) and key and value of shape
+        # (batch, head, n_blocks, 2 * block_size, head_dim).
+
+        # The query at position i of a block may attend to positions i + 1 through i + block_size of its
+        # block's keys, which are the block_size sequence elements ending at the query itself. The prior block
+        # of the first block does not exist, which is reflected in the padding mask below.
+        q_idx = torch.arange(block_size, device=query.device).unsqueeze(-1)
+        k_idx = torch.arange(2 * block_size, device=query.device).unsqueeze(0)
+        band_mask = (k_idx > q_idx) & (k_idx <= q_idx + block_size)
+
+        mask_value = torch.finfo(torch.float32).min
+        if attention_mask is None:
+            attention_mask = torch.zeros((1, 1, 1, seq_len), dtype=torch.float32, device=query.device)
+        else:
+            attention_mask = attention_mask.to(torch.float32)
+
+        # Keys in the (non-existent) prior block of the first block are masked out like padding elements.
+        attention_mask = with_prior_block(to_blocks(attention_mask.transpose(-1, -2)), mask_value)
+        attention_mask = attention_mask.transpose(-1, -2)
+        # attention_mask is now of shape (batch, 1, n_blocks, 1, 2 * block_size)
+
+        # As in `_attn`, keep the attention weights computation in fp32 to avoid overflow issues.
+        attn_weights = torch.matmul(query.to(torch.float32), key.to(torch.float32).transpose(-1, -2))
+        attn_weights = torch.where(band_mask, attn_weights, mask_value) + attention_mask
+        attn_weights = nn.functional.softmax(attn_weights, dim=-1)
+        attn_weights = self.attn_dropout(attn_weights.to(value.dtype))
+        attn_output = torch.matmul(attn_weights, value)
+
+        attn_output = attn_output.view(batch_size, num_heads, n_blocks * block_size, head_dim)
+        return attn_output[:, :, :seq_len]
+
     def forward(
         self,
         hidden_states,
@@ -225,28 +645,40 @@ class InnerSelfAttention(nn.Module):
         use_cache=False,
         output_attentions=False,
         static_kv_first: bool = False,
+        packed_events: PackedEvents | None = None,
     ):
         """Applies the attention mechanism to the input hidden states.
 
         Args:
             hidden_states: The input hidden states.
             attention_mask: A mask to be applied on the attention weights.
-            layer_past: The past layer states.
+            layer_past: The past layer states, either as a tuple of past keys and values or as a
+                `PreallocatedKVCache`, which will be updated in place with the new keys and values. A
+                `SlidingWindowKVCache` retains only the most recent keys and values, in which case the
+                attention mask is truncated to the keys that remain.
             head_mask: A mask to be applied on the attention heads.
             use_cache: A flag indicating whether to cache the layer's past states.
             output_attentions: A flag indicating whether to output the attention weights.
             static_kv_first: In the case of attention over the dependency graph, the history embedding is
                 dropped after processing, so we want to only use it as a KV, not as a query.
+            packed_events: If not `None`, ``hidden_states`` (and the output) hold only the real events of the
+                batch, packed as described by this object. The projected queries, keys, and values are
+                unpacked into their sequences for the attention computation itself, so each event attends
+                only within its own sequence.
 
         Returns:
             A tuple containing the output of the attention mechanism and a dictionary of optional outputs.
         """
 
-        # TODO(mmd): Flash attention
         query = self.q_proj(hidden_states)
         key = self.k_proj(hidden_states)
         value = self.v_proj(hidden_states)
 
+        if packed_events is not None:
+            query = packed_events.unpack(query)
+            key = packed_events.unpack(key)
+            value = packed_events.unpack(value)
+
         query = self._split_heads(query, self.num_heads, self.head_dim)
         key = self._split_heads(key, self.num_heads, self.head_dim)
         value = self._split_heads(value, self.num_heads, self.head_dim)
@@ -258,20 +690,47 @@ class InnerSelfAttention(nn.Module):
             # queries.
             query = query[:, :, 1:, :]
 
-        if layer_past is not None:
+        if isinstance(layer_past, PreallocatedKVCache):
+            key, value = layer_past.append(key, value)
+        elif layer_past is not None:
             past_key = layer_past[0]
             past_value = layer_past[1]
             key = torch.cat((past_key, key), dim=-2)
             value = torch.cat((past_value, value), dim=-2)
 
         if use_cache is True:
-            present = (key, value)
+            present = layer_past if isinstance(layer_past, PreallocatedKVCache) else (key, value)
         else:
             present = None
 
-        attn_output, attn_weights = self._attn(query, key, value, attention_mask, head_mask)
+        query_length, key_length = query.size(-2), key.size(-2)
+        if attention_mask is not None and attention_mask.size(-1) > key_length:
+            attention_mask = attention_mask[..., -key_length:]
+
+        use_banded = (
+            self.attention_type == "local"
+            and query_length == key_length
+            and key_length >= self.BANDED_MIN_WINDOWS * self.window_size
+            and not output_attentions
+            and head_mask is None
+            and (attention_mask is None or attention_mask.size(-2) == 1)
+        )
+        use_sdpa = (
+            self.attention_implementation == AttentionImplementation.SDPA
+            and not output_attentions
+            and head_mask is None
+            and key_length >= self.SDPA_MIN_KEY_LENGTH
+        )
+        if use_banded:
+            attn_output = self._banded_local_attn(query, key, value, attention_mask)
+        elif use_sdpa:
+            attn_output = self._sdpa_attn(query, key, value, attention_mask)
+        else:
+            attn_output, attn_weights = self._attn(query, key, value, attention_mask, head_mask)
 
         attn_output = self._merge_heads(attn_output, self.num_heads, self.head_dim)
+        if packed_events is not None:
+            attn_output = packed_events.pack(attn_output)
         attn_output = self.out_proj(attn_output)
         attn_output = self.resid_dropout(attn_output)
 
@@ -331,6 +790,7 @@ class InnerAttention(nn.Module):
         use_cache=False,
         output_attentions=False,
         static_kv_first: bool = False,
+        packed_events: PackedEvents | None = None,
     ):
         """Forward pass.
 
@@ -345,6 +805,8 @@ class InnerAttention(nn.Module):
             output_attentions: A flag indicating whether to output the attention weights.
             static_kv_first: In the case of attention over the dependency graph, the history embedding is
                 dropped after processing, so we want to only use it as a KV, not as a query.
+            packed_events: If not `None`, ``hidden_states`` hold only the real events of the batch, packed as
+                described by this object.
         """
 
         return self.attention(
@@ -355,6 +817,7 @@ class InnerAttention(nn.Module):
             use_cache=use_cache,
             output_attentions=output_attentions,
             static_kv_first=static_kv_first,
+            packed_events=packed_events,
         )
 
 
@@ -415,6 +878,7 @@ class InnerBlock(nn.Module):
         use_cache=False,
         output_attentions=False,
         static_kv_first: bool = False,
+        packed_events: PackedEvents | None = None,
     ) -> tuple[torch.Tensor, dict[str, torch.Tensor]]:
         """Conducts the forward pass for the inner block.
 
@@ -426,6 +890,8 @@ class InnerBlock(nn.Module):
             use_cache: Whether to use caching.
             output_attentions: Whether to return attention probabilities in the output.
             static_kv_first: Whether the static key-value pair comes first.
+            packed_events: If not `None`, ``hidden_states`` hold only the real events of the batch, packed as
+                described by this object.
 
         Returns:
             tuple: Modified hidden states and a dictionary containing present key-value pair and
@@ -444,6 +910,7 @@ class InnerBlock(nn.Module):
             use_cache=use_cache,
             output_attentions=output_attentions,
             static_kv_first=static_kv_first,
+            packed_events=packed_events,
         )
         attn_output, outputs = attn_outputs  # output_attn: a, {present, (attentions)}
 
@@ -725,13 +1192,19 @@ class ConditionallyIndependentPointProcessInputLayer(torch.nn.Module):
             self.time_embedding_layer = TemporalPositionEncoding(embedding_dim=config.hidden_size)
         self.embedding_dropout = torch.nn.Dropout(p=config.input_dropout)
 
-    def forward(self, batch: PytorchBatch) -> torch.Tensor:
+    def forward(self, batch: PytorchBatch, packed_events: PackedEvents | None = None) -> torch.Tensor:
         """Returns input event embeddings for the provided batch.
 
         Args:
             batch: A PytorchBatch instance containing input data.
+            packed_events: If not `None`, only the real events of the batch are embedded, and the embeddings
+                are returned packed as described by this object, in a tensor of shape ``(n_events,
+                hidden_size)``.
         """
 
+        if packed_events is not None:
+            return self(packed_events.pack_batch(batch)).squeeze(1)
+
         data_embed = self.data_embedding_layer(batch)
         time_embed = self.time_embedding_layer(batch)
         embed = data_embed + time_embed
@@ -777,6 +1250,37 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
         # Initialize weights and apply final processing
         self.post_init()
 
+    def preallocate_kv_cache(self, batch_size: int, capacity: int) -> tuple[PreallocatedKVCache]:
+        """Returns empty per-layer key/value caches with room for ``capacity`` sequence elements.
+
+        These can be passed as ``past`` to decode incrementally without re-allocating the cache each step.
+        Local attention layers whose window is much shorter than ``capacity`` get a `SlidingWindowKVCache`,
+        which retains only the keys and values still within the window.
+
+        Args:
+            batch_size: The batch size of the inputs that will be decoded.
+            capacity: The maximum number of sequence elements (including the prompt) that will be decoded.
+        """
+        caches = []
+        for block in self.h:
+            cache_kwargs = dict(
+                batch_size=batch_size,
+                num_heads=self.config.num_attention_heads,
+                head_dim=self.config.head_dim,
+                dtype=self.dtype,
+                device=self.device,
+            )
+            window_size = block.attn.window_size
+            if block.attn.attention_type == "local" and capacity > 2 * window_size:
+                caches.append(
+                    SlidingWindowKVCache.empty(
+                        capacity=2 * window_size, window_size=window_size, **cache_kwargs
+                    )
+                )
+            else:
+                caches.append(PreallocatedKVCache.empty(capacity=capacity, **cache_kwargs))
+        return tuple(caches)
+
     def forward(
         self,
         batch: PytorchBatch | None = None,
@@ -818,16 +1322,30 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
         if past is None:
             past = tuple([None] * len(self.h))
 
+        # The number of real events varies from batch to batch, so packing is skipped under `torch.compile`,
+        # where batches are instead padded to a fixed set of shapes.
+        packed_events = None
+        if (
+            self.config.do_pack_sequences
+            and not torch.compiler.is_compiling()
+            and input_embeds is None
+            and batch is not None
+            and batch.event_mask is not None
+            and all(layer_past is None for layer_past in past)
+        ):
+            packed_events = PackedEvents(batch.event_mask)
+
         if input_embeds is None:
             assert batch is not None
 
-            input_embeds = self.input_layer(batch)
+            input_embeds = self.input_layer(batch, packed_events=packed_events)
         else:
             assert batch is None, "Can't specify both input_embeds and batch."
 
-        torch._assert(
-            ~torch.isnan(input_embeds).any(), f"{torch.isnan(input_embeds).sum()} NaNs in input_embeds"
-        )
+        if not torch.compiler.is_compiling():
+            torch._assert(
+                ~torch.isnan(input_embeds).any(), f"{torch.isnan(input_embeds).sum()} NaNs in input_embeds"
+            )
 
         if seq_attention_mask is None and batch is not None and batch.get("event_mask", None) is not None:
             seq_attention_mask = expand_mask(batch["event_mask"], input_embeds.dtype)
@@ -846,7 +1364,9 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
         all_hidden_states = () if output_hidden_states else None
         for i, (block, layer_past) in enumerate(zip(self.h, past)):
             if output_hidden_states:
-                all_hidden_states = all_hidden_states + (hidden_states,)
+                all_hidden_states = all_hidden_states + (
+                    hidden_states if packed_events is None else packed_events.unpack(hidden_states),
+                )
 
             if self.gradient_checkpointing and self.training:
                 if use_cache:
@@ -871,6 +1391,8 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
                     head_mask[i],
                     use_cache,
                     output_attentions,
+                    False,
+                    packed_events,
                 )
 
                 outputs = torch.utils.checkpoint.checkpoint(create_custom_forward(block), *args)
@@ -882,12 +1404,13 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
                     head_mask=head_mask[i],
                     use_cache=use_cache,
                     output_attentions=output_attentions,
+                    packed_events=packed_events,
                 )
                 outputs = block(**kwargs)
 
             hidden_states, extra_return_info = outputs
 
-            if batch is not None and batch.event_mask is not None:
+            if packed_events is None and batch is not None and batch.event_mask is not None:
                 hidden_states = torch.where(
                     batch.event_mask.unsqueeze(-1).expand_as(hidden_states),
                     hidden_states,
@@ -900,9 +1423,13 @@ class ConditionallyIndependentPointProcessTransformer(StructuredTransformerPreTr
             if output_attentions:
                 all_self_attentions = all_self_attentions + (extra_return_info["attn_weights"],)
 
-        hidden_states = self.ln_f(hidden_states)
+        if packed_events is None:
+            hidden_states = self.ln_f(hidden_states)
+            hidden_states = hidden_states.view(input_embeds.size())
+        else:
+            # Padding events are zero going into the final layer norm, just as in the unpacked computation.
+            hidden_states = self.ln_f(packed_events.unpack(hidden_states))
 
-        hidden_states = hidden_states.view(input_embeds.size())
         # Add last hidden state
         if output_hidden_states:
             all_hidden_states = all_hidden_states + (hidden_states,)
@@ -984,15 +1511,7 @@ class NestedAttentionPointProcessInputLayer(torch.nn.Module):
             batch: A PytorchBatch instance containing input data.
         """
 
-        embed = self.data_embedding_layer(batch)
-        # `data_embed` is of shape (batch_size, sequence_length, dep_graph_len, config.hidden_size).
-
-        time_embed = self.time_embedding_layer(batch)
-        # `time_embed` is of shape (batch_size, sequence_length, config.hidden_size).
-
-        # In this model, the first entry of the dependency graph *always* contains all the and only the time
-        # dependent measures, so we combine the time_embedding in at this position as well.
-        embed[:, :, 0] += time_embed
+        embed = self._embed_dep_graph_levels(batch)
 
         # We perform a cumsum so that even in the first layer, our final embedding of the dep graph reflects
         # the entire event.
@@ -1003,6 +1522,95 @@ class NestedAttentionPointProcessInputLayer(torch.nn.Module):
             # single, new dependency graph element at a time.
             embed = embed[:, :, dep_graph_el_generation_target - 1].unsqueeze(2)
 
+        return self._mask_and_dropout(batch, embed)
+
+    @property
+    def embeds_dep_graph_levels_independently(self) -> bool:
+        """Whether the embedding of each dependency graph level depends only on that level's data elements.
+
+        This is not the case if measurement index normalization is used (as that normalizes over all data
+        elements in the event) or under joint embedding (as there the categorical embedding of each level
+        reflects all data elements in the event). In either case, the embedding of prior dependency graph
+        levels changes as new levels are filled in, so it can't be re-used during generation.
+        """
+        return (
+            self.data_embedding_layer.embedding_mode == EmbeddingMode.SPLIT_CATEGORICAL_NUMERICAL
+            and not self.config.do_normalize_by_measurement_index
+        )
+
+    def forward_dep_graph_el(
+        self,
+        batch: PytorchBatch,
+        dep_graph_el_generation_target: int,
+        dep_graph_embed_past: torch.Tensor | None = None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Returns the input embedding for a single, new dependency graph element, re-using prior levels.
+
+        In generation, dependency graph element ``dep_graph_el_generation_target`` is predicted from the
+        cumulative embedding of dependency graph levels ``0, ..., dep_graph_el_generation_target - 1`` of the
+        last event. As these levels are sampled one at a time, rather than re-embedding all of them for every
+        new level, the cumulative embedding of the levels seen so far is carried between calls in
+        ``dep_graph_embed_past`` and only the newest level is embedded and added to it. The returned embedding
+        is identical to that of `forward` for the same generation target. This is only possible if
+        `embeds_dep_graph_levels_independently`; otherwise, all levels of the event are embedded and no
+        cumulative embedding is returned.
+
+        Args:
+            batch: A PytorchBatch instance containing input data. During generation, this holds only the last
+                event.
+            dep_graph_el_generation_target: The (positive) index of the dependency graph element being
+                generated.
+            dep_graph_embed_past: The cumulative embedding of levels ``0, ..., dep_graph_el_generation_target
+                - 2``, as returned by the call for the prior generation target. If `None` and the target is
+                greater than 1, all prior levels are embedded from scratch.
+
+        Returns:
+            The input embedding of shape ``(batch_size, sequence_length, 1, hidden_size)`` and the updated
+            cumulative embedding, to be passed as ``dep_graph_embed_past`` for the next generation target (or
+            `None`, if levels can't be embedded independently).
+
+        Raises:
+            ValueError: If ``dep_graph_el_generation_target`` is not positive, or if ``dep_graph_embed_past``
+                is specified for the first generation target.
+        """
+        if dep_graph_el_generation_target < 1:
+            raise ValueError(
+                f"dep_graph_el_generation_target must be positive; got {dep_graph_el_generation_target}"
+            )
+
+        if not self.embeds_dep_graph_levels_independently:
+            return self(batch, dep_graph_el_generation_target=dep_graph_el_generation_target), None
+
+        level = dep_graph_el_generation_target - 1
+        if level == 0:
+            if dep_graph_embed_past is not None:
+                raise ValueError("dep_graph_embed_past must be None for dep_graph_el_generation_target 1!")
+            embed = self._embed_dep_graph_levels(batch, measurement_bucket=0)
+        elif dep_graph_embed_past is None:
+            embed = self._embed_dep_graph_levels(batch).cumsum(dim=2)[:, :, level].unsqueeze(2)
+        else:
+            embed = dep_graph_embed_past + self._embed_dep_graph_levels(batch, measurement_bucket=level)
+
+        return self._mask_and_dropout(batch, embed), embed
+
+    def _embed_dep_graph_levels(
+        self, batch: PytorchBatch, measurement_bucket: int | None = None
+    ) -> torch.Tensor:
+        """Returns the (non-cumulative) embedding of each, or of just one, dependency graph level."""
+        embed = self.data_embedding_layer(batch, measurement_bucket=measurement_bucket)
+        # `data_embed` is of shape (batch_size, sequence_length, dep_graph_len, config.hidden_size).
+
+        if measurement_bucket is None or measurement_bucket == 0:
+            time_embed = self.time_embedding_layer(batch)
+            # `time_embed` is of shape (batch_size, sequence_length, config.hidden_size).
+
+            # In this model, the first entry of the dependency graph *always* contains all the and only the
+            # time dependent measures, so we combine the time_embedding in at this position as well.
+            embed[:, :, 0] += time_embed
+
+        return embed
+
+    def _mask_and_dropout(self, batch: PytorchBatch, embed: torch.Tensor) -> torch.Tensor:
         if batch.event_mask is not None:
             embed = torch.where(
                 batch.event_mask.unsqueeze(-1).unsqueeze(-1).expand_as(embed),
@@ -1062,6 +1670,7 @@ class NestedAttentionPointProcessTransformer(StructuredTransformerPreTrainedMode
         return_dict: bool | None = None,
         dep_graph_past: tuple[torch.FloatTensor] | None = None,
         dep_graph_el_generation_target: int | None = None,
+        dep_graph_embed_past: torch.FloatTensor | None = None,
     ) -> tuple[torch.Tensor] | TransformerOutputWithPast:
         """Performs a forward pass on the transformer model.
 
@@ -1075,6 +1684,14 @@ class NestedAttentionPointProcessTransformer(StructuredTransformerPreTrainedMode
             output_attentions: Specifies whether attention probabilities should be returned in the output.
             output_hidden_states: Specifies whether hidden states should be returned in the output.
             return_dict: Specifies whether the output should be an object with key names (True) or a tuple.
+            dep_graph_past: Past key/values of the dependency graph attention module, for the event currently
+                being generated.
+            dep_graph_el_generation_target: The index of the dependency graph element being generated, if any.
+            dep_graph_embed_past: The cumulative input embedding of the dependency graph levels of the event
+                currently being generated that have already been embedded, as returned in the
+                ``dep_graph_embed_past`` key of the output past when caching. If specified alongside a
+                positive ``dep_graph_el_generation_target``, only the newest dependency graph level is
+                embedded.
 
         Returns:
             A tuple containing hidden states, or a TransformerOutputWithPast object if return_dict is True.
@@ -1092,13 +1709,28 @@ class NestedAttentionPointProcessTransformer(StructuredTransformerPreTrainedMode
         if input_embeds is None:
             assert batch is not None
 
-            input_embeds = self.input_layer(
-                batch, dep_graph_el_generation_target=dep_graph_el_generation_target
-            )
+            if (
+                use_cache
+                and dep_graph_el_generation_target is not None
+                and dep_graph_el_generation_target > 0
+            ):
+                # When generating new dependency graph elements, only the newest dependency graph level needs
+                # to be embedded; the embeddings of the levels prior are carried in `dep_graph_embed_past`.
+                input_embeds, dep_graph_embed_past = self.input_layer.forward_dep_graph_el(
+                    batch,
+                    dep_graph_el_generation_target=dep_graph_el_generation_target,
+                    dep_graph_embed_past=dep_graph_embed_past,
+                )
+            else:
+                input_embeds = self.input_layer(
+                    batch, dep_graph_el_generation_target=dep_graph_el_generation_target
+                )
+                dep_graph_embed_past = None
             event_mask = batch["event_mask"]
         else:
             assert batch is None, "Can't specify both input_embeds and batch."
             event_mask = None
+            dep_graph_embed_past = None
 
         if seq_attention_mask is None and batch is not None and batch.get("event_mask", None) is not None:
             seq_attention_mask = expand_mask(batch["event_mask"], input_embeds.dtype)
@@ -1112,7 +1744,10 @@ class NestedAttentionPointProcessTransformer(StructuredTransformerPreTrainedMode
         hidden_states = input_embeds
         bsz, seq_len, dep_graph_len, hidden_size = hidden_states.shape
 
-        presents = {"seq_past": (), "dep_graph_past": ()} if use_cache else None
+        if use_cache:
+            presents = {"seq_past": (), "dep_graph_past": (), "dep_graph_embed_past": dep_graph_embed_past}
+        else:
+            presents = None
         if output_attentions:
             all_self_attentions = {"seq_attentions": (), "dep_graph_attentions": ()}
         else:
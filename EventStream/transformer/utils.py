@@ -180,10 +180,11 @@ def safe_weighted_avg(X: torch.Tensor, weights: torch.Tensor) -> tuple[torch.Ten
  or the same shape as X excluding the second to last dimension
     """
 
-    torch._assert(
-        (weights >= 0).all(),
-        f"weights should be >= 0. Got min {torch.min(weights)}",
-    )
+    if not torch.compiler.is_compiling():
+        torch._assert(
+            (weights >= 0).all(),
+            f"weights should be >= 0. Got min {torch.min(weights)}",
+        )
 
     shape_err_string = (
         f"weights {weights.shape} must be the same shape as X {X.shape} "
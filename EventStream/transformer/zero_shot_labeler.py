@@ -4,6 +4,7 @@ import torch
 
 from ..data.types import PytorchBatch
 from .config import StructuredTransformerConfig
+from .generation.generation_stopping_criteria import StoppingCriteria
 
 
 class Labeler(abc.ABC):
@@ -25,6 +26,11 @@ class Labeler(abc.ABC):
     You can then use built-in zero-shot evaluation utilities on that task and your labeler will automatically
     be used to evaluate zero-shot performance via unsupervised generation.
 
+    Optionally, subclasses can also override `stopping_criteria` to stop generating each sample as soon as its
+    label is determined (e.g., once a predicate event has been generated, or the prediction window has
+    passed). Samples which are stopped early are right-padded with unobserved events (where `event_mask` is
+    `False`), which `__call__` must therefore respect.
+
     Attributes:
         config: The `StructuredTransformerConfig` config object defining the model being used. This holds
             information about vocabulary elements, index maps (which is important to decipher batch data into
@@ -36,6 +42,19 @@ class Labeler(abc.ABC):
     def __init__(self, config: StructuredTransformerConfig):
         self.config = config
 
+    def stopping_criteria(self, input_seq_len: int) -> list[StoppingCriteria]:
+        """Returns the criteria under which generation for a sample can stop, as its label is determined.
+
+        By default, there are none, and all samples are generated for the full number of new events.
+
+        Args:
+            input_seq_len: The number of events (including padding) in the input to generation.
+
+        Returns:
+            A list of stopping criteria, typically instances of `PerSequenceStoppingCriteria`.
+        """
+        return []
+
     @abc.abstractmethod
     def __call__(self, batch: PytorchBatch, input_seq_len: int) -> tuple[torch.LongTensor, torch.BoolTensor]:
         """The core labeling method of the class. Must be overwritten by subclass.
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""Benchmarks the data → model → generation hot paths on synthetic data.
+
+This script generates synthetic raw data with ``sample_data/generate_synthetic_data.py``, then measures the
+wall time and peak resident set size of:
+
+  1. Each stage of building a `Dataset` via ``scripts/build_dataset.py`` (construction, splitting,
+     pre-processing, saving, and `Dataset.cache_deep_learning_representation`).
+  2. `PytorchDataset` construction, ``__getitem__`` throughput, and ``collate`` throughput.
+  3. Forward and backward passes of the conditionally independent (CIPPT) and nested attention (NAPPT) models,
+     configured as in ``sample_data/pretrain_CI.yaml`` and ``sample_data/pretrain_NA.yaml``. With
+     ``compile=true``, these are also measured over batches padded to shape buckets both eagerly and with
+     the model compiled by ``torch.compile``, as pre-training and fine-tuning do with ``compile=true``.
+  4. Generation with each model, in events per second.
+
+Results are written to a JSON file (by default ``benchmarks/results/${git_commit}.json``) so that they can be
+compared across commits, e.g., by passing ``compare_to=/path/to/baseline.json``. All benchmarks run on the
+CPU. For stable numbers, fix the number of threads with ``torch_num_threads``.
+"""
+
+import rootutils
+
+root = rootutils.setup_root(__file__, dotenv=True, pythonpath=True, cwd=True)
+
+import dataclasses
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import hydra
+import lightning as L
+import torch
+from hydra import compose, initialize_config_dir
+from hydra.core.global_hydra import GlobalHydra
+from hydra.initialize import get_gh_backup, restore_gh_from_backup
+from omegaconf import OmegaConf
+
+from benchmarks.utils import (
+    BenchmarkRecorder,
+    compare_results,
+    environment_metadata,
+    git_commit,
+    load_module_from_path,
+)
+from EventStream.data.config import PytorchDatasetConfig, SeqPaddingSide
+from EventStream.data.dataset_polars import Dataset
+from EventStream.data.pytorch_dataset import PytorchDataset
+from EventStream.transformer.conditionally_independent_model import (
+    CIPPTForGenerativeSequenceModeling,
+)
+from EventStream.transformer.config import StructuredTransformerConfig
+from EventStream.transformer.nested_attention_model import (
+    NAPPTForGenerativeSequenceModeling,
+)
+from EventStream.utils import hydra_dataclass
+
+MODEL_CLASSES = {
+    "CI": CIPPTForGenerativeSequenceModeling,
+    "NA": NAPPTForGenerativeSequenceModeling,
+}
+
+BENCHMARK_GROUPS = ("dataset", "pytorch_dataset", "model", "generation")
+
+
+@hydra_dataclass
+class BenchmarkConfig:
+    """Parameters for running the benchmark suite.
+
+    Args:
+        n_subjects: The number of subjects worth of synthetic data to generate.
+        seed: The random seed to use.
+        output_path: Where to write the results JSON file. Defaults to
+            ``benchmarks/results/${git_commit}.json``.
+        work_dir: Where to write the synthetic raw data and the built dataset. Defaults to a temporary
+            directory that is removed at the end of the run.
+        compare_to: If specified, the path to a prior results JSON file to compare these results against.
+        regression_tolerance: The fractional increase in wall time or peak RSS over the results in
+            `compare_to` beyond which a benchmark is reported as a regression.
+        benchmark_groups: Which groups of benchmarks to run. The "pytorch_dataset", "model", and "generation"
+            groups all require a built dataset, so the dataset is always built, but its stages are only
+            recorded if "dataset" is included.
+        model_types: Which models to benchmark; a subset of "CI" and "NA".
+        cached_data_storage: The `PytorchDatasetConfig.cached_data_storage` mode to use.
+        max_seq_len: The maximum sequence length of the `PytorchDataset`.
+        batch_size: The batch size for ``collate``, the models, and generation.
+        n_model_batches: How many batches to run the forward and backward passes over.
+        n_generation_batches: How many batches to run generation over.
+        max_new_events: How many events to generate per sequence.
+        attention_implementation: If specified, overrides the models' configured
+            `StructuredTransformerConfig.attention_implementation`.
+        do_pack_sequences: If specified, overrides the models' configured
+            `StructuredTransformerConfig.do_pack_sequences`.
+        compile: If True, the forward and backward passes are additionally measured over batches padded to
+            shape buckets (`PytorchDatasetConfig.do_pad_to_shape_buckets`), first eagerly and then with the
+            model compiled with static shapes. The one-off compilation time is recorded separately.
+        torch_num_threads: If specified, the number of threads torch should use.
+    """
+
+    n_subjects: int = 100
+    seed: int = 1
+    output_path: str | None = None
+    work_dir: str | None = None
+    compare_to: str | None = None
+    regression_tolerance: float = 0.1
+    benchmark_groups: list[str] = dataclasses.field(default_factory=lambda: list(BENCHMARK_GROUPS))
+    model_types: list[str] = dataclasses.field(default_factory=lambda: list(MODEL_CLASSES))
+    cached_data_storage: str = "rows"
+    max_seq_len: int = 128
+    batch_size: int = 32
+    n_model_batches: int = 5
+    n_generation_batches: int = 1
+    max_new_events: int = 10
+    attention_implementation: str | None = None
+    do_pack_sequences: bool | None = None
+    compile: bool = False
+    torch_num_threads: int | None = None
+
+
+def build_dataset(cfg: BenchmarkConfig, work_dir: Path, recorder: BenchmarkRecorder) -> Path:
+    """Generates synthetic raw data and builds a dataset from it, measuring each stage of the build."""
+    raw_data_dir = work_dir / "raw"
+    save_dir = work_dir / "processed"
+    raw_data_dir.mkdir(parents=True, exist_ok=True)
+
+    synthetic_data = load_module_from_path(root / "sample_data" / "generate_synthetic_data.py")
+    synthetic_data.main(
+        synthetic_data.GenerateConfig(n_subjects=cfg.n_subjects, seed=cfg.seed, out_dir=str(raw_data_dir))
+    )
+
+    # This runs within the benchmark script's own hydra app, so its global state must be set aside to compose
+    # the dataset config, then restored.
+    hydra_state = get_gh_backup()
+    GlobalHydra.instance().clear()
+    try:
+        with initialize_config_dir(version_base=None, config_dir=str(root / "sample_data")):
+            dataset_cfg = compose(
+                config_name="dataset",
+                overrides=[
+                    f"hydra.searchpath=[file://{root / 'configs'}]",
+                    f"raw_data_dir={raw_data_dir}",
+                    f"save_dir={save_dir}",
+                    f"seed={cfg.seed}",
+                ],
+            )
+    finally:
+        restore_gh_from_backup(hydra_state)
+
+    build_dataset_script = load_module_from_path(root / "scripts" / "build_dataset.py")
+
+    stages = {
+        "dataset/init": (Dataset, "__init__"),
+        "dataset/split": (Dataset, "split"),
+        "dataset/preprocess": (Dataset, "preprocess"),
+        "dataset/save": (Dataset, "save"),
+        "dataset/cache_deep_learning_representation": (Dataset, "cache_deep_learning_representation"),
+    }
+
+    if "dataset" in cfg.benchmark_groups:
+        with recorder.measure_calls(stages), recorder.measure("dataset/total"):
+            build_dataset_script.main(dataset_cfg)
+    else:
+        build_dataset_script.main(dataset_cfg)
+
+    return save_dir
+
+
+def benchmark_pytorch_dataset(
+    cfg: BenchmarkConfig, data_config: PytorchDatasetConfig, recorder: BenchmarkRecorder
+) -> PytorchDataset:
+    """Measures `PytorchDataset` construction and item retrieval and collation throughput."""
+    with recorder.measure("pytorch_dataset/init"):
+        pyd = PytorchDataset(data_config, split="train")
+
+    with recorder.measure("pytorch_dataset/getitem", n_items=len(pyd), unit="items"):
+        items = [pyd[i] for i in range(len(pyd))]
+
+    batches = [items[st : st + cfg.batch_size] for st in range(0, len(items), cfg.batch_size)]
+    with recorder.measure("pytorch_dataset/collate", n_items=len(batches), unit="batches"):
+        for batch in batches:
+            pyd.collate(batch)
+
+    return pyd
+
+
+def get_batches(pyd: PytorchDataset, batch_size: int, n_batches: int) -> list:
+    """Returns the first `n_batches` collated batches of `pyd` (in order)."""
+    batches = []
+    for st in range(0, min(len(pyd), batch_size * n_batches), batch_size):
+        batches.append(pyd.collate([pyd[i] for i in range(st, min(st + batch_size, len(pyd)))]))
+    return batches
+
+
+def build_model(cfg: BenchmarkConfig, model_type: str, pyd: PytorchDataset) -> torch.nn.Module:
+    """Builds a freshly initialized model configured as in ``sample_data/pretrain_{model_type}.yaml``."""
+    pretrain_cfg = OmegaConf.load(root / "sample_data" / f"pretrain_{model_type}.yaml")
+    config_kwargs = OmegaConf.to_container(pretrain_cfg.config)
+    if cfg.attention_implementation is not None:
+        config_kwargs["attention_implementation"] = cfg.attention_implementation
+    if cfg.do_pack_sequences is not None:
+        config_kwargs["do_pack_sequences"] = cfg.do_pack_sequences
+    config = StructuredTransformerConfig(**config_kwargs)
+    config.set_to_dataset(pyd)
+    # So that sequences of the maximum length can be extended during generation.
+    config.max_seq_len = pyd.max_seq_len + cfg.max_new_events
+
+    L.seed_everything(cfg.seed)
+    return MODEL_CLASSES[model_type](config)
+
+
+def measure_forward_backward(model: torch.nn.Module, batches: list, prefix: str, recorder: BenchmarkRecorder):
+    """Measures the forward and then the backward passes of `model` over `batches` as ``{prefix}/*``."""
+    n_events = sum(int(batch.event_mask.sum()) for batch in batches)
+
+    model.train()
+    with recorder.measure(f"{prefix}/forward", n_items=n_events, unit="events"):
+        losses = [model(batch).loss for batch in batches]
+
+    with recorder.measure(f"{prefix}/backward", n_items=n_events, unit="events"):
+        for loss in losses:
+            loss.backward()
+
+
+def benchmark_compiled_model(
+    cfg: BenchmarkConfig, model_type: str, bucketed_pyd: PytorchDataset, recorder: BenchmarkRecorder
+):
+    """Measures the forward and backward passes over shape-bucketed batches with and without compilation.
+
+    Both are measured on the same model and batches, under ``model/{model_type}/bucketed/eager/*`` and
+    ``model/{model_type}/bucketed/compiled/*``. Compilation happens on the first pass over each batch shape,
+    so that pass is recorded separately, as ``model/{model_type}/bucketed/compile``.
+    """
+    model = build_model(cfg, model_type, bucketed_pyd)
+    batches = get_batches(bucketed_pyd, cfg.batch_size, cfg.n_model_batches)
+    prefix = f"model/{model_type}/bucketed"
+
+    measure_forward_backward(model, batches, f"{prefix}/eager", recorder)
+
+    # Distribution argument validation can't be traced, so, as in training, it is disabled for the compiled
+    # model; it is restored afterwards to leave the other benchmarks unaffected.
+    validate_args = torch.distributions.Distribution._validate_args
+    try:
+        torch.distributions.Distribution.set_default_validate_args(False)
+        model.compile(dynamic=False)
+        with recorder.measure(f"{prefix}/compile", n_items=len(batches), unit="batches"):
+            for batch in batches:
+                model(batch).loss.backward()
+
+        measure_forward_backward(model, batches, f"{prefix}/compiled", recorder)
+    finally:
+        torch.distributions.Distribution.set_default_validate_args(validate_args)
+
+    for stage in ("forward", "backward"):
+        eager = recorder.results[f"{prefix}/eager/{stage}"].wall_time_s
+        compiled = recorder.results[f"{prefix}/compiled/{stage}"].wall_time_s
+        print(f"{prefix}/{stage}: {eager:.3f}s eager, {compiled:.3f}s compiled ({eager / compiled:.2f}x)")
+
+
+def benchmark_model(
+    cfg: BenchmarkConfig,
+    model_type: str,
+    pyd: PytorchDataset,
+    generation_pyd: PytorchDataset | None,
+    recorder: BenchmarkRecorder,
+    bucketed_pyd: PytorchDataset | None = None,
+):
+    """Measures the forward and backward passes and generation throughput of the given model type.
+
+    Generation is run over batches of `generation_pyd`, which must be left-padded and include subject start
+    times, as generation requires. If `bucketed_pyd` is specified, which must pad its batches to shape
+    buckets, the forward and backward passes are also measured with and without compilation over its batches.
+    """
+    model = build_model(cfg, model_type, pyd)
+
+    if "model" in cfg.benchmark_groups:
+        batches = get_batches(pyd, cfg.batch_size, cfg.n_model_batches)
+        measure_forward_backward(model, batches, f"model/{model_type}", recorder)
+
+        if bucketed_pyd is not None:
+            benchmark_compiled_model(cfg, model_type, bucketed_pyd, recorder)
+
+    if "generation" in cfg.benchmark_groups:
+        batches = get_batches(generation_pyd, cfg.batch_size, cfg.n_generation_batches)
+        n_events = sum(batch.batch_size * cfg.max_new_events for batch in batches)
+
+        model.eval()
+        L.seed_everything(cfg.seed)
+        with recorder.measure(f"generation/{model_type}", n_items=n_events, unit="events"):
+            for batch in batches:
+                model.generate(
+                    batch,
+                    max_new_events=cfg.max_new_events,
+                    do_sample=True,
+                    return_dict_in_generate=False,
+                    output_scores=False,
+                    use_cache=True,
+                )
+
+
+def run_benchmarks(cfg: BenchmarkConfig, work_dir: Path) -> BenchmarkRecorder:
+    """Runs the benchmark groups and model types selected in `cfg`, using `work_dir` for all data."""
+    invalid_groups = set(cfg.benchmark_groups) - set(BENCHMARK_GROUPS)
+    if invalid_groups:
+        raise ValueError(f"Invalid benchmark groups {invalid_groups}; must be in {BENCHMARK_GROUPS}")
+    invalid_models = set(cfg.model_types) - set(MODEL_CLASSES)
+    if invalid_models:
+        raise ValueError(f"Invalid model types {invalid_models}; must be in {list(MODEL_CLASSES)}")
+
+    recorder = BenchmarkRecorder()
+
+    L.seed_everything(cfg.seed)
+    save_dir = build_dataset(cfg, work_dir, recorder)
+
+    data_config = PytorchDatasetConfig(
+        save_dir=save_dir,
+        max_seq_len=cfg.max_seq_len,
+        cached_data_storage=cfg.cached_data_storage,
+    )
+
+    if "pytorch_dataset" in cfg.benchmark_groups:
+        pyd = benchmark_pytorch_dataset(cfg, data_config, recorder)
+    else:
+        pyd = PytorchDataset(data_config, split="train")
+
+    if "generation" in cfg.benchmark_groups:
+        generation_data_config = dataclasses.replace(
+            data_config, seq_padding_side=SeqPaddingSide.LEFT, do_include_start_time_min=True
+        )
+        generation_pyd = PytorchDataset(generation_data_config, split="train")
+    else:
+        generation_pyd = None
+
+    if cfg.compile and "model" in cfg.benchmark_groups:
+        bucketed_data_config = dataclasses.replace(data_config, do_pad_to_shape_buckets=True)
+        bucketed_pyd = PytorchDataset(bucketed_data_config, split="train")
+    else:
+        bucketed_pyd = None
+
+    if {"model", "generation"} & set(cfg.benchmark_groups):
+        for model_type in cfg.model_types:
+            benchmark_model(cfg, model_type, pyd, generation_pyd, recorder, bucketed_pyd=bucketed_pyd)
+
+    return recorder
+
+
+@hydra.main(version_base=None, config_name="benchmark_config")
+def main(cfg: BenchmarkConfig):
+    if type(cfg) is not BenchmarkConfig:
+        cfg = hydra.utils.instantiate(cfg, _convert_="object")
+
+    if cfg.torch_num_threads is not None:
+        torch.set_num_threads(cfg.torch_num_threads)
+
+    if cfg.work_dir is None:
+        with TemporaryDirectory() as work_dir:
+            recorder = run_benchmarks(cfg, Path(work_dir))
+    else:
+        recorder = run_benchmarks(cfg, Path(cfg.work_dir))
+
+    if cfg.output_path is None:
+        output_path = root / "benchmarks" / "results" / f"{git_commit(short=True) or 'unknown'}.json"
+    else:
+        output_path = Path(cfg.output_path)
+
+    metadata = {**environment_metadata(), "config": dataclasses.asdict(cfg)}
+    recorder.to_json_file(output_path, metadata=metadata)
+    print(f"Wrote results to {output_path}")
+
+    if cfg.compare_to is not None:
+        baseline = json.loads(Path(cfg.compare_to).read_text())
+        candidate = json.loads(output_path.read_text())
+
+        def fmt(ratio: float | None) -> str:
+            return "n/a" if ratio is None else f"{ratio:.2f}x"
+
+        print(f"Comparison to {cfg.compare_to} (new / old):")
+        for row in compare_results(baseline, candidate, tolerance=cfg.regression_tolerance):
+            flag = " REGRESSION" if row["is_regression"] else ""
+            wall_time, peak_rss = fmt(row["wall_time_ratio"]), fmt(row["peak_rss_ratio"])
+            print(f"  {row['name']}: wall time {wall_time}, peak RSS {peak_rss}{flag}")
+
+
+if __name__ == "__main__":
+    main()
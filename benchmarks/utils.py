@@ -0,0 +1,290 @@
+"""Utilities to time, measure the memory use of, and record results of benchmarked code."""
+
+import dataclasses
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+import polars as pl
+import torch
+
+PROC_STATUS_FP = Path("/proc/self/status")
+PROC_CLEAR_REFS_FP = Path("/proc/self/clear_refs")
+
+
+def _read_proc_status_kb(key: str) -> int | None:
+    try:
+        with open(PROC_STATUS_FP) as f:
+            for line in f:
+                if line.startswith(f"{key}:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak resident set size of this process, if the platform supports it.
+
+    On Linux, writing ``5`` to ``/proc/self/clear_refs`` resets the ``VmHWM`` (peak RSS) counter to the
+    current RSS, so that the peak RSS of a single benchmarked block can be measured. Elsewhere, only the peak
+    RSS over the lifetime of the process is available.
+
+    Returns:
+        Whether the peak RSS was reset.
+    """
+    try:
+        PROC_CLEAR_REFS_FP.write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of this process (since the last successful reset) in MiB."""
+    hwm_kb = _read_proc_status_kb("VmHWM")
+    if hwm_kb is not None:
+        return hwm_kb / 1024
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # `ru_maxrss` is in bytes on macOS and in KiB elsewhere.
+    return max_rss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """The measurements of a single benchmarked block.
+
+    Args:
+        wall_time_s: The wall-clock duration of the block, in seconds.
+        peak_rss_mb: The peak resident set size of the process during the block, in MiB.
+        peak_rss_is_per_block: Whether `peak_rss_mb` was measured over just this block (`True`) or over the
+            lifetime of the process up to the end of this block (`False`), which happens on platforms where
+            the peak RSS can't be reset.
+        n_items: The number of items (e.g., subjects, batches, or events) processed in the block, if tracked.
+        unit: The unit of `n_items`.
+
+    Examples:
+        >>> result = BenchmarkResult(wall_time_s=2.0, peak_rss_mb=100.0, n_items=10, unit="batches")
+        >>> result.items_per_s
+        5.0
+        >>> result.to_dict()["batches_per_s"]
+        5.0
+    """
+
+    wall_time_s: float = 0.0
+    peak_rss_mb: float | None = None
+    peak_rss_is_per_block: bool = True
+    n_items: int | None = None
+    unit: str | None = None
+
+    @property
+    def items_per_s(self) -> float | None:
+        if self.n_items is None or self.wall_time_s <= 0:
+            return None
+        return self.n_items / self.wall_time_s
+
+    def to_dict(self) -> dict[str, Any]:
+        out = dataclasses.asdict(self)
+        if self.items_per_s is not None:
+            out[f"{self.unit or 'items'}_per_s"] = self.items_per_s
+        return out
+
+
+class BenchmarkRecorder:
+    """Measures benchmarked blocks of code and collects their results.
+
+    Examples:
+        >>> recorder = BenchmarkRecorder()
+        >>> with recorder.measure("sum", unit="elements") as result: # doctest: +ELLIPSIS
+        ...     result.n_items = len([sum(range(100)) for _ in range(10)])
+        sum: {'wall_time_s': ..., 'n_items': 10, 'unit': 'elements', 'elements_per_s': ...}
+        >>> list(recorder.results)
+        ['sum']
+        >>> recorder.results["sum"].n_items
+        10
+        >>> with recorder.measure("sum"):
+        ...     pass
+        Traceback (most recent call last):
+            ...
+        KeyError: 'Benchmark sum has already been recorded!'
+    """
+
+    def __init__(self):
+        self.results: dict[str, BenchmarkResult] = {}
+
+    @contextmanager
+    def measure(
+        self, name: str, n_items: int | None = None, unit: str | None = None
+    ) -> Iterator[BenchmarkResult]:
+        """Times and measures the peak RSS of the enclosed block, recording it under `name`.
+
+        The yielded `BenchmarkResult` can be used to set the number of items processed in the block once that
+        is known.
+
+        Raises:
+            KeyError: If a result has already been recorded under `name`.
+        """
+        if name in self.results:
+            raise KeyError(f"Benchmark {name} has already been recorded!")
+
+        result = BenchmarkResult(n_items=n_items, unit=unit)
+        result.peak_rss_is_per_block = reset_peak_rss()
+
+        st = time.perf_counter()
+        yield result
+        result.wall_time_s = time.perf_counter() - st
+        result.peak_rss_mb = peak_rss_mb()
+
+        self.results[name] = result
+        print(f"{name}: {result.to_dict()}")
+
+    @contextmanager
+    def measure_calls(self, methods: dict[str, tuple[type, str]]) -> Iterator[None]:
+        """Measures every call of each of the given methods made within the enclosed block.
+
+        This is used to separately measure the stages of code (e.g., the dataset building script) that can
+        only be run as a whole. Methods are restored upon exit.
+
+        Args:
+            methods: A mapping from the name under which to record each method's (single) call to the class
+                and name of the method.
+        """
+        originals = {}
+        for name, (cls, method_name) in methods.items():
+            fn = getattr(cls, method_name)
+            originals[name] = (cls, method_name, fn)
+            setattr(cls, method_name, self._measured(name, fn))
+
+        try:
+            yield
+        finally:
+            for cls, method_name, fn in originals.values():
+                setattr(cls, method_name, fn)
+
+    def _measured(self, name: str, fn: Callable) -> Callable:
+        def measured_fn(*args, **kwargs):
+            with self.measure(name):
+                return fn(*args, **kwargs)
+
+        return measured_fn
+
+    def to_json_file(self, fp: Path, metadata: dict[str, Any] | None = None):
+        """Writes the recorded results, along with run metadata, to `fp`."""
+        fp.parent.mkdir(exist_ok=True, parents=True)
+        out = {
+            "metadata": metadata or {},
+            "results": {name: result.to_dict() for name, result in self.results.items()},
+        }
+        fp.write_text(json.dumps(out, indent=2, default=str))
+
+
+def git_commit(short: bool = False) -> str | None:
+    """Returns the commit hash of the repository's `HEAD`, or `None` if it can't be determined."""
+    cmd = ["git", "rev-parse", "--short", "HEAD"] if short else ["git", "rev-parse", "HEAD"]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True, cwd=Path(__file__).parent)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode().strip()
+
+
+def environment_metadata() -> dict[str, Any]:
+    """Returns the information needed to judge whether two benchmark runs are comparable."""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_num_threads": torch.get_num_threads(),
+        "polars": pl.__version__,
+    }
+
+
+def compare_results(
+    baseline: dict[str, Any],
+    candidate: dict[str, Any],
+    tolerance: float = 0.1,
+    min_wall_time_s: float = 0.05,
+) -> list[dict[str, Any]]:
+    """Compares the wall times and peak RSS of two benchmark result files' contents.
+
+    Args:
+        baseline: The parsed contents of the baseline results JSON file.
+        candidate: The parsed contents of the candidate results JSON file.
+        tolerance: The fractional increase in wall time or peak RSS over the baseline beyond which a
+            benchmark is flagged as a regression.
+        min_wall_time_s: Wall time increases of benchmarks that took less than this long in both runs are too
+            noisy to be flagged as regressions.
+
+    Returns:
+        A row for each benchmark present in both files, with the ratio of the candidate's to the baseline's
+        wall time and peak RSS and whether either is a regression.
+
+    Examples:
+        >>> baseline = {"results": {
+        ...     "a": {"wall_time_s": 1.0, "peak_rss_mb": 100.0},
+        ...     "b": {"wall_time_s": 2.0, "peak_rss_mb": 100.0},
+        ...     "c": {"wall_time_s": 0.01, "peak_rss_mb": 100.0},
+        ... }}
+        >>> candidate = {"results": {
+        ...     "a": {"wall_time_s": 1.5, "peak_rss_mb": 100.0},
+        ...     "b": {"wall_time_s": 1.0, "peak_rss_mb": None},
+        ...     "c": {"wall_time_s": 0.02, "peak_rss_mb": 100.0},
+        ... }}
+        >>> for row in compare_results(baseline, candidate):
+        ...     print(row)
+        {'name': 'a', 'wall_time_ratio': 1.5, 'peak_rss_ratio': 1.0, 'is_regression': True}
+        {'name': 'b', 'wall_time_ratio': 0.5, 'peak_rss_ratio': None, 'is_regression': False}
+        {'name': 'c', 'wall_time_ratio': 2.0, 'peak_rss_ratio': 1.0, 'is_regression': False}
+    """
+
+    def ratio(new: float | None, old: float | None) -> float | None:
+        if new is None or old is None or old <= 0:
+            return None
+        return new / old
+
+    rows = []
+    for name, old in baseline["results"].items():
+        new = candidate["results"].get(name, None)
+        if new is None:
+            continue
+
+        wall_time_ratio = ratio(new["wall_time_s"], old["wall_time_s"])
+        peak_rss_ratio = ratio(new["peak_rss_mb"], old["peak_rss_mb"])
+        if max(new["wall_time_s"], old["wall_time_s"]) < min_wall_time_s:
+            ratios_to_check = (peak_rss_ratio,)
+        else:
+            ratios_to_check = (wall_time_ratio, peak_rss_ratio)
+        is_regression = any(r is not None and r > 1 + tolerance for r in ratios_to_check)
+        rows.append(
+            {
+                "name": name,
+                "wall_time_ratio": wall_time_ratio,
+                "peak_rss_ratio": peak_rss_ratio,
+                "is_regression": is_regression,
+            }
+        )
+    return rows
+
+
+def load_module_from_path(fp: Path) -> ModuleType:
+    """Imports the python file at `fp` (e.g., a script, which is not part of a package) as a module."""
+    spec = importlib.util.spec_from_file_location(fp.stem, fp)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -348,6 +348,10 @@ def main(cfg: DictConfig):
     do_overwrite = cfg.pop("do_overwrite", False)
     cfg.pop("cohort_name")
     DL_chunk_size = cfg.pop("DL_chunk_size", 20000)
+    DL_write_memmap = cfg.pop("DL_write_memmap", False)
+    DL_num_workers = cfg.pop("DL_num_workers", 1)
+    fit_num_workers = cfg.pop("fit_num_workers", 1)
+    lazy = cfg.pop("lazy", False)
 
     valid_config_kwargs = {f.name for f in dataclasses.fields(DatasetConfig)}
     extra_kwargs = {k: v for k, v in cfg.items() if k not in valid_config_kwargs}
@@ -361,11 +365,13 @@ def main(cfg: DictConfig):
     if config.save_dir is not None:
         dataset_schema.to_json_file(config.save_dir / "input_schema.json", do_overwrite=do_overwrite)
 
-    ESD = Dataset(config=config, input_schema=dataset_schema)
+    ESD = Dataset(config=config, input_schema=dataset_schema, lazy=lazy)
     ESD.split(split, seed=seed)
-    ESD.preprocess()
+    ESD.preprocess(num_workers=fit_num_workers)
     ESD.save(do_overwrite=do_overwrite)
-    ESD.cache_deep_learning_representation(DL_chunk_size, do_overwrite=do_overwrite)
+    ESD.cache_deep_learning_representation(
+        DL_chunk_size, do_overwrite=do_overwrite, do_write_memmap=DL_write_memmap, num_workers=DL_num_workers
+    )
 
 
 if __name__ == "__main__":
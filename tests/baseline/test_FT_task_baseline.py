@@ -0,0 +1,226 @@
+import sys
+
+sys.path.append("../..")
+
+import unittest
+import warnings
+from unittest.mock import MagicMock
+
+import numpy as np
+import polars as pl
+import scipy.sparse
+from sklearn.decomposition import PCA, TruncatedSVD
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import KNNImputer, SimpleImputer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from EventStream.baseline.FT_task_baseline import (
+    ESDFlatFeatureLoader,
+    ESDFlatFeatureLoaderConfig,
+    KNNImputerConfig,
+    PCAConfig,
+    RandomForestClassifierConfig,
+    SklearnConfig,
+    StandardScalerConfig,
+    fit_pipeline_in_batches,
+    predict_proba_in_batches,
+)
+
+FEATURE_COLS = ["FULL/a/count", "FULL/b/count", "FULL/c/count"]
+
+
+def get_flat_rep_df(n_rows: int = 40, seed: int = 1) -> tuple[pl.DataFrame, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    Y = np.arange(n_rows) % 2
+    df = pl.DataFrame(
+        {
+            "subject_id": list(range(n_rows)),
+            "FULL/a/count": rng.normal(size=n_rows) + Y,
+            "FULL/b/count": rng.normal(size=n_rows) - Y,
+            "FULL/c/count": rng.normal(size=n_rows),
+            "FULL/ignored/count": rng.normal(size=n_rows),
+        }
+    )
+    return df, Y
+
+
+def get_loader() -> ESDFlatFeatureLoader:
+    ESD = MagicMock()
+    ESD._get_flat_rep_feature_cols.return_value = FEATURE_COLS
+    return ESDFlatFeatureLoader(ESD, window_sizes=["FULL"], convert_to_mean_var=False)
+
+
+def get_batches(df: pl.DataFrame, Y: np.ndarray, batch_size: int):
+    return lambda: ((df[i : i + batch_size], Y[i : i + batch_size]) for i in range(0, df.height, batch_size))
+
+
+def get_sklearn_config(do_produce_sparse: bool) -> SklearnConfig:
+    return SklearnConfig(
+        experiment_dir="/tmp",
+        dataset_dir="/tmp",
+        task_df_name="task",
+        finetuning_task_label="label",
+        feature_selector=ESDFlatFeatureLoaderConfig(
+            window_sizes=["FULL"], do_produce_sparse=do_produce_sparse
+        ),
+        scaling=StandardScalerConfig(),
+        imputation=KNNImputerConfig(),
+        dim_reduce=PCAConfig(n_components=2),
+        model=RandomForestClassifierConfig(n_estimators=5),
+    )
+
+
+class TestESDFlatFeatureLoader(unittest.TestCase):
+    def test_to_csr(self):
+        df = pl.DataFrame(
+            {
+                "a": [None, 1, 0, 2],
+                "b": [2.5, None, float("nan"), 0.0],
+                "c": [None, None, None, None],
+            },
+            schema={"a": pl.Int64, "b": pl.Float64, "c": pl.Float32},
+        )
+
+        got = ESDFlatFeatureLoader._to_csr(df)
+
+        self.assertIsInstance(got, scipy.sparse.csr_matrix)
+        self.assertEqual((4, 3), got.shape)
+        # Nulls and zeros are implicit; NaNs are stored explicitly, so imputers still see them as missing.
+        self.assertEqual(4, got.nnz)
+        want = np.array([[0, 2.5, 0], [1, 0, 0], [0, np.nan, 0], [2, 0, 0]])
+        np.testing.assert_array_equal(want, got.toarray())
+
+    def test_partial_fit(self):
+        df, _ = get_flat_rep_df(n_rows=4)
+        batch_1 = df.with_columns(pl.lit(None, dtype=pl.Float64).alias("FULL/b/count"))
+        batch_2 = df.with_columns(pl.lit(None, dtype=pl.Float64).alias("FULL/c/count"))
+
+        loader = get_loader()
+        loader.partial_fit(batch_1)
+        self.assertEqual(["FULL/a/count", "FULL/c/count"], loader.feature_columns)
+
+        # Columns are retained if they are non-null in any batch seen so far, in the ESD's column order.
+        loader.partial_fit(batch_2)
+        self.assertEqual(FEATURE_COLS, loader.feature_columns)
+        loader.ESD._get_flat_rep_feature_cols.assert_called_once()
+
+        # `fit` starts over.
+        loader.fit(batch_2, None)
+        self.assertEqual(["FULL/a/count", "FULL/b/count"], loader.feature_columns)
+
+        with self.assertRaises(ValueError):
+            loader.partial_fit(df.drop("FULL/a/count"))
+
+    def test_to_csr_no_columns(self):
+        got = ESDFlatFeatureLoader._to_csr(pl.DataFrame({"a": [1, 2]}).select())
+        self.assertEqual((0, 0), got.shape)
+        self.assertEqual(0, got.nnz)
+
+
+class TestSklearnConfig(unittest.TestCase):
+    def test_get_model_dense(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            model = get_sklearn_config(do_produce_sparse=False).get_model(dataset=None)
+
+        steps = dict(model.steps)
+        self.assertIsInstance(steps["scaling"], StandardScaler)
+        self.assertTrue(steps["scaling"].with_mean)
+        self.assertIsInstance(steps["imputation"], KNNImputer)
+        self.assertIsInstance(steps["dim_reduce"], PCA)
+
+    def test_get_model_sparse(self):
+        with self.assertWarns(UserWarning):
+            model = get_sklearn_config(do_produce_sparse=True).get_model(dataset=None)
+
+        steps = dict(model.steps)
+        self.assertTrue(steps["feature_selector"].do_produce_sparse)
+        self.assertIsInstance(steps["scaling"], StandardScaler)
+        self.assertFalse(steps["scaling"].with_mean)
+        self.assertIsInstance(steps["imputation"], SimpleImputer)
+        self.assertEqual("constant", steps["imputation"].strategy)
+        self.assertEqual(0, steps["imputation"].fill_value)
+        self.assertIsInstance(steps["dim_reduce"], TruncatedSVD)
+        self.assertEqual(2, steps["dim_reduce"].n_components)
+
+        # Sparse flat representations store NaN values explicitly; the rest of the pipeline must handle them.
+        rng = np.random.default_rng(1)
+        X = rng.random((20, 5))
+        X[X < 0.5] = 0
+        X[0, 1] = X[3, 4] = np.nan
+        X = scipy.sparse.csr_matrix(X)
+        Y = np.arange(20) % 2
+
+        post_selector = Pipeline(model.steps[1:])
+        post_selector.fit(X, Y)
+        probs = post_selector.predict_proba(X)
+        self.assertEqual((20, 2), probs.shape)
+        self.assertFalse(np.isnan(probs).any())
+
+
+class TestBatchedTraining(unittest.TestCase):
+    def test_fit_and_predict_in_batches(self):
+        df, Y = get_flat_rep_df()
+
+        full_model = Pipeline(
+            [("loader", get_loader()), ("scaling", StandardScaler()), ("model", GaussianNB())]
+        )
+        full_model.fit(df, Y)
+
+        # Scaling and naive Bayes statistics are exactly incremental, so a batched fit matches a full fit.
+        batched_model = Pipeline(
+            [("loader", get_loader()), ("scaling", StandardScaler()), ("model", GaussianNB())]
+        )
+        got = fit_pipeline_in_batches(batched_model, get_batches(df, Y, 7), classes=np.array([0, 1]))
+        self.assertIs(batched_model, got)
+        self.assertEqual(FEATURE_COLS, batched_model["loader"].feature_columns)
+        np.testing.assert_allclose(full_model["scaling"].mean_, batched_model["scaling"].mean_)
+        np.testing.assert_allclose(full_model["scaling"].var_, batched_model["scaling"].var_)
+
+        got_Y, got_probs = predict_proba_in_batches(batched_model, get_batches(df, Y, 7)())
+        np.testing.assert_array_equal(Y, got_Y)
+        np.testing.assert_allclose(full_model.predict_proba(df), got_probs)
+
+    def test_fit_in_batches_sgd(self):
+        df, Y = get_flat_rep_df()
+        # The first batch holds a single class, so the full label set must be passed up front.
+        order = np.argsort(Y, kind="stable")
+        df, Y = df[order], Y[order]
+
+        sgd_kwargs = {"loss": "log_loss", "shuffle": False, "random_state": 1}
+        batched_model = Pipeline(
+            [("loader", get_loader()), ("scaling", StandardScaler()), ("model", SGDClassifier(**sgd_kwargs))]
+        )
+        fit_pipeline_in_batches(batched_model, get_batches(df, Y, 10), classes=np.array([0, 1]))
+
+        # This should match a single epoch of partial fits over the same batches of the full-data scaling.
+        scaler = StandardScaler().fit(df.select(FEATURE_COLS).to_numpy())
+        want = SGDClassifier(**sgd_kwargs)
+        for X_batch, Y_batch in get_batches(df, Y, 10)():
+            want.partial_fit(scaler.transform(X_batch.select(FEATURE_COLS).to_numpy()), Y_batch, [0, 1])
+
+        np.testing.assert_array_equal([0, 1], batched_model["model"].classes_)
+        np.testing.assert_allclose(want.coef_, batched_model["model"].coef_)
+        np.testing.assert_allclose(want.intercept_, batched_model["model"].intercept_)
+
+        _, got_probs = predict_proba_in_batches(batched_model, get_batches(df, Y, 10)())
+        np.testing.assert_allclose(batched_model.predict_proba(df), got_probs)
+
+    def test_fit_in_batches_without_partial_fit(self):
+        df, Y = get_flat_rep_df()
+
+        model = Pipeline([("loader", get_loader()), ("imputation", KNNImputer()), ("model", GaussianNB())])
+        with self.assertWarns(UserWarning):
+            fit_pipeline_in_batches(model, get_batches(df, Y, 10), classes=np.array([0, 1]))
+        self.assertEqual((10, 3), model["imputation"]._fit_X.shape)
+
+        model = Pipeline([("loader", get_loader()), ("model", RandomForestClassifier())])
+        with self.assertRaises(ValueError):
+            fit_pipeline_in_batches(model, get_batches(df, Y, 10), classes=np.array([0, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
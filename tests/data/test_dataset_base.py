@@ -5,7 +5,7 @@ sys.path.append("../..")
 import copy
 import unittest
 from collections import defaultdict
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 from pathlib import Path
 from typing import Any
 
@@ -96,6 +96,13 @@ class ESDMock(DatasetBase[dict, dict]):
         self.functions_called["_filter_col_inclusion"].append((df, col))
         return df
 
+    def _partition_by_subjects(self, subject_partitions: dict[str, Sequence[int]]) -> Iterator[tuple]:
+        self.functions_called["_partition_by_subjects"].append((subject_partitions,))
+        return iter((p, ({}, {}, {})) for p in subject_partitions)
+
+    def _shift_appended_ids(self, new: "ESDMock"):
+        self.functions_called["_shift_appended_ids"].append((new,))
+
     def _read_df(self, path: Path) -> dict:
         self.functions_called["_read_df"].append((path,))
         return {}
@@ -103,6 +110,12 @@ class ESDMock(DatasetBase[dict, dict]):
     def _write_df(self, df: dict, path: Path):
         self.functions_called["_write_df"].append((df, path))
 
+    def _write_memmap_df(self, df: dict, path: Path, **kwargs):
+        self.functions_called["_write_memmap_df"].append((df, path))
+
+    def _write_DL_stats(self, df: dict, path: Path, **kwargs):
+        self.functions_called["_write_DL_stats"].append((df, path))
+
     def _total_possible_and_observed(
         self, measure: str, config: MeasurementConfig, source_df: dict
     ) -> tuple[int, int]:
@@ -146,9 +159,9 @@ class ESDMock(DatasetBase[dict, dict]):
         return {}, None
 
     @classmethod
-    def _summarize_over_window(cls, df: dict, window_size: str):
-        cls.FUNCTIONS_CALLED["_summarize_over_window"].append((df, window_size))
-        return df
+    def _summarize_over_windows(cls, df: dict, window_sizes: list[str]):
+        cls.FUNCTIONS_CALLED["_summarize_over_windows"].append((df, window_sizes))
+        return {window_size: df for window_size in window_sizes}
 
     @classmethod
     def _split_range_events_df(
@@ -414,7 +427,7 @@ class TestDatasetBase(ConfigComparisonsMixin, unittest.TestCase):
 
         want_functions_called = {
             "_add_time_dependent_measurements": [()],
-            "fit_measurements": [((), {})],
+            "fit_measurements": [((), {"num_workers": 1})],
             "transform_measurements": [((), {})],
         }
 
@@ -515,8 +528,6 @@ class TestDatasetBase(ConfigComparisonsMixin, unittest.TestCase):
         want_functions_called = {
             "_get_source_df": [
                 ((self.config.measurement_configs["retained"],), {"do_only_train": True}),
-                ((self.config.measurement_configs["not_present"],), {"do_only_train": True}),
-                ((self.config.measurement_configs["numeric"],), {"do_only_train": True}),
             ],
             "_filter_col_inclusion": [
                 (mock_source_df, {"retained": True}),
@@ -2,10 +2,13 @@ import sys
 
 sys.path.append("../..")
 
+import copy
 import unittest
+from collections.abc import Iterator
 from datetime import datetime, timedelta
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
@@ -1717,6 +1720,41 @@ class TestDatasetEndToEnd(ConfigComparisonsMixin, unittest.TestCase):
 
         self.assertEqual(want_expl, got_expl)
 
+        with self.subTest("Caching a DL representation should write each split's subjects in chunks"):
+            want_DL_rep = E.build_DL_cached_representation().sort("subject_id")
+            for num_workers in (1, 2):
+                with TemporaryDirectory() as d:
+                    E.config.save_dir = Path(d) / "save_dir"
+                    E.cache_deep_learning_representation(subjects_per_output_file=3, num_workers=num_workers)
+
+                    DL_dir = E.config.save_dir / "DL_reps"
+                    got_fns = sorted(fp.name for fp in DL_dir.glob("*.parquet"))
+                    self.assertEqual(["held_out_0.parquet", "train_0.parquet", "train_1.parquet"], got_fns)
+
+                    for split, subjects in TEST_SPLIT.items():
+                        got = pl.concat([pl.read_parquet(fp) for fp in DL_dir.glob(f"{split}_*.parquet")])
+                        want = want_DL_rep.filter(pl.col("subject_id").is_in(list(subjects)))
+                        got = got.sort("subject_id")
+                        self.assertEqual(want.drop("dynamic_values"), got.drop("dynamic_values"))
+                        self.assertEqual(want.select(exploded_expr), got.select(exploded_expr))
+
+        with self.subTest("Partitioning by subjects should yield each partition's data in order, lazily"):
+            subject_partitions = {"a": [3, 1], "b": [2], "empty": []}
+            partitions = E._partition_by_subjects(subject_partitions)
+            self.assertIsInstance(partitions, Iterator)
+            for (got_name, got_dfs), (want_name, subjects) in zip(partitions, subject_partitions.items()):
+                self.assertEqual(want_name, got_name)
+                got_subjects_df, got_events_df, got_measurements_df = got_dfs
+                self.assertEqual(E.subjects_df.filter(pl.col("subject_id").is_in(subjects)), got_subjects_df)
+                want_events_df = E.events_df.filter(pl.col("subject_id").is_in(subjects))
+                self.assertEqual(want_events_df, got_events_df)
+                self.assertEqual(
+                    E.dynamic_measurements_df.filter(
+                        pl.col("event_id").is_in(want_events_df.get_column("event_id"))
+                    ),
+                    got_measurements_df,
+                )
+
         with self.subTest("Caching a flat representation should run"):
             with TemporaryDirectory() as d:
                 save_dir = Path(d) / "save_dir"
@@ -1725,6 +1763,49 @@ class TestDatasetEndToEnd(ConfigComparisonsMixin, unittest.TestCase):
 
                 # To-do: Produce expected flat output.
 
+        with self.subTest("Summarizing flat representations over history windows should match rolling sums"):
+            got_history_reps = {}
+            for num_workers in (1, 2):
+                with TemporaryDirectory() as d:
+                    E.config.save_dir = Path(d) / "save_dir"
+                    E.cache_flat_representation(window_sizes=["1d", "FULL"], num_workers=num_workers)
+
+                    flat_dir = E.config.save_dir / "flat_reps"
+                    got_history_reps[num_workers] = {
+                        fp.relative_to(flat_dir): pl.read_parquet(fp)
+                        for fp in sorted((flat_dir / "over_history").glob("*/*/*.parquet"))
+                    }
+
+                    for at_ts_fp in (flat_dir / "at_ts").glob("*/*.parquet"):
+                        at_ts = pl.read_parquet(at_ts_fp)
+                        value_cols = [c for c in at_ts.columns if c.endswith("/value")]
+                        self.assertTrue(len(value_cols) > 0)
+
+                        def windowed(c: str, agg: str) -> str:
+                            return "/".join(["1d", *c.split("/")[1:-1], agg])
+
+                        want = at_ts.groupby_rolling(
+                            index_column="timestamp", by="subject_id", period="1d"
+                        ).agg(
+                            *(pl.col(c).sum().cast(pl.Float32).alias(windowed(c, "sum")) for c in value_cols),
+                            # Polars returns the float maximum as the minimum of only `NaN` values, so those
+                            # are compared as nulls.
+                            *(
+                                pl.col(c).fill_nan(None).min().cast(pl.Float32).alias(windowed(c, "min"))
+                                for c in value_cols
+                            ),
+                        )
+                        sp_dir = flat_dir / "over_history" / at_ts_fp.parent.name
+                        got = pl.read_parquet(sp_dir / "1d" / at_ts_fp.name).with_columns(
+                            pl.col(windowed(c, "min")).fill_nan(None) for c in value_cols
+                        )
+                        self.assertEqual(want, got.select(want.columns))
+
+            self.assertTrue(len(got_history_reps[1]) > 0)
+            self.assertEqual(got_history_reps[1].keys(), got_history_reps[2].keys())
+            for k, want_df in got_history_reps[1].items():
+                self.assertEqual(want_df, got_history_reps[2][k])
+
         with self.subTest("Save/load should work"):
             with TemporaryDirectory() as d:
                 save_dir = Path(d) / "save_dir"
@@ -1744,3 +1825,267 @@ class TestDatasetEndToEnd(ConfigComparisonsMixin, unittest.TestCase):
                 self.assertNestedDictEqual(
                     WANT_INFERRED_MEASUREMENT_CONFIGS, got_inferred_measurement_configs
                 )
+
+    def test_end_to_end_parallel_fit(self):
+        E = ESDMock(
+            config=TEST_CONFIG,
+            subjects_df=IN_SUBJECTS_DF,
+            events_df=IN_EVENTS_DF,
+            dynamic_measurements_df=IN_MEASUREMENTS_DF,
+        )
+        E.split_subjects = TEST_SPLIT
+        E._filter_subjects()
+        E._add_time_dependent_measurements()
+
+        for temporality, source_df in (
+            (TemporalityType.DYNAMIC, E.train_dynamic_measurements_df),
+            (TemporalityType.FUNCTIONAL_TIME_DEPENDENT, E.train_events_df),
+        ):
+            configs = {
+                m: cfg
+                for m, cfg in TEST_CONFIG.measurement_configs.items()
+                if cfg.temporality == temporality and not cfg.is_dropped and m in source_df
+            }
+            want_counts = {m: E._total_possible_and_observed(m, cfg, source_df) for m, cfg in configs.items()}
+            self.assertEqual(want_counts, E._total_possible_and_observed_by_measure(configs, source_df))
+
+        E.fit_measurements(num_workers=3)
+        E.transform_measurements()
+
+        self.assertEqual(list(TEST_CONFIG.measurement_configs)[1:], list(E.inferred_measurement_configs))
+        self.assertNestedDictEqual(
+            WANT_INFERRED_MEASUREMENT_CONFIGS, E.inferred_measurement_configs, check_like=True
+        )
+        self.assertEqual(WANT_SUBJECTS_DF, E.subjects_df)
+        self.assertEqual(WANT_EVENTS_DF, E.events_df)
+        self.assertEqual(WANT_MEASUREMENTS_DF, E.dynamic_measurements_df)
+
+    def test_transform_measurements_matches_per_measurement_transform(self):
+        E = ESDMock(
+            config=TEST_CONFIG,
+            subjects_df=IN_SUBJECTS_DF,
+            events_df=IN_EVENTS_DF,
+            dynamic_measurements_df=IN_MEASUREMENTS_DF,
+        )
+        E.split_subjects = TEST_SPLIT
+        E._filter_subjects()
+        E._add_time_dependent_measurements()
+        E.fit_measurements()
+
+        per_measurement = copy.copy(E)
+        for measure, config in E.measurement_configs.items():
+            per_measurement._transform_measurement(measure, config)
+
+        E.transform_measurements()
+
+        self.assertEqual(WANT_MEASUREMENTS_DF, E.dynamic_measurements_df)
+        for attr in ("subjects_df", "events_df", "dynamic_measurements_df"):
+            self.assertEqual(getattr(per_measurement, attr), getattr(E, attr), msg=attr)
+
+    def test_summarize_over_windows_large_magnitudes(self):
+        E = ESDMock(
+            config=TEST_CONFIG,
+            subjects_df=IN_SUBJECTS_DF,
+            events_df=IN_EVENTS_DF,
+            dynamic_measurements_df=IN_MEASUREMENTS_DF,
+        )
+
+        # Values of very different magnitudes, before and within each subject's windows, lose all precision
+        # if window sums are taken as differences of a cumulative sum.
+        rng = np.random.default_rng(1)
+        n_events = 200
+        subject_ids = np.sort(rng.integers(0, 5, size=n_events))
+        values = rng.normal(loc=100, scale=20, size=n_events)
+        values[rng.choice(n_events, size=10, replace=False)] = 1e17
+        values[rng.choice(n_events, size=10, replace=False)] = -3e16
+        values[rng.choice(n_events, size=20, replace=False)] = np.nan
+        flat_df = (
+            pl.DataFrame(
+                {
+                    "subject_id": subject_ids,
+                    "timestamp": [
+                        datetime(2020, 1, 1) + timedelta(hours=int(h)) for h in rng.integers(0, 240, n_events)
+                    ],
+                    "dynamic/lab/lab/value": values,
+                }
+            )
+            .with_columns(pl.col("dynamic/lab/lab/value").fill_nan(None))
+            .sort("subject_id", "timestamp")
+        )
+        flat_df = pl.concat(
+            [
+                flat_df,
+                # A subject whose small values directly follow a huge one of another subject.
+                pl.DataFrame(
+                    {
+                        "subject_id": [5, 5, 5],
+                        "timestamp": [datetime(2020, 1, 1), datetime(2020, 1, 2), datetime(2020, 1, 3)],
+                        "dynamic/lab/lab/value": [1.0, 2.0, 3.0],
+                    }
+                ),
+            ]
+        )
+
+        def flat_col_dtype(col: str) -> pl.DataType:
+            return pl.Float32 if col.split("/")[-1] in ("sum", "sum_sqd", "min", "max") else pl.UInt32
+
+        with patch.object(ESDMock, "_get_flat_col_dtype", side_effect=flat_col_dtype):
+            got = E._summarize_over_windows(flat_df, ["1d", "3d", "FULL"])
+
+        for w in ("1d", "3d"):
+            want = flat_df.groupby_rolling(index_column="timestamp", by="subject_id", period=w).agg(
+                pl.col("dynamic/lab/lab/value").sum().cast(pl.Float32).alias(f"{w}/lab/lab/sum"),
+                (pl.col("dynamic/lab/lab/value") ** 2).sum().cast(pl.Float32).alias(f"{w}/lab/lab/sum_sqd"),
+                pl.col("dynamic/lab/lab/value")
+                .is_not_null()
+                .sum()
+                .cast(pl.UInt32)
+                .alias(f"{w}/lab/lab/count"),
+            )
+            got_w = got[w].collect()
+            self.assertEqual(
+                want, got_w.select(want.columns).with_columns(pl.col(f"{w}/lab/lab/count").fill_null(0))
+            )
+            self.assertEqual(
+                [1.0, 2.0, 3.0] if w == "1d" else [1.0, 3.0, 6.0],
+                got_w.filter(pl.col("subject_id") == 5)[f"{w}/lab/lab/sum"].to_list(),
+            )
+
+    def test_end_to_end_lazy(self):
+        exploded_expr = pl.col("dynamic_values").list.explode().list.explode().alias("dynamic_values")
+
+        with TemporaryDirectory() as d:
+            config = copy.deepcopy(TEST_CONFIG)
+            config.save_dir = Path(d) / "save_dir"
+
+            with patch.object(ESDMock, "LAZY_EVENTS_PER_CHUNK", 3):
+                E = ESDMock(
+                    config=config,
+                    subjects_df=IN_SUBJECTS_DF,
+                    events_df=IN_EVENTS_DF,
+                    dynamic_measurements_df=IN_MEASUREMENTS_DF,
+                    lazy=True,
+                )
+                E.split_subjects = TEST_SPLIT
+                E.preprocess()
+
+            self.assertIsInstance(E.dynamic_measurements_df, pl.LazyFrame)
+            checkpoints = list((config.save_dir / "lazy_checkpoints").iterdir())
+            self.assertEqual(1, len(checkpoints))
+            self.assertTrue(len(list(checkpoints[0].glob("*.parquet"))) > 1)
+
+            self.assertNestedDictEqual(
+                WANT_INFERRED_MEASUREMENT_CONFIGS, E.inferred_measurement_configs, check_like=True
+            )
+            self.assertEqual(WANT_SUBJECTS_DF, E.subjects_df)
+            self.assertEqual(WANT_EVENTS_DF, E.events_df)
+            self.assertEqual(
+                WANT_MEASUREMENTS_DF.sort("measurement_id"),
+                E.dynamic_measurements_df.collect().sort("measurement_id"),
+            )
+
+            got_DL_rep = E.build_DL_cached_representation(do_sort_outputs=True)
+            self.assertEqual(WANT_DL_REP_DF.drop("dynamic_values"), got_DL_rep.drop("dynamic_values"))
+            self.assertEqual(WANT_DL_REP_DF.select(exploded_expr), got_DL_rep.select(exploded_expr))
+
+            E.cache_deep_learning_representation(subjects_per_output_file=3)
+            got_DL_rep = pl.concat(
+                [pl.read_parquet(fp) for fp in (config.save_dir / "DL_reps").glob("*.parquet")]
+            ).sort("subject_id")
+            want_DL_rep = E.build_DL_cached_representation().sort("subject_id")
+            self.assertEqual(want_DL_rep.drop("dynamic_values"), got_DL_rep.drop("dynamic_values"))
+            self.assertEqual(want_DL_rep.select(exploded_expr), got_DL_rep.select(exploded_expr))
+
+            E.save()
+            got_E = Dataset.load(config.save_dir)
+            self.assertIsInstance(got_E.dynamic_measurements_df, pl.LazyFrame)
+            self.assertEqual(
+                WANT_MEASUREMENTS_DF.sort("measurement_id"),
+                got_E.dynamic_measurements_df.collect().sort("measurement_id"),
+            )
+
+    def test_append(self):
+        E_full = ESDMock(
+            config=TEST_CONFIG,
+            subjects_df=IN_SUBJECTS_DF,
+            events_df=IN_EVENTS_DF,
+            dynamic_measurements_df=IN_MEASUREMENTS_DF,
+        )
+        E_full.split_subjects = TEST_SPLIT
+        E_full.preprocess()
+
+        # Subject 3 is held out, so the dataset fit without them has the same fit parameters.
+        new_subjects = IN_SUBJECTS_DF.filter(pl.col("subject_id") == 3)
+        new_events = IN_EVENTS_DF.filter(pl.col("subject_id") == 3)
+        new_measurements = IN_MEASUREMENTS_DF.filter(pl.col("event_id").is_in(new_events["event_id"]))
+
+        with TemporaryDirectory() as d:
+            config = copy.deepcopy(TEST_CONFIG)
+            config.save_dir = Path(d) / "save_dir"
+
+            E = ESDMock(
+                config=config,
+                subjects_df=IN_SUBJECTS_DF.filter(pl.col("subject_id") != 3),
+                events_df=IN_EVENTS_DF.filter(pl.col("subject_id") != 3),
+                dynamic_measurements_df=IN_MEASUREMENTS_DF.filter(
+                    ~pl.col("event_id").is_in(new_events["event_id"])
+                ),
+            )
+            E.split_subjects = {"train": {1, 2, 4, 5}, "held_out": set()}
+            E.preprocess()
+            E.cache_deep_learning_representation()
+            E.cache_flat_representation()
+
+            with self.assertRaises(ValueError):
+                ESDMock(
+                    config=TEST_CONFIG,
+                    subjects_df=new_subjects,
+                    events_df=new_events,
+                    dynamic_measurements_df=new_measurements,
+                ).append(new_subjects, new_events, new_measurements)
+
+            # The new subject's (local) ID of 3 is shifted past the existing maximum of 5.
+            got_new_split_subjects = E.append(new_subjects, new_events, new_measurements)
+
+            self.assertEqual({"train": {9}, "held_out": set()}, got_new_split_subjects)
+            self.assertEqual({1, 2, 4, 5, 9}, E.subject_ids)
+            self.assertEqual({"train": {1, 2, 4, 5, 9}, "held_out": set()}, E.split_subjects)
+            self.assertEqual(E_full.n_events_per_subject[3], E.n_events_per_subject[9])
+
+            for df, id_col in (
+                (E.subjects_df, "subject_id"),
+                (E.events_df, "event_id"),
+                (E.dynamic_measurements_df, "measurement_id"),
+            ):
+                self.assertEqual(len(df), df[id_col].n_unique())
+
+            def new_rows(E: Dataset, subject_id: int) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+                events = E.events_df.filter(pl.col("subject_id") == subject_id)
+                measurements = E.dynamic_measurements_df.filter(pl.col("event_id").is_in(events["event_id"]))
+                id_cols = ["subject_id", "event_id", "measurement_id"]
+                return (
+                    E.subjects_df.filter(pl.col("subject_id") == subject_id).drop("subject_id"),
+                    events.drop(["subject_id", "event_id"]),
+                    measurements.sort("event_id", "measurement_id").drop(
+                        [c for c in id_cols if c in measurements]
+                    ),
+                )
+
+            for want, got in zip(new_rows(E_full, 3), new_rows(E, 9)):
+                self.assertEqual(want, got.select(want.columns))
+
+            DL_dir = config.save_dir / "DL_reps"
+            flat_dir = config.save_dir / "flat_reps" / "at_ts" / "train"
+            old_mtimes = {fp: fp.stat().st_mtime_ns for fp in [*DL_dir.iterdir(), *flat_dir.iterdir()]}
+
+            E.cache_deep_learning_representation(subject_ids={9})
+            got_fns = sorted(fp.name for fp in DL_dir.glob("*.parquet"))
+            self.assertEqual(["held_out_0.parquet", "train_0.parquet", "train_1.parquet"], got_fns)
+            self.assertEqual([9], pl.read_parquet(DL_dir / "train_1.parquet")["subject_id"].to_list())
+
+            E.cache_flat_representation(subject_ids={9})
+            got_fns = sorted(fp.name for fp in flat_dir.glob("*.parquet"))
+            self.assertEqual(["0.parquet", "1.parquet"], got_fns)
+            self.assertEqual([9], pl.read_parquet(flat_dir / "1.parquet")["subject_id"].unique().to_list())
+
+            self.assertEqual(old_mtimes, {fp: fp.stat().st_mtime_ns for fp in old_mtimes})
@@ -4,7 +4,10 @@ sys.path.append("../..")
 
 import copy
 import json
+import multiprocessing
+import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -14,6 +17,7 @@ import numpy as np
 import polars as pl
 import torch
 
+from EventStream.data.columnar_storage import ColumnarCachedData
 from EventStream.data.config import (
     MeasurementConfig,
     PytorchDatasetConfig,
@@ -307,6 +311,11 @@ def get_seeded_start_index(seed, curr_len, max_seq_len):
     return np.random.choice(curr_len - max_seq_len)
 
 
+def get_seeded_items(config: PytorchDatasetConfig) -> list[dict]:
+    pyd = PytorchDataset(config=config, split="fake_split")
+    return [pyd._seeded_getitem(i, seed=1) for i in range(len(pyd))]
+
+
 class TestPytorchDataset(MLTypeEqualityCheckableMixin, unittest.TestCase):
     def get_pyd(
         self,
@@ -688,6 +697,51 @@ class TestPytorchDataset(MLTypeEqualityCheckableMixin, unittest.TestCase):
 
         self.assertNestedDictEqual(asdict(want_out), asdict(out))
 
+    def test_collate_pads_to_shape_buckets(self):
+        batches = [
+            {
+                "time_delta": [0.0, 5, 10],
+                "dynamic_indices": [[1, 4, 3], [2, 7, 7, 7, 8], [1, 5]],
+                "dynamic_values": [[np.NaN, np.NaN, np.NaN], [np.NaN, 8, 9, 10, 11], [np.NaN, np.NaN]],
+                "dynamic_measurement_indices": [[1, 2, 2], [1, 3, 3, 3, 3], [1, 2]],
+            },
+            {
+                "time_delta": [0.0, 24 * 60.0],
+                "dynamic_indices": [[1, 4], [2, 7]],
+                "dynamic_values": [[np.NaN, np.NaN], [np.NaN, 1]],
+                "dynamic_measurement_indices": [[1, 2], [1, 3]],
+            },
+        ]
+
+        for seq_padding_side in ("right", "left"):
+            with self.subTest(seq_padding_side=seq_padding_side):
+                _, pyd = self.get_pyd(seq_padding_side=seq_padding_side, max_seq_len=10)
+                pyd.do_produce_static_data = False
+                want = pyd.collate(batches)
+
+                _, pyd = self.get_pyd(
+                    seq_padding_side=seq_padding_side, max_seq_len=10, do_pad_to_shape_buckets=True
+                )
+                pyd.do_produce_static_data = False
+                got = pyd.collate(batches)
+
+                self.assertEqual((2, 4, 8), tuple(got.dynamic_indices.shape))
+
+                # The extra padding is on the same side as the original padding, and otherwise empty.
+                seq_slice = slice(None, 3) if seq_padding_side == "right" else slice(1, None)
+                for k, v in asdict(got).items():
+                    if v is None:
+                        continue
+                    v = v[:, seq_slice]
+                    if v.dim() == 3:
+                        self.assertFalse(v[:, :, 5:].any(), k)
+                        v = v[:, :, :5]
+                    self.assertEqual(getattr(want, k).tolist(), v.tolist(), k)
+
+        _, pyd = self.get_pyd(seq_padding_side="right", max_seq_len=3, do_pad_to_shape_buckets=True)
+        pyd.do_produce_static_data = False
+        self.assertEqual(3, pyd.collate(batches).sequence_length, "Should be capped at max_seq_len")
+
     def test_collate_fn(self):
         config, pyd = self.get_pyd(max_seq_len=4)
         pyd.do_produce_static_data = True
@@ -825,6 +879,298 @@ class TestPytorchDataset(MLTypeEqualityCheckableMixin, unittest.TestCase):
 
         self.assertNestedDictEqual(asdict(want_out), asdict(out))
 
+    def test_array_storage_matches_rows(self):
+        cases = [
+            {
+                "msg": "Should produce identical batches without a task dataframe.",
+                "max_seq_len": 3,
+                "min_seq_len": 2,
+            },
+            {
+                "msg": "Should produce identical batches with a task dataframe.",
+                "max_seq_len": 4,
+                "min_seq_len": 2,
+                "task_df": TASK_DF,
+            },
+        ]
+
+        for C in cases:
+            with self.subTest(C["msg"]):
+                get_pyd_kwargs = {
+                    "max_seq_len": C["max_seq_len"],
+                    "min_seq_len": C["min_seq_len"],
+                    "do_include_subject_id": True,
+                    "do_include_start_time_min": True,
+                }
+                if "task_df" in C:
+                    get_pyd_kwargs["task_df"] = C["task_df"]
+
+                _, rows_pyd = self.get_pyd(cached_data_storage="rows", **get_pyd_kwargs)
+                want_items = [rows_pyd._seeded_getitem(i, seed=1) for i in range(len(rows_pyd))]
+                want_batch = rows_pyd.collate(want_items)
+
+                for storage in ("columnar", "memmap"):
+                    _, pyd = self.get_pyd(cached_data_storage=storage, **get_pyd_kwargs)
+
+                    self.assertEqual(len(rows_pyd), len(pyd))
+                    self.assertEqual(set(rows_pyd.columns), set(pyd.columns))
+
+                    got_items = [pyd._seeded_getitem(i, seed=1) for i in range(len(pyd))]
+
+                    for want_it, got_it in zip(want_items, got_items):
+                        self.assertEqual(want_it.keys(), got_it.keys())
+                        self.assertEqual(want_it["subject_id"], got_it["subject_id"])
+                        self.assertEqual(want_it["start_time"], got_it["start_time"])
+
+                    self.assertNestedDictEqual(asdict(want_batch), asdict(pyd.collate(got_items)))
+
+    def test_task_index(self):
+        with TemporaryDirectory() as d:
+            save_dir = Path(d)
+            DL_fp = save_dir / "DL_reps" / "fake_split.parquet"
+            DL_fp.parent.mkdir(parents=True, exist_ok=True)
+            DL_REP_DF.write_parquet(DL_fp)
+
+            raw_task_df_fp = save_dir / "task_dfs" / "fake_task.parquet"
+            raw_task_df_fp.parent.mkdir(parents=True, exist_ok=True)
+            TASK_DF.write_parquet(raw_task_df_fp)
+
+            VocabularyConfig().to_json_file(save_dir / "vocabulary_config.json")
+            with open(save_dir / "inferred_measurement_configs.json", mode="w") as f:
+                json.dump({}, f)
+
+            config = PytorchDatasetConfig(
+                save_dir=save_dir, task_df_name="fake_task", max_seq_len=4, min_seq_len=2
+            )
+            pyd = PytorchDataset(config=config, split="fake_split")
+            want_items = [pyd._seeded_getitem(i, seed=1) for i in range(len(pyd))]
+
+            task_dir = save_dir / "DL_reps" / "for_task" / "fake_task"
+            self.assertEqual([], list(task_dir.glob("*.parquet")))
+            self.assertEqual(["fake_split.parquet"], [fp.name for fp in (task_dir / "index").iterdir()])
+
+            got_index = pl.read_parquet(task_dir / "index" / "fake_split.parquet")
+            self.assertEqual(
+                ["subject_id", "shard_row_idx", "start_event_idx", "end_event_idx", *TASK_DF.columns[3:]],
+                got_index.columns,
+            )
+
+            raw_task_df_fp.unlink()
+            for storage in ("rows", "memmap"):
+                config.cached_data_storage = storage
+                reloaded_pyd = PytorchDataset(config=config, split="fake_split")
+                self.assertEqual(pyd.tasks, reloaded_pyd.tasks)
+                got_items = [reloaded_pyd._seeded_getitem(i, seed=1) for i in range(len(reloaded_pyd))]
+                self.assertNestedDictEqual(
+                    asdict(pyd.collate(want_items)), asdict(reloaded_pyd.collate(got_items))
+                )
+
+    def test_task_index_rebuilt_when_stale_or_missing(self):
+        def make_save_dir(save_dir: Path, DL_rep_df: pl.DataFrame) -> PytorchDatasetConfig:
+            DL_fp = save_dir / "DL_reps" / "fake_split.parquet"
+            DL_fp.parent.mkdir(parents=True, exist_ok=True)
+            DL_rep_df.write_parquet(DL_fp)
+
+            raw_task_df_fp = save_dir / "task_dfs" / "fake_task.parquet"
+            raw_task_df_fp.parent.mkdir(parents=True, exist_ok=True)
+            TASK_DF.write_parquet(raw_task_df_fp)
+
+            VocabularyConfig().to_json_file(save_dir / "vocabulary_config.json")
+            with open(save_dir / "inferred_measurement_configs.json", mode="w") as f:
+                json.dump({}, f)
+
+            return PytorchDatasetConfig(
+                save_dir=save_dir,
+                task_df_name="fake_task",
+                max_seq_len=4,
+                min_seq_len=2,
+                do_include_subject_id=True,
+            )
+
+        def get_batch(pyd: PytorchDataset) -> dict:
+            return asdict(pyd.collate([pyd._seeded_getitem(i, seed=1) for i in range(len(pyd))]))
+
+        with TemporaryDirectory() as d, TemporaryDirectory() as want_d:
+            save_dir = Path(d)
+            config = make_save_dir(save_dir, DL_REP_DF)
+            PytorchDataset(config=config, split="fake_split")
+
+            # Re-caching the data in a different order moves subjects to different rows.
+            recached_DL_REP_DF = DL_REP_DF.reverse()
+            recached_DL_REP_DF.write_parquet(save_dir / "DL_reps" / "fake_split.parquet")
+            want_pyd = PytorchDataset(
+                config=make_save_dir(Path(want_d), recached_DL_REP_DF), split="fake_split"
+            )
+
+            for storage in ("rows", "memmap"):
+                with self.subTest(f"Should rebuild out of date task indices in {storage} storage mode"):
+                    config.cached_data_storage = storage
+                    got_pyd = PytorchDataset(config=config, split="fake_split")
+                    self.assertNestedDictEqual(get_batch(want_pyd), get_batch(got_pyd))
+
+            with self.subTest("Should build task indices for new cached data files"):
+                DL_REP_DF.write_parquet(save_dir / "DL_reps" / "fake_split_1.parquet")
+                got_pyd = PytorchDataset(config=config, split="fake_split")
+                self.assertEqual(
+                    ["fake_split.parquet", "fake_split_1.parquet"],
+                    sorted(
+                        fp.name
+                        for fp in (save_dir / "DL_reps" / "for_task" / "fake_task" / "index").iterdir()
+                    ),
+                )
+                self.assertEqual(2 * len(want_pyd), len(got_pyd))
+
+            with self.subTest("Should error if a task index is out of date and can't be rebuilt"):
+                (save_dir / "task_dfs" / "fake_task.parquet").unlink()
+                DL_REP_DF.write_parquet(save_dir / "DL_reps" / "fake_split.parquet")
+                with self.assertRaises(FileNotFoundError):
+                    PytorchDataset(config=config, split="fake_split")
+
+    def test_memmap_rewritten_when_stale(self):
+        with TemporaryDirectory() as d:
+            save_dir = Path(d)
+            DL_fp = save_dir / "DL_reps" / "fake_split.parquet"
+            DL_fp.parent.mkdir(parents=True, exist_ok=True)
+            DL_REP_DF.write_parquet(DL_fp)
+
+            VocabularyConfig().to_json_file(save_dir / "vocabulary_config.json")
+            with open(save_dir / "inferred_measurement_configs.json", mode="w") as f:
+                json.dump({}, f)
+
+            config = PytorchDatasetConfig(
+                save_dir=save_dir, max_seq_len=4, min_seq_len=2, cached_data_storage="memmap"
+            )
+            PytorchDataset(config=config, split="fake_split")
+            self.assertTrue(ColumnarCachedData.is_current(DL_fp.with_suffix(".memmap"), DL_fp))
+
+            # Re-caching the data in a different order must not leave the memory-mapped copy pointing at the
+            # old rows.
+            DL_REP_DF.reverse().write_parquet(DL_fp)
+            self.assertFalse(ColumnarCachedData.is_current(DL_fp.with_suffix(".memmap"), DL_fp))
+
+            got_pyd = PytorchDataset(config=config, split="fake_split")
+            config.cached_data_storage = "rows"
+            want_pyd = PytorchDataset(config=config, split="fake_split")
+
+            self.assertEqual(len(want_pyd), len(got_pyd))
+            want_items = [want_pyd._seeded_getitem(i, seed=1) for i in range(len(want_pyd))]
+            got_items = [got_pyd._seeded_getitem(i, seed=1) for i in range(len(got_pyd))]
+            self.assertNestedDictEqual(
+                asdict(want_pyd.collate(want_items)), asdict(got_pyd.collate(got_items))
+            )
+
+    def test_memmap_concurrent_first_use(self):
+        with TemporaryDirectory() as d:
+            save_dir = Path(d)
+            DL_fp = save_dir / "DL_reps" / "fake_split.parquet"
+            DL_fp.parent.mkdir(parents=True, exist_ok=True)
+            DL_REP_DF.write_parquet(DL_fp)
+
+            VocabularyConfig().to_json_file(save_dir / "vocabulary_config.json")
+            with open(save_dir / "inferred_measurement_configs.json", mode="w") as f:
+                json.dump({}, f)
+
+            config = PytorchDatasetConfig(
+                save_dir=save_dir, max_seq_len=4, min_seq_len=2, cached_data_storage="memmap"
+            )
+            pyd = PytorchDataset(config=config, split="fake_split")
+            want = asdict(pyd.collate(get_seeded_items(config)))
+
+            # Re-saving keeps the buffers already opened by a reader intact.
+            memmap_dir = DL_fp.with_suffix(".memmap")
+            ColumnarCachedData.from_df(DL_REP_DF.reverse()).save(memmap_dir, do_overwrite=True)
+            got = [pyd._seeded_getitem(i, seed=1) for i in range(len(pyd))]
+            self.assertNestedDictEqual(want, asdict(pyd.collate(got)))
+
+            # As would several DDP ranks, processes opening a stale memory-mapped copy at once must each get
+            # the data from the parquet file.
+            DL_REP_DF.reverse().write_parquet(DL_fp)
+            config.cached_data_storage = "rows"
+            want_pyd = PytorchDataset(config=config, split="fake_split")
+            want = asdict(want_pyd.collate(get_seeded_items(config)))
+
+            config.cached_data_storage = "memmap"
+            with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for got in pool.map(get_seeded_items, [config] * 4):
+                    self.assertNestedDictEqual(want, asdict(want_pyd.collate(got)))
+
+            self.assertEqual(
+                [
+                    "fake_split.memmap",
+                    "fake_split.memmap.lock",
+                    "fake_split.parquet",
+                    "fake_split.stats.json",
+                ],
+                sorted(fp.name for fp in DL_fp.parent.iterdir()),
+            )
+
+    def test_cached_data_stats(self):
+        with TemporaryDirectory() as d:
+            save_dir = Path(d)
+            DL_fp = save_dir / "DL_reps" / "fake_split.parquet"
+            DL_fp.parent.mkdir(parents=True, exist_ok=True)
+            DL_REP_DF.write_parquet(DL_fp)
+
+            VocabularyConfig().to_json_file(save_dir / "vocabulary_config.json")
+            with open(save_dir / "inferred_measurement_configs.json", mode="w") as f:
+                json.dump({}, f)
+
+            config = PytorchDatasetConfig(save_dir=save_dir, max_seq_len=4, min_seq_len=2)
+
+            log_inter_event_times = (
+                DL_REP_DF.filter(pl.col("dynamic_indices").list.lengths() >= 2)
+                .select(pl.col("time").list.eval((pl.element().shift(-1) - pl.element()).fill_null(1)))
+                .get_column("time")
+                .explode()
+                .drop_nulls()
+                .log()
+            )
+
+            pyd = PytorchDataset(config=config, split="fake_split")
+            self.assertAlmostEqual(log_inter_event_times.mean(), pyd.mean_log_inter_event_time_min)
+            self.assertAlmostEqual(log_inter_event_times.std(), pyd.std_log_inter_event_time_min)
+
+            stats_fp = save_dir / "DL_reps" / "fake_split.stats.json"
+            self.assertTrue(stats_fp.is_file())
+            stats_mtime = stats_fp.stat().st_mtime_ns
+
+            reloaded_pyd = PytorchDataset(config=config, split="fake_split")
+            self.assertEqual(stats_mtime, stats_fp.stat().st_mtime_ns)
+            self.assertEqual(pyd.mean_log_inter_event_time_min, reloaded_pyd.mean_log_inter_event_time_min)
+            self.assertEqual(pyd.std_log_inter_event_time_min, reloaded_pyd.std_log_inter_event_time_min)
+            self.assertEqual(pyd.subject_ids, reloaded_pyd.subject_ids)
+
+            # Copying the cached data without preserving its timestamps should not invalidate its statistics.
+            os.utime(DL_fp, ns=(0, 0))
+            PytorchDataset(config=config, split="fake_split")
+            self.assertEqual(stats_mtime, stats_fp.stat().st_mtime_ns)
+
+            # Changing the cached data should invalidate its statistics.
+            DL_REP_DF.with_columns(
+                pl.when(pl.col("subject_id") == 1)
+                .then(pl.col("time").list.eval(pl.element() * 0))
+                .otherwise(pl.col("time"))
+                .alias("time")
+            ).write_parquet(DL_fp)
+
+            malformed_pyd = PytorchDataset(config=config, split="fake_split")
+            self.assertEqual([s for s in pyd.subject_ids if s != 1], malformed_pyd.subject_ids)
+            self.assertTrue((save_dir / "malformed_data_fake_split.parquet").is_file())
+
+    def test_subject_sizes(self):
+        for storage in ("rows", "columnar", "memmap"):
+            with self.subTest(f"Should record per-subject sizes in {storage} storage mode."):
+                _, pyd = self.get_pyd(max_seq_len=3, min_seq_len=2, cached_data_storage=storage)
+
+                self.assertEqual(len(pyd), len(pyd.seq_lens))
+                self.assertEqual(len(pyd), len(pyd.n_data_per_event))
+                for i in range(len(pyd)):
+                    item = pyd._seeded_getitem(i, seed=1)
+                    self.assertEqual(len(item["time_delta"]), pyd.seq_lens[i])
+                    self.assertLessEqual(
+                        max(len(x) for x in item["dynamic_indices"]), pyd.n_data_per_event[i]
+                    )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+import sys
+
+sys.path.append("../..")
+
+import unittest
+
+import numpy as np
+import torch
+from lightning.pytorch.utilities.data import _update_dataloader
+
+from EventStream.data.sampler import LengthBucketedBatchSampler
+
+
+class TestLengthBucketedBatchSampler(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.seq_lens = rng.integers(1, 100, size=53)
+        self.n_data_per_event = rng.integers(1, 10, size=53)
+
+    def get_sampler(self, **kwargs) -> LengthBucketedBatchSampler:
+        kwargs = {
+            "batch_size": 4,
+            "drop_last": False,
+            "seq_lens": self.seq_lens,
+            "n_data_per_event": self.n_data_per_event,
+            "pool_size_multiplier": 5,
+            **kwargs,
+        }
+        return LengthBucketedBatchSampler(torch.utils.data.RandomSampler(range(53)), **kwargs)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.get_sampler(n_data_per_event=self.n_data_per_event[:-1])
+        with self.assertRaises(ValueError):
+            self.get_sampler(max_tokens_per_batch=0)
+        with self.assertRaises(ValueError):
+            self.get_sampler(pool_size_multiplier=0)
+
+    def test_batches_by_count(self):
+        sampler = self.get_sampler()
+        batches = list(sampler)
+
+        self.assertEqual(len(sampler), len(batches))
+        self.assertEqual(list(range(53)), sorted(i for b in batches for i in b))
+        self.assertEqual(1, sum(len(b) != 4 for b in batches))
+
+        sampler = self.get_sampler(drop_last=True)
+        batches = list(sampler)
+        self.assertEqual(13, len(sampler))
+        self.assertEqual(13, len(batches))
+        self.assertTrue(all(len(b) == 4 for b in batches))
+
+    def test_reduces_padding(self):
+        def padded_size(batches: list[list[int]]) -> int:
+            return sum(len(b) * self.seq_lens[b].max() * self.n_data_per_event[b].max() for b in batches)
+
+        torch.manual_seed(1)
+        random_batches = list(torch.utils.data.BatchSampler(torch.randperm(53).tolist(), 4, False))
+
+        self.assertLess(padded_size(list(self.get_sampler())), padded_size(random_batches))
+
+    def test_token_budget(self):
+        max_tokens = 600
+        sampler = self.get_sampler(max_tokens_per_batch=max_tokens, batch_size=8)
+        batches = list(sampler)
+
+        self.assertEqual(len(sampler), len(batches))
+        self.assertEqual(list(range(53)), sorted(i for b in batches for i in b))
+        for b in batches:
+            self.assertLessEqual(len(b), 8)
+            if len(b) > 1:
+                self.assertLessEqual(
+                    len(b) * self.seq_lens[b].max() * self.n_data_per_event[b].max(), max_tokens
+                )
+
+    def test_shuffle_batches(self):
+        sampler = LengthBucketedBatchSampler(
+            range(53),
+            batch_size=4,
+            drop_last=False,
+            seq_lens=self.seq_lens,
+            n_data_per_event=self.n_data_per_event,
+            pool_size_multiplier=100,
+            shuffle_batches=False,
+        )
+        batches = list(sampler)
+        lens = [self.seq_lens[b].max() for b in batches]
+        self.assertEqual(sorted(lens), lens)
+
+        sampler.shuffle_batches = True
+        sampler.generator = torch.Generator().manual_seed(1)
+        shuffled = list(sampler)
+        self.assertNotEqual(batches, shuffled)
+        self.assertEqual(sorted(batches), sorted(shuffled))
+
+    def test_distributed_sampler_injection(self):
+        dataset = list(range(53))
+        sampler = self.get_sampler(shuffle_batches=False, max_tokens_per_batch=10**6)
+        dataloader = torch.utils.data.DataLoader(dataset, batch_sampler=sampler)
+
+        rank_batches = []
+        for rank in range(2):
+            dist_sampler = torch.utils.data.DistributedSampler(
+                dataset, num_replicas=2, rank=rank, shuffle=True
+            )
+            got = _update_dataloader(dataloader, dist_sampler).batch_sampler
+
+            self.assertIsInstance(got, LengthBucketedBatchSampler)
+            self.assertIs(dist_sampler, got.sampler)
+            for attr in ("batch_size", "drop_last", "max_tokens_per_batch", "pool_size_multiplier"):
+                self.assertEqual(getattr(sampler, attr), getattr(got, attr), msg=attr)
+            self.assertFalse(got.shuffle_batches)
+            np.testing.assert_array_equal(sampler.seq_lens, got.seq_lens)
+            np.testing.assert_array_equal(sampler.n_data_per_event, got.n_data_per_event)
+
+            batches = list(got)
+            self.assertEqual(len(got), len(batches))
+            self.assertEqual(sorted(dist_sampler), sorted(i for b in batches for i in b))
+            rank_batches.append(batches)
+
+        # Each rank batches its own shard (the distributed sampler pads the last shard by repeating indices).
+        self.assertEqual(set(dataset), {i for batches in rank_batches for b in batches for i in b})
+        self.assertEqual(len(rank_batches[0]), len(rank_batches[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
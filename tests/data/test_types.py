@@ -149,6 +149,16 @@ class TestPytorchBatch(ConfigComparisonsMixin, unittest.TestCase):
                     ),
                 ),
             },
+            {
+                "msg": "Should select batch elements when given a long tensor index",
+                "index": torch.LongTensor([1]),
+                "want": self.batch[1:2],
+            },
+            {
+                "msg": "Should error when given a non-long tensor index",
+                "index": torch.BoolTensor([False, True]),
+                "should_raise": ValueError,
+            },
             {
                 "msg": "Should error when given an empty index",
                 "index": tuple(),
@@ -9,6 +9,8 @@ import torch
 from EventStream.data.types import PytorchBatch
 from EventStream.transformer.generation.generation_stopping_criteria import (
     MaxLengthCriteria,
+    MaxTimeCriteria,
+    ObservedIndicesCriteria,
     StoppingCriteriaList,
 )
 
@@ -74,6 +76,48 @@ class TestMaxLengthCriteria(unittest.TestCase):
         self.assertTrue(C(self.batch, None))
 
 
+MULTI_SEQUENCE_BATCH = {
+    "event_mask": torch.BoolTensor([[False, True, True], [True, True, True], [True, True, False]]),
+    "time_delta": torch.FloatTensor([[0, 2, 1], [4, 3, 1], [1, 8, 0]]),
+    "dynamic_indices": torch.LongTensor(
+        [
+            [[0, 0], [1, 0], [2, 5]],
+            [[1, 0], [2, 0], [3, 4]],
+            [[1, 0], [5, 0], [0, 0]],
+        ]
+    ),
+}
+
+
+class TestMaxTimeCriteria(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = PytorchBatch(**MULTI_SEQUENCE_BATCH)
+
+    def test_criteria(self):
+        C = MaxTimeCriteria(3)
+        self.assertEqual(C(self.batch, None).tolist(), [False, True, True])
+
+        C = MaxTimeCriteria(2, reference_event_index=1)
+        self.assertEqual(C(self.batch, None).tolist(), [False, True, True])
+
+        C = MaxTimeCriteria(3, reference_event_index=1)
+        self.assertEqual(C(self.batch, None).tolist(), [False, False, True])
+
+
+class TestObservedIndicesCriteria(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = PytorchBatch(**MULTI_SEQUENCE_BATCH)
+
+    def test_criteria(self):
+        C = ObservedIndicesCriteria([4, 5])
+        self.assertEqual(C(self.batch, None).tolist(), [True, True, False])
+
+        C = ObservedIndicesCriteria([1])
+        self.assertEqual(C(self.batch, None).tolist(), [False, False, False])
+
+
 class TestStoppingCriteriaList(unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -84,3 +128,12 @@ class TestStoppingCriteriaList(unittest.TestCase):
         self.assertFalse(C(self.batch, None))
         C = StoppingCriteriaList([MaxLengthCriteria(5), MaxLengthCriteria(4)])
         self.assertTrue(C(self.batch, None))
+
+    def test_per_sequence_criteria(self):
+        batch = PytorchBatch(**MULTI_SEQUENCE_BATCH)
+
+        C = StoppingCriteriaList([MaxLengthCriteria(5), ObservedIndicesCriteria([4]), MaxTimeCriteria(3)])
+        self.assertEqual(C(batch, None).tolist(), [False, True, True])
+
+        C = StoppingCriteriaList([ObservedIndicesCriteria([4]), MaxLengthCriteria(3)])
+        self.assertIs(C(batch, None), True)
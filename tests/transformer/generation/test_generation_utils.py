@@ -295,6 +295,7 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
             "return_dict_in_generate": False,
             "max_length": 10,
             "max_seq_len": 20,
+            "use_cache": "config",
             "structured_event_processing_mode": StructuredEventProcessingMode.CONDITIONALLY_INDEPENDENT,
         }
         cases = [
@@ -349,6 +350,16 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
                 },
                 "want_call_sample_CI": True,
             },
+            {
+                "msg": "Should reflect use_cache=False passed by kwargs",
+                "kwargs": {"use_cache": False},
+                "want_model_kwargs": {
+                    "output_attentions": "config",
+                    "output_hidden_states": "config",
+                    "use_cache": False,
+                },
+                "want_call_sample_CI": True,
+            },
             {
                 "msg": "Should Error if passed an invalid structured event processing mode.",
                 "config_params": {"structured_event_processing_mode": "foobar"},
@@ -366,6 +377,37 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
                 },
                 "want_call_sample_NA": True,
             },
+            {
+                "msg": "Should validate every event and dependency graph level in full validation mode",
+                "kwargs": {"validation_mode": "full"},
+                "config_params": {
+                    "structured_event_processing_mode": StructuredEventProcessingMode.NESTED_ATTENTION
+                },
+                "want_model_kwargs": {
+                    "output_attentions": "config",
+                    "output_hidden_states": "config",
+                    "use_cache": None,
+                },
+                "want_call_sample_NA": True,
+                "want_validate_dep_graph_levels": True,
+                "want_validation_interval": 1,
+            },
+            {
+                "msg": "Should validate every validation_interval events in sampled validation mode",
+                "kwargs": {"validation_mode": "sampled", "validation_interval": 2},
+                "want_model_kwargs": {
+                    "output_attentions": "config",
+                    "output_hidden_states": "config",
+                    "use_cache": None,
+                },
+                "want_call_sample_CI": True,
+                "want_validation_interval": 2,
+            },
+            {
+                "msg": "Should error if the validation interval is invalid.",
+                "kwargs": {"validation_mode": "sampled", "validation_interval": 0},
+                "should_raise": ValueError,
+            },
             {
                 "msg": "Should error if passed both max new events and max length.",
                 "kwargs": {"max_length": 4, "max_new_events": 10},
@@ -416,6 +458,7 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
                 M._nested_attention_sample_event = Mock(side_effect=NA_sample_mocks)
 
                 M._expand_inputs_for_generation = MagicMock()
+                M._validate_batch = Mock()
 
                 stopping_criteria = Mock(side_effect=[False] * (want_n_events - 1) + [True])
                 M._get_stopping_criteria = Mock(return_value=stopping_criteria)
@@ -448,10 +491,21 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
                     )
                     batch = M._expand_inputs_for_generation.return_value
 
-                    model_kwargs = case.get("want_model_kwargs", {})
+                    model_kwargs = {**case.get("want_model_kwargs", {}), "max_length": max_length}
+                    validation_interval = case.get("want_validation_interval", None)
                     want_sample_calls = []
+                    want_validate_calls = []
                     for event in range(want_n_events):
-                        want_sample_calls.append(call(batch, event, **model_kwargs))
+                        if validation_interval is not None and event % validation_interval == 0:
+                            want_validate_calls.append(call(batch, f"on index {event}"))
+
+                        if case.get("want_call_sample_NA", False):
+                            validate_levels = case.get("want_validate_dep_graph_levels", False)
+                            want_sample_calls.append(
+                                call(batch, event, validate_dep_graph_levels=validate_levels, **model_kwargs)
+                            )
+                        else:
+                            want_sample_calls.append(call(batch, event, **model_kwargs))
 
                         if case.get("want_call_sample_CI", False):
                             sample = CI_sample_mocks[event]
@@ -475,6 +529,8 @@ class TestGenerationUtils(ConfigComparisonsMixin, unittest.TestCase):
                     else:
                         M._nested_attention_sample_event.assert_not_called()
 
+                    self.assertNestedCalledWith(M._validate_batch, want_validate_calls)
+
                     self.assertEqual(got, batch)
 
     def test_conditionally_independent_sample_event(self):
@@ -19,13 +19,17 @@ from EventStream.transformer.config import (
     StructuredEventProcessingMode,
     StructuredTransformerConfig,
 )
+from EventStream.transformer.generation.generation_stopping_criteria import (
+    PerSequenceStoppingCriteria,
+    StoppingCriteriaList,
+)
 from EventStream.transformer.model_output import (
     GenerativeSequenceModelLabels,
     GenerativeSequenceModelLosses,
     GenerativeSequenceModelOutput,
     GenerativeSequenceModelPredictions,
 )
-from EventStream.transformer.transformer import expand_mask
+from EventStream.transformer.transformer import PreallocatedKVCache, expand_mask
 
 from ..utils import ConfigComparisonsMixin, MockModule
 
@@ -380,6 +384,15 @@ class TestConditionallyIndependentGenerativeOutputLayer(ConfigComparisonsMixin,
                     self.assertNestedCalledWith(M.get_TTE_outputs, TTE_calls)
 
 
+class FinishFirstActiveSequence(PerSequenceStoppingCriteria):
+    """Finishes the first sequence still being generated at every step."""
+
+    def __call__(self, batch, outputs, **kwargs):
+        is_finished = torch.zeros(batch.batch_size, dtype=torch.bool)
+        is_finished[0] = True
+        return is_finished
+
+
 class TestCIPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -480,6 +493,27 @@ class TestCIPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     want = case["want"]
                     self.assertNestedDictEqual(want, got)
 
+    def test_prepare_inputs_for_generation_preallocates_cache(self):
+        batch = PytorchBatch(
+            time_delta=torch.Tensor([[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]]),
+            event_mask=torch.BoolTensor([[True, False, True], [True, True, True]]),
+            dynamic_indices=torch.LongTensor([[[1], [2], [3]], [[4], [5], [6]]]),
+            dynamic_measurement_indices=torch.LongTensor([[[1], [1], [1]], [[1], [1], [1]]]),
+            dynamic_values=torch.FloatTensor([[[0], [0], [0]], [[0], [0], [0]]]),
+            dynamic_values_mask=torch.BoolTensor([[[False], [False], [False]], [[False], [False], [False]]]),
+        )
+
+        got = self.M.prepare_inputs_for_generation(batch, past=None, max_length=7, use_cache=True)
+
+        self.assertEqual(batch, got["batch"])
+        self.assertNotIn("max_length", got)
+        self.assertEqual(self.config.num_hidden_layers, len(got["past"]))
+        for layer_past in got["past"]:
+            self.assertIsInstance(layer_past, PreallocatedKVCache)
+            self.assertEqual(7, layer_past.capacity)
+            self.assertEqual(0, layer_past.length)
+            self.assertEqual(2, layer_past.key.shape[0])
+
     def test_forward(self):
         cases = [
             {
@@ -532,6 +566,18 @@ class TestCIPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     is_generation=is_generation,
                 )
 
+    def test_compiles_without_graph_breaks(self):
+        self.addCleanup(torch._dynamo.reset)
+        # Distribution argument validation can't be traced; dynamo disables it globally the first time it
+        # runs, so we disable it here and restore it afterwards to keep other tests unaffected.
+        self.addCleanup(
+            torch.distributions.Distribution.set_default_validate_args,
+            torch.distributions.Distribution._validate_args,
+        )
+        torch.distributions.Distribution.set_default_validate_args(False)
+        compiled = torch.compile(self.M, backend="eager", fullgraph=True)
+        torch.testing.assert_close(self.M(self.batch).loss, compiled(self.batch).loss)
+
     def test_generation_shapes(self):
         num_return_sequences = 2
         max_new_events = 5
@@ -599,6 +645,50 @@ class TestCIPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
         with self.assertRaises(AssertionError):
             self.assertEqual(out_1_seed_1, out_1_seed_2)
 
+    def test_generation_with_per_sequence_stopping(self):
+        generation_kwargs = dict(
+            max_new_events=5,
+            num_return_sequences=2,
+            do_sample=True,
+            return_dict_in_generate=False,
+            output_scores=False,
+            output_attentions=False,
+            output_hidden_states=False,
+        )
+
+        input_seq_length = self.batch.sequence_length
+
+        outs = {}
+        for use_cache in (False, True):
+            with self.subTest(use_cache=use_cache):
+                L.seed_everything(1)
+                out_full = self.M.generate(self.batch, **generation_kwargs, use_cache=use_cache)
+
+                L.seed_everything(1)
+                out = self.M.generate(
+                    self.batch,
+                    **generation_kwargs,
+                    use_cache=use_cache,
+                    stopping_criteria=StoppingCriteriaList([FinishFirstActiveSequence()]),
+                )
+
+                # One sequence finishes per generated event, until the last one does.
+                self.assertEqual(out_full.batch_size, out.batch_size)
+                self.assertEqual(input_seq_length + out.batch_size, out.sequence_length)
+                for i in range(out.batch_size):
+                    self.assertFalse(out.event_mask[i, input_seq_length + i + 1 :].any())
+
+                # The first event is generated for the full batch, as it is without stopping criteria.
+                M = min(out.n_data_elements, out_full.n_data_elements)
+                self.assertEqual(
+                    out_full.dynamic_indices[0, : input_seq_length + 1, :M],
+                    out.dynamic_indices[0, : input_seq_length + 1, :M],
+                )
+                outs[use_cache] = out
+
+        # Dropping finished sequences from the cache must not change what is generated.
+        self.assertEqual(outs[False], outs[True])
+
     def test_generation_identical_with_or_without_caching(self):
         # We want to check that the output doesn't change when we do or do not use caching. To do this, we'll
         # run the model over a partial batch without caching and store the result. Then, we'll run the model
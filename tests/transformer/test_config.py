@@ -7,6 +7,8 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from unittest.mock import MagicMock
 
+import numpy as np
+
 from EventStream.data.types import DataModality
 from EventStream.transformer.config import (
     Averaging,
@@ -196,6 +198,32 @@ class TestOptimizationConfig(unittest.TestCase):
         self.assertEqual(10 * 3, cfg.max_training_steps)
         self.assertEqual(6, cfg.lr_num_warmup_steps)
 
+    def test_dataloader_batching_kwargs(self):
+        with self.assertRaises(ValueError):
+            OptimizationConfig(**{**DEFAULT_OPT_CONFIG_DICT, "max_tokens_per_batch": 10})
+
+        cfg = OptimizationConfig(
+            **{
+                **DEFAULT_OPT_CONFIG_DICT,
+                "batch_size": 2,
+                "validation_batch_size": 3,
+                "do_length_bucketed_batching": True,
+            }
+        )
+
+        pyd = MagicMock()
+        pyd.__len__.return_value = 6
+        pyd.seq_lens = np.array([5, 1, 4, 2, 3, 6])
+        pyd.n_data_per_event = np.array([1, 1, 1, 1, 1, 1])
+
+        train_kwargs = cfg.dataloader_batching_kwargs(pyd, is_train=True)
+        self.assertEqual({"batch_sampler"}, set(train_kwargs.keys()))
+        self.assertEqual(3, len(train_kwargs["batch_sampler"]))
+        self.assertEqual(set(range(6)), {i for b in train_kwargs["batch_sampler"] for i in b})
+
+        tuning_kwargs = cfg.dataloader_batching_kwargs(pyd, is_train=False)
+        self.assertEqual([[1, 3, 4], [2, 0, 5]], list(tuning_kwargs["batch_sampler"]))
+
 
 DEFAULT_MAIN_CONFIG_DICT = dict(
     vocab_sizes_by_measurement=None,
@@ -333,6 +361,22 @@ class TestStructuredTransformerConfig(ConfigComparisonsMixin, unittest.TestCase)
                 },
                 "should_raise": TypeError,
             },
+            {
+                "msg": "Should construct with the sdpa attention implementation.",
+                "kwargs": {"attention_implementation": "sdpa"},
+            },
+            {
+                "msg": "Should error when the attention implementation is invalid.",
+                "kwargs": {"attention_implementation": "flash"},
+                "should_raise": ValueError,
+            },
+            {
+                "msg": "Should construct with packed sequences.",
+                "kwargs": [
+                    {**DEFAULT_CONDITIONALLY_INDEPENDENT_DICT, "do_pack_sequences": True},
+                    {**DEFAULT_NESTED_ATTENTION_DICT, "do_pack_sequences": True},
+                ],
+            },
             {
                 "msg": "Should error when is specified as encoder_decoder.",
                 "kwargs": {"is_encoder_decoder": True},
@@ -12,7 +12,12 @@ from pytorch_lognormal_mixture import LogNormalMixtureDistribution
 
 from EventStream.data.config import MeasurementConfig
 from EventStream.data.time_dependent_functor import AgeFunctor, TimeOfDayFunctor
-from EventStream.data.types import DataModality, PytorchBatch, TemporalityType
+from EventStream.data.types import (
+    DataModality,
+    PreallocatedPytorchBatch,
+    PytorchBatch,
+    TemporalityType,
+)
 from EventStream.data.vocabulary import Vocabulary
 from EventStream.transformer.config import StructuredTransformerConfig
 from EventStream.transformer.model_output import (
@@ -831,6 +836,32 @@ class TestGenerativeSequenceModelSamples(MLTypeEqualityCheckableMixin, unittest.
                 want_batch, {k: v for k, v in batch.items()}, f"Batch failed for {meas_to_fill}"
             )
 
+    def test_e2e_preallocated(self):
+        batch = PytorchBatch(**copy.deepcopy(BASE_BATCH))
+        buffered = PreallocatedPytorchBatch.from_batch(
+            PytorchBatch(**copy.deepcopy(BASE_BATCH)), max_sequence_length=batch.sequence_length + 1
+        )
+
+        batch = self.samp.append_to_batch(batch, self.config)
+        got = self.samp.append_to_batch(buffered, self.config)
+        self.assertIs(got, buffered)
+        self.assertNestedDictEqual(dict(batch.items()), dict(buffered.items()))
+
+        for meas_to_fill, _ in WANT_UPDATED_DATA:
+            batch = self.samp.update_last_event_data(
+                batch=batch, config=self.config, measurements_to_fill=meas_to_fill
+            )
+            got = self.samp.update_last_event_data(
+                batch=buffered, config=self.config, measurements_to_fill=meas_to_fill
+            )
+            self.assertIs(got, buffered)
+            self.assertNestedDictEqual(
+                dict(batch.items()), dict(buffered.items()), f"Batch failed for {meas_to_fill}"
+            )
+
+        with self.assertRaises(ValueError):
+            self.samp.append_to_batch(buffered, self.config)
+
 
 TEST_MEASUREMENTS_PER_GEN_MODE = {
     DataModality.SINGLE_LABEL_CLASSIFICATION: ["event_type"],
@@ -920,6 +951,38 @@ class TestGenerativeOutputLayerBase(MLTypeEqualityCheckableMixin, unittest.TestC
         config = StructuredTransformerConfig(**BASE_CONFIG_KWARGS)
         GenerativeOutputLayerBase(config)
 
+    def test_classification_segments(self):
+        config = StructuredTransformerConfig(**{**BASE_CONFIG_KWARGS, "hidden_size": 10})
+        config.vocab_size = 10
+        layer = GenerativeOutputLayerBase(config)
+
+        self.assertEqual(
+            {"event_type": (1, 3), "multi_label_col": (3, 6), "regression_col": (6, 10)},
+            layer.classification_vocab_range_per_measurement,
+        )
+        self.assertEqual(
+            [3, 0, 0, 1, 1, 1, 2, 2, 2, 2],
+            layer._clf_segment_by_vocab.tolist(),
+            msg=(
+                "Vocabulary elements should map to the segment of their classification measurement, or to "
+                "the trailing unused segment."
+            ),
+        )
+        self.assertFalse(
+            any(k.startswith("_clf_") for k in layer.state_dict()),
+            msg="Segment buffers should not be saved with the model.",
+        )
+
+        # Losses are computed for all measurements at once, so should not depend on which are requested.
+        batch = PytorchBatch(**BASE_BATCH_OUTPUT_LAYER_BASE_TEST)
+        encoded = torch.randn(1, 3, 10)
+        all_losses, _, _ = layer.get_classification_outputs(
+            batch, encoded, set(layer.classification_mode_per_measurement)
+        )
+        for measurement in layer.classification_mode_per_measurement:
+            got_losses, _, _ = layer.get_classification_outputs(batch, encoded, {measurement})
+            self.assertEqual({measurement: all_losses[measurement]}, got_losses)
+
     def test_get_classification_outputs(self):
         cases = [
             {
@@ -15,6 +15,10 @@ from EventStream.transformer.config import (
     StructuredEventProcessingMode,
     StructuredTransformerConfig,
 )
+from EventStream.transformer.generation.generation_stopping_criteria import (
+    PerSequenceStoppingCriteria,
+    StoppingCriteriaList,
+)
 from EventStream.transformer.model_output import (
     GenerativeSequenceModelLabels,
     GenerativeSequenceModelLosses,
@@ -450,6 +454,15 @@ class TestNestedAttentionGenerativeOutputLayer(ConfigComparisonsMixin, unittest.
                     self.assertNestedCalledWith(M.get_TTE_outputs, TTE_calls)
 
 
+class FinishFirstActiveSequence(PerSequenceStoppingCriteria):
+    """Finishes the first sequence still being generated at every step."""
+
+    def __call__(self, batch, outputs, **kwargs):
+        is_finished = torch.zeros(batch.batch_size, dtype=torch.bool)
+        is_finished[0] = True
+        return is_finished
+
+
 class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -489,6 +502,15 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
             dynamic_values_mask=torch.BoolTensor([[[[False, True, True]]]]),
         )
 
+        unsqueezed_batch = PytorchBatch(
+            time_delta=torch.Tensor([[3.0]]),
+            event_mask=torch.BoolTensor([[True]]),
+            dynamic_indices=torch.LongTensor([[[[6, 7, 8]]]]),
+            dynamic_measurement_indices=torch.LongTensor([[[[7, 8, 9]]]]),
+            dynamic_values=torch.FloatTensor([[[[6, 7, 8]]]]),
+            dynamic_values_mask=torch.BoolTensor([[[[False, True, True]]]]),
+        )
+
         cases = [
             {
                 "msg": "Should work with use_cache=False.",
@@ -517,6 +539,7 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     "batch": default_batch,
                     "past": None,
                     "dep_graph_past": None,
+                    "dep_graph_embed_past": None,
                     "use_cache": True,
                 },
             },
@@ -555,6 +578,7 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     "batch": unsqueezed_batch_with_time,
                     "past": 1,
                     "dep_graph_past": None,
+                    "dep_graph_embed_past": None,
                     "use_cache": True,
                     "dep_graph_el_generation_target": None,
                 },
@@ -571,6 +595,7 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     "batch": unsqueezed_batch_with_time,
                     "past": 1,
                     "dep_graph_past": 2,
+                    "dep_graph_embed_past": None,
                     "use_cache": True,
                     "dep_graph_el_generation_target": 1,
                     "seq_attention_mask": default_attention_mask,
@@ -588,11 +613,49 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     "batch": unsqueezed_batch_with_time,
                     "past": 1,
                     "dep_graph_past": 2,
+                    "dep_graph_embed_past": None,
                     "use_cache": True,
                     "dep_graph_el_generation_target": 2,
                     "seq_attention_mask": default_attention_mask,
                 },
             },
+            {
+                "msg": (
+                    "Should ignore dep_graph_embed_past if dep_graph_el_generation_target is <= 1 and "
+                    "dep_graph_past is not None"
+                ),
+                "use_cache": True,
+                "past": {"seq_past": 1, "dep_graph_past": 2, "dep_graph_embed_past": 3},
+                "dep_graph_el_generation_target": 1,
+                "want": {
+                    "batch": unsqueezed_batch_with_time,
+                    "past": 1,
+                    "dep_graph_past": 2,
+                    "dep_graph_embed_past": None,
+                    "use_cache": True,
+                    "dep_graph_el_generation_target": 1,
+                    "seq_attention_mask": default_attention_mask,
+                },
+            },
+            {
+                "msg": (
+                    "Should strip batch down to last sequence element without computing time or the sequence "
+                    "attention mask if dep_graph_el_generation_target is > 1 and dep_graph_embed_past is not "
+                    "None"
+                ),
+                "use_cache": True,
+                "past": {"seq_past": 1, "dep_graph_past": 2, "dep_graph_embed_past": 3},
+                "dep_graph_el_generation_target": 2,
+                "want": {
+                    "batch": unsqueezed_batch,
+                    "past": 1,
+                    "dep_graph_past": 2,
+                    "dep_graph_embed_past": 3,
+                    "use_cache": True,
+                    "dep_graph_el_generation_target": 2,
+                    "seq_attention_mask": None,
+                },
+            },
             {
                 "msg": "Should error if dep_graph_el_generation_target is > 1 and dep_graph_past is None",
                 "use_cache": True,
@@ -605,7 +668,7 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
         for case in cases:
             with self.subTest(msg=case["msg"]):
                 kwargs = dict(
-                    batch=default_batch,
+                    batch=copy.deepcopy(default_batch),
                     **case.get("kwargs", {}),
                 )
 
@@ -678,6 +741,18 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                     dep_graph_el_generation_target=kwargs.get("dep_graph_el_generation_target", None),
                 )
 
+    def test_compiles_without_graph_breaks(self):
+        self.addCleanup(torch._dynamo.reset)
+        # Distribution argument validation can't be traced; dynamo disables it globally the first time it
+        # runs, so we disable it here and restore it afterwards to keep other tests unaffected.
+        self.addCleanup(
+            torch.distributions.Distribution.set_default_validate_args,
+            torch.distributions.Distribution._validate_args,
+        )
+        torch.distributions.Distribution.set_default_validate_args(False)
+        compiled = torch.compile(self.M, backend="eager", fullgraph=True)
+        torch.testing.assert_close(self.M(self.batch).loss, compiled(self.batch).loss)
+
     def test_generation_seed_dependent(self):
         generation_kwargs = dict(
             max_new_events=5,
@@ -744,6 +819,50 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
                 out[i * num_return_sequences, :input_seq_length, :input_n_data_elements],
             )
 
+    def test_generation_with_per_sequence_stopping(self):
+        generation_kwargs = dict(
+            max_new_events=5,
+            num_return_sequences=2,
+            do_sample=True,
+            return_dict_in_generate=False,
+            output_scores=False,
+            output_attentions=False,
+            output_hidden_states=False,
+        )
+
+        input_seq_length = self.batch.sequence_length
+
+        outs = {}
+        for use_cache in (False, True):
+            with self.subTest(use_cache=use_cache):
+                L.seed_everything(1)
+                out_full = self.M.generate(self.batch, **generation_kwargs, use_cache=use_cache)
+
+                L.seed_everything(1)
+                out = self.M.generate(
+                    self.batch,
+                    **generation_kwargs,
+                    use_cache=use_cache,
+                    stopping_criteria=StoppingCriteriaList([FinishFirstActiveSequence()]),
+                )
+
+                # One sequence finishes per generated event, until the last one does.
+                self.assertEqual(out_full.batch_size, out.batch_size)
+                self.assertEqual(input_seq_length + out.batch_size, out.sequence_length)
+                for i in range(out.batch_size):
+                    self.assertFalse(out.event_mask[i, input_seq_length + i + 1 :].any())
+
+                # The first event is generated for the full batch, as it is without stopping criteria.
+                M = min(out.n_data_elements, out_full.n_data_elements)
+                self.assertEqual(
+                    out_full.dynamic_indices[0, : input_seq_length + 1, :M],
+                    out.dynamic_indices[0, : input_seq_length + 1, :M],
+                )
+                outs[use_cache] = out
+
+        # Dropping finished sequences from the cache must not change what is generated.
+        self.assertEqual(outs[False], outs[True])
+
     def test_generation_identical_with_or_without_caching(self):
         # We want to check that the output doesn't change when we do or do not use caching. To do this, we'll
         # run the model over a partial batch without caching and store the result. Then, we'll run the model
@@ -769,6 +888,35 @@ class TestNAPPTForGenerativeSequenceModeling(ConfigComparisonsMixin, unittest.Te
 
         self.assertEqual(out_no_caching, out_with_caching)
 
+    def test_generation_identical_with_or_without_caching_split_embeddings(self):
+        # With split categorical/numerical embeddings, the input embedding of each dependency graph level is
+        # independent of the others, so during cached generation only the newest level is embedded.
+        config = StructuredTransformerConfig(
+            **NA_CONFIG_KWARGS,
+            do_split_embeddings=True,
+            categorical_embedding_dim=4,
+            numerical_embedding_dim=4,
+        )
+        M = NAPPTForGenerativeSequenceModeling(config).cpu()
+        M.eval()
+        self.assertTrue(M.encoder.input_layer.embeds_dep_graph_levels_independently)
+
+        generation_kwargs = dict(
+            max_new_events=15,
+            num_return_sequences=3,
+            do_sample=True,
+            return_dict_in_generate=False,
+            output_scores=False,
+        )
+
+        L.seed_everything(1)
+        out_no_caching = M.generate(self.batch, **generation_kwargs, use_cache=False)
+
+        L.seed_everything(1)
+        out_with_caching = M.generate(self.batch, **generation_kwargs, use_cache=True)
+
+        self.assertEqual(out_no_caching, out_with_caching)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,6 +4,7 @@ sys.path.append("../..")
 
 import copy
 import unittest
+from unittest.mock import patch
 
 import torch
 
@@ -15,7 +16,9 @@ from EventStream.transformer.config import (
 from EventStream.transformer.model_output import TransformerOutputWithPast
 from EventStream.transformer.transformer import (
     ConditionallyIndependentPointProcessTransformer,
+    InnerSelfAttention,
     NestedAttentionPointProcessTransformer,
+    SlidingWindowKVCache,
     expand_mask,
     time_from_deltas,
 )
@@ -206,6 +209,103 @@ class TestConditionallyIndependentTransformer(ConfigComparisonsMixin, unittest.T
         out_seq_to_2 = self.M(self.batch[:, :2])
         self.assertEqual(out_seq_to_2.last_hidden_state, out.last_hidden_state[:, :2])
 
+    def test_sdpa_attention_matches_eager(self):
+        for seq_attention_types in (["local", "global"], "global"):
+            config_kwargs = {**CI_CONFIG_KWARGS, "seq_attention_types": seq_attention_types}
+            M_eager = ConditionallyIndependentPointProcessTransformer(
+                StructuredTransformerConfig(**config_kwargs)
+            )
+            M_eager.eval()
+            M_sdpa = ConditionallyIndependentPointProcessTransformer(
+                StructuredTransformerConfig(**config_kwargs, attention_implementation="sdpa")
+            )
+            M_sdpa.load_state_dict(M_eager.state_dict())
+            M_sdpa.eval()
+
+            # The test sequences are shorter than those the fused kernel would normally be used for.
+            with patch.object(InnerSelfAttention, "SDPA_MIN_KEY_LENGTH", 0):
+                self.assertEqual(M_eager(self.batch), M_sdpa(self.batch))
+
+            # Attention weights can only be returned by the eager implementation, which is used instead.
+            out_eager = M_eager(self.batch, output_attentions=True)
+            out_sdpa = M_sdpa(self.batch, output_attentions=True)
+            self.assertEqual(out_eager, out_sdpa)
+            self.assertIsNotNone(out_sdpa.attentions)
+
+    def test_banded_local_attention_matches_dense(self):
+        config_kwargs = {**CI_CONFIG_KWARGS, "seq_attention_types": ["local", "global"], "seq_window_size": 2}
+        for attention_implementation in ("eager", "sdpa"):
+            M = ConditionallyIndependentPointProcessTransformer(
+                StructuredTransformerConfig(
+                    **config_kwargs, attention_implementation=attention_implementation
+                )
+            )
+            M.eval()
+
+            with patch.object(InnerSelfAttention, "BANDED_MIN_WINDOWS", 0):
+                out_banded = M(self.batch).last_hidden_state
+            with patch.object(InnerSelfAttention, "BANDED_MIN_WINDOWS", self.batch.sequence_length + 1):
+                out_dense = M(self.batch).last_hidden_state
+
+            # Outputs at padding events are not meaningful and may differ between the two.
+            self.assertEqual(out_dense[self.batch.event_mask], out_banded[self.batch.event_mask])
+
+    def test_packed_sequences_match_padded(self):
+        config_kwargs = {**CI_CONFIG_KWARGS, "seq_attention_types": ["local", "global"], "seq_window_size": 2}
+        M_padded = ConditionallyIndependentPointProcessTransformer(
+            StructuredTransformerConfig(**config_kwargs)
+        )
+        M_padded.eval()
+        M_packed = ConditionallyIndependentPointProcessTransformer(
+            StructuredTransformerConfig(**config_kwargs, do_pack_sequences=True)
+        )
+        M_packed.load_state_dict(M_padded.state_dict())
+        M_packed.eval()
+
+        out_kwargs = {"use_cache": True, "output_attentions": True, "output_hidden_states": True}
+        self.assertEqual(M_padded(self.batch, **out_kwargs), M_packed(self.batch, **out_kwargs))
+
+        # Gradients flow to the parameters just as they do without packing.
+        M_padded(self.batch).last_hidden_state.sum().backward()
+        M_packed(self.batch).last_hidden_state.sum().backward()
+        for (n, p_padded), p_packed in zip(M_padded.named_parameters(), M_packed.parameters()):
+            if p_padded.grad is None:
+                self.assertIsNone(p_packed.grad, n)
+            else:
+                torch.testing.assert_close(p_padded.grad, p_packed.grad, msg=n)
+
+    def test_sliding_window_cache_matches_full_forward(self):
+        config_kwargs = {**CI_CONFIG_KWARGS, "seq_attention_types": ["local", "global"], "seq_window_size": 2}
+        M = ConditionallyIndependentPointProcessTransformer(StructuredTransformerConfig(**config_kwargs))
+        M.eval()
+
+        out_no_caching = M(self.batch).last_hidden_state
+
+        past = M.preallocate_kv_cache(self.batch.batch_size, self.batch.sequence_length + 1)
+        self.assertIsInstance(past[0], SlidingWindowKVCache)
+        self.assertNotIsInstance(past[1], SlidingWindowKVCache)
+
+        source_batch_for_slicing = PytorchBatch(**copy.deepcopy(BASE_BATCH))
+        source_batch_for_slicing.time = time_from_deltas(source_batch_for_slicing)
+        seq_attention_mask = expand_mask(self.batch.event_mask, out_no_caching.dtype)
+
+        out_iterative_caching = []
+        for st, end in [(0, 2), (2, 3), (3, 4)]:
+            sliced_batch = copy.deepcopy(source_batch_for_slicing)[:, st:end]
+            sliced_out = M(
+                sliced_batch,
+                past=past,
+                seq_attention_mask=seq_attention_mask[:, :, :, :end],
+                use_cache=True,
+            )
+            out_iterative_caching.append(sliced_out.last_hidden_state)
+
+        # The local layer's cache only retains the keys and values within its window of the latest element.
+        self.assertEqual(4, past[0].capacity)
+        self.assertEqual(3, past[0][0].shape[-2])
+        self.assertEqual(self.batch.sequence_length, past[1][0].shape[-2])
+        self.assertEqual(out_no_caching, torch.cat(out_iterative_caching, dim=1))
+
     def test_forward_identical_with_or_without_caching(self):
         # We want to check that the output doesn't change when we do or do not use caching. To do this, we'll
         # run the model over a partial batch without caching and store the result. Then, we'll run the model
@@ -340,6 +440,65 @@ class TestNestedAttentionTransformer(ConfigComparisonsMixin, unittest.TestCase):
         out_seq_to_2 = self.M(self.batch[:, :2])
         self.assertEqual(out_seq_to_2.last_hidden_state, out.last_hidden_state[:, :2])
 
+    def test_input_layer_forward_dep_graph_el(self):
+        batch = copy.deepcopy(self.batch)
+        batch.time = time_from_deltas(batch)
+
+        for do_split_embeddings in (False, True):
+            config = StructuredTransformerConfig(
+                **{
+                    **NA_CONFIG_KWARGS,
+                    "do_split_embeddings": do_split_embeddings,
+                    "categorical_embedding_dim": 4,
+                    "numerical_embedding_dim": 4,
+                }
+            )
+            input_layer = NestedAttentionPointProcessTransformer(config).input_layer.eval()
+            self.assertEqual(input_layer.embeds_dep_graph_levels_independently, do_split_embeddings)
+
+            dep_graph_embed_past = None
+            for target in range(1, len(config.measurements_per_dep_graph_level)):
+                with self.subTest(do_split_embeddings=do_split_embeddings, target=target):
+                    want = input_layer(batch, dep_graph_el_generation_target=target)
+
+                    got, dep_graph_embed_past = input_layer.forward_dep_graph_el(
+                        batch,
+                        dep_graph_el_generation_target=target,
+                        dep_graph_embed_past=dep_graph_embed_past,
+                    )
+                    self.assertEqual(want, got)
+                    if not do_split_embeddings:
+                        self.assertIsNone(dep_graph_embed_past)
+
+                    got_from_scratch, _ = input_layer.forward_dep_graph_el(
+                        batch, dep_graph_el_generation_target=target
+                    )
+                    self.assertEqual(want, got_from_scratch)
+
+            with self.assertRaises(ValueError):
+                input_layer.forward_dep_graph_el(batch, dep_graph_el_generation_target=0)
+
+    def test_sdpa_attention_matches_eager(self):
+        for seq_attention_types in (["local", "global"], "global"):
+            config_kwargs = {**NA_CONFIG_KWARGS, "seq_attention_types": seq_attention_types}
+            M_eager = NestedAttentionPointProcessTransformer(StructuredTransformerConfig(**config_kwargs))
+            M_eager.eval()
+            M_sdpa = NestedAttentionPointProcessTransformer(
+                StructuredTransformerConfig(**config_kwargs, attention_implementation="sdpa")
+            )
+            M_sdpa.load_state_dict(M_eager.state_dict())
+            M_sdpa.eval()
+
+            # The test sequences are shorter than those the fused kernel would normally be used for.
+            with patch.object(InnerSelfAttention, "SDPA_MIN_KEY_LENGTH", 0):
+                self.assertEqual(M_eager(self.batch), M_sdpa(self.batch))
+
+            # Attention weights can only be returned by the eager implementation, which is used instead.
+            out_eager = M_eager(self.batch, output_attentions=True)
+            out_sdpa = M_sdpa(self.batch, output_attentions=True)
+            self.assertEqual(out_eager, out_sdpa)
+            self.assertIsNotNone(out_sdpa.attentions)
+
     def test_forward_identical_with_or_without_caching(self):
         # We want to check that the output doesn't change when we do or do not use caching. To do this, we'll
         # run the model over a partial batch without caching and store the result. Then, we'll run the model
@@ -18,7 +18,8 @@ class LabelerMock(Labeler):
 
 class TestLabeler(unittest.TestCase):
     def test_constructs(self):
-        LabelerMock(StructuredTransformerConfig())
+        L = LabelerMock(StructuredTransformerConfig())
+        self.assertEqual(L.stopping_criteria(input_seq_len=3), [])
 
         with self.assertRaises(TypeError):
             Labeler(StructuredTransformerConfig())